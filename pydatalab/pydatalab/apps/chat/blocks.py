@@ -5,6 +5,7 @@ from langchain_anthropic import ChatAnthropic
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_openai import ChatOpenAI
 
+from pydatalab.block_data import OFFLOADED_FIELDS_KEY
 from pydatalab.blocks.base import DataBlock
 from pydatalab.logger import LOGGER
 from pydatalab.models import ITEM_MODELS
@@ -39,6 +40,9 @@ class ChatBlock(DataBlock):
 
     __supports_collections = True
 
+    # Responses are not deterministic and each render may call an external API
+    _cacheable = False
+
     defaults = {
         "system_prompt": """You are whinchat (lowercase w), a virtual data managment assistant that helps materials chemists manage their experimental data and plan experiments. You are deployed in the group of Professor Clare Grey in the Department of Chemistry at the University of Cambridge.
 You are embedded within the program datalab, where you have access to JSON describing an ‘item’, or a collection of items, with connections to other items. These items may include experimental samples, starting materials, and devices (e.g. battery cells made out of experimental samples and starting materials).
@@ -227,6 +231,7 @@ Start with a friendly introduction and give me a one sentence summary of what th
         }
         for block in item_info.get("blocks_obj", {}).values():
             block.pop("bokeh_plot_data", None)
+            block.pop(OFFLOADED_FIELDS_KEY, None)
 
             block_fields_to_remove = ["item_id", "block_id"]
             [block.pop(field, None) for field in block_fields_to_remove]
@@ -1,25 +1,261 @@
+import importlib.metadata
 import os
+import tempfile
 import time
-from pathlib import Path
-from typing import Union
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import bokeh
+import numpy as np
 import pandas as pd
 from bson import ObjectId
 from navani import echem as ec
 
 from pydatalab import bokeh_plots
 from pydatalab.blocks.base import DataBlock
+from pydatalab.config import CONFIG
 from pydatalab.file_utils import get_file_info_by_id
 from pydatalab.logger import LOGGER
 from pydatalab.mongo import flask_mongo
+from pydatalab.parsed_data import get_appended_parsed_data, get_parsed_data
 
 from .utils import (
     compute_gpcl_differential,
     filter_df_by_cycle_index,
-    reduce_echem_cycle_sampling,
+    select_half_cycles,
 )
 
+try:
+    NAVANI_VERSION = importlib.metadata.version("navani")
+except importlib.metadata.PackageNotFoundError:
+    NAVANI_VERSION = "unknown"
+
+
+def _parse_echem_file(location: str) -> pd.DataFrame:
+    """Parses a raw cycler file with navani."""
+    LOGGER.debug("Loading file %s", location)
+    start_time = time.time()
+    raw_df = ec.echem_file_loader(location)
+    LOGGER.debug("Loaded file %s in %s seconds", location, time.time() - start_time)
+    return raw_df
+
+
+def _summarise_echem_file(location: str) -> pd.DataFrame:
+    """Computes the navani cycle summary of a raw cycler file."""
+    return ec.cycle_summary(
+        get_parsed_data(
+            location,
+            _parse_echem_file,
+            parser_version=NAVANI_VERSION,
+            partition_by="half cycle",
+        )
+    )
+
+
+APPENDABLE_FILE_EXTENSIONS = (".txt", ".mpt", ".csv")
+"""The extensions of the plain-text cycler formats that live files are parsed
+incrementally for, as rows are appended to them (see `_parse_appended_echem_file`)."""
+
+_READ_SIZE = 1024 * 1024
+
+
+def _line_offset_from_end(f, size: int, num_lines: int) -> Optional[int]:
+    """Returns the byte offset of the start of the `num_lines`-th last line of a file
+    that ends with a newline, by reading backwards from the end of the file.
+
+    """
+    position = size
+    # The newline at the end of the file terminates the last line
+    remaining = num_lines + 1
+    while position > 0:
+        start = max(position - _READ_SIZE, 0)
+        f.seek(start)
+        chunk = f.read(position - start)
+        index = len(chunk)
+        while (index := chunk.rfind(b"\n", 0, index)) >= 0:
+            remaining -= 1
+            if remaining == 0:
+                return start + index + 1
+        position = start
+    return 0 if remaining == 1 else None
+
+
+def _echem_append_state(
+    location: str, df: pd.DataFrame, header_lines: Optional[int] = None
+) -> Dict[str, Any]:
+    """Returns the state needed to continue parsing a plain-text cycler file once
+    more rows have been appended to it.
+
+    As the processing of each row by navani (e.g., the capacity and the half cycle
+    counter) depends on the rows before it, parsing resumes from the start of the
+    last half cycle in the file, which may not yet be finished, with the row before
+    it to carry over the state of the previous half cycle.
+
+    Parameters:
+        location: The location of the file.
+        df: The data parsed from the file.
+        header_lines: The number of lines before the first row of data, if known.
+
+    Returns:
+        The byte offsets of the end of the header and the start of the row before
+        the last half cycle, alongside the index of that row in the data, or an
+        empty dictionary if parsing cannot be resumed (e.g., if the last line of
+        the file is only partially written).
+
+    """
+    if "half cycle" not in df.columns or len(df) < 2:
+        return {}
+
+    half_cycles = df["half cycle"].to_numpy()
+    changes = np.flatnonzero(half_cycles[1:] != half_cycles[:-1])
+    if not len(changes):
+        return {}
+    row = int(changes[-1])
+
+    with open(location, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(size - 1)
+        if f.read(1) != b"\n":
+            return {}
+
+        if header_lines is None:
+            f.seek(0)
+            num_lines = sum(chunk.count(b"\n") for chunk in iter(partial(f.read, _READ_SIZE), b""))
+            header_lines = num_lines - len(df)
+            if header_lines < 1:
+                return {}
+
+        f.seek(0)
+        for _ in range(header_lines):
+            f.readline()
+        header_size = f.tell()
+
+        offset = _line_offset_from_end(f, size, len(df) - row)
+
+    if offset is None or offset < header_size:
+        return {}
+
+    return {"header_lines": header_lines, "header_size": header_size, "offset": offset, "row": row}
+
+
+def _matches(previous: pd.Series, parsed: pd.Series) -> bool:
+    return bool(
+        np.allclose(
+            pd.to_numeric(previous, errors="coerce").to_numpy(dtype=float),
+            pd.to_numeric(parsed, errors="coerce").to_numpy(dtype=float),
+            equal_nan=True,
+        )
+    )
+
+
+def _append_echem_rows(
+    location: str, previous: pd.DataFrame, state: Dict[str, Any]
+) -> Optional[pd.DataFrame]:
+    """Parses the rows of a plain-text cycler file from the row before its last
+    previously parsed half cycle onwards, and appends them to the previous data.
+
+    The re-parsed rows that were previously parsed must match the previous data,
+    otherwise `None` is returned and the whole file should be parsed instead.
+
+    """
+    row = state["row"]
+    with open(location, "rb") as f:
+        header = f.read(state["header_size"])
+        f.seek(state["offset"])
+        tail = f.read()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # navani picks the format from the file extension (and header)
+        tail_location = os.path.join(directory, os.path.basename(location))
+        with open(tail_location, "wb") as f:
+            f.write(header)
+            f.write(tail)
+        tail_df = _parse_echem_file(tail_location)
+
+    overlap = len(previous) - row
+    if overlap < 2 or len(tail_df) < overlap:
+        return None
+
+    previous_rows = previous.iloc[row : row + overlap]
+    tail_rows = tail_df.iloc[:overlap]
+    shift = previous_rows["half cycle"].iloc[1] - tail_rows["half cycle"].iloc[1]
+    if not (
+        previous_rows["half cycle"].to_numpy()[1:] - tail_rows["half cycle"].to_numpy()[1:] == shift
+    ).all():
+        return None
+    for column in ("Time", "Voltage", "Current"):
+        if column in previous.columns and not _matches(previous_rows[column], tail_rows[column]):
+            return None
+    # The row before the last half cycle is parsed as its own half cycle, so its capacity differs
+    if "Capacity" in previous.columns and not _matches(
+        previous_rows["Capacity"].iloc[1:], tail_rows["Capacity"].iloc[1:]
+    ):
+        return None
+
+    tail_df = tail_df.iloc[1:].copy()
+    tail_df["half cycle"] += shift
+    if "full cycle" in tail_df.columns:
+        tail_df["full cycle"] = np.ceil(tail_df["half cycle"] / 2)
+
+    return pd.concat([previous.iloc[: row + 1], tail_df], ignore_index=True)
+
+
+def _parse_appended_echem_file(
+    location: str, previous: Optional[pd.DataFrame], state: Dict[str, Any]
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Parses a live plain-text cycler file, only parsing the rows appended since
+    it was last parsed where possible (see `pydatalab.parsed_data.AppendParser`).
+
+    """
+    if previous is not None and state:
+        try:
+            df = _append_echem_rows(location, previous, state)
+        except Exception as exc:
+            LOGGER.debug("Unable to parse appended rows of %s: %r", location, exc)
+            df = None
+        if df is not None:
+            return df, _echem_append_state(location, df, header_lines=state["header_lines"])
+        LOGGER.debug("Appended rows of %s do not match previous data, parsing in full", location)
+
+    df = _parse_echem_file(location)
+    return df, _echem_append_state(location, df)
+
+
+def _summarise_appended_echem_file(
+    location: str, previous: Optional[pd.DataFrame], state: Dict[str, Any]
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Computes the navani cycle summary of a live plain-text cycler file, only
+    summarising the last previously summarised cycle and any new cycles where possible.
+
+    """
+
+    def load_raw(partitions=None) -> pd.DataFrame:
+        return get_appended_parsed_data(
+            location,
+            _parse_appended_echem_file,
+            parser_version=NAVANI_VERSION,
+            partition_by="half cycle",
+            partitions=partitions,
+        )
+
+    last_full_cycle = state.get("last_full_cycle")
+    if previous is not None and last_full_cycle is not None:
+        # The cycle summary is computed independently for each full cycle
+        summary = pd.concat(
+            [
+                previous[previous.index < last_full_cycle],
+                ec.cycle_summary(
+                    load_raw(
+                        lambda half_cycles: [h for h in half_cycles if h >= 2 * last_full_cycle - 1]
+                    )
+                ),
+            ]
+        )
+    else:
+        summary = ec.cycle_summary(load_raw())
+
+    return summary, {"last_full_cycle": float(summary.index.max())} if len(summary) else {}
+
 
 class CycleBlock(DataBlock):
     """A data block for processing electrochemical cycling data.
@@ -62,13 +298,25 @@ class CycleBlock(DataBlock):
             return characteristic_mass_mg / 1000.0
         return None
 
-    def _load(self, file_id: Union[str, ObjectId], reload: bool = False):
-        """Loads the echem data using navani, summarises it, then caches the results
-        to disk with suffixed names.
+    def _get_render_dependencies(self):
+        return {"characteristic_mass_g": self._get_characteristic_mass_g()}
+
+    def _load(
+        self,
+        file_id: Union[str, ObjectId],
+        reload: bool = False,
+        cycle_list: Optional[List[int]] = None,
+    ):
+        """Loads the echem data using navani and summarises it, via the parsed data cache.
+
+        The raw data is stored partitioned by half cycle, so that only the rows for
+        the requested cycles are read from the cache.
 
         Parameters:
             file_id: The ID of the file to load.
             reload: Whether to reload the data from the file, or use the cached version, if available.
+            cycle_list: If provided, only load the raw data for these full cycles
+                (see `filter_df_by_cycle_index`).
 
         """
 
@@ -97,9 +345,6 @@ class CycleBlock(DataBlock):
         file_info = get_file_info_by_id(file_id, update_if_live=True)
         filename = file_info["name"]
 
-        if file_info.get("is_live"):
-            reload = True
-
         ext = os.path.splitext(filename)[-1].lower()
 
         if ext not in self.accepted_file_extensions:
@@ -107,36 +352,52 @@ class CycleBlock(DataBlock):
                 f"Unrecognized filetype {ext}, must be one of {self.accepted_file_extensions}"
             )
 
-        parsed_file_loc = Path(file_info["location"]).with_suffix(".RAW_PARSED.pkl")
-        cycle_summary_file_loc = Path(file_info["location"]).with_suffix(".SUMMARY.pkl")
+        partitions = (
+            partial(select_half_cycles, cycle_list=cycle_list) if cycle_list is not None else None
+        )
+
+        # Live plain-text files only ever have rows appended to them, so only the
+        # new rows need to be parsed each time they are synced
+        appendable = file_info.get("is_live") and ext in APPENDABLE_FILE_EXTENSIONS and not reload
 
-        raw_df = None
-        cycle_summary_df = None
-        if not reload:
-            if parsed_file_loc.exists():
-                raw_df = pd.read_pickle(parsed_file_loc)
-
-            if cycle_summary_file_loc.exists():
-                cycle_summary_df = pd.read_pickle(cycle_summary_file_loc)
-
-        if raw_df is None:
-            try:
-                LOGGER.debug("Loading file %s", file_info["location"])
-                start_time = time.time()
-                raw_df = ec.echem_file_loader(file_info["location"])
-                LOGGER.debug(
-                    "Loaded file %s in %s seconds",
+        try:
+            if appendable:
+                raw_df = get_appended_parsed_data(
+                    file_info["location"],
+                    _parse_appended_echem_file,
+                    parser_version=NAVANI_VERSION,
+                    columns=required_keys,
+                    partition_by="half cycle",
+                    partitions=partitions,
+                )
+            else:
+                raw_df = get_parsed_data(
                     file_info["location"],
-                    time.time() - start_time,
+                    _parse_echem_file,
+                    parser_version=NAVANI_VERSION,
+                    columns=required_keys,
+                    reload=reload,
+                    partition_by="half cycle",
+                    partitions=partitions,
                 )
-            except Exception as exc:
-                raise RuntimeError(f"Navani raised an error when parsing: {exc}") from exc
-            raw_df.to_pickle(parsed_file_loc)
+        except Exception as exc:
+            raise RuntimeError(f"Navani raised an error when parsing: {exc}") from exc
 
+        cycle_summary_df = None
         try:
-            if cycle_summary_df is None:
-                cycle_summary_df = ec.cycle_summary(raw_df)
-                cycle_summary_df.to_pickle(cycle_summary_file_loc)
+            if appendable:
+                cycle_summary_df = get_appended_parsed_data(
+                    file_info["location"],
+                    _summarise_appended_echem_file,
+                    parser_version=NAVANI_VERSION,
+                )
+            else:
+                cycle_summary_df = get_parsed_data(
+                    file_info["location"],
+                    _summarise_echem_file,
+                    parser_version=NAVANI_VERSION,
+                    reload=reload,
+                )
         except Exception:
             pass
 
@@ -178,7 +439,7 @@ class CycleBlock(DataBlock):
         if not isinstance(cycle_list, list):
             cycle_list = None
 
-        raw_df, cycle_summary_df = self._load(file_id)
+        raw_df, cycle_summary_df = self._load(file_id, cycle_list=cycle_list)
 
         characteristic_mass_g = self._get_characteristic_mass_g()
 
@@ -193,7 +454,7 @@ class CycleBlock(DataBlock):
                     cycle_summary_df["discharge capacity (mAh)"] / characteristic_mass_g
                 )
 
-        df = filter_df_by_cycle_index(raw_df, cycle_list)
+        df = raw_df
         if cycle_summary_df is not None:
             cycle_summary_df = filter_df_by_cycle_index(cycle_summary_df, cycle_list)
 
@@ -206,12 +467,9 @@ class CycleBlock(DataBlock):
                 window_size_1=int(self.data["win_size_1"]),
                 window_size_2=int(self.data["win_size_2"]),
                 use_normalized_capacity=bool(characteristic_mass_g),
+                processes=CONFIG.ECHEM_DIFFERENTIAL_PROCESSES,
             )
 
-        # Reduce df size to 100 points per cycle by default if there are more than a 100k points
-        if len(df) > 1e5:
-            df = reduce_echem_cycle_sampling(df, num_samples=100)
-
         layout = bokeh_plots.double_axes_echem_plot(
             df, cycle_summary=cycle_summary_df, mode=mode, normalized=bool(characteristic_mass_g)
         )
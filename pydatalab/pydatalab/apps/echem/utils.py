@@ -1,33 +1,34 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 import navani.echem as ec
 import numpy as np
 import pandas as pd
 
 from pydatalab.logger import LOGGER
-from pydatalab.utils import reduce_df_size
+from pydatalab.worker_pool import map_in_worker_pool
 
 
-def reduce_echem_cycle_sampling(df: pd.DataFrame, num_samples: int = 100) -> pd.DataFrame:
-    """Reduce number of cycles to at most `num_samples` points per half cycle. Will
-    keep the endpoint values of each half cycle.
-
-    Parameters:
-        df: The echem dataframe to reduce, which must have cycling data stored
-            under a `"half cycle"` column.
-        num_samples: The maximum number of sample points to include per cycle.
-
-    Returns:
-        The output dataframe.
+def _differentiate_half_cycle(
+    y: np.ndarray, x: np.ndarray, smoothing_parameters: Dict[str, Any]
+) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Computes the derivative of a single half cycle with navani, returning `None`
+    if it could not be computed (e.g., for a rest or voltage hold).
 
     """
+    try:
+        return ec.dqdv_single_cycle(y, x, **smoothing_parameters)
+    except TypeError as e:
+        LOGGER.debug(
+            "Calculating derivative failed with the following error (likely it is a rest or voltage hold): %s",
+            e,
+        )
+        return None
 
-    return_df = pd.DataFrame([])
-
-    for _, half_cycle in df.groupby("half cycle"):
-        return_df = pd.concat([return_df, reduce_df_size(half_cycle, num_samples, endpoint=True)])
 
-    return return_df
+def _differentiate_half_cycles(
+    half_cycles: List[Tuple[np.ndarray, np.ndarray]], smoothing_parameters: Dict[str, Any]
+) -> List[Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]]:
+    return [_differentiate_half_cycle(y, x, smoothing_parameters) for y, x in half_cycles]
 
 
 def compute_gpcl_differential(
@@ -41,6 +42,7 @@ def compute_gpcl_differential(
     polyorder_1: int = 5,
     polyorder_2: int = 5,
     use_normalized_capacity: bool = False,
+    processes: int = 1,
 ) -> pd.DataFrame:
     """Compute differential dQ/dV or dV/dQ for the input dataframe.
 
@@ -54,6 +56,10 @@ def compute_gpcl_differential(
         window_size_2: The window size for the `savgol` filter when smoothing the final differential.
         polyorder_1: The polynomial order for the `savgol` filter when smoothing the capacity.
         polyorder_2: The polynomial order for the `savgol` filter when smoothing the final differential.
+        use_normalized_capacity: Whether to use the capacity normalized by the characteristic mass.
+        processes: The number of tasks to split the half cycles between on the shared
+            worker pool (see `pydatalab.worker_pool`); the derivatives are computed
+            serially when set to 1, or if this process has no worker pool.
 
     Returns:
         A data frame containing the voltages, capacities and requested differential
@@ -85,47 +91,94 @@ def compute_gpcl_differential(
         "final_smooth": smoothing,
     }
 
-    differential_df = pd.DataFrame()
+    half_cycles = [
+        (
+            cycle,
+            df_cycle[y_label].to_numpy(),
+            df_cycle[x_label].to_numpy(),
+            df_cycle["full cycle"].max(),
+        )
+        for cycle, df_cycle in df.groupby("half cycle", sort=False)
+    ]
+
+    results = None
+    if processes > 1 and len(half_cycles) > 1:
+        chunks = np.array_split(np.arange(len(half_cycles)), min(processes, len(half_cycles)))
+        chunked_results = map_in_worker_pool(
+            _differentiate_half_cycles,
+            [[half_cycles[ind][1:3] for ind in chunk] for chunk in chunks],
+            [smoothing_parameters] * len(chunks),
+        )
+        if chunked_results is not None:
+            results = [result for chunk in chunked_results for result in chunk]
 
-    # Loop over distinct half cycles
-    for cycle in df["half cycle"].unique():
-        # Extract all segments corresponding to this half cycle index
-        df_cycle = df[df["half cycle"] == cycle]
+    if results is None:
+        results = _differentiate_half_cycles(
+            [(y, x) for _, y, x, _ in half_cycles], smoothing_parameters
+        )
 
-        # Compute the desired derivative
-        try:
-            x, yp, y = ec.dqdv_single_cycle(
-                df_cycle[y_label], df_cycle[x_label], **smoothing_parameters
-            )
-        except TypeError as e:
-            LOGGER.debug(
-                f"""Calculating derivative {mode} of half_cycle {cycle} failed with the following error (likely it is a rest or voltage hold):
-                 {e}
-                Skipping derivative calculation for this half cycle."""
-            )
+    differential_dfs = []
+    for (cycle, _, _, cycle_index), result in zip(half_cycles, results):
+        if result is None:
+            LOGGER.debug("Skipping derivative %s calculation for half cycle %s", mode, cycle)
             continue
 
-        # Set up an array per cycle segment that stores the cycle and half-cycle index
-        cycle_index = df_cycle["full cycle"].max()
-        cycle_index_array = np.full(len(x), int(cycle_index), dtype=int)
-        half_cycle_index_array = np.full(len(x), int(cycle), dtype=int)
-
-        differential_df = pd.concat(
-            [
-                differential_df,
-                pd.DataFrame(
-                    {
-                        x_label: x,
-                        y_label: y,
-                        yp_label: yp,
-                        "full cycle": cycle_index_array,
-                        "half cycle": half_cycle_index_array,
-                    }
-                ),
-            ]
+        x, yp, y = result
+        differential_dfs.append(
+            pd.DataFrame(
+                {
+                    x_label: x,
+                    y_label: y,
+                    yp_label: yp,
+                    "full cycle": np.full(len(x), int(cycle_index), dtype=int),
+                    "half cycle": np.full(len(x), int(cycle), dtype=int),
+                }
+            )
         )
 
-    return differential_df
+    if not differential_dfs:
+        return pd.DataFrame()
+
+    return pd.concat(differential_dfs)
+
+
+def select_half_cycles(
+    half_cycles: Sequence[float], cycle_list: Optional[List[int]] = None
+) -> Optional[List[int]]:
+    """Returns the half cycle indices corresponding to the chosen full cycles
+    in the `cycle_list`, given the half cycle indices present in the data.
+
+    If only a single cycle is requested and it lies beyond the end of the data,
+    the final cycle will be selected instead.
+
+    Args:
+        half_cycles: The half cycle indices available in the data.
+        cycle_list: The provided list of cycle indices to keep.
+
+    Returns:
+        The list of half cycle indices to keep, or `None` if all should be kept.
+
+    """
+    if cycle_list is None:
+        return None
+
+    cycle_list = sorted(i for i in cycle_list if i > 0)
+    half_cycles = [i for i in half_cycles if not pd.isna(i)]
+    if not half_cycles:
+        return []
+
+    try:
+        if len(cycle_list) == 1 and 2 * max(cycle_list) > max(half_cycles):
+            cycle_list[0] = max(half_cycles) // 2
+        return [
+            i
+            for item in cycle_list
+            for i in [max((2 * int(item)) - 1, min(half_cycles)), 2 * int(item)]
+        ]
+    except ValueError as exc:
+        raise ValueError(
+            f"Unable to parse `cycle_list` as integers: {cycle_list}. Error: {exc}"
+        ) from exc
 
 
 def filter_df_by_cycle_index(
@@ -146,9 +199,8 @@ def filter_df_by_cycle_index(
     if cycle_list is None:
         return df
 
-    cycle_list = sorted(i for i in cycle_list if i > 0)
-
     if "half cycle" not in df.columns:
+        cycle_list = sorted(i for i in cycle_list if i > 0)
         if "cycle index" not in df.columns:
             raise ValueError(
                 "Input dataframe must have either 'half cycle' or 'cycle index' column"
@@ -158,16 +210,5 @@ def filter_df_by_cycle_index(
             cycle_list[0] = df["cycle index"].max()
         return df[df["cycle index"].isin(i for i in cycle_list)]
 
-    try:
-        if len(cycle_list) == 1 and 2 * max(cycle_list) > df["half cycle"].max():
-            cycle_list[0] = df["half cycle"].max() // 2
-        half_cycles = [
-            i
-            for item in cycle_list
-            for i in [max((2 * int(item)) - 1, df["half cycle"].min()), 2 * int(item)]
-        ]
-    except ValueError as exc:
-        raise ValueError(
-            f"Unable to parse `cycle_list` as integers: {cycle_list}. Error: {exc}"
-        ) from exc
+    half_cycles = select_half_cycles(df["half cycle"].unique(), cycle_list)
     return df[df["half cycle"].isin(half_cycles)]
@@ -9,6 +9,7 @@ from pydatalab.blocks.base import DataBlock
 from pydatalab.bokeh_plots import DATALAB_BOKEH_THEME, selectable_axes_plot
 from pydatalab.file_utils import get_file_info_by_id
 from pydatalab.logger import LOGGER
+from pydatalab.parsed_data import get_parsed_data
 
 
 def parse_ivium_eis_txt(filename: Path):
@@ -51,7 +52,7 @@ class EISBlock(DataBlock):
                 )
                 return
 
-            eis_data = parse_ivium_eis_txt(Path(file_info["location"]))
+            eis_data = get_parsed_data(file_info["location"], parse_ivium_eis_txt)
 
         if eis_data is not None:
             plot = selectable_axes_plot(
@@ -1,3 +1,4 @@
+import functools
 import os
 import zipfile
 
@@ -8,8 +9,11 @@ from pydatalab.blocks.base import DataBlock
 from pydatalab.bokeh_plots import DATALAB_BOKEH_THEME, selectable_axes_plot
 from pydatalab.file_utils import get_file_info_by_id
 from pydatalab.logger import LOGGER
+from pydatalab.parsed_data import get_parsed_data
 
-from .utils import read_bruker_1d
+from .utils import list_bruker_zip_processes, read_bruker_1d_zip
+
+NMR_PARSER_VERSION = "1"
 
 
 class NMRBlock(DataBlock):
@@ -25,10 +29,21 @@ class NMRBlock(DataBlock):
     def plot_functions(self):
         return (self.generate_nmr_plot,)
 
-    def read_bruker_nmr_data(self):
+    def read_bruker_nmr_data(self) -> pd.DataFrame | None:
+        """Reads the selected process of the zipped Bruker project attached to the block,
+        storing its parameters in the block data.
+
+        The spectrum itself is parsed (and cached against the contents of the zip file)
+        with `get_parsed_data`, so that the archive is only read once per revision
+        and the spectrum is not stored in the block document.
+
+        Returns:
+            The spectrum, or `None` if no 1D spectrum could be read.
+
+        """
         if "file_id" not in self.data:
             LOGGER.warning("NMRPlot.read_bruker_nmr_data(): No file set in the DataBlock")
-            return
+            return None
 
         zip_file_info = get_file_info_by_id(self.data["file_id"], update_if_live=True)
         filename = zip_file_info["name"]
@@ -38,60 +53,59 @@ class NMRBlock(DataBlock):
             LOGGER.warning(
                 "NMRBlock.read_bruker_nmr_data(): Unsupported file extension (must be .zip)"
             )
-            return
+            return None
 
-        # unzip:
-        directory_location = zip_file_info["location"] + ".extracted"
-        LOGGER.debug(f"Directory location is: {directory_location}")
-        with zipfile.ZipFile(zip_file_info["location"], "r") as zip_ref:
-            zip_ref.extractall(directory_location)
+        # spectra are no longer stored in the block document
+        self.data.pop("processed_data", None)
 
-        extracted_directory_name = os.path.join(directory_location, name)
-        available_processes = os.listdir(os.path.join(extracted_directory_name, "pdata"))
+        try:
+            available_processes = list_bruker_zip_processes(zip_file_info["location"])
+        except (zipfile.BadZipFile, ValueError) as error:
+            LOGGER.critical(f"Unable to read {name} as a zipped Bruker project. {error}")
+            return None
 
         if self.data.get("selected_process") not in available_processes:
             self.data["selected_process"] = available_processes[0]
 
         try:
-            df, a_dic, topspin_title, processed_data_shape = read_bruker_1d(
-                os.path.join(directory_location, name),
-                process_number=self.data["selected_process"],
-                verbose=False,
+            df = get_parsed_data(
+                zip_file_info["location"],
+                functools.partial(read_bruker_1d_zip, process_number=self.data["selected_process"]),
+                parser_version=NMR_PARSER_VERSION,
             )
         except Exception as error:
             LOGGER.critical(f"Unable to parse {name} as Bruker project. {error}")
-            return
+            return None
 
-        serialized_df = df.to_dict() if (df is not None) else None
+        acqus = df.attrs["acquisition_parameters"]
 
         # all data sorted in a fairly raw way
-        self.data["processed_data"] = serialized_df
-        self.data["acquisition_parameters"] = a_dic["acqus"]
-        self.data["processing_parameters"] = a_dic["procs"]
-        self.data["pulse_program"] = a_dic["pprog"]
+        self.data["acquisition_parameters"] = acqus
+        self.data["processing_parameters"] = df.attrs["processing_parameters"]
+        self.data["pulse_program"] = df.attrs["pulse_program"]
 
         # specific things that we might want to pull out for the UI:
         self.data["available_processes"] = available_processes
-        self.data["nucleus"] = a_dic["acqus"]["NUC1"]
-        self.data["carrier_frequency_MHz"] = a_dic["acqus"]["SFO1"]
-        self.data["carrier_offset_Hz"] = a_dic["acqus"]["O1"]
-        self.data["recycle_delay"] = a_dic["acqus"]["D"][1]
-        self.data["nscans"] = a_dic["acqus"]["NS"]
-        self.data["CNST31"] = a_dic["acqus"]["CNST"][31]
-        self.data["processed_data_shape"] = processed_data_shape
-
-        self.data["probe_name"] = a_dic["acqus"]["PROBHD"]
-        self.data["pulse_program_name"] = a_dic["acqus"]["PULPROG"]
-        self.data["topspin_title"] = topspin_title
+        self.data["nucleus"] = acqus["NUC1"]
+        self.data["carrier_frequency_MHz"] = acqus["SFO1"]
+        self.data["carrier_offset_Hz"] = acqus["O1"]
+        self.data["recycle_delay"] = acqus["D"][1]
+        self.data["nscans"] = acqus["NS"]
+        self.data["CNST31"] = acqus["CNST"][31]
+        self.data["processed_data_shape"] = df.attrs["shape"]
+
+        self.data["probe_name"] = acqus["PROBHD"]
+        self.data["pulse_program_name"] = acqus["PULPROG"]
+        self.data["topspin_title"] = df.attrs["topspin_title"]
+
+        return df if len(df) else None
 
     def generate_nmr_plot(self):
-        # currently calls every time plotting happens, but it should only happen if the file was updated
-        self.read_bruker_nmr_data()
-        if "processed_data" not in self.data or not self.data["processed_data"]:
+        df = self.read_bruker_nmr_data()
+        if df is None:
             self.data["bokeh_plot_data"] = None
             return
 
-        df = pd.DataFrame(self.data["processed_data"])
         df["normalized intensity"] = df.intensity / df.intensity.max()
 
         bokeh_layout = selectable_axes_plot(
@@ -1,6 +1,8 @@
 import itertools
 import os
 import re
+import tempfile
+import zipfile
 from pathlib import Path
 
 import matplotlib.pyplot as plt
@@ -96,6 +98,90 @@ def read_bruker_1d(
     return df, a_dic, topspin_title, a_data.shape
 
 
+def _bruker_zip_layout(zip_ref: zipfile.ZipFile) -> tuple[str, list[str]]:
+    """Returns the path of the experiment directory inside a zipped Bruker project
+    and the (sorted) process numbers found in its `pdata` directory, from the zip
+    index alone.
+
+    """
+    experiment_dir = None
+    processes = set()
+    for member in zip_ref.namelist():
+        if member.startswith("__MACOSX/"):
+            continue
+        match = re.match(r"^(.*?)pdata/([^/]+)/", member)
+        if match is None:
+            continue
+        if experiment_dir is None:
+            experiment_dir = match.group(1)
+        if match.group(1) == experiment_dir:
+            processes.add(match.group(2))
+
+    if experiment_dir is None:
+        raise ValueError("No `pdata` directory found in the zip file")
+
+    return experiment_dir, sorted(
+        processes, key=lambda p: (not p.isdigit(), int(p) if p.isdigit() else p)
+    )
+
+
+def list_bruker_zip_processes(location: str | Path) -> list[str]:
+    """Lists the process numbers available in a zipped Bruker project, without extracting it."""
+    with zipfile.ZipFile(location, "r") as zip_ref:
+        return _bruker_zip_layout(zip_ref)[1]
+
+
+def read_bruker_1d_zip(location: str | Path, process_number: int | str = 1) -> pd.DataFrame:
+    """Read a 1D bruker nmr spectrum from a zipped Bruker project.
+
+    Only the acquisition files at the top level of the experiment directory and
+    the files of the requested process (i.e., not other processes, or any other
+    directories in the archive) are extracted, into a temporary directory that
+    is removed once the spectrum has been read with `read_bruker_1d`.
+
+    Parameters:
+        location: The location of the zip file.
+        process_number: The process number of the processed data to read.
+
+    Returns:
+        A pandas DataFrame containing the spectrum data (empty if the data is not 1D),
+        with the acquisition and processing parameters, pulse program, title and shape
+        of the data stored in its `attrs`.
+
+    """
+    with zipfile.ZipFile(location, "r") as zip_ref:
+        experiment_dir, processes = _bruker_zip_layout(zip_ref)
+        if str(process_number) not in processes:
+            raise ValueError(f"Process {process_number} not found, must be one of {processes}")
+
+        process_dir = f"{experiment_dir}pdata/{process_number}/"
+        members = []
+        for info in zip_ref.infolist():
+            if info.is_dir() or not info.filename.startswith(experiment_dir):
+                continue
+            is_top_level = "/" not in info.filename[len(experiment_dir) :]
+            if is_top_level or info.filename.startswith(process_dir):
+                members.append(info)
+
+        with tempfile.TemporaryDirectory() as directory:
+            for info in members:
+                zip_ref.extract(info, directory)
+            df, a_dic, topspin_title, shape = read_bruker_1d(
+                Path(directory) / experiment_dir, process_number=process_number
+            )
+
+    if df is None:
+        df = pd.DataFrame()
+    df.attrs = {
+        "acquisition_parameters": a_dic["acqus"],
+        "processing_parameters": a_dic["procs"],
+        "pulse_program": a_dic["pprog"],
+        "topspin_title": topspin_title,
+        "shape": list(shape),
+    }
+    return df
+
+
 def read_topspin_txt(filename, sample_mass_mg=None, nscans=None):
     MAX_HEADER_LINES = 10
     LEFTRIGHT_REGEX = r"# LEFT = (-?\d+\.\d+) ppm. RIGHT = (-?\d+\.\d+) ppm\."
@@ -1,16 +1,18 @@
 import os
 from pathlib import Path
+from typing import Sequence
 
 import bokeh
 import numpy as np
 import pandas as pd
-from pybaselines import Baseline
 from rsciio.renishaw import file_reader
-from scipy.signal import medfilt
 
 from pydatalab.blocks.base import DataBlock
 from pydatalab.bokeh_plots import DATALAB_BOKEH_THEME, selectable_axes_plot
 from pydatalab.file_utils import get_file_info_by_id
+from pydatalab.parsed_data import get_parsed_data, get_parsed_data_key
+
+from .transforms import RAMAN_TRANSFORMS
 
 
 class RamanBlock(DataBlock):
@@ -19,14 +21,56 @@ class RamanBlock(DataBlock):
     description = "Visualize 1D Raman spectroscopy data."
     accepted_file_extensions = (".txt", ".wdf")
 
+    transforms = RAMAN_TRANSFORMS
+
+    defaults = {"y_columns": ["normalized intensity", "sqrt(intensity)", "log(intensity)"]}
+
     @property
     def plot_functions(self):
         return (self.generate_raman_plot,)
 
     @classmethod
-    def load(self, location: str | Path) -> tuple[pd.DataFrame, dict, list[str]]:
+    def load(
+        self, location: str | Path, y_columns: Sequence[str] | None = None
+    ) -> tuple[pd.DataFrame, dict, list[str]]:
+        """Loads a Raman spectrum and computes the requested derived columns.
+
+        Parameters:
+            location: The location of the spectrum file.
+            y_columns: The derived intensity columns to compute (see `RAMAN_TRANSFORMS`),
+                defaults to all of them.
+
+        Returns:
+            The spectrum dataframe, its metadata and the list of columns that can be
+            plotted on the y-axis.
+
+        """
         if not isinstance(location, str):
             location = str(location)
+        df = get_parsed_data(location, self._parse_spectrum_file)
+        metadata = df.attrs.pop("metadata", {})
+
+        try:
+            cache_key = get_parsed_data_key(location, self._parse_spectrum_file)
+        except OSError:
+            cache_key = None
+
+        RAMAN_TRANSFORMS.evaluate(df, y_columns, cache_key=cache_key)
+        df.index.name = location.split("/")[-1]
+
+        y_options = [
+            c
+            for c in dict.fromkeys(("normalized intensity", "intensity", *RAMAN_TRANSFORMS.options))
+            if c in df.columns
+        ]
+        return df, metadata, y_options
+
+    @classmethod
+    def _parse_spectrum_file(self, location: str) -> pd.DataFrame:
+        """Parses the raw wavenumber and intensity columns of a spectrum file,
+        with any metadata stored in `DataFrame.attrs["metadata"]`.
+
+        """
         ext = os.path.splitext(location)[-1].lower()
 
         vendor = None
@@ -66,57 +110,8 @@ class RamanBlock(DataBlock):
                 "Could not detect Raman data vendor -- this file type is not supported by this block."
             )
 
-        df["sqrt(intensity)"] = np.sqrt(df["intensity"])
-        df["log(intensity)"] = np.log10(df["intensity"])
-        df["normalized intensity"] = df["intensity"] / np.max(df["intensity"])
-        polyfit_deg = 15
-        polyfit_baseline = np.poly1d(
-            np.polyfit(df["wavenumber"], df["normalized intensity"], deg=polyfit_deg)
-        )(df["wavenumber"])
-        df["intensity - polyfit baseline"] = df["normalized intensity"] - polyfit_baseline
-        df[f"baseline (`numpy.polyfit`, {polyfit_deg=})"] = polyfit_baseline / np.max(
-            df["intensity - polyfit baseline"]
-        )
-        df["intensity - polyfit baseline"] /= np.max(df["intensity - polyfit baseline"])
-
-        kernel_size = 101
-        median_baseline = medfilt(df["normalized intensity"], kernel_size=kernel_size)
-        df["intensity - median baseline"] = df["normalized intensity"] - median_baseline
-        df[f"baseline (`scipy.signal.medfilt`, {kernel_size=})"] = median_baseline / np.max(
-            df["intensity - median baseline"]
-        )
-        df["intensity - median baseline"] /= np.max(df["intensity - median baseline"])
-
-        # baseline calculation I used in my data
-        half_window = round(
-            0.03 * df.shape[0]
-        )  # a value which worked for my data, not sure how universally good it will be
-        baseline_fitter = Baseline(x_data=df["wavenumber"])
-        morphological_baseline = baseline_fitter.mor(
-            df["normalized intensity"], half_window=half_window
-        )[0]
-        df["intensity - morphological baseline"] = (
-            df["normalized intensity"] - morphological_baseline
-        )
-        df[f"baseline (`pybaselines.Baseline.mor`, {half_window=})"] = (
-            morphological_baseline / np.max(df["intensity - morphological baseline"])
-        )
-        df["intensity - morphological baseline"] /= np.max(df["intensity - morphological baseline"])
-        df.index.name = location.split("/")[-1]
-
-        y_options = [
-            "normalized intensity",
-            "intensity",
-            "sqrt(intensity)",
-            "log(intensity)",
-            "intensity - median baseline",
-            f"baseline (`scipy.signal.medfilt`, {kernel_size=})",
-            "intensity - polyfit baseline",
-            f"baseline (`numpy.polyfit`, {polyfit_deg=})",
-            "intensity - morphological baseline",
-            f"baseline (`pybaselines.Baseline.mor`, {half_window=})",
-        ]
-        return df, metadata, y_options
+        df.attrs["metadata"] = metadata
+        return df
 
     @classmethod
     def make_wdf_df(self, location: Path | str) -> pd.DataFrame:
@@ -169,7 +164,9 @@ class RamanBlock(DataBlock):
                     self.accepted_file_extensions,
                     ext,
                 )
-            pattern_dfs, _, y_options = self.load(file_info["location"])
+            pattern_dfs, _, y_options = self.load(
+                file_info["location"], y_columns=self.data.get("y_columns")
+            )
             pattern_dfs = [pattern_dfs]
 
         if pattern_dfs:
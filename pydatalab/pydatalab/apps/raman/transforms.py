@@ -0,0 +1,39 @@
+"""Derived columns that can be computed on demand for Raman spectra
+(see `pydatalab.transforms`), from the `wavenumber` and `intensity` columns
+of a parsed spectrum.
+
+"""
+
+from pybaselines import Baseline
+
+from pydatalab.transforms import (
+    TransformRegistry,
+    register_baseline,
+    register_spectrum_transforms,
+)
+
+__all__ = ("RAMAN_TRANSFORMS",)
+
+MORPHOLOGICAL_HALF_WINDOW_FRACTION = 0.03
+
+RAMAN_TRANSFORMS = TransformRegistry("raman")
+"""The derived columns available to `RamanBlock`, in the order they are offered for plotting."""
+
+register_spectrum_transforms(RAMAN_TRANSFORMS, "wavenumber")
+
+
+def _morphological_baseline(df, half_window_fraction):
+    # a window which worked for the original test data, not sure how universally good it will be
+    half_window = round(half_window_fraction * df.shape[0])
+    baseline_fitter = Baseline(x_data=df["wavenumber"])
+    return baseline_fitter.mor(df["normalized intensity"], half_window=half_window)[0]
+
+
+register_baseline(
+    RAMAN_TRANSFORMS,
+    "morphological",
+    "baseline (`pybaselines.Baseline.mor`, half_window=3% of points)",
+    _morphological_baseline,
+    depends_on=("wavenumber", "normalized intensity"),
+    parameters={"half_window_fraction": MORPHOLOGICAL_HALF_WINDOW_FRACTION},
+)
@@ -1,27 +1,131 @@
 import os
 from pathlib import Path
+from typing import Any, Dict, Tuple
 
 import bokeh
 import numpy as np
 import PIL
 from bokeh.layouts import column
-from bokeh.models import ColorBar, ColumnDataSource, LinearColorMapper
-from pybaselines import Baseline
+from bokeh.models import ColorBar, ColumnDataSource, HoverTool, LinearColorMapper
+from bokeh.palettes import Greys256
 from rsciio.renishaw import file_reader
 
 from pydatalab.blocks.base import DataBlock
+from pydatalab.config import CONFIG
 from pydatalab.file_utils import get_file_info_by_id
+from pydatalab.parsed_data import get_parsed_arrays
+
+from .utils import representative_indices, shade_density, spectra_density, subtract_baselines
+
+BASELINE_HALF_WINDOW = 30
+"""The half window of the morphological baseline subtracted from each spectrum."""
+
+COLOR_BY_OPTIONS = ("position", "intensity")
+"""The quantities that the points of the map can be coloured by."""
+
+MAX_OVERLAID_SPECTRA = 100
+"""Maps with more points than this have their spectra plotted as a density image."""
+
+DENSITY_IMAGE_SHAPE = (300, 700)
+"""The maximum (height, width) in bins of the density image of the spectra."""
+
+NUM_REPRESENTATIVE_SPECTRA = 5
+"""The number of individual spectra drawn over the density image, chosen at evenly
+spaced quantiles of the values the points are coloured by."""
+
+
+def _read_map_file(location: str) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """Reads a Raman map from a .wdf file with RosettaSciIO (once), subtracts a baseline
+    from every spectrum and extracts the optical image the map was measured on.
+
+    Returns:
+        A dictionary of arrays containing the Raman shift axis (`raman_shift`), the
+        baseline-subtracted spectra with one row per point of the map (`spectra`),
+        the coordinates of each point (`x` and `y`) and the optical image as
+        packed RGBA values (`image`, if present), alongside a dictionary describing
+        the extent of the image and the metadata of the measurement.
+
+    """
+    raman_data = file_reader(location)
+
+    if len(raman_data[0]["axes"]) == 3:
+        pass
+    elif len(raman_data[0]["axes"]) == 1:
+        raise RuntimeError("This block is for 2D Raman data, not 1D")
+    else:
+        raise RuntimeError("Data is not compatible 1D or 2D Raman data.")
+
+    raman_shift = None
+    for axis in raman_data[0]["axes"]:
+        if axis["name"] == "Raman Shift":
+            raman_shift = float(axis["offset"]) + float(axis["scale"]) * np.arange(
+                int(axis["size"])
+            )
+    if raman_shift is None:
+        raise RuntimeError("No Raman shift axis found in the map.")
+
+    # one spectrum per row, ordered by y then x
+    intensity_data = raman_data[0]["data"]
+    spectra = intensity_data.reshape(-1, intensity_data.shape[-1])
+    spectra = subtract_baselines(
+        spectra, half_window=BASELINE_HALF_WINDOW, processes=CONFIG.RAMAN_MAP_PROCESSES
+    )
+
+    original_metadata = raman_data[0]["original_metadata"]
+    size, scale, offset = (
+        original_metadata["WMAP_0"][key] for key in ("size_xyz", "scale_xyz", "offset_xyz")
+    )
+    x_coordinates, y_coordinates = np.meshgrid(
+        offset[0] + scale[0] * np.arange(size[0]), offset[1] + scale[1] * np.arange(size[1])
+    )
+
+    arrays = {
+        "raman_shift": raman_shift,
+        "spectra": spectra.astype(np.float32),
+        "x": x_coordinates.ravel(),
+        "y": y_coordinates.ravel(),
+    }
+    attrs: Dict[str, Any] = {"metadata": raman_data[0]["metadata"]}
+
+    if "WHTL_0" in original_metadata:
+        whtl = original_metadata["WHTL_0"]
+        # converts the image to packed RGBA values, as used by bokeh
+        image_array = np.flip(np.array(PIL.Image.open(whtl["image"]), dtype=np.uint8), axis=0)
+        image_array = np.dstack((image_array, 255 * np.ones_like(image_array[:, :, 0])))
+        arrays["image"] = np.ascontiguousarray(image_array).view(dtype=np.uint32)[:, :, 0]
+        attrs["origin"] = [float(o) for o in whtl["FocalPlaneXYOrigins"][:2]]
+        attrs["x_span"] = float(whtl["FocalPlaneXResolution"])
+        attrs["y_span"] = float(whtl["FocalPlaneYResolution"])
+
+    return arrays, attrs
 
 
 class RamanMapBlock(DataBlock):
     blocktype = "raman_map"
+    name = "Raman map"
     description = "Raman spectroscopy map"
     accepted_file_extensions = ".wdf"
 
+    defaults = {"color_by": "position"}
+
     @property
     def plot_functions(self):
         return (self.generate_raman_map_plot,)
 
+    @classmethod
+    def load_map(self, location: Path | str) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        """Loads the baseline-subtracted spectra, coordinates and image of a Raman map,
+        which are cached after the first read of each file (see `_read_map_file`).
+
+        Parameters:
+            location: The location of the file to read.
+
+        Returns:
+            The arrays and attributes described in `_read_map_file`.
+
+        """
+        return get_parsed_arrays(location, _read_map_file, parser_version=f"{BASELINE_HALF_WINDOW}")
+
     @classmethod
     def get_map_data(self, location: Path | str):
         """Read the .wdf file with RosettaSciIO and extract relevant
@@ -31,169 +135,139 @@ class RamanMapBlock(DataBlock):
             location: The location of the file to read.
 
         Returns:
-            col: list of numbers corresponding to colors of each scatter
-            point
-            p: plot of image and points Raman was measured
-            metadata: metadata associated witht the measurement
-
+            The Raman shift axis, the baseline-subtracted spectra of each point
+            and the metadata associated with the measurement.
 
         """
+        arrays, attrs = self.load_map(location)
+        return arrays["raman_shift"], arrays["spectra"], attrs.get("metadata", {})
 
-        raman_data = file_reader(location)
+    @staticmethod
+    def get_point_colors(arrays: Dict[str, np.ndarray], color_by: str = "position") -> np.ndarray:
+        """Returns the numbers used to colour each point of the map (and its spectrum).
 
-        if len(raman_data[0]["axes"]) == 3:
-            pass
-        elif len(raman_data[0]["axes"]) == 1:
-            raise RuntimeError("This block is for 2D Raman data, not 1D")
-        else:
-            raise RuntimeError("Data is not compatible 1D or 2D Raman data.")
-
-        for dictionary in raman_data[0]["axes"]:
-            if dictionary["name"] == "Raman Shift":
-                raman_shift = []
-                for i in range(int(dictionary["size"])):
-                    raman_shift.append(float(dictionary["offset"]) + float(dictionary["scale"]) * i)
-        return np.array(raman_shift), raman_data[0]["data"], raman_data[0]["metadata"]
-
-    def plot_raman_map(self, location: str | Path):
-        data = file_reader(location)
-        raman_shift, intensity_data, metadata = self.get_map_data(location)
-        x_coordinates = []
-        # gets the size, point spacing and original offset of x-axis
-        # check for origin
-        size_x = data[0]["original_metadata"]["WMAP_0"]["size_xyz"][0]
-        scale_x = data[0]["original_metadata"]["WMAP_0"]["scale_xyz"][0]
-        offset_x = data[0]["original_metadata"]["WMAP_0"]["offset_xyz"][0]
-        # generates x-coordinates
-        for i in range(size_x):
-            x_coordinates.append(i * scale_x + offset_x)
-        y_coordinates = []
-        # gets the size, point spacing and original offset of x-axis
-        size_y = data[0]["original_metadata"]["WMAP_0"]["size_xyz"][1]
-        scale_y = data[0]["original_metadata"]["WMAP_0"]["scale_xyz"][1]
-        offset_y = data[0]["original_metadata"]["WMAP_0"]["offset_xyz"][1]
-        # generates y-coordinates
-        for i in range(size_y):
-            y_coordinates.append(i * scale_y + offset_y)
-
-        coordinate_pairs = []
-        for y in y_coordinates:
-            for x in x_coordinates:
-                coordinate_pairs.append((x, y))
-
-        # extracts image and gets relevant data
-        image_data = data[0]["original_metadata"]["WHTL_0"]["image"]
-        image = PIL.Image.open(image_data)
-        origin = data[0]["original_metadata"]["WHTL_0"]["FocalPlaneXYOrigins"]
-        origin = [float(origin[0]), float(origin[1])]
-        x_span = float(data[0]["original_metadata"]["WHTL_0"]["FocalPlaneXResolution"])
-        y_span = float(data[0]["original_metadata"]["WHTL_0"]["FocalPlaneYResolution"])
-        # converts image to vector compatible with bokeh
-        image_array = np.array(image, dtype=np.uint8)
-        image_array = np.flip(image_array, axis=0)
-        image_array = np.dstack((image_array, 255 * np.ones_like(image_array[:, :, 0])))
-        img_vector = image_array.view(dtype=np.uint32).reshape(
-            (image_array.shape[0], image_array.shape[1])
-             )
-        # generates numbers for colours for points in linear gradient
-        col = [
-            i / (len(x_coordinates) * len(y_coordinates))
-            for i in range(len(x_coordinates) * len(y_coordinates))
-        ]
+        Parameters:
+            arrays: The map arrays, as returned by `load_map`.
+            color_by: Either `"position"`, to colour points by their order in the map,
+                or `"intensity"`, to colour points by their integrated intensity.
 
+        """
+        if color_by not in COLOR_BY_OPTIONS:
+            raise ValueError(
+                f"Cannot colour map by {color_by!r}, must be one of {COLOR_BY_OPTIONS}"
+            )
+        num_points = len(arrays["x"])
+        if color_by == "intensity":
+            return np.asarray(arrays["spectra"].sum(axis=1), dtype=np.float64)
+        return np.arange(num_points) / num_points
+
+    def plot_raman_map(self, arrays: Dict[str, np.ndarray], attrs: Dict[str, Any], col):
         # links x- and y-coordinates with colour numbers
-        source = ColumnDataSource(
-            data={
-                "x": [pair[0] for pair in coordinate_pairs],
-                "y": [pair[1] for pair in coordinate_pairs],
-                "col": col,
-            }
-        )
-        # gemerates colormap for coloured scatter poitns
-        exp_cmap = LinearColorMapper(palette="Turbo256", low=min(col), high=max(col))
+        source = ColumnDataSource(data={"x": arrays["x"], "y": arrays["y"], "col": col})
+        # generates colormap for coloured scatter points
+        exp_cmap = LinearColorMapper(palette="Turbo256", low=np.min(col), high=np.max(col))
 
-        # generates image figure and plots image
-        from pathlib import Path
+        if "image" in arrays:
+            image = arrays["image"]
+            origin, x_span, y_span = attrs["origin"], attrs["x_span"], attrs["y_span"]
+            p = bokeh.plotting.figure(
+                width=image.shape[1],
+                height=image.shape[0],
+                x_range=(origin[0], origin[0] + x_span),
+                y_range=(origin[1] + y_span, origin[1]),
+            )
+            p.image_rgba(
+                image=[np.asarray(image)], x=origin[0], y=origin[1] + y_span, dw=x_span, dh=y_span
+            )
+        else:
+            p = bokeh.plotting.figure(width=600, height=600, match_aspect=True)
 
-        p = bokeh.plotting.figure(
-            width=image_array.shape[1],
-            height=image_array.shape[0],
-            x_range=(origin[0], origin[0] + x_span),
-            y_range=(origin[1] + y_span, origin[1]),
-        )
-        p.image_rgba(image=[img_vector], x=origin[0], y=origin[1], dw=x_span, dh=y_span)
-        p = bokeh.plotting.figure(
-            width=image_data.shape[1],
-            height=image_data.shape[0],
-            x_range=(origin[0], origin[0] + x_span),
-            y_range=(origin[1] + y_span, origin[1]),
-        )
-        p.image_rgba(image=[img_vector], x=origin[0], y=origin[1] + y_span, dw=x_span, dh=y_span)
         # plot scatter points and colorbar
         p.circle("x", "y", size=10, source=source, color={"field": "col", "transform": exp_cmap})
         color_bar = ColorBar(
             color_mapper=exp_cmap, label_standoff=12, border_line_color=None, location=(0, 0)
         )
         p.add_layout(color_bar, "right")
-        bokeh.plotting.save(p)
-        # return color numbers to use in spectra plotting and returns figure object
+        return p
 
-        bokeh.plotting.output_file(Path(__file__).parent / "plot.html")
-        return col, p, metadata
+    def plot_raman_spectra(self, arrays: Dict[str, np.ndarray], col):
+        """Plots the baseline-subtracted spectra of the map.
 
-    def plot_raman_spectra(self, location: str | Path, col):
-        """Read the .wdf file with RosettaSciIO and extract relevant
-        data.
+        Small maps are plotted as one line per point. Otherwise, all of the spectra
+        are binned into a density image on the server (see `spectra_density`),
+        overlaid with the mean spectrum and a few representative spectra, so that
+        the size of the plot does not depend on the number of points in the map.
 
         Parameters:
-            location: The location of the file to read.
+            arrays: The map arrays, as returned by `load_map`.
             col: list of numbers corresponding to colors of the points generated
             in the map plot
 
         Returns:
             Bokeh plot of the Raman spectra
 
-
         """
-        # generates plot and extracts raman spectra from .wdf file
         p = bokeh.plotting.figure(
             width=800,
             height=400,
             x_axis_label="Raman Shift (cm-1)",
             y_axis_label="Intensity (a.u.)",
         )
-        raman_shift, intensity_data, metadata = self.get_map_data(location)
-        intensity_list = []
-
-        # generates baseline to be subtracted from spectra
-        def generate_baseline(x_data, y_data):
-            baseline_fitter = Baseline(x_data=x_data)
-            baseline = baseline_fitter.mor(y_data, half_window=30)[0]
-            return baseline
-
-        # the bokeh ColumnDataSource works was easiest for me to work with this as a list so making list of spectra intensities
-        for i in range(intensity_data.shape[0]):
-            for j in range(intensity_data.shape[1]):
-                intensity_spectrum = intensity_data[i, j, :]
-                # want to make optional but will leave for now
-                baseline = generate_baseline(raman_shift, intensity_spectrum)
-                intensity_spectrum = intensity_spectrum - baseline
-                intensity_list.append(intensity_spectrum)
-
-        # generates colorbar
+        raman_shift = np.asarray(arrays["raman_shift"])
+        spectra = arrays["spectra"]
+        exp_cmap = LinearColorMapper(palette="Turbo256", low=np.min(col), high=np.max(col))
+
+        if len(spectra) <= MAX_OVERLAID_SPECTRA:
+            source = ColumnDataSource(
+                data={"x": [raman_shift] * len(spectra), "y": list(np.asarray(spectra)), "col": col}
+            )
+            p.multi_line(
+                "x",
+                "y",
+                line_width=0.5,
+                source=source,
+                color={"field": "col", "transform": exp_cmap},
+            )
+            return p
+
+        counts, x_range, y_range = spectra_density(raman_shift, spectra, DENSITY_IMAGE_SHAPE)
+        density_cmap = LinearColorMapper(
+            palette=Greys256[::-1], low=1, high=255, low_color=(0, 0, 0, 0)
+        )
+        p.image(
+            image=[shade_density(counts)],
+            x=x_range[0],
+            y=y_range[0],
+            dw=x_range[1] - x_range[0],
+            dh=y_range[1] - y_range[0],
+            color_mapper=density_cmap,
+        )
+
+        indices = representative_indices(col, NUM_REPRESENTATIVE_SPECTRA)
         source = ColumnDataSource(
-            data={"x": [raman_shift] * len(intensity_list), "y": intensity_list, "col": col}
+            data={
+                "x": [raman_shift] * len(indices),
+                "y": [np.asarray(spectra[i]) for i in indices],
+                "col": np.asarray(col)[indices],
+                "point": indices,
+            }
+        )
+        lines = p.multi_line(
+            "x", "y", line_width=1, source=source, color={"field": "col", "transform": exp_cmap}
         )
-        exp_cmap = LinearColorMapper(palette="Turbo256", low=min(col), high=max(col))
-        # plots spectra
-        p.multi_line(
-            "x", "y", line_width=0.5, source=source, color={"field": "col", "transform": exp_cmap}
+        p.add_tools(HoverTool(renderers=[lines], tooltips=[("point", "@point")]))
+        p.line(
+            raman_shift,
+            np.mean(spectra, axis=0, dtype=np.float64),
+            line_width=1.5,
+            line_dash="dashed",
+            color="black",
+            legend_label="mean",
         )
         return p
 
     def generate_raman_map_plot(self):
         file_info = None
-        pattern_dfs = None
 
         if "file_id" not in self.data:
             return None
@@ -203,10 +277,13 @@ class RamanMapBlock(DataBlock):
             ext = os.path.splitext(file_info["location"].split("/")[-1])[-1].lower()
             if ext not in self.accepted_file_extensions:
                 raise RuntimeError(
-                    "RamanBlock.generate_raman_plot(): Unsupported file extension (must be one of %s), not %s",
+                    "RamanMapBlock.generate_raman_map_plot(): Unsupported file extension (must be one of %s), not %s",
                     self.accepted_file_extensions,
                     ext,
                 )
-        col, p1, metadata = self.plot_raman_map(file_info["location"])
-        p2 = self.plot_raman_spectra(file_info["location"], col=col)
+
+        arrays, attrs = self.load_map(file_info["location"])
+        col = self.get_point_colors(arrays, self.data.get("color_by", self.defaults["color_by"]))
+        p1 = self.plot_raman_map(arrays, attrs, col)
+        p2 = self.plot_raman_spectra(arrays, col)
         self.data["bokeh_plot_data"] = bokeh.embed.json_item(column(p1, p2))
@@ -0,0 +1,130 @@
+from typing import Tuple
+
+import numpy as np
+from scipy.ndimage import grey_dilation, grey_erosion, grey_opening
+
+from pydatalab.worker_pool import map_in_worker_pool
+
+
+def morphological_baselines(spectra: np.ndarray, half_window: int) -> np.ndarray:
+    """Fits a morphological baseline to every spectrum (row) of a 2D array at once.
+
+    This is equivalent to calling `pybaselines.Baseline.mor(spectrum, half_window=half_window)`
+    on each spectrum in turn, but performs the morphological operations on the whole array,
+    with a window that only extends along each spectrum.
+
+    Parameters:
+        spectra: An array of shape `(num_spectra, num_points)`.
+        half_window: The half window size of the morphological operations.
+
+    Returns:
+        The baselines, with the same shape as `spectra`.
+
+    """
+    spectra = np.asarray(spectra, dtype=np.float64)
+    window = (1, 2 * half_window + 1)
+    opening = grey_opening(spectra, size=window)
+    average = 0.5 * (grey_dilation(opening, size=window) + grey_erosion(opening, size=window))
+    return np.minimum(opening, average)
+
+
+def subtract_baselines(spectra: np.ndarray, half_window: int, processes: int = 1) -> np.ndarray:
+    """Subtracts a morphological baseline from every spectrum (row) of a 2D array.
+
+    Parameters:
+        spectra: An array of shape `(num_spectra, num_points)`.
+        half_window: The half window size of the morphological operations.
+        processes: The number of tasks to split the spectra between on the shared
+            worker pool (see `pydatalab.worker_pool`); the baselines are fitted in the
+            current process when set to 1, or if this process has no worker pool.
+
+    Returns:
+        The baseline-subtracted spectra.
+
+    """
+    spectra = np.asarray(spectra, dtype=np.float64)
+    baselines = None
+    if processes > 1 and len(spectra) > 1:
+        chunks = np.array_split(spectra, min(processes, len(spectra)))
+        chunked_baselines = map_in_worker_pool(
+            morphological_baselines, chunks, [half_window] * len(chunks)
+        )
+        if chunked_baselines is not None:
+            baselines = np.concatenate(chunked_baselines)
+
+    if baselines is None:
+        baselines = morphological_baselines(spectra, half_window)
+
+    return spectra - baselines
+
+
+def spectra_density(
+    raman_shift: np.ndarray,
+    spectra: np.ndarray,
+    shape: Tuple[int, int],
+    chunk_size: int = 1024,
+) -> Tuple[np.ndarray, Tuple[float, float], Tuple[float, float]]:
+    """Bins every point of every spectrum into a 2D histogram of intensity against
+    Raman shift, i.e., a density image of the overlaid spectra whose size does not
+    depend on the number of spectra.
+
+    Parameters:
+        raman_shift: The Raman shift axis shared by all spectra.
+        spectra: An array of shape `(num_spectra, len(raman_shift))`.
+        shape: The maximum `(height, width)` of the image in bins; the width is
+            reduced to the number of points in each spectrum if smaller.
+        chunk_size: The number of spectra binned at once, to bound memory usage.
+
+    Returns:
+        The counts in each bin as an array of shape `(height, width)` (with the lowest
+        intensities in the first row), and the `(min, max)` extent of the bins along
+        the Raman shift and intensity axes.
+
+    """
+    raman_shift = np.asarray(raman_shift, dtype=np.float64)
+    height, width = shape[0], min(shape[1], len(raman_shift))
+
+    x_range = (float(raman_shift.min()), float(raman_shift.max()))
+    y_range = (float(np.nanmin(spectra)), float(np.nanmax(spectra)))
+    x_span = (x_range[1] - x_range[0]) or 1.0
+    y_span = (y_range[1] - y_range[0]) or 1.0
+
+    x_index = np.clip(((raman_shift - x_range[0]) / x_span * width).astype(np.int64), 0, width - 1)
+    counts = np.zeros(height * width, dtype=np.int64)
+    for start in range(0, len(spectra), chunk_size):
+        chunk = np.asarray(spectra[start : start + chunk_size], dtype=np.float64)
+        finite = np.isfinite(chunk)
+        y_index = np.clip(
+            ((chunk[finite] - y_range[0]) / y_span * height).astype(np.int64), 0, height - 1
+        )
+        flat = y_index * width + np.broadcast_to(x_index, chunk.shape)[finite]
+        counts += np.bincount(flat, minlength=height * width)
+
+    return counts.reshape(height, width), x_range, y_range
+
+
+def shade_density(counts: np.ndarray) -> np.ndarray:
+    """Maps histogram counts onto 255 levels on a logarithmic scale, so that both
+    rare and common features of the spectra remain visible.
+
+    Returns:
+        A `uint8` array of the same shape, with 0 for empty bins and 1-255 otherwise.
+
+    """
+    log_counts = np.log1p(counts)
+    scale = log_counts.max() or 1.0
+    levels = 1 + np.round(254 * log_counts / scale)
+    return np.where(counts > 0, levels, 0).astype(np.uint8)
+
+
+def representative_indices(values: np.ndarray, num: int) -> np.ndarray:
+    """Returns the indices of (at most) `num` points whose values are closest
+    to evenly spaced quantiles of all the values, from lowest to highest.
+
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) <= num:
+        return np.argsort(values, kind="stable")
+    order = np.argsort(values, kind="stable")
+    positions = np.round(np.linspace(0, len(values) - 1, num)).astype(np.int64)
+    return order[np.unique(positions)]
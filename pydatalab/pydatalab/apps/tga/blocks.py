@@ -3,6 +3,7 @@ from pathlib import Path
 from typing import List, Tuple
 
 import bokeh
+import pandas as pd
 from bokeh.layouts import gridplot
 from scipy.signal import savgol_filter
 
@@ -11,6 +12,19 @@ from pydatalab.blocks.base import DataBlock
 from pydatalab.bokeh_plots import DATALAB_BOKEH_GRID_THEME, selectable_axes_plot
 from pydatalab.file_utils import get_file_info_by_id
 from pydatalab.logger import LOGGER
+from pydatalab.parsed_data import get_parsed_data
+
+
+def _parse_ms_file(location: str) -> pd.DataFrame:
+    """Parses a mass spectrometry file into a single dataframe, with a
+    `species` column distinguishing the data for each species and the
+    header metadata stored in `DataFrame.attrs["meta"]`.
+
+    """
+    ms_data = parse_mt_mass_spec_ascii(Path(location))
+    df = pd.concat(ms_data["data"], names=["species", None]).reset_index(level="species")
+    df.attrs["meta"] = ms_data["meta"]
+    return df
 
 
 class MassSpecBlock(DataBlock):
@@ -42,7 +56,14 @@ class MassSpecBlock(DataBlock):
                 )
                 return
 
-            ms_data = parse_mt_mass_spec_ascii(Path(file_info["location"]))
+            ms_df = get_parsed_data(file_info["location"], _parse_ms_file)
+            ms_data = {
+                "meta": ms_df.attrs.get("meta", {}),
+                "data": {
+                    species: species_df.drop(columns="species")
+                    for species, species_df in ms_df.groupby("species", sort=False)
+                },
+            }
 
         x_options = ["Time Relative [s]"]
 
@@ -1,19 +1,35 @@
 import os
-from typing import List, Tuple
+from typing import List, Sequence, Tuple
 
 import bokeh
 import numpy as np
 import pandas as pd
-from scipy.signal import medfilt
 
 from pydatalab.blocks.base import DataBlock
 from pydatalab.bokeh_plots import DATALAB_BOKEH_THEME, selectable_axes_plot
 from pydatalab.file_utils import get_file_info_by_id
 from pydatalab.logger import LOGGER
 from pydatalab.mongo import flask_mongo
+from pydatalab.parsed_data import get_parsed_data, get_parsed_data_key
 
+from .transforms import XRD_TRANSFORMS
 from .utils import parse_xrdml
 
+PATTERN_PARSER_VERSION = "2"
+
+
+def _parse_pattern_file(location: str) -> pd.DataFrame:
+    """Parses the raw 2θ and intensity columns of a diffraction pattern file."""
+    ext = os.path.splitext(location.split("/")[-1])[-1].lower()
+
+    if ext == ".xrdml":
+        return parse_xrdml(location)
+
+    elif ext == ".xy":
+        return pd.read_csv(location, sep=r"\s+", names=["twotheta", "intensity"])
+
+    return pd.read_csv(location, sep=r"\s+", names=["twotheta", "intensity", "error"])
+
 
 class XRDBlock(DataBlock):
     blocktype = "xrd"
@@ -21,31 +37,58 @@ class XRDBlock(DataBlock):
     description = "Visualize XRD patterns and perform simple baseline corrections."
     accepted_file_extensions = (".xrdml", ".xy", ".dat", ".xye")
 
-    defaults = {"wavelength": 1.54060}
+    transforms = XRD_TRANSFORMS
+
+    defaults = {
+        "wavelength": 1.54060,
+        "y_columns": ["normalized intensity", "sqrt(intensity)", "log(intensity)"],
+    }
 
     @property
     def plot_functions(self):
         return (self.generate_xrd_plot,)
 
+    def _get_render_file_ids(self):
+        if "file_id" not in self.data:
+            # If no file set, all of the files attached to the item will be plotted
+            item_info = flask_mongo.db.items.find_one(
+                {"item_id": self.data["item_id"]}, projection={"file_ObjectIds": 1}
+            )
+            return [str(f) for f in (item_info or {}).get("file_ObjectIds", [])]
+        return super()._get_render_file_ids()
+
     @classmethod
     def load_pattern(
-        self, location: str, wavelength: float | None = None
+        self,
+        location: str,
+        wavelength: float | None = None,
+        y_columns: Sequence[str] | None = None,
     ) -> Tuple[pd.DataFrame, List[str]]:
-        if not isinstance(location, str):
-            location = str(location)
+        """Loads a diffraction pattern and computes the requested derived columns.
 
-        ext = os.path.splitext(location.split("/")[-1])[-1].lower()
+        Parameters:
+            location: The location of the pattern file.
+            wavelength: The wavelength (in Å) used to compute Q and d-spacings,
+                which are omitted if no wavelength is given.
+            y_columns: The derived intensity columns to compute (see `XRD_TRANSFORMS`),
+                defaults to all of them.
 
-        if ext == ".xrdml":
-            df = parse_xrdml(location)
+        Returns:
+            The pattern dataframe and the list of columns that can be plotted on the y-axis.
 
-        elif ext == ".xy":
-            df = pd.read_csv(location, sep=r"\s+", names=["twotheta", "intensity"])
+        """
+        if not isinstance(location, str):
+            location = str(location)
 
-        else:
-            df = pd.read_csv(location, sep=r"\s+", names=["twotheta", "intensity", "error"])
+        df = get_parsed_data(location, _parse_pattern_file, parser_version=PATTERN_PARSER_VERSION)
+        df = df.rename(columns={"twotheta": "2θ (°)", "omega": "ω (°)"})
 
-        df = df.rename(columns={"twotheta": "2θ (°)"})
+        try:
+            cache_key = get_parsed_data_key(
+                location, _parse_pattern_file, parser_version=PATTERN_PARSER_VERSION
+            )
+        except OSError:
+            cache_key = None
 
         # if no wavelength (or invalid wavelength) is passed, don't convert to Q and d
         if wavelength:
@@ -55,38 +98,14 @@ class XRDBlock(DataBlock):
             except (ValueError, ZeroDivisionError):
                 pass
 
-        df["sqrt(intensity)"] = np.sqrt(df["intensity"])
-        df["log(intensity)"] = np.log10(df["intensity"])
-        df["normalized intensity"] = df["intensity"] / np.max(df["intensity"])
-        polyfit_deg = 15
-        polyfit_baseline = np.poly1d(
-            np.polyfit(df["2θ (°)"], df["normalized intensity"], deg=polyfit_deg)
-        )(df["2θ (°)"])
-        df["intensity - polyfit baseline"] = df["normalized intensity"] - polyfit_baseline
-        df["intensity - polyfit baseline"] /= np.max(df["intensity - polyfit baseline"])
-        df[f"baseline (`numpy.polyfit`, deg={polyfit_deg})"] = polyfit_baseline / np.max(
-            df["intensity - polyfit baseline"]
-        )
-
-        kernel_size = 101
-        median_baseline = medfilt(df["normalized intensity"], kernel_size=kernel_size)
-        df["intensity - median baseline"] = df["normalized intensity"] - median_baseline
-        df["intensity - median baseline"] /= np.max(df["intensity - median baseline"])
-        df[f"baseline (`scipy.signal.medfilt`, kernel_size={kernel_size})"] = (
-            median_baseline / np.max(df["intensity - median baseline"])
-        )
+        XRD_TRANSFORMS.evaluate(df, y_columns, cache_key=cache_key)
 
         df.index.name = location.split("/")[-1]
 
         y_options = [
-            "normalized intensity",
-            "intensity",
-            "sqrt(intensity)",
-            "log(intensity)",
-            "intensity - median baseline",
-            f"baseline (`scipy.signal.medfilt`, kernel_size={kernel_size})",
-            "intensity - polyfit baseline",
-            f"baseline (`numpy.polyfit`, deg={polyfit_deg})",
+            c
+            for c in dict.fromkeys(("normalized intensity", "intensity", *XRD_TRANSFORMS.options))
+            if c in df.columns
         ]
 
         return df, y_options
@@ -121,6 +140,7 @@ class XRDBlock(DataBlock):
                     pattern_df, y_options = self.load_pattern(
                         f["location"],
                         wavelength=float(self.data.get("wavelength", self.defaults["wavelength"])),
+                        y_columns=self.data.get("y_columns"),
                     )
                 except Exception as exc:
                     raise RuntimeError(
@@ -141,13 +161,17 @@ class XRDBlock(DataBlock):
             pattern_dfs, y_options = self.load_pattern(
                 file_info["location"],
                 wavelength=float(self.data.get("wavelength", self.defaults["wavelength"])),
+                y_columns=self.data.get("y_columns"),
             )
             pattern_dfs = [pattern_dfs]
 
         if pattern_dfs:
+            x_options = ["2θ (°)", "Q (Å⁻¹)", "d (Å)"]
+            if all("ω (°)" in df for df in pattern_dfs):
+                x_options.append("ω (°)")
             p = selectable_axes_plot(
                 pattern_dfs,
-                x_options=["2θ (°)", "Q (Å⁻¹)", "d (Å)"],
+                x_options=x_options,
                 y_options=y_options,
                 plot_line=True,
                 plot_points=True,
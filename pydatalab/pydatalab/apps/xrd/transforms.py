@@ -0,0 +1,14 @@
+"""Derived columns that can be computed on demand for diffraction patterns
+(see `pydatalab.transforms`), from the `2θ (°)` and `intensity` columns of a
+parsed pattern.
+
+"""
+
+from pydatalab.transforms import TransformRegistry, register_spectrum_transforms
+
+__all__ = ("XRD_TRANSFORMS",)
+
+XRD_TRANSFORMS = TransformRegistry("xrd")
+"""The derived columns available to `XRDBlock`, in the order they are offered for plotting."""
+
+register_spectrum_transforms(XRD_TRANSFORMS, "2θ (°)")
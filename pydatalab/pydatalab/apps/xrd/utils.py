@@ -1,7 +1,8 @@
 import os
 import re
 import warnings
-from typing import List, Tuple
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
@@ -11,33 +12,131 @@ STARTEND_REGEX = (
 )
 DATA_REGEX = r'<(intensities|counts) unit="counts">((-?\d+ )+-?\d+)</(intensities|counts)>'
 
+XRDML_AXIS_COLUMNS = {"2Theta": "twotheta", "Omega": "omega"}
+"""The scan axes that are returned by `parse_xrdml`, and their column names."""
+
 
 class XrdmlParseError(Exception):
     pass
 
 
-def parse_xrdml(filename: str) -> pd.DataFrame:
-    """Parses an XRDML file and returns a pandas DataFrame with columns
-    twotheta and intensity.
+def _local_name(tag: str) -> str:
+    """Strips the XML namespace from a tag."""
+    return tag.rpartition("}")[2]
+
+
+def _parse_values(text: Optional[str]) -> np.ndarray:
+    """Decodes a whitespace-separated block of numbers (e.g., intensities) into an array."""
+    if not text:
+        return np.empty(0)
+    return np.fromstring(text, sep=" ")
+
+
+def _axis_positions(positions: ET.Element, num_points: int) -> np.ndarray:
+    """Returns the position of an axis at each data point, from either its
+    start and end positions, an explicit list of positions or a common position.
+
+    """
+    values = {_local_name(child.tag): child.text for child in positions}
+    if "listPositions" in values:
+        return _parse_values(values["listPositions"])
+    if "startPosition" in values and "endPosition" in values:
+        return np.linspace(
+            float(values["startPosition"]), float(values["endPosition"]), num=num_points
+        )
+    if "commonPosition" in values:
+        return np.full(num_points, float(values["commonPosition"]))
+    raise XrdmlParseError(f"no positions were found for the {positions.get('axis')} axis")
+
+
+def _parse_data_points(data_points: ET.Element) -> Dict[str, np.ndarray]:
+    """Extracts the intensities and the positions of each axis from a `dataPoints` element."""
+    intensities = None
+    for child in data_points:
+        if _local_name(child.tag) in ("intensities", "counts"):
+            intensities = _parse_values(child.text)
+            break
+
+    if intensities is None or not len(intensities):
+        raise XrdmlParseError("the intensitites were not found in the XML file")
+
+    scan = {}
+    for child in data_points:
+        if _local_name(child.tag) == "positions" and child.get("axis") in XRDML_AXIS_COLUMNS:
+            positions = _axis_positions(child, len(intensities))
+            if len(positions) != len(intensities):
+                raise XrdmlParseError(
+                    f"found {len(positions)} {child.get('axis')} positions for {len(intensities)} intensities"
+                )
+            scan[XRDML_AXIS_COLUMNS[child.get("axis")]] = positions
+
+    if "twotheta" not in scan:
+        raise XrdmlParseError("the start and end 2theta positions were not found in the XRDML file")
+
+    scan["intensity"] = intensities
+    return scan
+
+
+def iter_xrdml_scans(filename: str) -> Iterator[Dict[str, np.ndarray]]:
+    """Incrementally parses an XRDML file, yielding the data of each scan in turn.
+
+    The file is read in chunks with `xml.etree.ElementTree.iterparse`, and each
+    element is discarded once it has been processed, so that only a single scan
+    is ever held in memory.
 
     Parameters:
         filename: The file to parse.
 
+    Yields:
+        A dictionary containing the `intensity` array of each scan, alongside
+        the position arrays for each of the axes in `XRDML_AXIS_COLUMNS` that
+        are present in the file.
+
     """
-    with open(filename) as f:
-        s = f.read()
+    in_scan = False
+    try:
+        for event, element in ET.iterparse(filename, events=("start", "end")):
+            tag = _local_name(element.tag)
+            if event == "start":
+                in_scan = in_scan or tag == "scan"
+                continue
+
+            if tag == "dataPoints":
+                yield _parse_data_points(element)
+            if tag == "scan":
+                in_scan = False
+            # Keep the children of a scan until its data points have been read,
+            # but discard everything else as soon as it has been parsed
+            if not in_scan or tag == "dataPoints":
+                element.clear()
+    except ET.ParseError as exc:
+        raise XrdmlParseError(f"unable to parse XRDML file: {exc}") from exc
+
+
+def parse_xrdml(filename: str, scan: Optional[int] = 0) -> pd.DataFrame:
+    """Parses an XRDML file and returns a pandas DataFrame with columns
+    twotheta and intensity (and omega, if present in the file).
+
+    Parameters:
+        filename: The file to parse.
+        scan: The index of the scan to return, or `None` to return all scans,
+            with an additional `scan` column containing the index of each.
 
-    start, end = getStartEnd(s)  # extract first and last angle
-    intensities = getIntensities(s)  # extract intensities
+    Raises:
+        XrdmlParseError: if the file contains no (or not enough) scans.
 
-    angles = np.linspace(start, end, num=len(intensities))
+    """
+    scans = []
+    for index, data in enumerate(iter_xrdml_scans(str(filename))):
+        if scan is None:
+            scans.append(pd.DataFrame({**data, "scan": index}))
+        elif index == scan:
+            return pd.DataFrame(data)
+
+    if not scans:
+        raise XrdmlParseError(f"scan {scan} was not found in the XRDML file")
 
-    return pd.DataFrame(
-        {
-            "twotheta": angles,
-            "intensity": intensities,
-        }
-    )
+    return pd.concat(scans, ignore_index=True)
 
 
 def convertSinglePattern(
@@ -70,13 +169,11 @@ def convertSinglePattern(
             )
             return outfn
 
-    with open(filename) as f:
-        s = f.read()
-
     print(f"Processing file {filename}")
-    start, end = getStartEnd(s)
+    df = parse_xrdml(filename)
+    start, end = df["twotheta"].iloc[0], df["twotheta"].iloc[-1]
     print(f"\tstart angle: {start}\tend angle: {end}")
-    intensities = getIntensities(s)
+    intensities = df["intensity"].tolist()
 
     if adjust_baseline:
         _intensities = np.array(intensities)  # type: ignore
@@ -101,7 +198,8 @@ def convertSinglePattern(
 
 def getStartEnd(s: str) -> Tuple[float, float]:
     """Parse a given string representation of an xrdml file to find the start and end 2Theta points of the scan.
-    Note: this could match either Omega or 2Theta depending on their order in the XRDML file.
+    Note: this could match either Omega or 2Theta depending on their order in the XRDML file;
+    prefer `parse_xrdml`, which does not require the whole file to be read into memory.
 
     Raises:
         XrdmlParseError: if the start and end positions could not be found.
@@ -121,7 +219,8 @@ def getStartEnd(s: str) -> Tuple[float, float]:
 
 
 def getIntensities(s: str) -> List[float]:
-    """Parse a given string representation of an xrdml file to find the peak intensities.
+    """Parse a given string representation of an xrdml file to find the peak intensities
+    of the first scan; prefer `parse_xrdml`, which is faster and handles multiple scans.
 
     Raises:
         XrdmlParseError: if intensities could not be found in the file
@@ -15,7 +15,8 @@ def take_snapshot(snapshot_path: Path, encrypt: bool = False) -> None:
     config files.
 
     Creates a tar file with the following structure:
-        - `./files/` - contains all files in `CONFIG.FILE_DIRECTORY`
+        - `./files/` - contains all files in `CONFIG.FILE_DIRECTORY`, where files
+          linked to the same blob (see `pydatalab.blobs`) are only stored once
         - `./mongodb/` - contains a dump of the mongodb database
         - `./config/` - contains a dump of the server config
 
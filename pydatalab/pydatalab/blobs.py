@@ -0,0 +1,122 @@
+"""This module implements a content-addressed store for the contents of files,
+so that identical files attached to many items (e.g., a reference pattern or
+a cycler export) are only stored on disk once.
+
+Each distinct file contents is stored once as a "blob" under
+`FILE_DIRECTORY/.blobs`, named by its SHA-256 hash. Files keep their usual
+`location` (`FILE_DIRECTORY/<file_id>/<filename>`), which is a hard link to the
+blob, so anything that reads files from their location is unaffected, and
+snapshots of the file store (see `pydatalab.backups`) also only contain each blob
+once. The blob of the current revision of a file is recorded in its `blob` field,
+and the number of files referencing each blob is counted in the `blobs`
+collection, so that blobs are removed once no file references them.
+
+As the contents of a blob are shared, files must never be modified in place:
+new contents are instead written to a temporary file that then replaces the file
+(with `os.replace`), and blobs are made read-only to guard against this.
+
+Existing files can be moved into the store with the `migration.store-file-blobs`
+task.
+
+"""
+
+import datetime
+import os
+import stat
+import uuid
+from pathlib import Path
+from typing import Optional, Union
+
+from pymongo import ReturnDocument
+
+import pydatalab.mongo
+from pydatalab.config import CONFIG
+from pydatalab.logger import LOGGER
+
+__all__ = (
+    "BLOBS_COLLECTION",
+    "get_blob_path",
+    "store_blob",
+    "release_blob",
+)
+
+BLOBS_COLLECTION = "blobs"
+"""The name of the MongoDB collection used to count references to each blob."""
+
+_BLOB_DIRECTORY = ".blobs"
+
+
+def _collection():
+    return pydatalab.mongo.get_database()[BLOBS_COLLECTION]
+
+
+def get_blob_path(sha256: str) -> Path:
+    """Returns the path at which the blob with the given hash is stored."""
+    return Path(CONFIG.FILE_DIRECTORY) / _BLOB_DIRECTORY / sha256[:2] / sha256
+
+
+def store_blob(location: Union[str, Path], sha256: str) -> Optional[str]:
+    """Stores the contents of a file in the blob store, replacing the file with a
+    link to an existing blob if one with the same contents is already stored.
+
+    Parameters:
+        location: The location of the file, which should not yet be referenced
+            by the blob store.
+        sha256: The SHA-256 hash of the contents of the file.
+
+    Returns:
+        The hash of the blob the file is now linked to, which should be recorded
+        as the `blob` of the file, or `None` if the file could not be stored
+        (e.g., if the file store does not support hard links).
+
+    """
+    blob_path = get_blob_path(sha256)
+    size = os.path.getsize(location)
+    _collection().update_one(
+        {"_id": sha256},
+        {
+            "$inc": {"refcount": 1},
+            "$setOnInsert": {
+                "size": size,
+                "created": datetime.datetime.now(tz=datetime.timezone.utc),
+            },
+        },
+        upsert=True,
+    )
+
+    try:
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(location, blob_path)
+            os.chmod(blob_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        except FileExistsError:
+            if not os.path.samefile(location, blob_path):
+                temporary = f"{location}.{uuid.uuid4().hex}.link"
+                os.link(blob_path, temporary)
+                os.replace(temporary, location)
+                LOGGER.debug("Linked %s to existing blob %s", location, sha256)
+    except OSError as exc:
+        LOGGER.warning("Unable to store %s in the blob store: %r", location, exc)
+        release_blob(sha256)
+        return None
+
+    return sha256
+
+
+def release_blob(sha256: Optional[str]) -> None:
+    """Removes a reference to a blob (e.g., when the file linked to it has new
+    contents), removing the blob once it is no longer referenced.
+
+    """
+    if not sha256:
+        return
+
+    blob = _collection().find_one_and_update(
+        {"_id": sha256}, {"$inc": {"refcount": -1}}, return_document=ReturnDocument.AFTER
+    )
+    if blob is None or blob["refcount"] > 0:
+        return
+
+    if _collection().delete_one({"_id": sha256, "refcount": {"$lte": 0}}).deleted_count:
+        LOGGER.debug("Removing unreferenced blob %s", sha256)
+        get_blob_path(sha256).unlink(missing_ok=True)
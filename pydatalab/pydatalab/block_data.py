@@ -0,0 +1,188 @@
+"""This module implements a store for large fields of data blocks (e.g., chat
+messages, NMR parameters or encoded images) outside of the item and collection
+documents that the blocks belong to.
+
+When a block is saved, any field whose BSON-encoded size exceeds
+`CONFIG.BLOCK_DATA_OFFLOAD_SIZE` is written to a GridFS bucket (`BLOCK_DATA_BUCKET`)
+and removed from the stored block, with a reference to the stored field recorded
+under the `offloaded_fields` key of the block instead. Item documents therefore
+stay small (and below the MongoDB document size limit), so that queries that do
+not need the contents of the blocks do not have to transfer them. The fields are
+restored with `load_offloaded_fields` when a block is rendered.
+
+Stored fields are named by the SHA-256 hash of their encoded contents, so saving a
+block whose large fields have not changed does not write them again, and copies of
+an item share the same stored fields. Stored fields that are no longer referenced
+by any block can be removed with `prune_block_data`.
+
+"""
+
+import datetime
+import hashlib
+from typing import Any, Dict, Iterable, Optional, Set
+
+import bson
+import gridfs
+
+import pydatalab.mongo
+from pydatalab.config import CONFIG
+from pydatalab.logger import LOGGER
+
+__all__ = (
+    "BLOCK_DATA_BUCKET",
+    "OFFLOADED_FIELDS_KEY",
+    "offload_block_fields",
+    "load_offloaded_fields",
+    "prune_block_data",
+)
+
+BLOCK_DATA_BUCKET = "blockData"
+"""The name of the GridFS bucket used to store large block fields."""
+
+OFFLOADED_FIELDS_KEY = "offloaded_fields"
+"""The block data key under which references to the stored fields are recorded."""
+
+INLINE_BLOCK_KEYS = (
+    "blocktype",
+    "block_id",
+    "item_id",
+    "collection_id",
+    "file_id",
+    "file_ids",
+    "title",
+    OFFLOADED_FIELDS_KEY,
+)
+"""Block data keys that are always stored inside the item document, as they
+are used to query or identify blocks."""
+
+_PRUNE_MIN_AGE = datetime.timedelta(hours=1)
+
+
+def _bucket() -> gridfs.GridFS:
+    return gridfs.GridFS(pydatalab.mongo.get_database(), collection=BLOCK_DATA_BUCKET)
+
+
+def _store_field(encoded: bytes) -> str:
+    """Stores an encoded field in the bucket (if not already present), returning its hash."""
+    digest = hashlib.sha256(encoded).hexdigest()
+    bucket = _bucket()
+    if not bucket.exists(digest):
+        try:
+            bucket.put(encoded, _id=digest)
+        except gridfs.errors.FileExists:
+            # Stored concurrently by another request
+            pass
+    return digest
+
+
+def offload_block_fields(
+    block_data: Dict[str, Any], min_size: Optional[int] = None
+) -> Dict[str, Any]:
+    """Stores any large fields of a block in the block data store, and returns
+    the block data to store in the item document in their place.
+
+    Fields that are referenced in `offloaded_fields` but not present in the block
+    data (i.e., the block was saved without having been rendered) keep their
+    existing reference.
+
+    Parameters:
+        block_data: The block data, as returned by `DataBlock.to_db()`.
+        min_size: The size (in bytes, when BSON-encoded) above which fields are stored
+            separately, defaults to `CONFIG.BLOCK_DATA_OFFLOAD_SIZE`; 0 disables offloading.
+
+    Returns:
+        A copy of the block data, with any large fields replaced by references.
+
+    """
+    if min_size is None:
+        min_size = CONFIG.BLOCK_DATA_OFFLOAD_SIZE
+
+    offloaded = dict(block_data.get(OFFLOADED_FIELDS_KEY) or {})
+    stored = {k: v for k, v in block_data.items() if k != OFFLOADED_FIELDS_KEY}
+
+    for field, value in block_data.items():
+        if field in INLINE_BLOCK_KEYS:
+            continue
+        encoded = bson.encode({"value": value})
+        if not min_size or len(encoded) <= min_size:
+            offloaded.pop(field, None)
+            continue
+        offloaded[field] = _store_field(encoded)
+        del stored[field]
+
+    if offloaded:
+        stored[OFFLOADED_FIELDS_KEY] = offloaded
+    return stored
+
+
+def load_offloaded_fields(block_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Restores any fields of a block that were stored in the block data store.
+
+    Parameters:
+        block_data: The block data, as stored in the item document.
+
+    Returns:
+        The full block data (a copy, if any fields were restored), without any
+        `offloaded_fields` references.
+
+    """
+    references = block_data.get(OFFLOADED_FIELDS_KEY)
+    if not references:
+        return block_data
+
+    data = {k: v for k, v in block_data.items() if k != OFFLOADED_FIELDS_KEY}
+    bucket = _bucket()
+    for field, digest in references.items():
+        if field in data:
+            continue
+        try:
+            data[field] = bson.decode(bucket.get(digest).read())["value"]
+        except gridfs.errors.NoFile:
+            LOGGER.warning(
+                "Stored field %r of block %s is missing (%s)", field, data.get("block_id"), digest
+            )
+
+    return data
+
+
+def _referenced_fields(collections: Iterable[str]) -> Set[str]:
+    referenced: Set[str] = set()
+    pipeline = [
+        {"$match": {"blocks_obj": {"$type": "object"}}},
+        {"$project": {"blocks": {"$objectToArray": "$blocks_obj"}}},
+        {"$unwind": "$blocks"},
+        {"$match": {f"blocks.v.{OFFLOADED_FIELDS_KEY}": {"$type": "object"}}},
+        {"$project": {"references": {"$objectToArray": f"$blocks.v.{OFFLOADED_FIELDS_KEY}"}}},
+        {"$unwind": "$references"},
+        {"$group": {"_id": "$references.v"}},
+    ]
+    db = pydatalab.mongo.get_database()
+    for collection in collections:
+        referenced.update(entry["_id"] for entry in db[collection].aggregate(pipeline))
+    return referenced
+
+
+def prune_block_data(min_age: datetime.timedelta = _PRUNE_MIN_AGE) -> int:
+    """Removes stored fields that are no longer referenced by any block of any
+    item or collection.
+
+    Parameters:
+        min_age: Only remove fields stored longer ago than this, so that fields
+            written by saves that are still in progress are kept.
+
+    Returns:
+        The number of stored fields removed.
+
+    """
+    referenced = _referenced_fields(("items", "collections"))
+    cutoff = datetime.datetime.now(tz=datetime.timezone.utc) - min_age
+
+    bucket = _bucket()
+    removed = 0
+    for stored in bucket.find({"uploadDate": {"$lt": cutoff}}):
+        if stored._id not in referenced:
+            bucket.delete(stored._id)
+            removed += 1
+
+    LOGGER.debug("Removed %s unreferenced entries from the block data store", removed)
+    return removed
@@ -1,10 +1,15 @@
 import random
 import warnings
-from typing import Any, Callable, Dict, Optional, Sequence
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence
 
 from bson import ObjectId
 
+from pydatalab.downsampling import record_point_counts
 from pydatalab.logger import LOGGER
+from pydatalab.plot_data import externalize_plot_data, plot_data_exists
+
+if TYPE_CHECKING:
+    from pydatalab.transforms import TransformRegistry
 
 __all__ = ("generate_random_id", "DataBlock")
 
@@ -56,9 +61,18 @@ class DataBlock:
     plot_functions: Optional[Sequence[Callable[[], None]]] = None
     """A list of methods that will generate plots for this block."""
 
+    transforms: Optional["TransformRegistry"] = None
+    """A registry of derived columns that this block can compute on demand,
+    which are selected by the `y_columns` field of the block data
+    (see `pydatalab.transforms`)."""
+
     _supports_collections: bool = False
     """Whether this datablock can operate on collection data, or just individual items"""
 
+    _cacheable: bool = True
+    """Whether the outputs of the plot functions of this block can be stored in the
+    persistent render cache (see `pydatalab.render_cache`)."""
+
     def __init__(
         self,
         item_id: Optional[str] = None,
@@ -129,6 +143,8 @@ class DataBlock:
         if "bokeh_plot_data" in self.data:
             self.data.pop("bokeh_plot_data")
 
+        self.data.pop("render_cache", None)
+
         if "file_id" in self.data:
             dict_for_db = self.data.copy()  # gross, I know
             dict_for_db["file_id"] = ObjectId(dict_for_db["file_id"])
@@ -143,7 +159,8 @@ class DataBlock:
         new_block = cls(
             item_id=db_entry.get("item_id"),
             collection_id=db_entry.get("collection_id"),
-            dictionary=db_entry,
+            init_data=db_entry,
+            unique_id=db_entry.get("block_id"),
         )
         if "file_id" in new_block.data:
             new_block.data["file_id"] = str(new_block.data["file_id"])
@@ -153,28 +170,143 @@ class DataBlock:
 
         return new_block
 
+    def _get_render_file_ids(self) -> List[str]:
+        """Returns the IDs of all files that the plot functions of this block will read.
+        Blocks that read files not referenced in their own data should override this method.
+
+        """
+        file_ids = []
+        if self.data.get("file_id"):
+            file_ids.append(str(self.data["file_id"]))
+        file_ids.extend(str(f) for f in self.data.get("file_ids") or [])
+        return file_ids
+
+    def _get_render_dependencies(self) -> Dict[str, Any]:
+        """Returns any other data that the plot functions of this block depend on
+        (e.g., properties of the parent item), to be included in the render cache key.
+
+        """
+        return {}
+
+    def _get_render_cache_key(self) -> Optional[str]:
+        if not (self.plot_functions and self._cacheable):
+            return None
+
+        from pydatalab.render_cache import get_render_cache_key
+
+        try:
+            return get_render_cache_key(self)
+        except Exception as exc:
+            LOGGER.warning(
+                "Unable to compute render cache key for %s: %s", self.__class__.__name__, exc
+            )
+            return None
+
+    def _load_cached_render(self, cache_key: str) -> bool:
+        """Applies the cached plot outputs for the given key to the block data, if present.
+
+        Returns:
+            Whether a cached render was found.
+
+        """
+        from pydatalab.render_cache import load_cached_render
+
+        try:
+            cached = load_cached_render(cache_key)
+        except Exception as exc:
+            LOGGER.warning("Unable to load cached render for %s: %s", self.__class__.__name__, exc)
+            return False
+
+        if cached is None:
+            return False
+
+        # The binary plot data referenced by the cached plot may since have been evicted
+        plot_data = (cached["data"].get("bokeh_plot_data") or {}).get("plot_data")
+        if plot_data and not plot_data_exists(plot_data["key"]):
+            return False
+
+        self.data.update(cached["data"])
+        for key in cached["removed"]:
+            self.data.pop(key, None)
+
+        self.data.pop("errors", None)
+        if cached["warnings"]:
+            self.data["warnings"] = cached["warnings"]
+        else:
+            self.data.pop("warnings", None)
+
+        return True
+
+    def _store_cached_render(
+        self, cache_key: str, data_before: Dict[str, Any], block_warnings: List[str]
+    ) -> None:
+        """Stores the changes made to the block data by the plot functions in the render cache."""
+        from pydatalab.render_cache import store_cached_render
+
+        payload = {
+            "data": {
+                k: v
+                for k, v in self.data.items()
+                if k not in ("errors", "warnings")
+                and (k not in data_before or data_before[k] is not v)
+            },
+            "removed": [k for k in data_before if k not in self.data],
+            "warnings": block_warnings,
+        }
+
+        try:
+            store_cached_render(cache_key, payload, self.blocktype)
+        except Exception as exc:
+            LOGGER.warning("Unable to cache render for %s: %s", self.__class__.__name__, exc)
+
     def to_web(self) -> Dict[str, Any]:
-        """Returns a JSON serializable dictionary to render the data block on the web."""
+        """Returns a JSON serializable dictionary to render the data block on the web.
+
+        If the block has already been rendered with the same parameters and input files,
+        the outputs of the plot functions will be loaded from the render cache instead.
+        Whether this occurred is recorded under the `render_cache` key of the returned data.
+
+        """
+        cache_key = self._get_render_cache_key()
+        if cache_key and self._load_cached_render(cache_key):
+            self.data["render_cache"] = {"status": "hit", "key": cache_key}
+            return self.data
+
+        data_before = dict(self.data)
+
         block_errors = []
         block_warnings = []
         if self.plot_functions:
-            for plot in self.plot_functions:
-                with warnings.catch_warnings(record=True) as captured_warnings:
-                    try:
-                        plot()
-                    except Exception as e:
-                        block_errors.append(f"{self.__class__.__name__} raised error: {e}")
-                        LOGGER.warning(
-                            f"Could not create plot for {self.__class__.__name__}: {self.data}"
-                        )
-                    finally:
-                        if captured_warnings:
-                            block_warnings.extend(
-                                [
-                                    f"{self.__class__.__name__} raised warning: {w.message}"
-                                    for w in captured_warnings
-                                ]
+            with record_point_counts() as point_counts:
+                for plot in self.plot_functions:
+                    with warnings.catch_warnings(record=True) as captured_warnings:
+                        try:
+                            plot()
+                        except Exception as e:
+                            block_errors.append(f"{self.__class__.__name__} raised error: {e}")
+                            LOGGER.warning(
+                                f"Could not create plot for {self.__class__.__name__}: {self.data}"
                             )
+                        finally:
+                            if captured_warnings:
+                                block_warnings.extend(
+                                    [
+                                        f"{self.__class__.__name__} raised warning: {w.message}"
+                                        for w in captured_warnings
+                                    ]
+                                )
+
+            # Report the number of points shown by the plots, out of those available
+            if (
+                point_counts["original"]
+                and not block_errors
+                and isinstance(self.data.get("bokeh_plot_data"), dict)
+            ):
+                self.data["bokeh_plot_data"]["point_counts"] = point_counts
+
+            # Serve the column data of the plots as a separate binary blob
+            if not block_errors and isinstance(self.data.get("bokeh_plot_data"), dict):
+                externalize_plot_data(self.data["bokeh_plot_data"])
 
         # If the last plotting run did not raise any errors or warnings, remove any old ones
         if block_errors:
@@ -186,6 +318,15 @@ class DataBlock:
         else:
             self.data.pop("warnings", None)
 
+        if cache_key and not block_errors:
+            self._store_cached_render(cache_key, data_before, block_warnings)
+
+        if self.plot_functions:
+            self.data["render_cache"] = {
+                "status": "miss" if cache_key else "bypass",
+                "key": cache_key,
+            }
+
         return self.data
 
     @classmethod
@@ -1,13 +1,11 @@
-import base64
-import io
 import warnings
 from pathlib import Path
 
 import pandas as pd
-from PIL import Image
 
 from pydatalab.file_utils import get_file_info_by_id
 from pydatalab.logger import LOGGER
+from pydatalab.media import get_image_preview_urls
 
 from .base import DataBlock
 
@@ -34,24 +32,27 @@ class MediaBlock(DataBlock):
 
     @property
     def plot_functions(self):
-        return (self.encode_tiff,)
+        return (self.generate_image_preview,)
+
+    def generate_image_preview(self):
+        """Generates the previews of the selected image file for its current revision
+        (see `pydatalab.media`), if they do not already exist, and stores their URLs
+        under `media_urls`. Very large images are instead shown from a pyramid of
+        tiles, which is built in the background when first requested.
+
+        """
+        # Images were previously embedded in the block data as base64-encoded PNGs
+        self.data.pop("b64_encoded_image", None)
+        self.data.pop("media_urls", None)
 
-    def encode_tiff(self):
         if "file_id" not in self.data:
-            LOGGER.warning("ImageBlock.encode_tiff(): No file set in the DataBlock")
+            LOGGER.warning("MediaBlock.generate_image_preview(): No file set in the DataBlock")
             return
-        if "b64_encoded_image" not in self.data:
-            self.data["b64_encoded_image"] = {}
+
         file_info = get_file_info_by_id(self.data["file_id"], update_if_live=True)
-        if file_info["name"].endswith(".tif") or file_info["name"].endswith(".tiff"):
-            im = Image.open(file_info["location"])
-            LOGGER.warning("Making base64 encoding of tif")
-            with io.BytesIO() as f:
-                im.save(f, format="PNG")
-                f.seek(0)
-                self.data["b64_encoded_image"][self.data["file_id"]] = base64.b64encode(
-                    f.getvalue()
-                ).decode()
+        urls = get_image_preview_urls(file_info)
+        if urls is not None:
+            self.data["media_urls"] = urls
 
 
 class TabularDataBlock(DataBlock):
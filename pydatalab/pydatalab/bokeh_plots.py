@@ -22,6 +22,9 @@ from bokeh.plotting import ColumnDataSource, figure
 from bokeh.themes import Theme
 from scipy.signal import find_peaks
 
+from pydatalab.config import CONFIG
+from pydatalab.downsampling import MIN_POINT_BUDGET, downsample_df, downsample_groups
+
 FONTSIZE = "12pt"
 TYPEFACE = "Helvetica, sans-serif"
 COLORS = Dark2[8]
@@ -152,6 +155,8 @@ def selectable_axes_plot(
     plot_title: Optional[str] = None,
     plot_index: Optional[int] = None,
     tools: Optional[List] = None,
+    point_budget: Optional[int] = None,
+    downsampling_method: str = "lttb",
     **kwargs,
 ):
     """
@@ -174,6 +179,11 @@ def selectable_axes_plot(
         plot_index: If part of a larger number of plots, use this index for e.g., choosing the correct
             value in the colour cycle.
         tools: A list of Bokeh tools to enable.
+        point_budget: The maximum number of points to plot, shared between all dataframes
+            (with at least `MIN_POINT_BUDGET` each), above which the data is downsampled.
+            Defaults to `CONFIG.PLOT_POINT_BUDGET`. The csv export contains the plotted
+            points, and is labelled as downsampled if they are.
+        downsampling_method: The method to use to downsample the data (see `pydatalab.downsampling`).
 
     Returns:
         Bokeh layout
@@ -223,16 +233,40 @@ def selectable_axes_plot(
     if isinstance(df, dict):
         labels = list(df.keys())
 
+    if point_budget is None:
+        point_budget = CONFIG.PLOT_POINT_BUDGET
+
+    downsampled_columns = list(
+        dict.fromkeys(
+            list(y_options)
+            + (y_default if isinstance(y_default, list) else [y_default])
+            + (color_options or [])
+        )
+    )
+
+    frame_budget = max(point_budget // len(df), MIN_POINT_BUDGET) if point_budget else None
+    downsampled = False
+
     for ind, df_ in enumerate(df):
         if isinstance(df, dict):
             df_ = df[df_]
 
+        num_points = len(df_)
+        df_ = downsample_df(
+            df_,
+            frame_budget,
+            x=x_default,
+            ys=downsampled_columns,
+            method=downsampling_method,
+        )
+
         if labels:
             label = labels[ind]
         else:
             label = df_.index.name if len(df) > 1 else ""
 
         source = ColumnDataSource(df_)
+        downsampled |= len(df_) < num_points
 
         if color_options:
             color = {"field": color_options[0], "transform": color_mapper}
@@ -334,7 +368,9 @@ def selectable_axes_plot(
         and isinstance(df, list)
         and isinstance(df[0], pd.DataFrame)
     ):
-        save_data = Button(label="Download .csv", button_type="primary", width_policy="min")
+        # The full data is not embedded in the plot, so only the plotted points are exported
+        label = "Download .csv (downsampled)" if downsampled else "Download .csv"
+        save_data = Button(label=label, button_type="primary", width_policy="min")
         save_data_callback = CustomJS(
             args=dict(source=source),
             code=GENERATE_CSV_CALLBACK,
@@ -355,6 +391,7 @@ def double_axes_echem_plot(
     x_options: Sequence[str] = [],
     pick_peaks: bool = True,
     normalized: bool = False,
+    point_budget: Optional[int] = None,
     **kwargs,
 ) -> gridplot:
     """Creates a Bokeh plot for electrochemistry data.
@@ -366,6 +403,9 @@ def double_axes_echem_plot(
         x_options: Columns from `df` that can be selected for the
             first plot. The first will be used as the default.
         pick_peaks: Whether or not to pick and plot the peaks in dV/dQ mode.
+        normalized: Whether to plot the capacities normalized by the characteristic mass.
+        point_budget: The maximum number of points to plot, shared between all half
+            cycles, above which the data is downsampled. Defaults to `CONFIG.PLOT_POINT_BUDGET`.
 
     Returns: The Bokeh layout.
     """
@@ -473,6 +513,16 @@ def double_axes_echem_plot(
         p3.y_range.start = 0
         p3.xaxis.ticker.desired_num_ticks = 5
 
+    if point_budget is None:
+        point_budget = CONFIG.PLOT_POINT_BUDGET
+
+    df = downsample_groups(
+        df,
+        "half cycle",
+        point_budget,
+        ys=x_options + ["voltage (V)", "dQ/dV (mA/V)", "dV/dQ (V/mA)"],
+    )
+
     lines = []
     grouped_by_half_cycle = df.groupby("half cycle")
 
@@ -4,7 +4,7 @@ import logging
 import os
 import platform
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Type, Union
+from typing import Any, Dict, List, Literal, Optional, Type, Union
 
 from pydantic import (
     AnyUrl,
@@ -107,6 +107,15 @@ class RemoteFilesystem(BaseModel):
         description="The hostname for the filesystem. `None` indicates the filesystem is already mounted locally.",
     )
     path: Path = Field(description="The path to the base of the filesystem to include.")
+    max_depth: Optional[int] = Field(
+        None,
+        ge=1,
+        description="The maximum depth of directories to scan below `path`, where 1 only includes the entries directly within `path`. `None` scans all directories.",
+    )
+    exclude: List[str] = Field(
+        [],
+        description="Glob patterns for files and directories to leave out of the scan of the filesystem, matched against both the name of each entry and its path relative to `path` (e.g., `'*.tmp'` or `'archive/raw'`).",
+    )
 
 
 class SMTPSettings(BaseModel):
@@ -141,6 +150,27 @@ class ServerConfig(BaseSettings):
         "mongodb://localhost:27017/datalabvue",
         description="The URI for the underlying MongoDB.",
     )
+
+    MONGO_MAX_POOL_SIZE: int = Field(
+        100,
+        description="The maximum number of concurrent connections held by the shared MongoDB connection pool of each server process.",
+    )
+
+    MONGO_MIN_POOL_SIZE: int = Field(
+        0,
+        description="The minimum number of connections that each server process will keep open to MongoDB.",
+    )
+
+    MONGO_TIMEOUT_MS: int = Field(
+        1000,
+        description="The timeout, in milliseconds, used when connecting to and selecting a MongoDB server.",
+    )
+
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: Optional[int] = Field(
+        None,
+        description="The maximum time, in milliseconds, that a request will wait for a free connection from the pool before failing. `None` waits indefinitely.",
+    )
+
     SESSION_LIFETIME: int = Field(
         7 * 24,
         description="The lifetime of each authenticated session, in hours.",
@@ -151,6 +181,86 @@ class ServerConfig(BaseSettings):
         description="The path under which to place stored files uploaded to the server.",
     )
 
+    FILE_SENDFILE_HEADER: Optional[Literal["X-Accel-Redirect", "X-Sendfile"]] = Field(
+        None,
+        description="If set, the contents of stored files are sent by the reverse proxy in front of the API, rather than by the API itself, which only checks permissions and conditional request headers before responding with this header. `X-Sendfile` (e.g., Apache with `mod_xsendfile`) is given the absolute path of the file, and `X-Accel-Redirect` (Nginx) its path under `FILE_ACCEL_REDIRECT_PREFIX`.",
+    )
+
+    FILE_ACCEL_REDIRECT_PREFIX: str = Field(
+        "/_files/",
+        description="The internal location at which the reverse proxy serves the contents of `FILE_DIRECTORY`, when `FILE_SENDFILE_HEADER` is `X-Accel-Redirect`.",
+    )
+
+    CACHE_DIRECTORY: Union[str, Path] = Field(
+        Path(__file__).parent.joinpath("../cache").resolve(),
+        description="The path under which to place derived data (e.g., parsed data files) that can be safely deleted and regenerated.",
+    )
+
+    PARSED_DATA_CACHE_MAX_SIZE: int = Field(
+        10 * 1024 * 1024 * 1024,
+        ge=0,
+        description="The maximum total size, in bytes, of the on-disk cache of parsed data files (stored under `CACHE_DIRECTORY`), beyond which the least recently used entries are removed; setting this to 0 disables the cache.",
+    )
+
+    RENDER_CACHE_MAX_SIZE: int = Field(
+        512 * 1024 * 1024,
+        description="The maximum total size, in bytes, of the persistent cache of rendered data blocks (stored in the `renderCache` collection); setting this to 0 disables the cache.",
+    )
+
+    PLOT_DATA_CACHE_MAX_SIZE: int = Field(
+        1024 * 1024 * 1024,
+        ge=0,
+        description="The maximum total size, in bytes, of the binary plot data served separately from the plot JSON (stored under `CACHE_DIRECTORY`), beyond which the least recently used entries are removed; setting this to 0 embeds all plot data in the JSON instead.",
+    )
+
+    BLOCK_DATA_OFFLOAD_SIZE: int = Field(
+        256 * 1024,
+        ge=0,
+        description="Fields of saved data blocks that are larger than this size (in bytes, when BSON-encoded) are stored in a separate GridFS bucket (`blockData`) rather than inside the item or collection document, and are only loaded when the block is rendered; setting this to 0 stores all block data inline.",
+    )
+
+    IMAGE_PREVIEW_SIZE: int = Field(
+        1024,
+        ge=1,
+        description="The maximum width and height, in pixels, of the downscaled previews of image files shown in media blocks (see `pydatalab.media`).",
+    )
+
+    IMAGE_TILING_MIN_PIXELS: int = Field(
+        25_000_000,
+        ge=0,
+        description="Images with more pixels than this are never converted whole, and are instead shown in media blocks from a pyramid of tiles built by a background job (see `pydatalab.media`).",
+    )
+
+    PLOT_POINT_BUDGET: int = Field(
+        10_000,
+        ge=0,
+        description="The maximum number of points (approximately) to send to the browser for each plot; larger datasets are downsampled with a shape-preserving algorithm (LTTB). Setting this to 0 disables downsampling.",
+    )
+
+    BLOCK_RENDER_PROCESSES: int = Field(
+        1,
+        ge=1,
+        description="The number of worker processes to use when rendering all of the data blocks of an item at once. Blocks are rendered serially in the server process when set to 1. Each server process starts a single pool of workers, shared with the other `*_PROCESSES` settings and sized by the largest of them, when the app is created; processes forked after the app is created (e.g., by `gunicorn --preload`) do not share their parent's pool and do all work serially.",
+    )
+
+    ECHEM_DIFFERENTIAL_PROCESSES: int = Field(
+        1,
+        ge=1,
+        description="The number of worker processes to use when computing the dQ/dV or dV/dQ curves of each half cycle in an electrochemistry block. Curves are computed serially when set to 1.",
+    )
+
+    RAMAN_MAP_PROCESSES: int = Field(
+        1,
+        ge=1,
+        description="The number of worker processes to use when fitting the baselines of every spectrum in a Raman map. Baselines are fitted serially when set to 1.",
+    )
+
+    RENDER_JOB_WORKERS: int = Field(
+        0,
+        ge=0,
+        description="The number of local worker processes to start alongside each server process for executing background jobs, e.g., block renders requested with `background=True`. When set to 0, no workers are started and all blocks are rendered within the request.",
+    )
+
     LOG_FILE: str | Path | None = Field(
         None,
         description="The path to the log file to use for the server and all associated processes (e.g., invoke tasks)",
@@ -186,6 +296,22 @@ class ServerConfig(BaseSettings):
         description="The minimum age, in minutes, of the remote filesystem cache, below which the cache will not be invalidated if an update is manually requested.",
     )
 
+    LIVE_FILE_WATCHER: bool = Field(
+        False,
+        description="Whether live files (i.e., files added from remote filesystems that are still being modified) are kept up to date by a live file watcher, rather than by checking the remote whenever a live file is read. The watcher must be run separately with `invoke admin.watch-live-files`, or alongside the server with `START_LIVE_FILE_WATCHER`. Changes to files on mounted remote filesystems are picked up immediately with inotify (where available), and all live files are also checked every `LIVE_FILE_POLL_INTERVAL` seconds.",
+    )
+
+    START_LIVE_FILE_WATCHER: bool = Field(
+        False,
+        description="Whether to start a live file watcher alongside the server, in a background process forked from each server process. Only one watcher is active at a time, so for deployments with several server processes, running the watcher as a separate service is preferred.",
+    )
+
+    LIVE_FILE_POLL_INTERVAL: int = Field(
+        60,
+        ge=1,
+        description="The interval, in seconds, at which the live file watcher checks all live files for changes, with one batched request per remote host.",
+    )
+
     BEHIND_REVERSE_PROXY: bool = Field(
         False,
         description="Whether the Flask app is being deployed behind a reverse proxy. If `True`, the reverse proxy middleware described in the [Flask docs](https://flask.palletsprojects.com/en/2.2.x/deploying/proxy_fix/) will be attached to the app.",
@@ -224,6 +350,12 @@ Warning: this value will overwrite any other values passed to `FLASK_MAX_CONTENT
 its importance when deploying a datalab instance.""",
     )
 
+    UPLOAD_CHUNK_SIZE: int = Field(
+        16 * 1024 * 1024,
+        ge=1,
+        description="The size in bytes of the chunks that large files are sent in by resumable uploads (see `pydatalab.uploads`), which must be smaller than `MAX_CONTENT_LENGTH`.",
+    )
+
     BACKUP_STRATEGIES: Optional[dict[str, BackupStrategy]] = Field(
         {
             "daily-snapshots": BackupStrategy(
@@ -0,0 +1,54 @@
+"""This module implements helpers shared by the on-disk caches of derived data
+(see `pydatalab.parsed_data` and `pydatalab.plot_data`).
+
+The total size of each cache is bounded, but scanning a cache directory to find
+its size is linear in the number of entries, so it is not repeated on every store.
+Instead, each process keeps a `CacheSizeEstimate` of the cache: the total found by
+its last scan, plus the size of everything it has stored since. The cache is only
+scanned (and evicted) once that estimate exceeds the limit, or once the process has
+stored a fraction (`RESCAN_FRACTION`) of the limit since its last scan, which bounds
+how far the cache can grow past its limit through stores made by other processes.
+
+"""
+
+import threading
+from typing import Optional
+
+__all__ = ("RESCAN_FRACTION", "CacheSizeEstimate")
+
+RESCAN_FRACTION = 0.1
+"""The fraction of the maximum size of a cache that a process can store before it
+rescans the cache, regardless of its estimate of the total size."""
+
+
+class CacheSizeEstimate:
+    """A per-process estimate of the total size of an on-disk cache, used to decide
+    when the cache needs to be scanned and evicted.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scanned: Optional[int] = None
+        self._stored = 0
+
+    def add(self, size: int, max_size: int) -> bool:
+        """Records that an entry of `size` bytes was stored in the cache.
+
+        Returns:
+            Whether the cache should now be scanned and evicted (see `scanned`).
+
+        """
+        with self._lock:
+            self._stored += size
+            return (
+                self._scanned is None
+                or self._scanned + self._stored > max_size
+                or self._stored > max_size * RESCAN_FRACTION
+            )
+
+    def scanned(self, total: int) -> None:
+        """Records the total size of the cache found by a scan (after any eviction)."""
+        with self._lock:
+            self._scanned = total
+            self._stored = 0
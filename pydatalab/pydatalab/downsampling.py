@@ -0,0 +1,292 @@
+"""This module implements shape-preserving downsampling of plot data, so that
+large datasets can be plotted in the browser without shipping every point.
+
+Two methods are available:
+
+- `"lttb"`: the Largest-Triangle-Three-Buckets algorithm, which keeps the point
+  in each bucket that forms the largest triangle with its neighbours, and thus
+  preserves the visual shape of the curve (including peaks).
+- `"minmax"`: keeps the minimum and maximum point in each bucket, which is
+  cheaper and guarantees that no extrema are lost.
+
+Both always keep the first and last points of the data.
+
+The number of points before and after downsampling can be recorded with
+`record_point_counts`, which is used to report these to the UI alongside each plot.
+
+"""
+
+import contextlib
+import contextvars
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+__all__ = (
+    "lttb_indices",
+    "minmax_indices",
+    "downsample_indices",
+    "downsample_df",
+    "downsample_groups",
+    "record_point_counts",
+    "MIN_POINT_BUDGET",
+)
+
+DOWNSAMPLING_METHODS = ("lttb", "minmax")
+
+MIN_POINT_BUDGET = 100
+"""The smallest point budget given to each dataframe when the budget of a plot
+is shared between many dataframes, so that each of them keeps its shape."""
+
+_POINT_COUNTS: contextvars.ContextVar[Optional[Dict[str, int]]] = contextvars.ContextVar(
+    "point_counts", default=None
+)
+
+
+def _bucket_edges(n: int, n_out: int) -> np.ndarray:
+    """Returns the edges of `n_out - 2` buckets spanning the interior points `[1, n - 1)`."""
+    return np.linspace(1, n - 1, n_out - 1).astype(int)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Returns the indices of the points selected by Largest-Triangle-Three-Buckets.
+
+    The averages of each bucket and the areas for each candidate point are computed
+    with numpy, leaving only the (inherently sequential) choice of each bucket's
+    point as a loop over buckets.
+
+    Parameters:
+        x: The x-values of the data, which should be sorted.
+        y: The y-values of the data.
+        n_out: The number of points to keep.
+
+    Returns:
+        The sorted indices of the points to keep.
+
+    """
+    n = len(y)
+    if n_out >= n or n < 3:
+        return np.arange(n)
+    n_out = max(n_out, 3)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = _bucket_edges(n, n_out)
+    starts, stops = edges[:-1], edges[1:]
+    num_buckets = len(starts)
+
+    # Average point of each bucket, with the final point used as the
+    # "next bucket" for the last bucket
+    finite = np.isfinite(y)
+    y_filled = np.where(finite, y, 0.0)
+    counts = np.add.reduceat(finite.astype(int), starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_x = np.append(np.add.reduceat(x, starts) / (stops - starts), x[-1])
+        avg_y = np.append(np.add.reduceat(y_filled, starts) / counts, y[-1])
+
+    # Pad the buckets into a 2D array so each can be sliced cheaply
+    width = int((stops - starts).max())
+    positions = starts[:, None] + np.arange(width)[None, :]
+    valid = positions < stops[:, None]
+    positions = np.where(valid, positions, stops[:, None] - 1)
+    usable = valid & finite[positions]
+    bucket_x = x[positions]
+    bucket_y = np.where(usable, y_filled[positions], 0.0)
+    # Padding and non-finite points can never be selected (unless the whole bucket is empty)
+    penalty = np.where(usable, 0.0, -np.inf)
+
+    selected = np.empty(num_buckets + 2, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    ax, ay = float(x[0]), float(y_filled[0])
+    for i in range(num_buckets):
+        cx, cy = avg_x[i + 1], avg_y[i + 1]
+        area = np.abs(bucket_y[i] * (ax - cx) + bucket_x[i] * (cy - ay) + (cx * ay - ax * cy))
+        j = int((area + penalty[i]).argmax())
+        selected[i + 1] = positions[i, j]
+        if usable[i, j]:
+            ax, ay = bucket_x[i, j], bucket_y[i, j]
+
+    return np.unique(selected)
+
+
+def minmax_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Returns the indices of the minimum and maximum points in each bucket.
+
+    Parameters:
+        x: The x-values of the data (unused, but accepted for a consistent signature).
+        y: The y-values of the data.
+        n_out: The (maximum) number of points to keep.
+
+    Returns:
+        The sorted indices of the points to keep.
+
+    """
+    n = len(y)
+    if n_out >= n or n < 3:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=float)
+    edges = _bucket_edges(n, max(n_out // 2, 1) + 2)
+    starts, stops = edges[:-1], edges[1:]
+
+    width = int((stops - starts).max())
+    positions = starts[:, None] + np.arange(width)[None, :]
+    valid = positions < stops[:, None]
+    positions = np.where(valid, positions, stops[:, None] - 1)
+    bucket_y = np.where(valid, y[positions], np.nan)
+
+    low = np.nan_to_num(bucket_y, nan=np.inf).argmin(axis=1)
+    high = np.nan_to_num(bucket_y, nan=-np.inf).argmax(axis=1)
+
+    rows = np.arange(len(starts))
+    return np.unique(np.concatenate([[0], positions[rows, low], positions[rows, high], [n - 1]]))
+
+
+_METHODS = {"lttb": lttb_indices, "minmax": minmax_indices}
+
+
+def downsample_indices(
+    x: Optional[np.ndarray], ys: Sequence[np.ndarray], n_out: int, method: str = "lttb"
+) -> np.ndarray:
+    """Returns the indices of the rows to keep so that each of the `ys` columns
+    is downsampled to its share of `n_out` points, against the same `x` column.
+
+    Parameters:
+        x: The x-values of the data, or `None` to use the row positions.
+        ys: The y-values of each column to preserve.
+        n_out: The total number of points to keep across all columns.
+        method: The downsampling method to use, one of `DOWNSAMPLING_METHODS`.
+
+    Returns:
+        The sorted indices of the rows to keep.
+
+    """
+    if method not in _METHODS:
+        raise ValueError(
+            f"Unknown downsampling method {method!r}, must be one of {DOWNSAMPLING_METHODS}"
+        )
+
+    n = len(ys[0]) if ys else 0
+    if not ys or n <= n_out:
+        return np.arange(n)
+
+    if x is None:
+        x = np.arange(n, dtype=float)
+
+    per_column = max(n_out // len(ys), 3)
+    return np.unique(np.concatenate([_METHODS[method](x, y, per_column) for y in ys]))
+
+
+def _numeric_columns(df: pd.DataFrame, columns: Optional[Sequence[str]]) -> List[str]:
+    if columns is None:
+        columns = list(df.columns)
+    return [c for c in columns if c in df.columns and pd.api.types.is_numeric_dtype(df[c])]
+
+
+def downsample_df(
+    df: pd.DataFrame,
+    n_out: Optional[int],
+    x: Optional[str] = None,
+    ys: Optional[Sequence[str]] = None,
+    method: str = "lttb",
+) -> pd.DataFrame:
+    """Downsamples the dataframe to at most (approximately) `n_out` rows, preserving
+    the shape of each of the `ys` columns plotted against `x`, and records the number
+    of points before and after (see `record_point_counts`).
+
+    Parameters:
+        df: The dataframe to downsample.
+        n_out: The point budget for this dataframe; `None` or 0 disables downsampling.
+        x: The column to use for the x-values, or `None` to use the row positions
+            (suitable for e.g., time series).
+        ys: The columns whose shape should be preserved, defaults to all numeric columns.
+        method: The downsampling method to use, one of `DOWNSAMPLING_METHODS`.
+
+    Returns:
+        The downsampled dataframe (or the original, if it was already within budget).
+
+    """
+    original = len(df)
+    if n_out and original > n_out:
+        columns = _numeric_columns(df, ys)
+        x_values = None
+        if x is not None and x in df.columns and pd.api.types.is_numeric_dtype(df[x]):
+            x_values = df[x].to_numpy()
+            if not df[x].is_monotonic_increasing and not df[x].is_monotonic_decreasing:
+                x_values = None
+        if columns:
+            indices = downsample_indices(
+                x_values, [df[c].to_numpy() for c in columns], n_out, method=method
+            )
+            df = df.iloc[indices]
+
+    _add_point_counts(original, len(df))
+    return df
+
+
+def downsample_groups(
+    df: pd.DataFrame,
+    by: str,
+    n_out: Optional[int],
+    x: Optional[str] = None,
+    ys: Optional[Sequence[str]] = None,
+    method: str = "lttb",
+) -> pd.DataFrame:
+    """Downsamples each group of rows (e.g., each half cycle) separately, with the
+    point budget shared between groups in proportion to their size.
+
+    Parameters:
+        df: The dataframe to downsample.
+        by: The column to group by.
+        n_out: The total point budget; `None` or 0 disables downsampling.
+        x: The column to use for the x-values, or `None` to use the row positions.
+        ys: The columns whose shape should be preserved.
+        method: The downsampling method to use, one of `DOWNSAMPLING_METHODS`.
+
+    Returns:
+        The downsampled dataframe, in the same order as the input.
+
+    """
+    original = len(df)
+    if n_out and original > n_out:
+        columns = _numeric_columns(df, ys)
+        values = [df[c].to_numpy() for c in columns]
+        x_values = df[x].to_numpy() if x is not None and x in df.columns else None
+        keep = []
+        for positions in df.groupby(by, sort=False).indices.values():
+            budget = max(int(n_out * len(positions) / original), 3)
+            indices = downsample_indices(
+                x_values[positions] if x_values is not None else None,
+                [v[positions] for v in values],
+                budget,
+                method=method,
+            )
+            keep.append(positions[indices])
+        if keep:
+            df = df.iloc[np.sort(np.concatenate(keep))]
+
+    _add_point_counts(original, len(df))
+    return df
+
+
+def _add_point_counts(original: int, displayed: int) -> None:
+    counts = _POINT_COUNTS.get()
+    if counts is not None:
+        counts["original"] += original
+        counts["displayed"] += displayed
+
+
+@contextlib.contextmanager
+def record_point_counts() -> Iterator[Dict[str, int]]:
+    """Context manager that yields a dictionary accumulating the number of
+    `original` and `displayed` points of any data downsampled inside it.
+
+    """
+    counts = {"original": 0, "displayed": 0}
+    token = _POINT_COUNTS.set(counts)
+    try:
+        yield counts
+    finally:
+        _POINT_COUNTS.reset(token)
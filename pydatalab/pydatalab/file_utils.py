@@ -1,25 +1,29 @@
 import datetime
+import hashlib
 import os
 import pathlib
-import re
 import shutil
-import subprocess
-from typing import Any, Dict, Union
+from typing import Any, Dict, List, Union
 
 from bson.objectid import ObjectId
+from flask import has_request_context
 from pymongo import ReturnDocument
 from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
 
+from pydatalab.blobs import release_blob, store_blob
 from pydatalab.config import CONFIG, RemoteFilesystem
 from pydatalab.logger import LOGGER, logged_route
 from pydatalab.models import File
 from pydatalab.models.utils import PyObjectId
 from pydatalab.mongo import _get_active_mongo_client, flask_mongo
 from pydatalab.permissions import get_default_permissions
+from pydatalab.remote_sessions import fetch_remote_file, split_remote_path, stat_remote_files
 
 LIVE_FILE_CUTOFF = datetime.timedelta(days=31)
 
+_HASH_CHUNK_SIZE = 1024 * 1024
+
 
 def get_space_available_bytes() -> int:
     """For the configured file location, return the number of available bytes, as
@@ -35,88 +39,142 @@ def get_space_available_bytes() -> int:
     return stats.f_bsize * stats.f_bavail
 
 
-def _escape_spaces_scp_path(remote_path: str) -> str:
-    r"""Takes a remote path prefixed by 'ssh://' and encloses
-    the filename in quotes and escapes spaces to allow for
-    scp'ing of files with spaces in the name, e.g., "ssh://hostname:/path to file"
-    becomes 'ssh://hostname:"/path\ to\ file"'.
+def compute_file_hash(path: Union[str, pathlib.Path]) -> str:
+    """Returns the hex-encoded SHA-256 hash of the contents of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(_HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_file_hash(file_info: Dict[str, Any]) -> str:
+    """Returns the SHA-256 hash of the current revision of a stored file.
+
+    Hashes are recorded whenever the contents of a file are saved; for files
+    stored before this was the case, the hash is computed and recorded on first use.
+
+    Arguments:
+        file_info: The stored file information, including its `_id`, `location` and `revision`.
+
+    Raises:
+        OSError: If the file does not exist on disk.
+
+    """
+    if file_info.get("sha256"):
+        return file_info["sha256"]
+
+    digest = compute_file_hash(file_info["location"])
+    flask_mongo.db.files.update_one(
+        {"_id": file_info["_id"], "revision": file_info.get("revision"), "sha256": None},
+        {"$set": {"sha256": digest}},
+    )
+    return digest
+
+
+def _save_and_hash_file(file, location: str) -> str:
+    """Saves an uploaded file to the given location, hashing its contents as they
+    are written.
 
-    Leaves paths without spaces unaltered.
+    Returns:
+        The SHA-256 hash of the contents of the file.
 
     """
-    protocol, host, path = remote_path.split(":")
-    if " " not in path:
-        return remote_path
+    digest = hashlib.sha256()
+    with open(location, "wb") as f:
+        while data := file.stream.read(_HASH_CHUNK_SIZE):
+            f.write(data)
+            digest.update(data)
+    return digest.hexdigest()
 
-    # Escape all spaces, but make sure not to double-escape
-    path = path.replace(r"\ ", " ").replace(" ", r"\ ")
 
-    return f'{protocol}:{host}:"{path}"'
+def _temporary_location(location: str, tag: str | None = None) -> str:
+    """Returns a temporary location alongside a stored file, at which to write its
+    new contents before replacing it (see `pydatalab.blobs`).
+
+    Args:
+        location: The location of the stored file.
+        tag: A fixed name for the temporary file (e.g., so that an interrupted
+            copy can be resumed), otherwise a unique name is used.
+
+    """
+    directory, filename = os.path.split(location)
+    return os.path.join(directory, f".{filename}.{tag or ObjectId()}.tmp")
 
 
 @logged_route
-def _sync_file_with_remote(remote_path: str, src: str) -> None:
+def _sync_file_with_remote(remote_path: str, src: str, previous: str | None = None) -> None:
     """Copy a file from a mounted volume or ssh-able remote to the
     local file store.
 
     Arguments:
         remote_path: The original location of the file.
         src: The local location of the file.
+        previous: The local location of a previous version of the file, from which
+            only the changes are copied for ssh-able remotes (see `pydatalab.remote_sessions`).
     """
     if os.path.isfile(remote_path):
         shutil.copy(remote_path, src)
     elif remote_path.startswith("ssh://"):
-        # Unescape spaces are we are now quoting the whole path
-        remote_path = _escape_spaces_scp_path(remote_path)
-        scp_command = f"scp {re.sub('^ssh://', '', remote_path)} {src}"
-
-        pathlib.Path(src).parent.mkdir(parents=False, exist_ok=True)
-
-        LOGGER.debug("Syncing file with '%s'", scp_command)
-        proc = subprocess.Popen(
-            scp_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
-        _, stderr = proc.communicate()
-        if stderr:
-            raise RuntimeError(
-                f"scp command {scp_command} raised the the following errors: {stderr!r}"
-            )
+        fetch_remote_file(remote_path, src, previous=previous)
 
     if not os.path.isfile(src):
-        raise RuntimeError("Something went wrong copying {remote_path} to {src}.")
+        raise RuntimeError(f"Something went wrong copying {remote_path} to {src}.")
 
 
 @logged_route
-def _call_remote_stat(path: str):
+def _call_remote_stat(path: str) -> datetime.datetime:
     """Call `stat` on a remote file.
 
     Args:
         path: The full remote path.
 
     Returns:
-        A dictionary of the `tree` output.
+        The last modified time of the remote file.
 
     """
+    return get_remote_timestamps([path])[path]
 
-    path = path.strip("ssh://")
-    path = path.replace(r"\ ", " ").replace(" ", r"\ ")
-    hostname, file_path = path.split(":", 1)
-    command = f"ssh {hostname} 'stat -c %Y {file_path}'"
-    process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    LOGGER.debug(f"Calling {command}")
-    try:
-        stdout, stderr = process.communicate(timeout=20)
-        timestamp = int(stdout.decode("utf-8"))
-    except Exception as exc:
-        raise RuntimeError(f"Remote stat process {command!r} returned: {exc!r}")
-    if stderr:
-        raise RuntimeError(f"Remote statprocess {command!r} returned: {stderr!r}")
 
-    return datetime.datetime.fromtimestamp(timestamp)
+def get_remote_timestamps(paths: List[str]) -> Dict[str, datetime.datetime]:
+    """Returns the last modified times of many files on ssh-able remotes, with one
+    round trip over a shared connection for each remote host rather than one
+    connection for each file.
+
+    Args:
+        paths: The full remote paths.
+
+    Raises:
+        RuntimeError: If any of the remotes could not be accessed, or any of the
+            files could not be found.
+
+    Returns:
+        A dictionary from each path to its last modified time.
+
+    """
+    paths_by_host: Dict[str, Dict[str, str]] = {}
+    for path in paths:
+        hostname, file_path = split_remote_path(path)
+        paths_by_host.setdefault(hostname, {})[file_path] = path
+
+    timestamps = {}
+    for hostname, host_paths in paths_by_host.items():
+        stats = stat_remote_files(hostname, list(host_paths))
+        for file_path, path in host_paths.items():
+            if stats[file_path] is None:
+                raise RuntimeError(f"Remote file {path!r} could not be found.")
+            timestamps[path] = datetime.datetime.fromtimestamp(stats[file_path].mtime)
+
+    return timestamps
 
 
 @logged_route
-def _check_and_sync_file(file_info: File, file_id: ObjectId) -> File:
+def _check_and_sync_file(
+    file_info: File,
+    file_id: ObjectId,
+    remote_timestamp: datetime.datetime | None = None,
+    max_age: datetime.timedelta | None = None,
+) -> File:
     """For a given file, check if the remote version is newer
     than the stored version and sync them if so.
 
@@ -124,6 +182,10 @@ def _check_and_sync_file(file_info: File, file_id: ObjectId) -> File:
         file_info: The `File` metadata object.
         file_id: The `bson.ObjectId` of the file stored in the database
             (used to update the file collection).
+        remote_timestamp: The last modified time of the remote file, if already
+            known (e.g., from `get_remote_timestamps`), otherwise the remote is checked.
+        max_age: How much newer the remote file must be than the stored version before
+            it is synced, defaults to `CONFIG.REMOTE_CACHE_MAX_AGE` minutes.
 
     Returns:
         The updated file info, if an update was required,
@@ -154,7 +216,10 @@ def _check_and_sync_file(file_info: File, file_id: ObjectId) -> File:
     if remote.hostname:
         full_remote_path = f"{remote.hostname}:{full_remote_path}"
 
-    if full_remote_path.startswith("ssh://"):
+    if remote_timestamp is not None:
+        LOGGER.debug("Using known timestamp %s for %s", remote_timestamp, full_remote_path)
+
+    elif full_remote_path.startswith("ssh://"):
         # For ssh-able remotes, check age of the local file, rather than the last time the remote file was modified
         remote_timestamp = _call_remote_stat(full_remote_path)
         LOGGER.debug(
@@ -175,21 +240,30 @@ def _check_and_sync_file(file_info: File, file_id: ObjectId) -> File:
             )
             return file_info
 
-    if remote_timestamp > cached_timestamp + datetime.timedelta(
-        minutes=CONFIG.REMOTE_CACHE_MAX_AGE
-    ):
+    if max_age is None:
+        max_age = datetime.timedelta(minutes=CONFIG.REMOTE_CACHE_MAX_AGE)
+
+    if remote_timestamp > cached_timestamp + max_age:
         LOGGER.debug("Updating file %s to latest version", file_info.source_path)
 
+        # Sync to a temporary file, as the stored file may be linked to a shared blob;
+        # this is kept if the sync fails, so that the next sync can resume from it
+        temporary_location = _temporary_location(file_info.location, tag="sync")
         try:
-            _sync_file_with_remote(full_remote_path, file_info.location)
+            _sync_file_with_remote(
+                full_remote_path, temporary_location, previous=file_info.location
+            )
         except RuntimeError:
             LOGGER.warning(
                 "Unable to sync file %s with %s on server.", file_info.location, full_remote_path
             )
             return file_info
+        os.replace(temporary_location, file_info.location)
+        synced = True
 
     else:
         LOGGER.debug("File %s is recent enough, not updating", file_info.source_path)
+        synced = False
 
     if file_info.location is not None:
         local_stat_results = os.stat(file_info.location)
@@ -199,17 +273,22 @@ def _check_and_sync_file(file_info: File, file_id: ObjectId) -> File:
         if datetime.datetime.now() - remote_timestamp > LIVE_FILE_CUTOFF:
             is_live = False
 
+        updates = {
+            "size": local_stat_results.st_size,
+            "last_modified": datetime.datetime.fromtimestamp(local_stat_results.st_mtime),
+            "last_modified_remote": remote_timestamp,
+            "is_live": is_live,
+        }
+        if synced:
+            updates["sha256"] = compute_file_hash(file_info.location)
+            updates["blob"] = store_blob(file_info.location, updates["sha256"])
+
+        # Syncs made outside of a request (e.g., by the live file watcher) are not
+        # made on behalf of any user
+        permissions = get_default_permissions(user_only=False) if has_request_context() else {}
         updated_file_info = file_collection.find_one_and_update(
-            {"_id": file_id, **get_default_permissions(user_only=False)},
-            {
-                "$set": {
-                    "size": local_stat_results.st_size,
-                    "last_modified": datetime.datetime.fromtimestamp(local_stat_results.st_mtime),
-                    "last_modified_remote": remote_timestamp,
-                    "is_live": is_live,
-                },
-                "$inc": {"revision": 1},
-            },
+            {"_id": file_id, **permissions},
+            {"$set": updates, "$inc": {"revision": 1}},
             return_document=ReturnDocument.AFTER,
         )
 
@@ -219,8 +298,13 @@ def _check_and_sync_file(file_info: File, file_id: ObjectId) -> File:
                 file_info.source_path,
                 updated_file_info,
             )
+            if synced:
+                release_blob(updates["blob"])
             return file_info
 
+        if synced:
+            release_blob(file_info.blob)
+
         return File(**updated_file_info)
 
     return file_info
@@ -234,7 +318,10 @@ def get_file_info_by_id(
 
     If the `update_if_live` and the file has been updated on the
     remote since it was added to the database, then the new version
-    will be copied into the local filestore.
+    will be copied into the local filestore. When the live file watcher
+    is enabled (`CONFIG.LIVE_FILE_WATCHER`), live files are instead kept
+    up to date in the background (see `pydatalab.live_files`), so the
+    remote is never accessed here.
 
     Arguments:
         file_id: Either the string or ObjectID representatoin of the file ID.
@@ -260,17 +347,18 @@ def get_file_info_by_id(
 
     file_info = File(**file_info)
 
-    if update_if_live and file_info.is_live:
+    if update_if_live and file_info.is_live and not CONFIG.LIVE_FILE_WATCHER:
         file_info = _check_and_sync_file(file_info, file_id)
 
     return file_info.dict()
 
 
 @logged_route
-def update_uploaded_file(file, file_id, last_modified=None, size_bytes=None):
+def update_uploaded_file(file, file_id, last_modified=None, size_bytes=None, sha256=None):
     """file is a file object from a flask request.
     last_modified should be an isodate format. if None, the current time will be inserted
     By default, only changes the last_modified, and size_bytes, increments version, and verifies source=remote and is_live=false. (converts )
+    sha256 can be passed if the hash of the new contents is already known (e.g., for chunked uploads)
     additional_updates can be used to pass other fields to change in (NOT IMPLEMENTED YET)"""
 
     last_modified = datetime.datetime.now().isoformat()
@@ -285,6 +373,7 @@ def update_uploaded_file(file, file_id, last_modified=None, size_bytes=None):
                 "source": "remote",
                 "is_live": False,
             },
+            "$unset": {"sha256": ""},
             "$inc": {"revision": 1},
         },
         return_document=ReturnDocument.AFTER,
@@ -295,8 +384,23 @@ def update_uploaded_file(file, file_id, last_modified=None, size_bytes=None):
 
     updated_file_entry = File(**updated_file_entry)
 
-    # overwrite the old file with the new location
-    file.save(updated_file_entry.location)
+    # write the new contents alongside the old file, then replace it, as the old
+    # file may be linked to a blob shared with other files
+    temporary_location = _temporary_location(updated_file_entry.location)
+    if sha256:
+        file.save(temporary_location)
+    else:
+        sha256 = _save_and_hash_file(file, temporary_location)
+    os.replace(temporary_location, updated_file_entry.location)
+
+    previous_blob = updated_file_entry.blob
+    updated_file_entry.sha256 = sha256
+    updated_file_entry.blob = store_blob(updated_file_entry.location, sha256)
+    file_collection.update_one(
+        {"_id": file_id, "revision": updated_file_entry.revision},
+        {"$set": {"sha256": updated_file_entry.sha256, "blob": updated_file_entry.blob}},
+    )
+    release_blob(previous_blob)
 
     ret = updated_file_entry.dict()
     ret.update({"_id": file_id})
@@ -311,6 +415,7 @@ def save_uploaded_file(
     last_modified: datetime.datetime | str | None = None,
     size_bytes: int | None = None,
     creator_ids: list[PyObjectId | str] | None = None,
+    sha256: str | None = None,
 ) -> dict:
     """Attempt to save a copy of the file object from the request in the file store, and
     add its metadata to the database.
@@ -325,6 +430,8 @@ def save_uploaded_file(
             the file can be saved.
         creator_ids: A list of IDs for users who will be registered as the creator of this file,
             i.e., retaining write access.
+        sha256: The SHA-256 hash of the file contents, if already known (e.g., for chunked
+            uploads), otherwise it will be computed after saving the file.
 
     Returns:
         A dictionary containing the saved metadata for the file.
@@ -400,7 +507,10 @@ def save_uploaded_file(
         new_directory = os.path.join(CONFIG.FILE_DIRECTORY, str(inserted_id))
         file_location = os.path.join(new_directory, filename)
         pathlib.Path(new_directory).mkdir(exist_ok=False)
-        file.save(file_location)
+        if sha256:
+            file.save(file_location)
+        else:
+            sha256 = _save_and_hash_file(file, file_location)
 
     updated_file_entry = flask_mongo.db.files.find_one_and_update(
         {"_id": inserted_id, **get_default_permissions(user_only=False)},
@@ -408,6 +518,8 @@ def save_uploaded_file(
             "$set": {
                 "location": file_location,
                 "size": os.path.getsize(file_location),
+                "sha256": sha256,
+                "blob": store_blob(file_location, sha256),
             }
         },
         return_document=ReturnDocument.AFTER,
@@ -504,6 +616,7 @@ def add_file_from_remote_directory(
     new_file_location = os.path.join(new_directory, filename)
     pathlib.Path(new_directory).mkdir(exist_ok=True)
     _sync_file_with_remote(full_remote_path, new_file_location)
+    sha256 = compute_file_hash(new_file_location)
 
     updated_file_entry = file_collection.find_one_and_update(
         {"_id": inserted_id, **get_default_permissions(user_only=False)},
@@ -511,6 +624,8 @@ def add_file_from_remote_directory(
             "$set": {
                 "location": new_file_location,
                 "url_path": new_file_location,
+                "sha256": sha256,
+                "blob": store_blob(new_file_location, sha256),
             }
         },
         return_document=ReturnDocument.AFTER,
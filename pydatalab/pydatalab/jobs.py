@@ -0,0 +1,357 @@
+"""This module implements a simple job queue for expensive work (e.g., block renders)
+that should not be performed inside a web request.
+
+Jobs are stored in the `jobs` MongoDB collection, so no additional services are
+required. Jobs are executed by local worker processes forked from the server process
+(see `start_job_workers`), which claim queued jobs atomically, report their progress
+back to the database and store the result of each job once finished. While a job is
+running, its worker renews its lease from a background thread, so that long-running
+jobs are not claimed again by other workers.
+
+Jobs submitted with a de-duplication key will be merged with any queued or running
+job with the same key, so that identical concurrent requests only do the work once.
+
+"""
+
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import pymongo.errors
+from bson import Binary, ObjectId
+from flask import Flask
+from pymongo import ReturnDocument
+
+import pydatalab.mongo
+from pydatalab.config import CONFIG
+from pydatalab.logger import LOGGER
+from pydatalab.utils import CustomJSONEncoder
+
+__all__ = (
+    "JOB_HANDLERS",
+    "JobStatus",
+    "register_job_handler",
+    "submit_job",
+    "get_job",
+    "get_job_result",
+    "update_job_progress",
+    "run_job_worker",
+    "start_job_workers",
+)
+
+JOBS_COLLECTION = "jobs"
+"""The name of the MongoDB collection used to store jobs."""
+
+JOB_LEASE = datetime.timedelta(minutes=10)
+"""The time after which a running job that has not reported any progress
+is assumed to have been abandoned by its worker, and can be claimed again."""
+
+JOB_HEARTBEAT_INTERVAL = JOB_LEASE / 5
+"""How often the lease of a running job is renewed by its worker."""
+
+MAX_JOB_ATTEMPTS = 3
+"""The maximum number of times a job will be claimed before it is failed."""
+
+MAX_RESULT_SIZE = 15 * 1024 * 1024
+"""The maximum size (in bytes) of a compressed job result that can be stored."""
+
+FINISHED_JOB_EXPIRY = datetime.timedelta(days=1)
+"""The time after which finished jobs (and their results) are removed from the database."""
+
+
+class JobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETE = "complete"
+    FAILED = "failed"
+
+
+JOB_HANDLERS: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+"""The registered handlers for each kind of job, which are passed the job document
+and return a JSON-serializable result."""
+
+
+def register_job_handler(kind: str):
+    """Decorator that registers the decorated function as the handler for jobs of the given kind."""
+
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+
+    return decorator
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(tz=datetime.timezone.utc)
+
+
+def _collection():
+    return pydatalab.mongo.get_database()[JOBS_COLLECTION]
+
+
+def submit_job(
+    kind: str,
+    payload: Dict[str, Any],
+    dedup_key: Optional[str] = None,
+    creator_id: Optional[str] = None,
+) -> str:
+    """Adds a job to the queue.
+
+    Parameters:
+        kind: The kind of job, which must have a registered handler.
+        payload: The JSON-serializable input data for the job.
+        dedup_key: If provided, any queued or running job with the same key
+            will be returned instead of creating a new job.
+        creator_id: The ID of the user submitting the job, which is recorded in
+            its `requester_ids`.
+
+    Returns:
+        The ID of the (new or existing) job.
+
+    """
+    if kind not in JOB_HANDLERS:
+        raise RuntimeError(f"No handler registered for jobs of kind {kind!r}")
+
+    now = _now()
+    job = {
+        "kind": kind,
+        "payload": payload,
+        "status": JobStatus.QUEUED,
+        "active": True,
+        "progress": 0.0,
+        "message": "Queued",
+        "attempts": 0,
+        "created": now,
+        "updated": now,
+    }
+    requesters = [creator_id] if creator_id else []
+
+    if dedup_key is None:
+        return str(_collection().insert_one({**job, "requester_ids": requesters}).inserted_id)
+
+    update: Dict[str, Any] = {"$setOnInsert": {**job, "dedup_key": dedup_key}}
+    if requesters:
+        update["$addToSet"] = {"requester_ids": {"$each": requesters}}
+    else:
+        update["$setOnInsert"]["requester_ids"] = []
+
+    for _ in range(2):
+        try:
+            existing = _collection().find_one_and_update(
+                {"dedup_key": dedup_key, "active": True},
+                update,
+                upsert=True,
+                projection={"_id": 1},
+                return_document=ReturnDocument.AFTER,
+            )
+            return str(existing["_id"])
+        except pymongo.errors.DuplicateKeyError:
+            # Another request created the same job concurrently, so try again to find it
+            continue
+
+    raise RuntimeError(f"Unable to submit job with {dedup_key=}")
+
+
+def get_job(job_id: str, include_payload: bool = False) -> Optional[Dict[str, Any]]:
+    """Returns the job document (without its result, or its payload unless
+    `include_payload` is set), if it exists.
+
+    """
+    try:
+        job_id = ObjectId(job_id)
+    except Exception:
+        return None
+
+    projection = {"result": 0} if include_payload else {"payload": 0, "result": 0}
+    return _collection().find_one({"_id": job_id}, projection=projection)
+
+
+def get_job_result(job_id: str) -> Any:
+    """Returns the stored result of a completed job, or `None` if there is no result."""
+    job = _collection().find_one({"_id": ObjectId(job_id)}, projection={"result": 1})
+    if not job or job.get("result") is None:
+        return None
+    return json.loads(zlib.decompress(job["result"]).decode("utf-8"))
+
+
+def update_job_progress(job_id: ObjectId, progress: float, message: Optional[str] = None) -> None:
+    """Records the progress (between 0 and 1) of a running job, which also renews its lease."""
+    update: Dict[str, Any] = {"progress": max(0.0, min(progress, 1.0)), "updated": _now()}
+    if message is not None:
+        update["message"] = message
+    _collection().update_one({"_id": job_id, "status": JobStatus.RUNNING}, {"$set": update})
+
+
+def _claim_job(worker_id: str) -> Optional[Dict[str, Any]]:
+    """Atomically claim the oldest queued job (or an abandoned running job)."""
+    now = _now()
+    return _collection().find_one_and_update(
+        {
+            "kind": {"$in": list(JOB_HANDLERS)},
+            "$or": [
+                {"status": JobStatus.QUEUED},
+                {"status": JobStatus.RUNNING, "updated": {"$lt": now - JOB_LEASE}},
+            ],
+        },
+        {
+            "$set": {
+                "status": JobStatus.RUNNING,
+                "worker": worker_id,
+                "started": now,
+                "updated": now,
+                "message": "Running",
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("created", pymongo.ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def _finish_job(job_id: ObjectId, status: str, result: Any = None, error: Optional[str] = None):
+    update: Dict[str, Any] = {
+        "status": status,
+        "finished": _now(),
+        "updated": _now(),
+        "message": "Complete" if status == JobStatus.COMPLETE else "Failed",
+    }
+    if status == JobStatus.COMPLETE:
+        update["progress"] = 1.0
+    if result is not None:
+        compressed = zlib.compress(json.dumps(result, cls=CustomJSONEncoder).encode("utf-8"))
+        if len(compressed) > MAX_RESULT_SIZE:
+            update["status"] = JobStatus.FAILED
+            update["message"] = "Failed"
+            error = f"Job result was too large to store ({len(compressed)} bytes)."
+        else:
+            update["result"] = Binary(compressed)
+    if error is not None:
+        update["error"] = error
+
+    _collection().update_one({"_id": job_id}, {"$set": update, "$unset": {"active": ""}})
+
+
+@contextlib.contextmanager
+def _job_heartbeat(job: Dict[str, Any]) -> Iterator[None]:
+    """Renews the lease of a running job every `JOB_HEARTBEAT_INTERVAL` from a
+    background thread, for as long as the context is active and the job is still
+    held by the worker that claimed it.
+
+    """
+    stopped = threading.Event()
+
+    def _renew():
+        while not stopped.wait(JOB_HEARTBEAT_INTERVAL.total_seconds()):
+            try:
+                _collection().update_one(
+                    {"_id": job["_id"], "status": JobStatus.RUNNING, "worker": job.get("worker")},
+                    {"$set": {"updated": _now()}},
+                )
+            except Exception as exc:
+                LOGGER.warning("Unable to renew the lease of job %s: %s", job["_id"], exc)
+
+    thread = threading.Thread(target=_renew, name="datalab-job-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def _run_job(job: Dict[str, Any]) -> None:
+    if job["attempts"] > MAX_JOB_ATTEMPTS:
+        _finish_job(job["_id"], JobStatus.FAILED, error="Job was abandoned too many times.")
+        return
+
+    try:
+        with _job_heartbeat(job):
+            result = JOB_HANDLERS[job["kind"]](job)
+    except Exception as exc:
+        LOGGER.warning("Job %s of kind %s failed: %s", job["_id"], job["kind"], exc)
+        _finish_job(job["_id"], JobStatus.FAILED, error=f"{exc.__class__.__name__}: {exc}")
+        return
+
+    _finish_job(job["_id"], JobStatus.COMPLETE, result=result)
+
+
+def run_job_worker(
+    app: Flask,
+    poll_interval: float = 1.0,
+    max_jobs: Optional[int] = None,
+    exit_when_idle: bool = False,
+) -> int:
+    """Runs a worker loop that claims and executes jobs from the queue.
+
+    Parameters:
+        app: The Flask app, used to provide an app context for each job.
+        poll_interval: How long to wait (in seconds) before checking for new jobs
+            when the queue is empty.
+        max_jobs: If provided, the worker will exit after executing this many jobs.
+        exit_when_idle: Whether to exit as soon as the queue is empty.
+
+    Returns:
+        The number of jobs executed.
+
+    """
+    worker_id = f"{os.uname().nodename}:{os.getpid()}"
+    parent_pid = os.getppid()
+    executed = 0
+
+    LOGGER.info("Starting job worker %s", worker_id)
+
+    while max_jobs is None or executed < max_jobs:
+        try:
+            job = _claim_job(worker_id)
+        except Exception as exc:
+            LOGGER.warning("Job worker %s unable to claim job: %s", worker_id, exc)
+            job = None
+
+        if job is None:
+            if exit_when_idle or os.getppid() != parent_pid:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        with app.app_context():
+            _run_job(job)
+        executed += 1
+
+    return executed
+
+
+def start_job_workers(
+    app: Flask, num_workers: Optional[int] = None
+) -> List[multiprocessing.Process]:
+    """Starts local job worker processes, forked from the current process.
+
+    The workers are daemonic, and will exit alongside the process that started them.
+
+    Parameters:
+        app: The Flask app to pass to the workers.
+        num_workers: The number of worker processes to start, defaults to
+            `CONFIG.RENDER_JOB_WORKERS`.
+
+    Returns:
+        The list of started processes.
+
+    """
+    if num_workers is None:
+        num_workers = CONFIG.RENDER_JOB_WORKERS
+
+    context = multiprocessing.get_context("fork")
+    workers = []
+    for _ in range(num_workers):
+        process = context.Process(
+            target=run_job_worker, args=(app,), name="datalab-job-worker", daemon=True
+        )
+        process.start()
+        workers.append(process)
+
+    return workers
@@ -0,0 +1,392 @@
+"""This module implements a watcher that keeps live files (i.e., files added from
+remote filesystems that are still being modified, such as the exports of a running
+cycler) up to date in the background, so that reading a live file never has to
+access its remote.
+
+The watcher checks for changes in two ways:
+
+- For remote filesystems that are mounted locally (i.e., without a `hostname`),
+  the directories containing live files are watched with inotify (on Linux), so
+  that changes are synced a few seconds after they are written. As inotify does
+  not report changes made by other machines to network filesystems, these files
+  are also checked periodically.
+- All live files are checked every `CONFIG.LIVE_FILE_POLL_INTERVAL` seconds: files
+  on ssh remotes with one batched `stat` for each host, over the shared connection
+  to that host (see `pydatalab.remote_sessions`), and files on mounted remotes
+  with a local `stat`.
+
+Files that have changed are synced into the file store, which bumps their
+`revision` and `last_modified_remote` (see `pydatalab.file_utils`). The derived
+caches are keyed on the revision (rendered blocks, see `pydatalab.render_cache`)
+or contents (parsed data, see `pydatalab.parsed_data`) of each file, so a sync
+invalidates any entries for the previous version of the file.
+
+When `CONFIG.LIVE_FILE_WATCHER` is enabled, `pydatalab.file_utils.get_file_info_by_id`
+no longer checks the remotes of live files, and a watcher should be run as a separate
+service with the `admin.watch-live-files` task, or alongside the server with
+`CONFIG.START_LIVE_FILE_WATCHER`. Only one watcher is active at a time, by holding
+a lease in the database that it renews as it checks and syncs files.
+
+"""
+
+import datetime
+import multiprocessing
+import os
+import select
+import struct
+import time
+from typing import Dict, List, Optional, Set
+
+import pymongo.errors
+from bson import ObjectId
+from flask import Flask
+from pymongo import ReturnDocument
+
+import pydatalab.mongo
+from pydatalab.config import CONFIG
+from pydatalab.logger import LOGGER
+from pydatalab.models import File
+
+__all__ = (
+    "WATCHER_COLLECTION",
+    "check_live_files",
+    "run_live_file_watcher",
+    "start_live_file_watcher",
+)
+
+WATCHER_COLLECTION = "liveFileWatcher"
+"""The name of the MongoDB collection used to store the lease of the active watcher."""
+
+WATCHER_LEASE = datetime.timedelta(minutes=10)
+"""The time after which a watcher that has not renewed its lease is assumed to have
+exited, so that another watcher can take over. The lease is renewed before each file
+is synced, so this should be longer than it takes to sync any one file."""
+
+SETTLE_DELAY = 2.0
+"""How long to wait (in seconds) after a change is reported by inotify before syncing
+the file, so that a burst of writes to the file results in a single sync."""
+
+_LEASE_ID = "watcher"
+
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_WATCH_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+_EVENT_HEADER = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(tz=datetime.timezone.utc)
+
+
+def _collection():
+    return pydatalab.mongo.get_database()[WATCHER_COLLECTION]
+
+
+def _acquire_lease(owner: str) -> bool:
+    """Acquires (or renews) the lease of the active watcher, returning whether it is held by `owner`."""
+    now = _now()
+    try:
+        lease = _collection().find_one_and_update(
+            {
+                "_id": _LEASE_ID,
+                "$or": [{"owner": owner}, {"renewed": {"$lt": now - WATCHER_LEASE}}],
+            },
+            {"$set": {"owner": owner, "renewed": now}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except pymongo.errors.DuplicateKeyError:
+        # The lease is held by another watcher
+        return False
+    return lease is not None and lease["owner"] == owner
+
+
+def _release_lease(owner: str) -> None:
+    _collection().delete_one({"_id": _LEASE_ID, "owner": owner})
+
+
+class _Inotify:
+    """A minimal wrapper around the Linux inotify API (via `ctypes`), reporting
+    changes to the files within a set of watched directories.
+
+    """
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "Unable to initialise inotify")
+        self.fd = fd
+        self.directories: Dict[int, str] = {}
+
+    def watch(self, directories: Set[str]) -> None:
+        """Updates the set of watched directories."""
+        watched = {directory: wd for wd, directory in self.directories.items()}
+        for directory in set(watched) - directories:
+            self._libc.inotify_rm_watch(self.fd, watched[directory])
+            self.directories.pop(watched[directory], None)
+        for directory in directories - set(watched):
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), _WATCH_MASK)
+            if wd < 0:
+                LOGGER.debug("Unable to watch %s with inotify, will only poll it", directory)
+                continue
+            self.directories[wd] = directory
+
+    def read(self, timeout: float) -> Optional[Set[str]]:
+        """Waits up to `timeout` seconds for changes, returning the paths of the
+        changed files, or `None` if changes were lost (i.e., the event queue overflowed).
+
+        """
+        ready, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        changed: Set[str] = set()
+        overflowed = False
+        while ready:
+            try:
+                data = os.read(self.fd, _READ_SIZE)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+                if mask & _IN_Q_OVERFLOW:
+                    overflowed = True
+                elif mask & _IN_IGNORED:
+                    # The directory was removed
+                    self.directories.pop(wd, None)
+                elif name and wd in self.directories:
+                    changed.add(os.path.join(self.directories[wd], os.fsdecode(name)))
+        return None if overflowed else changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def _remote_timestamp(mtime: float) -> datetime.datetime:
+    """Converts a modification time to the precision with which it is stored in the database."""
+    timestamp = datetime.datetime.fromtimestamp(mtime)
+    return timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)
+
+
+def _get_live_files(file_ids: Optional[List[ObjectId]] = None) -> Dict[str, File]:
+    """Returns the live files (or the subset of them with the given IDs), keyed
+    by their full remote path.
+
+    """
+    remotes = {fs.name: fs for fs in CONFIG.REMOTE_FILESYSTEMS}
+    query: Dict = {"is_live": True}
+    if file_ids is not None:
+        query["_id"] = {"$in": file_ids}
+
+    live_files = {}
+    for file_info in pydatalab.mongo.get_database().files.find(query):
+        file_info = File(**file_info)
+        remote = remotes.get(file_info.source_server_name or "")
+        if remote is None or not file_info.source_path or not file_info.location:
+            continue
+        path = os.path.join(remote.path, file_info.source_path)
+        if remote.hostname:
+            path = f"{remote.hostname}:{path}"
+        live_files[path] = file_info
+    return live_files
+
+
+def _stat_live_files(paths: List[str]) -> Dict[str, datetime.datetime]:
+    """Returns the last modified times of the given files that could be found, with
+    one request for all of the files on each ssh remote.
+
+    """
+    from pydatalab.remote_sessions import split_remote_path, stat_remote_files
+
+    timestamps = {}
+    paths_by_host: Dict[str, Dict[str, str]] = {}
+    for path in paths:
+        if path.startswith("ssh://"):
+            hostname, remote_path = split_remote_path(path)
+            paths_by_host.setdefault(hostname, {})[remote_path] = path
+            continue
+        try:
+            timestamps[path] = _remote_timestamp(os.stat(path).st_mtime)
+        except OSError as exc:
+            LOGGER.debug("Unable to check live file %s: %r", path, exc)
+
+    for hostname, host_paths in paths_by_host.items():
+        try:
+            stats = stat_remote_files(hostname, list(host_paths))
+        except RuntimeError as exc:
+            LOGGER.warning("Unable to check live files on %s: %s", hostname, exc)
+            continue
+        for remote_path, path in host_paths.items():
+            if stats[remote_path] is None:
+                LOGGER.debug("Live file %s could not be found on its remote", path)
+                continue
+            timestamps[path] = _remote_timestamp(stats[remote_path].mtime)
+
+    return timestamps
+
+
+def check_live_files(file_ids: Optional[List[ObjectId]] = None, owner: Optional[str] = None) -> int:
+    """Checks live files for changes on their remotes, syncing any that have
+    changed into the file store. Files that have not changed for
+    `pydatalab.file_utils.LIVE_FILE_CUTOFF` are no longer marked as live.
+
+    Must be called within a Flask app context.
+
+    Parameters:
+        file_ids: The IDs of the files to check, defaults to all live files.
+        owner: The watcher running the check, if any, whose lease is renewed
+            before each file is synced. The check stops early if the lease has
+            been taken over by another watcher.
+
+    Returns:
+        The number of files that were updated.
+
+    """
+    from pydatalab.file_utils import LIVE_FILE_CUTOFF, _check_and_sync_file
+
+    live_files = _get_live_files(file_ids)
+    timestamps = _stat_live_files(list(live_files))
+
+    updated = 0
+    for path, remote_timestamp in timestamps.items():
+        file_info = live_files[path]
+        cached_timestamp = file_info.last_modified_remote
+        if cached_timestamp is not None and remote_timestamp <= cached_timestamp:
+            if datetime.datetime.now() - remote_timestamp <= LIVE_FILE_CUTOFF:
+                continue
+        if owner is not None and not _acquire_lease(owner):
+            LOGGER.warning("Live file watcher %s lost its lease while syncing files", owner)
+            break
+        try:
+            synced = _check_and_sync_file(
+                file_info,
+                file_info.immutable_id,
+                remote_timestamp=remote_timestamp,
+                max_age=datetime.timedelta(0),
+            )
+        except Exception as exc:
+            LOGGER.warning("Unable to sync live file %s: %r", path, exc)
+            continue
+        if synced.revision != file_info.revision:
+            LOGGER.debug("Updated live file %s to revision %s", path, synced.revision)
+            updated += 1
+
+    return updated
+
+
+def run_live_file_watcher(
+    app: Flask, poll_interval: Optional[float] = None, max_polls: Optional[int] = None
+) -> int:
+    """Runs the watcher loop, which checks all live files every `poll_interval`
+    seconds and, in between, syncs files on mounted remotes as soon as inotify
+    reports that they have changed.
+
+    If another watcher holds the lease, this watcher waits to take over from it.
+
+    Parameters:
+        app: The Flask app, used to provide an app context for each check.
+        poll_interval: The interval (in seconds) at which all live files are
+            checked, defaults to `CONFIG.LIVE_FILE_POLL_INTERVAL`.
+        max_polls: If provided, the watcher will exit after this many intervals.
+
+    Returns:
+        The number of file updates made.
+
+    """
+    from pydatalab.remote_sessions import close_remote_sessions
+
+    if poll_interval is None:
+        poll_interval = CONFIG.LIVE_FILE_POLL_INTERVAL
+
+    owner = f"{os.uname().nodename}:{os.getpid()}"
+    parent_pid = os.getppid()
+
+    inotify: Optional[_Inotify] = None
+    try:
+        inotify = _Inotify()
+    except (OSError, AttributeError) as exc:
+        LOGGER.info("inotify is not available (%r), live files will only be polled", exc)
+
+    LOGGER.info("Starting live file watcher %s", owner)
+
+    updated = 0
+    polls = 0
+    try:
+        while max_polls is None or polls < max_polls:
+            if os.getppid() != parent_pid:
+                break
+            deadline = time.monotonic() + poll_interval
+            polls += 1
+
+            with app.app_context():
+                try:
+                    if not _acquire_lease(owner):
+                        time.sleep(poll_interval)
+                        continue
+                    updated += check_live_files(owner=owner)
+                    mounted = {
+                        path: file_info.immutable_id
+                        for path, file_info in _get_live_files().items()
+                        if not path.startswith("ssh://")
+                    }
+                except Exception as exc:
+                    LOGGER.warning("Live file watcher %s unable to check files: %r", owner, exc)
+                    time.sleep(poll_interval)
+                    continue
+
+                if inotify is None:
+                    time.sleep(max(deadline - time.monotonic(), 0))
+                    continue
+
+                inotify.watch({os.path.dirname(path) for path in mounted})
+                while (remaining := deadline - time.monotonic()) > 0:
+                    changed = inotify.read(remaining)
+                    if changed is None:
+                        # Changes were missed, so check all files now
+                        break
+                    if not (changed & set(mounted)):
+                        continue
+                    time.sleep(SETTLE_DELAY)
+                    changed |= inotify.read(0) or set()
+                    try:
+                        updated += check_live_files(
+                            [mounted[path] for path in changed if path in mounted], owner=owner
+                        )
+                    except Exception as exc:
+                        LOGGER.warning("Live file watcher %s unable to sync files: %r", owner, exc)
+
+    finally:
+        if inotify is not None:
+            inotify.close()
+        close_remote_sessions()
+        try:
+            with app.app_context():
+                _release_lease(owner)
+        except Exception:
+            pass
+
+    return updated
+
+
+def start_live_file_watcher(app: Flask) -> multiprocessing.Process:
+    """Starts the live file watcher in a daemonic process forked from the current
+    process, which will exit alongside the process that started it (see
+    `CONFIG.START_LIVE_FILE_WATCHER`).
+
+    """
+    context = multiprocessing.get_context("fork")
+    process = context.Process(
+        target=run_live_file_watcher, args=(app,), name="datalab-live-file-watcher", daemon=True
+    )
+    process.start()
+    return process
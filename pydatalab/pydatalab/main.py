@@ -16,6 +16,7 @@ from pydatalab.logger import LOGGER, setup_log
 from pydatalab.login import LOGIN_MANAGER
 from pydatalab.send_email import MAIL
 from pydatalab.utils import BSONProvider
+from pydatalab.worker_pool import start_worker_pool
 
 COMPRESS = Compress()
 
@@ -150,17 +151,37 @@ def create_app(
 
     # Must use the full path so that this object can be mocked for testing
     flask_mongo = pydatalab.mongo.flask_mongo
-    flask_mongo.init_app(app, connectTimeoutMS=100, serverSelectionTimeoutMS=100)
+    flask_mongo.init_app(app)
 
     for extension in (LOGIN_MANAGER, MAIL, COMPRESS):
         extension.init_app(app)
 
+    register_endpoints(app)
+
+    # The worker pool must be forked before any database connections are opened
+    # (or any other threads are started) by this process
+    start_worker_pool(app)
+
     pydatalab.mongo.create_default_indices()
 
     if CONFIG.FILE_DIRECTORY is not None:
         pathlib.Path(CONFIG.FILE_DIRECTORY).mkdir(parents=False, exist_ok=True)
 
-    register_endpoints(app)
+    if CONFIG.CACHE_DIRECTORY is not None:
+        pathlib.Path(CONFIG.CACHE_DIRECTORY).mkdir(parents=False, exist_ok=True)
+
+    if CONFIG.RENDER_JOB_WORKERS:
+        from pydatalab.jobs import start_job_workers
+
+        start_job_workers(app)
+        LOGGER.info("Started %s background job worker(s).", CONFIG.RENDER_JOB_WORKERS)
+
+    if CONFIG.START_LIVE_FILE_WATCHER:
+        from pydatalab.live_files import start_live_file_watcher
+
+        start_live_file_watcher(app)
+        LOGGER.info("Started live file watcher.")
+
     LOGGER.info("App created.")
 
     @app.route("/logout")
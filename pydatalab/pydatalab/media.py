@@ -0,0 +1,750 @@
+"""This module generates browser-friendly previews of image files (e.g., TIFFs
+from microscopes), so that they can be displayed by the media block without
+converting or embedding the original image on every render.
+
+For each revision of an image file, two variants are generated once and stored
+in a `.previews` directory alongside the file:
+
+- `preview`: a WebP image downscaled to at most `CONFIG.IMAGE_PREVIEW_SIZE` pixels
+  along its longest side,
+- `full`: a full-resolution PNG, only for formats that browsers cannot display
+  (for other formats, the original file is served instead).
+
+The variants are named by a key computed from the revision, size and modification
+time of the file, and are served by the `/files/<file_id>/preview/<variant>` endpoint,
+which (re)generates them if necessary. URLs to them (see `get_image_preview_urls`)
+include the key, so that they can be cached by the browser indefinitely.
+
+Images larger than `CONFIG.IMAGE_TILING_MIN_PIXELS` (e.g., SEM or optical mosaics)
+are never converted whole. Instead, a background job (see `submit_image_pyramid_job`)
+builds a DeepZoom-style pyramid of `TILE_SIZE` WebP tiles for them, in a
+`<filename>.<key>.tiles` directory alongside the other variants:
+
+- level `n` holds the image downscaled by a factor of `2 ** (max_level - n)`, where
+  level `max_level` is the full-resolution image and level 0 is a single pixel,
+- each level is split into tiles stored as `<level>/<x>_<y>.webp`, and
+- an `info.json` file describing the pyramid is written once it is complete.
+
+The full-resolution level is read in bands of `TILE_SIZE` rows (for TIFFs that are
+uncompressed, or compressed with LZW, Deflate or PackBits, only the strips or tiles of
+the file covering each band are decoded), and each lower level is assembled from the
+tiles of the level above it, so the memory used does not depend on the size of the
+image. Images that can only be decoded whole are not tiled if they are too large to
+decode at once (see `check_image_tileable`). The `preview` variant is taken from the
+pyramid, and the tiles are served by the `/files/<file_id>/tiles/<level>/<x>/<y>`
+endpoint.
+
+"""
+
+import contextlib
+import hashlib
+import io
+import json
+import math
+import os
+import shutil
+import struct
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+from PIL import Image, features
+from PIL.TiffImagePlugin import (
+    BITSPERSAMPLE,
+    COMPRESSION,
+    EXTRASAMPLES,
+    FILLORDER,
+    IMAGELENGTH,
+    IMAGEWIDTH,
+    PHOTOMETRIC_INTERPRETATION,
+    PLANAR_CONFIGURATION,
+    PREDICTOR,
+    ROWSPERSTRIP,
+    SAMPLEFORMAT,
+    SAMPLESPERPIXEL,
+    STRIPBYTECOUNTS,
+    STRIPOFFSETS,
+    TILEBYTECOUNTS,
+    TILELENGTH,
+    TILEOFFSETS,
+    TILEWIDTH,
+    ImageFileDirectory_v2,
+    TiffImageFile,
+)
+
+import pydatalab.mongo
+from pydatalab.config import CONFIG
+from pydatalab.jobs import register_job_handler, submit_job, update_job_progress
+from pydatalab.logger import LOGGER
+
+__all__ = (
+    "IMAGE_PREVIEW_EXTENSIONS",
+    "BROWSER_IMAGE_EXTENSIONS",
+    "PREVIEW_VARIANTS",
+    "get_image_preview_key",
+    "get_image_preview_path",
+    "ensure_image_previews",
+    "get_image_preview_urls",
+    "TILE_SIZE",
+    "is_tiled_image",
+    "check_image_tileable",
+    "get_image_tile_path",
+    "get_image_pyramid_info",
+    "build_image_pyramid",
+    "submit_image_pyramid_job",
+)
+
+IMAGE_PREVIEW_EXTENSIONS = (".png", ".jpeg", ".jpg", ".tif", ".tiff")
+"""The extensions of the image files that previews are generated for."""
+
+BROWSER_IMAGE_EXTENSIONS = (".png", ".jpeg", ".jpg")
+"""The extensions of the image files that can be displayed by browsers directly."""
+
+PREVIEW_VARIANTS: Dict[str, Tuple[str, str]] = {
+    "preview": ("WEBP", ".webp"),
+    "full": ("PNG", ".png"),
+}
+"""The format and file extension of each variant."""
+
+TILE_SIZE = 256
+"""The width and height, in pixels, of the tiles of image pyramids."""
+
+_PREVIEW_DIRECTORY = ".previews"
+_PYRAMID_INFO = "info.json"
+_PNG_MODES = ("1", "L", "LA", "P", "RGB", "RGBA", "I;16")
+_PART_COMPRESSIONS = ("tiff_lzw", "tiff_adobe_deflate", "tiff_deflate", "packbits")
+"""The TIFF compressions whose strips or tiles can be decoded one at a time."""
+_PART_TAGS = (
+    BITSPERSAMPLE,
+    COMPRESSION,
+    PHOTOMETRIC_INTERPRETATION,
+    FILLORDER,
+    SAMPLESPERPIXEL,
+    PLANAR_CONFIGURATION,
+    PREDICTOR,
+    EXTRASAMPLES,
+    SAMPLEFORMAT,
+)
+_WEBP_MODES = ("RGB", "RGBA")
+
+
+def get_image_preview_key(file_info: Dict[str, Any]) -> str:
+    """Returns a key identifying the current contents of an image file.
+
+    Parameters:
+        file_info: The stored file information, including its `location` and `revision`.
+
+    Raises:
+        OSError: If the file does not exist on disk.
+
+    """
+    stat = os.stat(file_info["location"])
+    return hashlib.sha1(
+        f"{file_info.get('revision')}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+    ).hexdigest()[:16]
+
+
+def _has_full_variant(location: str) -> bool:
+    return Path(location).suffix.lower() not in BROWSER_IMAGE_EXTENSIONS
+
+
+def get_image_preview_path(location: str, key: str, variant: str) -> Path:
+    """Returns the path of the given variant of the preview with the given key."""
+    location = Path(location)
+    return (
+        location.parent
+        / _PREVIEW_DIRECTORY
+        / f"{location.name}.{key}.{variant}{PREVIEW_VARIANTS[variant][1]}"
+    )
+
+
+def _is_high_bit_depth(image: Image.Image) -> bool:
+    return image.mode.startswith("I") or image.mode == "F"
+
+
+def _value_range(image: Image.Image) -> Optional[Tuple[float, float]]:
+    """Returns the range of the finite values of an image, if it has any."""
+    values = np.asarray(image, dtype=np.float64)
+    finite = values[np.isfinite(values)]
+    return (float(finite.min()), float(finite.max())) if finite.size else None
+
+
+def _to_8bit(image: Image.Image, value_range: Optional[Tuple[float, float]] = None) -> Image.Image:
+    """Scales high bit-depth (e.g., 16-bit or floating point) greyscale images to 8 bits,
+    using the given range of values (defaults to the range of the values of the image).
+
+    """
+    values = np.asarray(image, dtype=np.float64)
+    if value_range is None:
+        value_range = _value_range(image)
+    low, high = value_range or (0.0, 1.0)
+    scaled = (np.nan_to_num(values, nan=low) - low) / ((high - low) or 1.0)
+    return Image.fromarray(np.clip(np.round(255 * scaled), 0, 255).astype(np.uint8), mode="L")
+
+
+def _convert(
+    image: Image.Image,
+    modes: Tuple[str, ...],
+    value_range: Optional[Tuple[float, float]] = None,
+) -> Image.Image:
+    if image.mode in modes:
+        return image
+    if _is_high_bit_depth(image):
+        image = _to_8bit(image, value_range)
+        return image if image.mode in modes else image.convert("RGB")
+    if "RGBA" in modes and ("A" in image.mode or "transparency" in image.info):
+        return image.convert("RGBA")
+    return image.convert("RGB")
+
+
+def _save_atomic(image: Image.Image, path: Path, format: str) -> None:
+    temporary = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+    try:
+        image.save(temporary, format=format)
+        os.replace(temporary, path)
+    finally:
+        temporary.unlink(missing_ok=True)
+
+
+def _remove_stale_previews(location: Path, key: str) -> None:
+    """Removes the previews (and pyramids) of previous revisions of the file at `location`."""
+    directory = location.parent / _PREVIEW_DIRECTORY
+    if not directory.exists():
+        return
+    for item in os.scandir(directory):
+        if item.name.startswith(f"{location.name}.") and not item.name.startswith(
+            f"{location.name}.{key}."
+        ):
+            try:
+                if item.is_dir(follow_symlinks=False):
+                    shutil.rmtree(item.path)
+                else:
+                    os.unlink(item.path)
+            except OSError:
+                pass
+
+
+@contextlib.contextmanager
+def _open_image(location: str) -> Iterator[Image.Image]:
+    """Opens (the first frame of) an image without reading its pixel data.
+
+    TIFFs that are too large for Pillow's decompression bomb check (which is
+    based on the size in their header) are opened regardless, as they can be
+    tiled without being decoded whole; the check is instead applied by
+    `_check_image_pixels` before an image is decoded at once.
+
+    """
+    try:
+        image = Image.open(location)
+    except Image.DecompressionBombError as exc:
+        try:
+            image = TiffImageFile(location)
+        except (OSError, SyntaxError):
+            raise exc from None
+        LOGGER.debug("Opened %s without checking its size, to decode it in parts", location)
+
+    with image:
+        image.seek(0)
+        yield image
+
+
+def _check_image_pixels(image: Image.Image) -> None:
+    """Raises `Image.DecompressionBombError` if an image is too large to decode at once."""
+    max_pixels = Image.MAX_IMAGE_PIXELS
+    if max_pixels and image.width * image.height > 2 * max_pixels:
+        raise Image.DecompressionBombError(
+            f"Image size ({image.width * image.height} pixels) exceeds limit of "
+            f"{2 * max_pixels} pixels, and it cannot be decoded in parts"
+        )
+
+
+def is_tiled_image(size: Tuple[int, int]) -> bool:
+    """Whether an image of the given (width, height) is shown as a tile pyramid."""
+    return size[0] * size[1] > CONFIG.IMAGE_TILING_MIN_PIXELS
+
+
+def _can_decode_in_parts(image: Image.Image) -> bool:
+    return (
+        _row_tiles(image, 0, image.height) is not None
+        or _compressed_row_parts(image, 0, image.height) is not None
+    )
+
+
+def check_image_tileable(file_info: Dict[str, Any]) -> None:
+    """Checks that a tile pyramid can be built for an image file, before submitting
+    a job to build it.
+
+    Raises:
+        Image.DecompressionBombError: If the image can only be decoded whole (e.g.,
+            a JPEG, or a TIFF stored in a single compressed strip) and is too large
+            to be decoded at once.
+
+    """
+    with _open_image(file_info["location"]) as image:
+        if _can_decode_in_parts(image):
+            return
+        try:
+            _check_image_pixels(image)
+        except Image.DecompressionBombError as exc:
+            raise Image.DecompressionBombError(
+                f"{exc}. Save the image as an uncompressed TIFF, or as a TIFF compressed "
+                "with LZW, Deflate or PackBits in strips or tiles, to view it."
+            ) from None
+
+
+def ensure_image_previews(file_info: Dict[str, Any]) -> Optional[str]:
+    """Generates the preview variants for the current revision of an image file,
+    if they do not already exist.
+
+    The previews of tiled images (see `is_tiled_image`) are not generated here,
+    but by `build_image_pyramid`.
+
+    Parameters:
+        file_info: The stored file information, including its `location` and `revision`.
+
+    Returns:
+        The key of the previews, or `None` if the file is not a supported image.
+
+    """
+    location = file_info["location"]
+    if Path(location).suffix.lower() not in IMAGE_PREVIEW_EXTENSIONS:
+        return None
+
+    key = get_image_preview_key(file_info)
+    variants = ["preview"] + (["full"] if _has_full_variant(location) else [])
+    missing = [v for v in variants if not get_image_preview_path(location, key, v).exists()]
+    if not missing:
+        return key
+
+    with _open_image(location) as image:
+        if is_tiled_image(image.size):
+            _remove_stale_previews(Path(location), key)
+            return key
+
+        directory = Path(location).parent / _PREVIEW_DIRECTORY
+        directory.mkdir(exist_ok=True)
+
+        LOGGER.debug("Generating %s image previews of %s", missing, location)
+        _check_image_pixels(image)
+        if "full" in missing:
+            _save_atomic(
+                _convert(image, _PNG_MODES), get_image_preview_path(location, key, "full"), "PNG"
+            )
+        if "preview" in missing:
+            preview = _convert(image, _WEBP_MODES + ("L",))
+            preview.thumbnail((CONFIG.IMAGE_PREVIEW_SIZE, CONFIG.IMAGE_PREVIEW_SIZE))
+            _save_atomic(
+                _convert(preview, _WEBP_MODES),
+                get_image_preview_path(location, key, "preview"),
+                "WEBP",
+            )
+
+    _remove_stale_previews(Path(location), key)
+    return key
+
+
+def get_image_preview_urls(file_info: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    """Generates the previews of an image file if necessary, and returns the URLs
+    (relative to the API) of the downscaled `preview` and either the `full` resolution
+    image or, for tiled images, the description of its `tiles`.
+
+    Returns:
+        The URLs by variant, or `None` if the file is not a supported image.
+
+    """
+    key = ensure_image_previews(file_info)
+    if key is None:
+        return None
+
+    file_id = str(file_info.get("immutable_id") or file_info["_id"])
+    urls = {"preview": f"/files/{file_id}/preview/preview?key={key}"}
+    with _open_image(file_info["location"]) as image:
+        tiled = is_tiled_image(image.size)
+    if tiled:
+        urls["tiles"] = f"/files/{file_id}/tiles?key={key}"
+    elif _has_full_variant(file_info["location"]):
+        urls["full"] = f"/files/{file_id}/preview/full?key={key}"
+    else:
+        urls["full"] = f"/files/{file_id}/{file_info['name']}"
+    return urls
+
+
+def _get_pyramid_directory(location: str, key: str) -> Path:
+    location = Path(location)
+    return location.parent / _PREVIEW_DIRECTORY / f"{location.name}.{key}.tiles"
+
+
+def get_image_tile_path(location: str, key: str, level: int, x: int, y: int) -> Path:
+    """Returns the path of a tile of the pyramid with the given key."""
+    return _get_pyramid_directory(location, key) / str(level) / f"{x}_{y}.webp"
+
+
+def get_image_pyramid_info(file_info: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Returns the description of the completed pyramid for the current revision
+    of an image file, or `None` if it has not been built.
+
+    """
+    path = _get_pyramid_directory(file_info["location"], get_image_preview_key(file_info))
+    try:
+        return json.loads((path / _PYRAMID_INFO).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _level_size(width: int, height: int, max_level: int, level: int) -> Tuple[int, int]:
+    scale = 2 ** (max_level - level)
+    return math.ceil(width / scale), math.ceil(height / scale)
+
+
+def _row_tiles(image: Image.Image, top: int, bottom: int) -> Optional[List[Tuple[Any, ...]]]:
+    """Returns the tiles of an image that cover the rows between `top` and `bottom`,
+    splitting any uncompressed strips to the rows needed.
+
+    Returns:
+        The tiles, as `(codec, extents, offset, (rawmode, stride, ystep))` tuples with
+        extents relative to the full image and a non-zero stride, or `None` if the
+        image is compressed (see `_compressed_row_parts`) or in another format.
+
+    """
+    # Tiles are unpacked positionally, as they are only named tuples from Pillow 11
+    if image.format != "TIFF" or any(tile[0] != "raw" for tile in image.tile):
+        return None
+    if image.mode in ("P", "PA") or image.tag_v2.get(PLANAR_CONFIGURATION, 1) != 1:
+        return None
+
+    bits = tuple(image.tag_v2.get(BITSPERSAMPLE, (1,)))
+    if len(bits) == 1:
+        bits *= image.tag_v2.get(SAMPLESPERPIXEL, 1)
+
+    tiles = []
+    for codec, extents, offset, args in (tile[:4] for tile in image.tile):
+        x0, y0, x1, y1 = extents
+        if y1 <= top or y0 >= bottom:
+            continue
+        rawmode, stride, ystep = args[:3]
+        stride = stride or ((x1 - x0) * sum(bits) + 7) // 8
+        if ystep == 1 and (y0 < top or y1 > bottom):
+            start, end = max(y0, top), min(y1, bottom)
+            offset += (start - y0) * stride
+            y0, y1 = start, end
+        tiles.append((codec, (x0, y0, x1, y1), offset, (rawmode, stride, ystep)))
+
+    return tiles
+
+
+def _decode_rows(image: Image.Image, top: int, bottom: int) -> Image.Image:
+    """Decodes the rows between `top` and `bottom` of an uncompressed TIFF, reading
+    only the tiles covering them (see `_row_tiles`) from its file.
+
+    """
+    tiles = _row_tiles(image, top, bottom)
+    assert tiles is not None
+    band = Image.new(image.mode, (image.width, bottom - top))
+    fp = image.fp
+    assert fp is not None
+    for _, (x0, y0, x1, y1), offset, (rawmode, stride, ystep) in tiles:
+        fp.seek(offset)
+        data = fp.read((y1 - y0) * stride)
+        tile = Image.frombytes(image.mode, (x1 - x0, y1 - y0), data, "raw", rawmode, stride, ystep)
+        band.paste(tile, (x0, y0 - top))
+    return band
+
+
+def _compressed_row_parts(
+    image: Image.Image, top: int, bottom: int
+) -> Optional[List[Tuple[Tuple[int, int, int, int], int, int]]]:
+    """Returns the compressed strips or tiles of a TIFF that cover the rows between
+    `top` and `bottom`.
+
+    Returns:
+        The parts, as `(extents, offset, length)` tuples with extents relative to
+        the full image (including any padding of tiles beyond its edges), or `None`
+        if the image cannot be decoded in parts (e.g., other compressions, or strips
+        or tiles that are themselves too large to decode at once).
+
+    """
+    if image.format != "TIFF" or image.info.get("compression") not in _PART_COMPRESSIONS:
+        return None
+    if image.mode in ("P", "PA") or image.tag_v2.get(PLANAR_CONFIGURATION, 1) != 1:
+        return None
+    if not features.check("libtiff"):
+        return None
+
+    tags = image.tag_v2
+    if TILEOFFSETS in tags:
+        part_width, part_height = tags.get(TILEWIDTH, 0), tags.get(TILELENGTH, 0)
+        offsets, lengths = tags[TILEOFFSETS], tags.get(TILEBYTECOUNTS, ())
+    else:
+        part_width, part_height = image.width, tags.get(ROWSPERSTRIP, image.height)
+        offsets, lengths = tags.get(STRIPOFFSETS, ()), tags.get(STRIPBYTECOUNTS, ())
+    if part_width <= 0 or part_height <= 0 or len(offsets) != len(lengths):
+        return None
+    if Image.MAX_IMAGE_PIXELS and part_width * part_height > Image.MAX_IMAGE_PIXELS:
+        return None
+
+    columns = math.ceil(image.width / part_width)
+    if len(offsets) < columns * math.ceil(image.height / part_height):
+        return None
+
+    parts = []
+    for index, (offset, length) in enumerate(zip(offsets, lengths)):
+        x0, y0 = (index % columns) * part_width, (index // columns) * part_height
+        if y0 >= image.height:
+            break
+        # Strips (but not tiles) are truncated at the bottom of the image
+        y1 = y0 + part_height if TILEOFFSETS in tags else min(y0 + part_height, image.height)
+        if y1 <= top or y0 >= bottom:
+            continue
+        parts.append(((x0, y0, x0 + part_width, y1), offset, length))
+
+    return parts
+
+
+def _decode_part(
+    image: Image.Image, size: Tuple[int, int], offset: int, length: int
+) -> Image.Image:
+    """Decodes a single compressed strip or tile of a TIFF, by wrapping it in a TIFF
+    of its own, with the tags of the image that describe how it is encoded.
+
+    """
+    ifd = ImageFileDirectory_v2(prefix=image.tag_v2.prefix)
+    for tag in _PART_TAGS:
+        if tag in image.tag_v2:
+            ifd[tag] = image.tag_v2[tag]
+            ifd.tagtype[tag] = image.tag_v2.tagtype[tag]
+    ifd[IMAGEWIDTH], ifd[IMAGELENGTH] = size
+    ifd[ROWSPERSTRIP] = size[1]
+    # Strip offsets are written relative to the end of the directory
+    ifd[STRIPOFFSETS] = 0
+    ifd[STRIPBYTECOUNTS] = length
+    for tag in (IMAGEWIDTH, IMAGELENGTH, ROWSPERSTRIP, STRIPOFFSETS, STRIPBYTECOUNTS):
+        ifd.tagtype[tag] = 4
+
+    fp = image.fp
+    assert fp is not None
+    fp.seek(offset)
+    header = ifd.prefix + struct.pack("<HL" if ifd.prefix == b"II" else ">HL", 42, 8)
+    with Image.open(io.BytesIO(header + ifd.tobytes(8) + fp.read(length))) as part:
+        part.load()
+        return part.copy()
+
+
+def _decode_compressed_rows(
+    image: Image.Image,
+    top: int,
+    bottom: int,
+    decoded: Dict[int, Tuple[int, Image.Image]],
+) -> Image.Image:
+    """Decodes the rows between `top` and `bottom` of a compressed TIFF, decoding
+    only the strips or tiles covering them (see `_compressed_row_parts`).
+
+    Parameters:
+        decoded: The parts decoded for previous bands, by offset, along with the
+            row they end at, reused for parts covering several bands and dropped
+            once they are no longer needed.
+
+    """
+    parts = _compressed_row_parts(image, top, bottom)
+    assert parts is not None
+    for offset in [o for o, (end, _) in decoded.items() if end <= top]:
+        del decoded[offset]
+
+    band = Image.new(image.mode, (image.width, bottom - top))
+    for (x0, y0, x1, y1), offset, length in parts:
+        if offset not in decoded:
+            decoded[offset] = (y1, _decode_part(image, (x1 - x0, y1 - y0), offset, length))
+        band.paste(decoded[offset][1], (x0, y0 - top))
+    return band
+
+
+def _iter_row_bands(location: str, band_height: int) -> Iterator[Tuple[int, Image.Image]]:
+    """Reads an image in bands of rows, decoding only the parts of the file
+    covering each band where possible.
+
+    Yields:
+        The index of the first row of each band, and the band itself.
+
+    """
+    with _open_image(location) as image:
+        width, height = image.size
+        if _row_tiles(image, 0, height) is not None:
+            for top in range(0, height, band_height):
+                yield top, _decode_rows(image, top, min(top + band_height, height))
+            return
+
+        if _compressed_row_parts(image, 0, height) is not None:
+            decoded: Dict[int, Tuple[int, Image.Image]] = {}
+            for top in range(0, height, band_height):
+                yield (
+                    top,
+                    _decode_compressed_rows(image, top, min(top + band_height, height), decoded),
+                )
+            return
+
+        LOGGER.debug("Decoding %s whole, as it cannot be decoded in parts", location)
+        _check_image_pixels(image)
+        image.load()
+        for top in range(0, height, band_height):
+            yield top, image.crop((0, top, width, min(top + band_height, height)))
+
+
+def build_image_pyramid(
+    file_info: Dict[str, Any],
+    progress: Optional[Callable[[float, str], None]] = None,
+) -> Dict[str, Any]:
+    """Builds the tile pyramid (and the `preview` variant) for the current revision
+    of an image file, if it has not already been built.
+
+    Parameters:
+        file_info: The stored file information, including its `location` and `revision`.
+        progress: An optional callback, passed the fraction of the pyramid built so
+            far and a description of the current step.
+
+    Returns:
+        The description of the pyramid, as returned by `get_image_pyramid_info`.
+
+    """
+    location = file_info["location"]
+    key = get_image_preview_key(file_info)
+    info = get_image_pyramid_info(file_info)
+    if info is not None:
+        return info
+
+    check_image_tileable(file_info)
+    with _open_image(location) as image:
+        width, height = image.size
+        high_bit_depth = _is_high_bit_depth(image)
+
+    max_level = (max(width, height) - 1).bit_length()
+    levels = [_level_size(width, height, max_level, level) for level in range(max_level + 1)]
+    rows = [math.ceil(h / TILE_SIZE) for _, h in levels]
+    columns = [math.ceil(w / TILE_SIZE) for w, _ in levels]
+    done, total = 0, sum(rows) + (rows[-1] if high_bit_depth else 0)
+
+    def _report(message: str) -> None:
+        if progress is not None:
+            progress(done / total, message)
+
+    LOGGER.debug("Building %s-level tile pyramid of %s", max_level + 1, location)
+    directory = _get_pyramid_directory(location, key)
+    for level in range(max_level + 1):
+        (directory / str(level)).mkdir(parents=True, exist_ok=True)
+
+    # Scale high bit-depth images by the range of values of the whole image
+    value_range = None
+    if high_bit_depth:
+        for _, band in _iter_row_bands(location, TILE_SIZE):
+            band_range = _value_range(band)
+            if band_range is not None:
+                value_range = (
+                    band_range
+                    if value_range is None
+                    else (min(value_range[0], band_range[0]), max(value_range[1], band_range[1]))
+                )
+            done += 1
+            _report("Measuring image")
+
+    for top, band in _iter_row_bands(location, TILE_SIZE):
+        band = _convert(band, _WEBP_MODES, value_range)
+        for x in range(columns[max_level]):
+            _save_atomic(
+                band.crop((x * TILE_SIZE, 0, min((x + 1) * TILE_SIZE, width), band.height)),
+                get_image_tile_path(location, key, max_level, x, top // TILE_SIZE),
+                "WEBP",
+            )
+        done += 1
+        _report(f"Tiling level {max_level}")
+
+    for level in range(max_level - 1, -1, -1):
+        child_width, child_height = levels[level + 1]
+        for y in range(rows[level]):
+            for x in range(columns[level]):
+                size = (
+                    min(2 * TILE_SIZE, child_width - 2 * TILE_SIZE * x),
+                    min(2 * TILE_SIZE, child_height - 2 * TILE_SIZE * y),
+                )
+                canvas = None
+                for dy in (0, 1):
+                    for dx in (0, 1):
+                        child_path = get_image_tile_path(
+                            location, key, level + 1, 2 * x + dx, 2 * y + dy
+                        )
+                        if not child_path.exists():
+                            continue
+                        with Image.open(child_path) as child:
+                            if canvas is None:
+                                canvas = Image.new(child.mode, size)
+                            canvas.paste(child, (dx * TILE_SIZE, dy * TILE_SIZE))
+                assert canvas is not None
+                _save_atomic(
+                    canvas.resize(
+                        (math.ceil(size[0] / 2), math.ceil(size[1] / 2)), Image.Resampling.BOX
+                    ),
+                    get_image_tile_path(location, key, level, x, y),
+                    "WEBP",
+                )
+            done += 1
+            _report(f"Tiling level {level}")
+
+    # The preview is assembled from the largest level that fits within the preview size
+    preview_level = max(
+        level for level, size in enumerate(levels) if max(size) <= CONFIG.IMAGE_PREVIEW_SIZE
+    )
+    preview = None
+    for y in range(rows[preview_level]):
+        for x in range(columns[preview_level]):
+            with Image.open(get_image_tile_path(location, key, preview_level, x, y)) as tile:
+                if preview is None:
+                    preview = Image.new(tile.mode, levels[preview_level])
+                preview.paste(tile, (x * TILE_SIZE, y * TILE_SIZE))
+    assert preview is not None
+    _save_atomic(preview, get_image_preview_path(location, key, "preview"), "WEBP")
+
+    info = {
+        "key": key,
+        "width": width,
+        "height": height,
+        "tile_size": TILE_SIZE,
+        "overlap": 0,
+        "format": "webp",
+        "max_level": max_level,
+    }
+    temporary = directory / f".{_PYRAMID_INFO}.{uuid.uuid4().hex}"
+    temporary.write_text(json.dumps(info))
+    os.replace(temporary, directory / _PYRAMID_INFO)
+
+    _remove_stale_previews(Path(location), key)
+    return info
+
+
+def submit_image_pyramid_job(file_info: Dict[str, Any], creator_id: Optional[str] = None) -> str:
+    """Submits a job to build the tile pyramid for the current revision of an image
+    file, de-duplicated against any identical job already queued or running.
+
+    Returns:
+        The ID of the job.
+
+    """
+    file_id = str(file_info["_id"])
+    return submit_job(
+        "image_pyramid",
+        {"file_id": file_id},
+        dedup_key=f"image_pyramid:{file_id}:{get_image_preview_key(file_info)}",
+        creator_id=creator_id,
+    )
+
+
+@register_job_handler("image_pyramid")
+def _image_pyramid_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Builds the tile pyramid of the file, as it is when the job runs."""
+    file_id = job["payload"]["file_id"]
+    file_info = pydatalab.mongo.get_database().files.find_one({"_id": ObjectId(file_id)})
+    if file_info is None:
+        raise RuntimeError(f"File {file_id} no longer exists.")
+
+    return build_image_pyramid(
+        file_info,
+        progress=lambda fraction, message: update_job_progress(job["_id"], fraction, message),
+    )
@@ -15,6 +15,14 @@ class File(Entry, HasOwner, HasRevisionControl):
 
     size: Optional[int] = Field(description="The size of the file on disk in bytes.")
 
+    sha256: Optional[str] = Field(
+        description="The SHA-256 hash of the contents of the current revision of the file."
+    )
+
+    blob: Optional[str] = Field(
+        description="The hash of the blob in the content-addressed file store that the current revision of the file is linked to, if any (see `pydatalab.blobs`)."
+    )
+
     last_modified_remote: Optional[IsoformatDateTime] = Field(
         description="The last date/time at which the remote file was modified."
     )
@@ -1,20 +1,70 @@
-from typing import List, Optional
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
 
 # Must be imported in this way to allow for easy patching with mongomock
 import pymongo
 from flask_pymongo import PyMongo
 from pydantic import BaseModel
 from pymongo.errors import ConnectionFailure
+from pymongo.monitoring import ConnectionPoolListener
+from pymongo.uri_parser import parse_uri
 
 __all__ = (
     "flask_mongo",
     "check_mongo_connection",
     "create_default_indices",
     "_get_active_mongo_client",
+    "get_mongo_client",
+    "get_pool_statistics",
     "insert_pydantic_model_fork_safe",
 )
 
-flask_mongo = PyMongo()
+
+class PooledPyMongo(PyMongo):
+    """A `PyMongo` extension whose `cx` and `db` attributes resolve to the
+    pooled client of the current process (see `get_mongo_client`), rather than
+    a client created once when the app is initialised.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._uri: Optional[str] = None
+        self._database_name: Optional[str] = None
+        super().__init__(*args, **kwargs)
+
+    def init_app(self, app, uri: Optional[str] = None, *args, **kwargs) -> None:
+        self._uri = uri or app.config.get("MONGO_URI")
+        if self._uri is not None:
+            self._database_name = parse_uri(self._uri)["database"]
+        super().init_app(app, uri, *args, **kwargs)
+
+    @property
+    def cx(self) -> Optional[pymongo.MongoClient]:
+        if self._uri is None:
+            return None
+        return get_mongo_client(self._uri)
+
+    @cx.setter
+    def cx(self, client: Optional[pymongo.MongoClient]) -> None:
+        # Flask-PyMongo creates its own (unconnected) client in `init_app`;
+        # it is closed immediately in favour of the pooled client
+        if client is not None:
+            client.close()
+
+    @property
+    def db(self) -> Optional[pymongo.database.Database]:
+        if self._uri is None or not self._database_name:
+            return None
+        return self.cx[self._database_name]
+
+    @db.setter
+    def db(self, _) -> None:
+        pass
+
+
+flask_mongo = PooledPyMongo()
 """This is the primary database interface used by the Flask app."""
 
 
@@ -27,13 +77,200 @@ def insert_pydantic_model_fork_safe(model: BaseModel, collection: str) -> str:
     )
 
 
-def _get_active_mongo_client(timeoutMS: int = 1000) -> pymongo.MongoClient:
-    """Returns a `MongoClient` for the configured `MONGO_URI`,
+class _PoolStatisticsListener(ConnectionPoolListener):
+    """Records connection pool usage for a single `MongoClient`, so that the
+    state of the pool can be inspected by monitoring endpoints.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connections_open = 0
+        self.checked_out = 0
+        self.total_checkouts = 0
+        self.failed_checkouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def _record_wait(self, event) -> None:
+        # `duration` is only reported by newer versions of pymongo
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            wait_ms = 1000 * duration
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def connection_checked_out(self, event) -> None:
+        with self._lock:
+            self.checked_out += 1
+            self.total_checkouts += 1
+            self._record_wait(event)
+
+    def connection_checked_in(self, event) -> None:
+        with self._lock:
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def connection_check_out_failed(self, event) -> None:
+        with self._lock:
+            self.failed_checkouts += 1
+            self._record_wait(event)
+
+    def connection_created(self, event) -> None:
+        with self._lock:
+            self.connections_open += 1
+
+    def connection_closed(self, event) -> None:
+        with self._lock:
+            self.connections_open = max(self.connections_open - 1, 0)
+
+    def pool_cleared(self, event) -> None:
+        with self._lock:
+            self.checked_out = 0
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_check_out_started(self, event) -> None:
+        pass
+
+    def statistics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "connections_open": self.connections_open,
+                "checked_out": self.checked_out,
+                "total_checkouts": self.total_checkouts,
+                "failed_checkouts": self.failed_checkouts,
+                "total_wait_ms": round(self.total_wait_ms, 3),
+                "max_wait_ms": round(self.max_wait_ms, 3),
+                "mean_wait_ms": round(self.total_wait_ms / self.total_checkouts, 3)
+                if self.total_checkouts
+                else 0.0,
+            }
+
+
+_MONGO_CLIENTS: Dict[Tuple[str, int], Tuple[pymongo.MongoClient, _PoolStatisticsListener]] = {}
+"""The registry of pooled clients for this process, keyed by URI and timeout."""
+
+_MONGO_CLIENTS_PID: Optional[int] = None
+"""The PID of the process that created the clients in the registry."""
+
+_MONGO_CLIENTS_LOCK = threading.Lock()
+
+
+def _reset_mongo_clients() -> None:
+    """Forget any clients inherited from a parent process.
+
+    `MongoClient` instances are not fork-safe, so the copies inherited by
+    a child process are discarded (without closing them, as the sockets
+    are still in use by the parent) and new clients will be created on demand.
+
+    """
+    global _MONGO_CLIENTS, _MONGO_CLIENTS_PID, _MONGO_CLIENTS_LOCK
+    _MONGO_CLIENTS = {}
+    _MONGO_CLIENTS_PID = os.getpid()
+    _MONGO_CLIENTS_LOCK = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_mongo_clients)
+
+
+def get_mongo_client(
+    uri: Optional[str] = None, timeoutMS: Optional[int] = None
+) -> pymongo.MongoClient:
+    """Returns the pooled `MongoClient` for this process, creating it if necessary.
+
+    A single client (and thus a single connection pool) is shared by every
+    caller in a given process. If the process has been forked since the client
+    was created, a new client is created for the child process.
+
+    Parameters:
+        uri: The MongoDB URI to connect to, defaults to the configured `MONGO_URI`.
+        timeoutMS: Value to use for the MongoDB timeouts (connect and server select)
+            in milliseconds, defaults to the configured `MONGO_TIMEOUT_MS`.
+
+    Returns:
+        The shared `MongoClient`.
+
+    """
+    from pydatalab.config import CONFIG
+
+    if uri is None:
+        uri = CONFIG.MONGO_URI
+    if timeoutMS is None:
+        timeoutMS = CONFIG.MONGO_TIMEOUT_MS
+
+    key = (uri, timeoutMS)
+
+    if _MONGO_CLIENTS_PID != os.getpid():
+        _reset_mongo_clients()
+
+    with _MONGO_CLIENTS_LOCK:
+        if key not in _MONGO_CLIENTS:
+            listener = _PoolStatisticsListener()
+            client = pymongo.MongoClient(
+                uri,
+                connectTimeoutMS=timeoutMS,
+                serverSelectionTimeoutMS=timeoutMS,
+                maxPoolSize=CONFIG.MONGO_MAX_POOL_SIZE,
+                minPoolSize=CONFIG.MONGO_MIN_POOL_SIZE,
+                waitQueueTimeoutMS=CONFIG.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                event_listeners=[listener],
+                connect=True,
+            )
+            _MONGO_CLIENTS[key] = (client, listener)
+
+        return _MONGO_CLIENTS[key][0]
+
+
+def get_pool_statistics() -> Dict[str, Any]:
+    """Returns usage statistics for the connection pools held by this process.
+
+    Returns:
+        A dictionary containing the PID of the current process and, for each
+        pooled client, the configured pool size, the number of open and
+        checked out connections and the time spent waiting for a connection.
+
+    """
+    from pydatalab.config import CONFIG
+
+    pools = []
+    if _MONGO_CLIENTS_PID == os.getpid():
+        for (uri, timeout), (_, listener) in list(_MONGO_CLIENTS.items()):
+            pools.append(
+                {
+                    "uri": _redact_uri(uri),
+                    "timeout_ms": timeout,
+                    "max_pool_size": CONFIG.MONGO_MAX_POOL_SIZE,
+                    "min_pool_size": CONFIG.MONGO_MIN_POOL_SIZE,
+                    **listener.statistics(),
+                }
+            )
+
+    return {"pid": os.getpid(), "pools": pools}
+
+
+def _redact_uri(uri: str) -> str:
+    """Removes any credentials from a MongoDB URI."""
+    return re.sub(r"://[^@/]*@", "://***@", uri)
+
+
+def _get_active_mongo_client(timeoutMS: Optional[int] = None) -> pymongo.MongoClient:
+    """Returns the pooled `MongoClient` for the configured `MONGO_URI`,
     raising a `RuntimeError` if not available.
 
     Parameters:
         timeoutMS: Value to use for the MongoDB timeouts (connect and server select)
-            in milliseconds
+            in milliseconds, defaults to the configured `MONGO_TIMEOUT_MS`.
 
     Returns:
         The active MongoClient, already connected.
@@ -43,12 +280,7 @@ def _get_active_mongo_client(timeoutMS: int = 1000) -> pymongo.MongoClient:
     from pydatalab.logger import LOGGER
 
     try:
-        return pymongo.MongoClient(
-            CONFIG.MONGO_URI,
-            connectTimeoutMS=timeoutMS,
-            serverSelectionTimeoutMS=timeoutMS,
-            connect=True,
-        )
+        return get_mongo_client(timeoutMS=timeoutMS)
     except ConnectionFailure as exc:
         LOGGER.critical(f"Unable to connect to MongoDB at {CONFIG.MONGO_URI}")
         raise RuntimeError from exc
@@ -85,6 +317,9 @@ def create_default_indices(
         - A text index over all string fields in item models,
         - An index over item type,
         - A unique index over `item_id` and `refcode`.
+        - An index over the last access time of render cache entries.
+        - Indexes for claiming queued jobs, de-duplicating active jobs and expiring old jobs.
+        - An index expiring abandoned upload sessions.
         - A text index over user names and identities.
 
     Parameters:
@@ -94,7 +329,9 @@ def create_default_indices(
         A list of messages returned by each `create_index` call.
 
     """
+    from pydatalab.jobs import FINISHED_JOB_EXPIRY
     from pydatalab.models import ITEM_MODELS
+    from pydatalab.uploads import UPLOAD_SESSION_EXPIRY
 
     if client is None:
         client = _get_active_mongo_client()
@@ -146,6 +383,36 @@ def create_default_indices(
     )
     ret += db.items.create_index("last_modified", name="last modified", background=background)
 
+    ret += db.renderCache.create_index(
+        "last_accessed", name="render cache last accessed", background=background
+    )
+
+    ret += db.jobs.create_index(
+        [("status", pymongo.ASCENDING), ("created", pymongo.ASCENDING)],
+        name="job status and creation time",
+        background=background,
+    )
+    ret += db.jobs.create_index(
+        "dedup_key",
+        unique=True,
+        partialFilterExpression={"active": True},
+        name="unique active job de-duplication key",
+        background=background,
+    )
+    ret += db.jobs.create_index(
+        "finished",
+        expireAfterSeconds=int(FINISHED_JOB_EXPIRY.total_seconds()),
+        name="finished job expiry",
+        background=background,
+    )
+
+    ret += db.uploads.create_index(
+        "updated",
+        expireAfterSeconds=int(UPLOAD_SESSION_EXPIRY.total_seconds()),
+        name="upload session expiry",
+        background=background,
+    )
+
     user_fts_fields = {"identities.name", "display_name"}
 
     user_index_name = "unique user identifiers"
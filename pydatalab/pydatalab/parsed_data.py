@@ -0,0 +1,866 @@
+"""This module implements an on-disk, columnar cache for the parsed contents of
+raw data files (e.g., the dataframes returned by the echem, XRD and Raman parsers).
+
+Entries are keyed on a hash of the file contents and the identity/version of the
+parser used, so they never need to be invalidated explicitly: a new revision of a
+file (or a new version of a parser) simply produces a new key, and stale entries
+are eventually evicted.
+
+Each entry is a directory under `CONFIG.CACHE_DIRECTORY / "parsed"` containing:
+
+- `meta.json`, describing the columns, their dtypes, the number of rows and any
+  JSON-serializable metadata (`DataFrame.attrs`) returned by the parser,
+- one `.npy` file per column.
+
+Columns are read back with `numpy.load(..., mmap_mode="r")`, so that only the
+requested columns (and rows) are ever read from disk.
+
+Data that is not tabular (e.g., spectral maps) can instead be stored as a set of
+named, multi-dimensional arrays in the same format with `get_parsed_arrays`.
+
+Files that only ever grow by having data appended to them (e.g., the exports of a
+running cycler) can be parsed incrementally with `get_appended_parsed_data`: the
+entry for the latest version of each file is recorded alongside any state the
+parser needs to continue from the end of that version, so that only the appended
+part of a new version has to be parsed.
+
+The total size of the cache (including the memoised content hashes and the
+records of appended files) is bounded by `CONFIG.PARSED_DATA_CACHE_MAX_SIZE`, with
+the least recently used entries evicted first. The cache is only scanned for eviction
+once its estimated size exceeds the limit (see `pydatalab.disk_cache`).
+
+"""
+
+import functools
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from pydatalab.config import CONFIG
+from pydatalab.disk_cache import CacheSizeEstimate
+from pydatalab.logger import LOGGER
+
+__all__ = (
+    "PartitionSelection",
+    "AppendParser",
+    "get_parsed_data",
+    "get_appended_parsed_data",
+    "get_parsed_data_key",
+    "file_content_hash",
+    "store_parsed_data",
+    "load_parsed_data",
+    "get_parsed_arrays",
+    "store_parsed_arrays",
+    "load_parsed_arrays",
+    "evict_parsed_data",
+)
+
+PARSED_DATA_FORMAT = 1
+"""The version of the on-disk format, included in every cache key."""
+
+_META_FILENAME = "meta.json"
+_HASHES_DIRECTORY = "hashes"
+_APPENDED_DIRECTORY = "appended"
+_PREFIX_CHECK_SIZE = 64 * 1024
+_INDEX_COLUMN = "__index__"
+_HASH_CHUNK_SIZE = 1024 * 1024
+_STALE_TEMPORARY_AGE = 60 * 60
+
+_MAX_CONTENT_HASHES = 10_000
+
+_CONTENT_HASHES: Dict[Tuple[str, int, int], str] = {}
+"""An in-process memo of file content hashes, keyed by path, size and modification time,
+holding at most `_MAX_CONTENT_HASHES` of the most recently computed hashes."""
+
+_SIZE_ESTIMATE = CacheSizeEstimate()
+
+
+def _parsed_data_enabled() -> bool:
+    return bool(CONFIG.PARSED_DATA_CACHE_MAX_SIZE)
+
+
+def _parsed_data_directory() -> Path:
+    return Path(CONFIG.CACHE_DIRECTORY) / "parsed"
+
+
+def file_content_hash(location: Union[str, Path]) -> str:
+    """Returns the SHA-256 hash of the file contents.
+
+    Hashes are memoised against the path, size and modification time of the file,
+    both in memory and alongside the cache entries, so that an unchanged file is
+    only read once.
+
+    """
+    location = Path(location).resolve()
+    stat = location.stat()
+    memo_key = (str(location), stat.st_size, stat.st_mtime_ns)
+
+    if memo_key in _CONTENT_HASHES:
+        return _CONTENT_HASHES[memo_key]
+
+    memo_file = (
+        _parsed_data_directory()
+        / _HASHES_DIRECTORY
+        / f"{hashlib.sha1(str(location).encode('utf-8')).hexdigest()}.json"
+    )
+    try:
+        memo = json.loads(memo_file.read_text())
+        if memo["size"] == stat.st_size and memo["mtime_ns"] == stat.st_mtime_ns:
+            # Mark the memo as recently used, so that it is evicted last
+            os.utime(memo_file)
+            _memoise_content_hash(memo_key, memo["sha256"])
+            return memo["sha256"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    sha256 = hashlib.sha256()
+    with open(location, "rb") as f:
+        while chunk := f.read(_HASH_CHUNK_SIZE):
+            sha256.update(chunk)
+    digest = sha256.hexdigest()
+
+    _memoise_content_hash(memo_key, digest)
+    try:
+        memo_file.parent.mkdir(parents=True, exist_ok=True)
+        _write_atomic(
+            memo_file,
+            json.dumps({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}),
+        )
+    except OSError as exc:
+        LOGGER.debug("Unable to store content hash for %s: %s", location, exc)
+
+    return digest
+
+
+def _memoise_content_hash(memo_key: Tuple[str, int, int], digest: str) -> None:
+    _CONTENT_HASHES.pop(memo_key, None)
+    _CONTENT_HASHES[memo_key] = digest
+    while len(_CONTENT_HASHES) > _MAX_CONTENT_HASHES:
+        _CONTENT_HASHES.pop(next(iter(_CONTENT_HASHES)), None)
+
+
+def _write_atomic(path: Path, contents: str) -> None:
+    """Writes a small file (e.g., a memo or pointer) atomically, counting it towards
+    the size of the cache.
+
+    """
+    temporary = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+    temporary.write_text(contents)
+    os.replace(temporary, path)
+    _record_store(len(contents))
+
+
+def _record_store(size: int) -> None:
+    """Records that `size` bytes were stored in the cache, evicting entries if the
+    estimated size of the cache exceeds the configured limit.
+
+    """
+    if _SIZE_ESTIMATE.add(size, CONFIG.PARSED_DATA_CACHE_MAX_SIZE):
+        evict_parsed_data()
+
+
+def get_parsed_data_key(
+    location: Union[str, Path],
+    parser: Callable,
+    parser_version: str = "1",
+    partition_by: Optional[str] = None,
+) -> str:
+    """Computes the cache key for the given file and parser.
+
+    Parameters:
+        location: The location of the raw data file.
+        parser: The function used to parse the file. A `functools.partial` can be
+            given to pass further (JSON-serializable) arguments to the parser, which
+            are then included in the key.
+        parser_version: A version string for the parser, which should be changed
+            whenever the parser output changes (e.g., the version of an upstream
+            parsing library).
+        partition_by: The column used to partition the stored rows, if any.
+
+    Returns:
+        A hex digest to use as the cache key.
+
+    """
+    arguments = None
+    if isinstance(parser, functools.partial):
+        arguments = {"args": list(parser.args), "kwargs": parser.keywords}
+        parser = parser.func
+
+    key_data: Dict[str, Any] = {
+        "format": PARSED_DATA_FORMAT,
+        "content": file_content_hash(location),
+        "parser": f"{parser.__module__}.{parser.__qualname__}",
+        "parser_version": parser_version,
+    }
+    if arguments is not None:
+        key_data["arguments"] = arguments
+    if partition_by is not None:
+        key_data["partition_by"] = partition_by
+    return hashlib.sha256(
+        json.dumps(key_data, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def _column_to_numpy(series: pd.Series) -> Tuple[np.ndarray, Optional[List[Any]]]:
+    """Converts a column to a numpy array that can be saved without pickling.
+
+    Object columns containing only strings are stored as fixed-width unicode arrays;
+    any other object columns (e.g., mixed strings and integers) are stored as integer
+    codes into a list of JSON-serializable categories, which is also returned.
+
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(object)
+    elif pd.api.types.is_extension_array_dtype(series.dtype):
+        try:
+            return series.to_numpy(dtype="float64", na_value=np.nan), None
+        except (TypeError, ValueError):
+            series = series.astype(object)
+
+    values = series.to_numpy()
+    if values.dtype != object:
+        return values, None
+
+    if all(isinstance(value, str) for value in values):
+        return values.astype(str), None
+
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    categories = [value.item() if isinstance(value, np.generic) else value for value in uniques]
+    try:
+        json.dumps(categories, allow_nan=True)
+    except (TypeError, ValueError):
+        categories = [str(value) for value in categories]
+    return codes, categories
+
+
+def _column_from_numpy(values: np.ndarray, categories: Optional[List[Any]]) -> np.ndarray:
+    if categories is None:
+        return np.array(values)
+    # Missing values are coded as -1, which selects the trailing NaN
+    return np.array(categories + [np.nan], dtype=object)[values]
+
+
+def _normalize_attrs(attrs: Dict[str, Any]) -> Dict[str, Any]:
+    from pydatalab.utils import CustomJSONEncoder
+
+    return json.loads(json.dumps(attrs, cls=CustomJSONEncoder, default=str))
+
+
+def _partition(df: pd.DataFrame, partition_by: str) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Orders the rows of the dataframe so that each distinct value of the
+    `partition_by` column is stored contiguously, and returns the value and
+    row offsets of each partition.
+
+    """
+    if not df[partition_by].is_monotonic_increasing:
+        df = df.iloc[np.argsort(df[partition_by].to_numpy(), kind="stable")]
+
+    values = df[partition_by].to_numpy()
+    missing = pd.isna(values)
+    changed = (values[1:] != values[:-1]) & ~(missing[1:] & missing[:-1])
+    starts = np.concatenate([[0], np.flatnonzero(changed) + 1]) if len(values) else []
+
+    partition_values = [
+        None if missing[start] else (v.item() if isinstance(v := values[start], np.generic) else v)
+        for start in starts
+    ]
+    offsets = [int(start) for start in starts] + [len(values)]
+
+    return df, {"column": str(partition_by), "values": partition_values, "offsets": offsets}
+
+
+def _write_entry(key: str, write: Callable[[Path], Dict[str, Any]]) -> bool:
+    """Writes a cache entry into a temporary directory with the given function,
+    which returns the entry metadata, then moves it into place atomically
+    and evicts older entries if necessary.
+
+    """
+    root = _parsed_data_directory()
+    entry = root / key
+    if entry.exists():
+        return True
+
+    temporary = root / f".{key}.{uuid.uuid4().hex}"
+    try:
+        temporary.mkdir(parents=True)
+        meta = write(temporary)
+        meta.update({"format": PARSED_DATA_FORMAT, "created": time.time()})
+        (temporary / _META_FILENAME).write_text(json.dumps(meta))
+        size = _entry_size(temporary)
+
+        try:
+            os.rename(temporary, entry)
+        except OSError:
+            # Another process stored the same entry concurrently
+            shutil.rmtree(temporary, ignore_errors=True)
+
+    except Exception as exc:
+        LOGGER.warning("Unable to store parsed data %s: %s", key, exc)
+        shutil.rmtree(temporary, ignore_errors=True)
+        return False
+
+    _record_store(size)
+    return True
+
+
+def _read_meta(key: str) -> Optional[Dict[str, Any]]:
+    try:
+        meta = json.loads((_parsed_data_directory() / key / _META_FILENAME).read_text())
+    except (OSError, ValueError):
+        return None
+    if meta.get("format") != PARSED_DATA_FORMAT:
+        return None
+    return meta
+
+
+def store_parsed_data(key: str, df: pd.DataFrame, partition_by: Optional[str] = None) -> bool:
+    """Stores a parsed dataframe (and its `attrs`) in the cache, then evicts
+    older entries if the cache has exceeded its configured size.
+
+    Parameters:
+        key: The cache key, as returned by `get_parsed_data_key`.
+        df: The dataframe to store.
+        partition_by: If provided, the rows will be stored grouped by the values
+            of this column, with the offsets of each group recorded so that
+            individual partitions can be loaded without reading the others.
+
+    Returns:
+        Whether the dataframe was stored.
+
+    """
+
+    def write(directory: Path) -> Dict[str, Any]:
+        data, partitions = df, None
+        if partition_by is not None and partition_by in data.columns:
+            data, partitions = _partition(data, partition_by)
+
+        columns: List[Dict[str, Any]] = []
+        to_save: List[Tuple[str, pd.Series]] = []
+        index = data.index
+        if not isinstance(index, pd.RangeIndex) or index.start != 0 or index.step != 1:
+            to_save.append((_INDEX_COLUMN, index.to_series()))
+        to_save.extend((name, data[name]) for name in data.columns)
+
+        for ind, (name, series) in enumerate(to_save):
+            values, categories = _column_to_numpy(series)
+            filename = f"{ind}.npy"
+            np.save(directory / filename, values, allow_pickle=False)
+            column = {"name": str(name), "file": filename, "dtype": values.dtype.str}
+            if categories is not None:
+                column["categories"] = categories
+            columns.append(column)
+
+        return {
+            "nrows": len(data),
+            "columns": columns,
+            "index_name": data.index.name,
+            "partitions": partitions,
+            "attrs": _normalize_attrs(data.attrs),
+        }
+
+    return _write_entry(key, write)
+
+
+def store_parsed_arrays(
+    key: str, arrays: Dict[str, np.ndarray], attrs: Optional[Dict[str, Any]] = None
+) -> bool:
+    """Stores a set of (possibly multi-dimensional) arrays, such as a spectral map,
+    and any JSON-serializable metadata in the cache.
+
+    Parameters:
+        key: The cache key, as returned by `get_parsed_data_key`.
+        arrays: The arrays to store, by name.
+        attrs: Any metadata to store alongside the arrays.
+
+    Returns:
+        Whether the arrays were stored.
+
+    """
+
+    def write(directory: Path) -> Dict[str, Any]:
+        entries = []
+        for ind, (name, values) in enumerate(arrays.items()):
+            values = np.asarray(values)
+            filename = f"{ind}.npy"
+            np.save(directory / filename, values, allow_pickle=False)
+            entries.append({"name": str(name), "file": filename, "dtype": values.dtype.str})
+        return {"arrays": entries, "attrs": _normalize_attrs(attrs or {})}
+
+    return _write_entry(key, write)
+
+
+def load_parsed_arrays(key: str) -> Optional[Tuple[Dict[str, np.ndarray], Dict[str, Any]]]:
+    """Loads a set of arrays stored with `store_parsed_arrays`, if present,
+    and marks them as recently used.
+
+    The arrays are returned as read-only memory maps, so only the parts that are
+    accessed are read from disk.
+
+    Returns:
+        The arrays and their metadata, or `None` if no entry exists for this key.
+
+    """
+    meta = _read_meta(key)
+    if meta is None or "arrays" not in meta:
+        return None
+
+    entry = _parsed_data_directory() / key
+    try:
+        arrays = {
+            array["name"]: np.load(entry / array["file"], mmap_mode="r", allow_pickle=False)
+            for array in meta["arrays"]
+        }
+        os.utime(entry / _META_FILENAME)
+    except (OSError, ValueError) as exc:
+        LOGGER.warning("Unable to load parsed data %s: %s", key, exc)
+        return None
+
+    return arrays, meta.get("attrs", {})
+
+
+def get_parsed_arrays(
+    location: Union[str, Path],
+    parser: Callable[[str], Tuple[Dict[str, np.ndarray], Dict[str, Any]]],
+    parser_version: str = "1",
+    reload: bool = False,
+) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """Returns the arrays (and metadata) parsed from a file, using the cache if possible;
+    the equivalent of `get_parsed_data` for data that is not tabular.
+
+    Parameters:
+        location: The location of the raw data file.
+        parser: A function that takes the file location and returns a dictionary of
+            arrays and a dictionary of JSON-serializable metadata.
+        parser_version: A version string for the parser, see `get_parsed_data_key`.
+        reload: Whether to ignore any existing cache entry and re-parse the file.
+
+    Returns:
+        The arrays (as read-only memory maps, if loaded from the cache) and metadata.
+
+    """
+    location = str(location)
+    if not _parsed_data_enabled():
+        return parser(location)
+
+    try:
+        key = get_parsed_data_key(location, parser, parser_version)
+    except OSError as exc:
+        LOGGER.warning("Unable to hash %s for the parsed data cache: %s", location, exc)
+        return parser(location)
+
+    if not reload:
+        cached = load_parsed_arrays(key)
+        if cached is not None:
+            return cached
+
+    start_time = time.monotonic()
+    arrays, attrs = parser(location)
+    LOGGER.debug("Parsed %s in %.3f seconds", location, time.monotonic() - start_time)
+
+    if reload:
+        shutil.rmtree(_parsed_data_directory() / key, ignore_errors=True)
+    store_parsed_arrays(key, arrays, attrs)
+    return arrays, _normalize_attrs(attrs)
+
+
+PartitionSelection = Union[Sequence[Any], Callable[[List[Any]], Sequence[Any]]]
+"""Either a list of partition values to select, or a function that takes the list
+of all available partition values and returns those to select."""
+
+
+def _select(
+    df: pd.DataFrame,
+    columns: Optional[Sequence[str]],
+    rows: Optional[slice],
+    partition_by: Optional[str] = None,
+    partitions: Optional[PartitionSelection] = None,
+) -> pd.DataFrame:
+    if partition_by is not None and partitions is not None:
+        if callable(partitions):
+            partitions = partitions(list(df[partition_by].dropna().unique()))
+        df = df[df[partition_by].isin(partitions)]
+    if columns is not None:
+        df = df[[c for c in df.columns if c in set(columns)]]
+    if rows is not None:
+        df = df.iloc[rows]
+    return df
+
+
+def load_parsed_data(
+    key: str,
+    columns: Optional[Sequence[str]] = None,
+    rows: Optional[slice] = None,
+    partitions: Optional[PartitionSelection] = None,
+    partition_by: Optional[str] = None,
+) -> Optional[pd.DataFrame]:
+    """Loads a parsed dataframe from the cache, if present, and marks it as recently used.
+
+    Parameters:
+        key: The cache key, as returned by `get_parsed_data_key`.
+        columns: If provided, only load these columns (missing columns are ignored).
+        rows: If provided, only load this slice of rows.
+        partitions: If provided, only load the rows in these partitions of an entry
+            stored with `partition_by` (see `PartitionSelection`).
+        partition_by: The column the entry was partitioned by; if the entry was
+            stored without a partition layout, all of its rows are loaded and then
+            filtered on this column instead.
+
+    Returns:
+        The cached dataframe, or `None` if no entry exists for this key.
+
+    """
+    if rows is not None and partitions is not None:
+        raise ValueError("Only one of `rows` and `partitions` can be provided.")
+
+    entry = _parsed_data_directory() / key
+    meta_file = entry / _META_FILENAME
+    meta = _read_meta(key)
+    if meta is None or "columns" not in meta:
+        return None
+
+    requested_columns = columns
+    filter_partitions: Optional[PartitionSelection] = None
+    ranges: Optional[List[Tuple[int, int]]] = None
+    if partitions is not None and meta.get("partitions") is None:
+        if partition_by is None:
+            return None
+        filter_partitions = partitions
+        if columns is not None:
+            columns = [*columns, partition_by]
+    elif partitions is not None:
+        layout = meta["partitions"]
+        if callable(partitions):
+            partitions = partitions([v for v in layout["values"] if v is not None])
+        selected = set(partitions)
+        ranges = [
+            (layout["offsets"][ind], layout["offsets"][ind + 1])
+            for ind, value in enumerate(layout["values"])
+            if value in selected
+        ]
+
+    wanted = set(columns) if columns is not None else None
+    data: Dict[str, np.ndarray] = {}
+    index = None
+    try:
+        for column in meta["columns"]:
+            name = column["name"]
+            if name != _INDEX_COLUMN and wanted is not None and name not in wanted:
+                continue
+            values = np.load(entry / column["file"], mmap_mode="r", allow_pickle=False)
+            if rows is not None:
+                values = values[rows]
+            elif ranges is not None:
+                values = np.concatenate(
+                    [values[start:stop] for start, stop in ranges] or [values[:0]]
+                )
+            values = _column_from_numpy(values, column.get("categories"))
+            if name == _INDEX_COLUMN:
+                index = pd.Index(values, name=meta.get("index_name"))
+            else:
+                data[name] = values
+        os.utime(meta_file)
+    except (OSError, ValueError) as exc:
+        LOGGER.warning("Unable to load parsed data %s: %s", key, exc)
+        return None
+
+    if index is None:
+        index = pd.RangeIndex(meta["nrows"], name=meta.get("index_name"))
+        if rows is not None:
+            index = index[rows]
+        elif ranges is not None:
+            index = pd.Index(
+                np.concatenate([np.arange(start, stop) for start, stop in ranges] or [[]]).astype(
+                    int
+                ),
+                name=meta.get("index_name"),
+            )
+
+    df = pd.DataFrame(data, index=index)
+    df.attrs = meta.get("attrs", {})
+    if filter_partitions is not None:
+        df = _select(df, requested_columns, None, partition_by, filter_partitions)
+    return df
+
+
+def get_parsed_data(
+    location: Union[str, Path],
+    parser: Callable[[str], pd.DataFrame],
+    parser_version: str = "1",
+    columns: Optional[Sequence[str]] = None,
+    rows: Optional[slice] = None,
+    reload: bool = False,
+    partition_by: Optional[str] = None,
+    partitions: Optional[PartitionSelection] = None,
+) -> pd.DataFrame:
+    """Returns the parsed contents of a file, using the cache if possible.
+
+    The parser will only be called if no entry exists for the current contents
+    of the file and the given parser (and version). Any metadata that should
+    be cached alongside the data should be returned by the parser in
+    `DataFrame.attrs`, and must be JSON-serializable.
+
+    Parameters:
+        location: The location of the raw data file.
+        parser: A function that takes the file location and returns a dataframe.
+        parser_version: A version string for the parser, see `get_parsed_data_key`.
+        columns: If provided, only return these columns.
+        rows: If provided, only return this slice of rows.
+        reload: Whether to ignore any existing cache entry and re-parse the file.
+        partition_by: A column to partition the stored rows by, such that subsets
+            of the data can be loaded with `partitions`.
+        partitions: If provided, only return the rows in these partitions (see
+            `PartitionSelection`).
+
+    Returns:
+        The parsed dataframe.
+
+    """
+    if partitions is not None and partition_by is None:
+        raise ValueError("`partition_by` must be provided to select `partitions`.")
+
+    location = str(location)
+    if not _parsed_data_enabled():
+        return _select(parser(location), columns, rows, partition_by, partitions)
+
+    try:
+        key = get_parsed_data_key(location, parser, parser_version, partition_by=partition_by)
+    except OSError as exc:
+        LOGGER.warning("Unable to hash %s for the parsed data cache: %s", location, exc)
+        return _select(parser(location), columns, rows, partition_by, partitions)
+
+    if not reload:
+        df = load_parsed_data(
+            key, columns=columns, rows=rows, partitions=partitions, partition_by=partition_by
+        )
+        if df is not None:
+            return df
+
+    start_time = time.monotonic()
+    df = parser(location)
+    LOGGER.debug("Parsed %s in %.3f seconds", location, time.monotonic() - start_time)
+
+    if reload:
+        shutil.rmtree(_parsed_data_directory() / key, ignore_errors=True)
+    store_parsed_data(key, df, partition_by=partition_by)
+    df.attrs = _normalize_attrs(df.attrs)
+    return _select(df, columns, rows, partition_by, partitions)
+
+
+AppendParser = Callable[
+    [str, Optional[pd.DataFrame], Dict[str, Any]], Tuple[pd.DataFrame, Dict[str, Any]]
+]
+"""A parser for append-only files, which takes the file location, the data parsed from
+an earlier version of the file (or `None`) and the state returned alongside it, and
+returns the data parsed from the current file alongside the (JSON-serializable) state
+needed to continue parsing from its end, which may be empty if this is not possible."""
+
+
+def _appended_pointer_path(
+    location: str, parser: Callable, parser_version: str, partition_by: Optional[str]
+) -> Path:
+    identity = {
+        "location": str(Path(location).resolve()),
+        "parser": f"{parser.__module__}.{parser.__qualname__}",
+        "parser_version": parser_version,
+        "partition_by": partition_by,
+    }
+    digest = hashlib.sha1(json.dumps(identity, sort_keys=True).encode("utf-8")).hexdigest()
+    return _parsed_data_directory() / _APPENDED_DIRECTORY / f"{digest}.json"
+
+
+def _prefix_digests(location: str, size: int) -> List[str]:
+    """Returns the hashes of the first and last blocks of the first `size` bytes of a
+    file, used to check that a file still starts with an earlier version of itself.
+
+    """
+    with open(location, "rb") as f:
+        head = f.read(min(_PREFIX_CHECK_SIZE, size))
+        start = max(size - _PREFIX_CHECK_SIZE, 0)
+        f.seek(start)
+        tail = f.read(size - start)
+    return [hashlib.sha256(head).hexdigest(), hashlib.sha256(tail).hexdigest()]
+
+
+def get_appended_parsed_data(
+    location: Union[str, Path],
+    parser: AppendParser,
+    parser_version: str = "1",
+    columns: Optional[Sequence[str]] = None,
+    partition_by: Optional[str] = None,
+    partitions: Optional[PartitionSelection] = None,
+) -> pd.DataFrame:
+    """Returns the parsed contents of an append-only file, using the cache if possible.
+
+    If there is no entry for the current contents of the file, but there is one for
+    an earlier version of the file that the current contents start with, the parser
+    is given the data and state of the earlier version, so that it only needs to
+    parse the appended part of the file. Otherwise, the parser is given no previous
+    data and parses the whole file.
+
+    Parameters:
+        location: The location of the raw data file.
+        parser: The function used to parse the file (see `AppendParser`).
+        parser_version: A version string for the parser, see `get_parsed_data_key`.
+        columns: If provided, only return these columns.
+        partition_by: A column to partition the stored rows by, see `get_parsed_data`.
+        partitions: If provided, only return the rows in these partitions.
+
+    Returns:
+        The parsed dataframe.
+
+    """
+    if partitions is not None and partition_by is None:
+        raise ValueError("`partition_by` must be provided to select `partitions`.")
+
+    location = str(location)
+    if not _parsed_data_enabled():
+        df, _ = parser(location, None, {})
+        return _select(df, columns, None, partition_by, partitions)
+
+    try:
+        size = os.path.getsize(location)
+        key = get_parsed_data_key(location, parser, parser_version, partition_by=partition_by)
+    except OSError as exc:
+        LOGGER.warning("Unable to hash %s for the parsed data cache: %s", location, exc)
+        df, _ = parser(location, None, {})
+        return _select(df, columns, None, partition_by, partitions)
+
+    df = load_parsed_data(key, columns=columns, partitions=partitions, partition_by=partition_by)
+    if df is not None:
+        return df
+
+    pointer_path = _appended_pointer_path(location, parser, parser_version, partition_by)
+    previous, state = None, {}
+    try:
+        pointer = json.loads(pointer_path.read_text())
+        if pointer["size"] < size and pointer["digests"] == _prefix_digests(
+            location, pointer["size"]
+        ):
+            previous = load_parsed_data(pointer["key"])
+            state = pointer["state"] if previous is not None else {}
+    except (OSError, ValueError, KeyError):
+        pass
+
+    start_time = time.monotonic()
+    df, state = parser(location, previous, state)
+    LOGGER.debug(
+        "Parsed %s in %.3f seconds (%s)",
+        location,
+        time.monotonic() - start_time,
+        "appended" if previous is not None else "in full",
+    )
+
+    if store_parsed_data(key, df, partition_by=partition_by) and state:
+        try:
+            pointer_path.parent.mkdir(parents=True, exist_ok=True)
+            _write_atomic(
+                pointer_path,
+                json.dumps(
+                    {
+                        "key": key,
+                        "size": size,
+                        "digests": _prefix_digests(location, size),
+                        "state": state,
+                    }
+                ),
+            )
+        except OSError as exc:
+            LOGGER.debug("Unable to record appended parsed data for %s: %s", location, exc)
+
+    df.attrs = _normalize_attrs(df.attrs)
+    return _select(df, columns, None, partition_by, partitions)
+
+
+def _entry_size(entry: Path) -> int:
+    return sum(f.stat().st_size for f in os.scandir(entry) if f.is_file())
+
+
+def _scan_small_files(directory: Path) -> List[Tuple[float, int, Path]]:
+    """Returns the last used time, size and path of each of the memo or pointer
+    files in a directory of the cache, removing any abandoned temporary files.
+
+    """
+    files = []
+    try:
+        items = list(os.scandir(directory))
+    except OSError:
+        return files
+    now = time.time()
+    for item in items:
+        try:
+            stat = item.stat()
+            if item.name.startswith("."):
+                if now - stat.st_mtime > _STALE_TEMPORARY_AGE:
+                    os.unlink(item.path)
+                continue
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, Path(item.path)))
+    return files
+
+
+def evict_parsed_data(max_size: Optional[int] = None) -> int:
+    """Removes the least recently used entries from the parsed data cache (including
+    the memoised content hashes and records of appended files) until its total size
+    is below the configured limit.
+
+    Parameters:
+        max_size: The maximum total size of the cache in bytes, defaults to
+            `CONFIG.PARSED_DATA_CACHE_MAX_SIZE`.
+
+    Returns:
+        The number of entries removed.
+
+    """
+    if max_size is None:
+        max_size = CONFIG.PARSED_DATA_CACHE_MAX_SIZE
+
+    root = _parsed_data_directory()
+    if not root.exists():
+        _SIZE_ESTIMATE.scanned(0)
+        return 0
+
+    now = time.time()
+    entries: List[Tuple[float, int, Path]] = []
+    for directory in (_HASHES_DIRECTORY, _APPENDED_DIRECTORY):
+        entries.extend(_scan_small_files(root / directory))
+    for item in os.scandir(root):
+        if not item.is_dir() or item.name in (_HASHES_DIRECTORY, _APPENDED_DIRECTORY):
+            continue
+        path = Path(item.path)
+        try:
+            if item.name.startswith("."):
+                # Remove any entries abandoned part-way through being written
+                if now - item.stat().st_mtime > _STALE_TEMPORARY_AGE:
+                    shutil.rmtree(path, ignore_errors=True)
+                continue
+            last_used = (path / _META_FILENAME).stat().st_mtime
+            size = _entry_size(path)
+        except OSError:
+            continue
+        entries.append((last_used, size, path))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    if total > max_size:
+        for _, size, path in sorted(entries):
+            if total <= max_size:
+                break
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        LOGGER.debug("Evicted %s entries from the parsed data cache", removed)
+
+    _SIZE_ESTIMATE.scanned(total)
+    return removed
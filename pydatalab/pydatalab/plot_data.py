@@ -0,0 +1,337 @@
+"""This module implements a binary transport for the column data of Bokeh plots,
+so that large numeric arrays do not have to be embedded (as base64 or JSON lists)
+inside the plot JSON returned with each block.
+
+After a block has been plotted, `externalize_plot_data` walks the Bokeh document
+for `ColumnDataSource` models and moves each of their numeric columns into a single
+binary blob, leaving empty columns in the JSON and a reference to the blob under
+the `plot_data` key of the plot data. The browser fetches the blob from the
+`/plot-data/<key>` endpoint and fills in the columns after embedding the plot.
+
+Numeric columns are downcast before packing, where this is lossless at plotting
+resolution:
+
+- float64 columns are stored as float32 if the round-trip error is below
+  `FLOAT32_TOLERANCE` of the range of the data,
+- integer columns are stored as int32 (or smaller) if their values fit.
+
+The blob is laid out as:
+
+- a little-endian `uint32` giving the length of the header,
+- a UTF-8 JSON header listing each column's source ID, name, dtype, shape and
+  the offset and length (in bytes) of its buffer,
+- the little-endian buffers themselves, each aligned to 8 bytes so that they
+  can be viewed as typed arrays without copying,
+
+and is stored gzip-compressed under `CONFIG.CACHE_DIRECTORY / "plots"`, named by
+the SHA-256 hash of its contents. The total size of these files is bounded by
+`CONFIG.PLOT_DATA_CACHE_MAX_SIZE`, with the least recently used evicted first
+once their estimated total exceeds the limit (see `pydatalab.disk_cache`).
+
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from pydatalab.config import CONFIG
+from pydatalab.disk_cache import CacheSizeEstimate
+from pydatalab.logger import LOGGER
+
+__all__ = (
+    "PLOT_DATA_FORMAT",
+    "externalize_plot_data",
+    "pack_plot_data",
+    "unpack_plot_data",
+    "get_plot_data_path",
+    "plot_data_exists",
+    "evict_plot_data",
+)
+
+PLOT_DATA_FORMAT = 1
+"""The version of the binary layout, stored in each header."""
+
+FLOAT32_TOLERANCE = 1e-6
+"""The maximum round-trip error of a float32 column, relative to the range of
+its values, for it to be stored as float32 (i.e., well below a screen pixel)."""
+
+MIN_EXTERNAL_SIZE = 16 * 1024
+"""Plots with less numeric data than this (in bytes) are left embedded in the JSON."""
+
+_SUFFIX = ".bin.gz"
+_ALIGNMENT = 8
+_STALE_TEMPORARY_AGE = 60 * 60
+
+_SIZE_ESTIMATE = CacheSizeEstimate()
+
+
+def _plot_data_enabled() -> bool:
+    return bool(CONFIG.PLOT_DATA_CACHE_MAX_SIZE)
+
+
+def _plot_data_directory() -> Path:
+    return Path(CONFIG.CACHE_DIRECTORY) / "plots"
+
+
+def get_plot_data_path(key: str) -> Optional[Path]:
+    """Returns the path to the stored blob for the given key, or `None` if the
+    key is malformed.
+
+    """
+    if len(key) != 64 or any(c not in "0123456789abcdef" for c in key):
+        return None
+    return _plot_data_directory() / f"{key}{_SUFFIX}"
+
+
+def plot_data_exists(key: str) -> bool:
+    """Whether the blob for the given key is (still) stored."""
+    path = get_plot_data_path(key)
+    return path is not None and path.exists()
+
+
+def _iter_column_data_sources(plot_data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    doc = plot_data.get("doc") or {}
+    for reference in (doc.get("roots") or {}).get("references", []):
+        if reference.get("type") == "ColumnDataSource":
+            yield reference
+
+
+def _decode_column(column: Any) -> Optional[np.ndarray]:
+    """Decodes a column of a serialized `ColumnDataSource` into a numpy array, if
+    it is numeric (either a base64-encoded `__ndarray__` or a list of numbers).
+
+    """
+    if isinstance(column, dict) and "__ndarray__" in column:
+        dtype = np.dtype(column["dtype"])
+        if column.get("order", "little") == "big":
+            dtype = dtype.newbyteorder(">")
+        if dtype.kind not in "iuf":
+            return None
+        values = np.frombuffer(base64.b64decode(column["__ndarray__"]), dtype=dtype)
+        return values.reshape(column.get("shape") or (-1,))
+
+    if isinstance(column, list) and column:
+        if all(isinstance(v, int) and not isinstance(v, bool) for v in column):
+            try:
+                return np.array(column, dtype=np.int64)
+            except OverflowError:
+                return None
+        if all(
+            (isinstance(v, (int, float)) and not isinstance(v, bool)) or v is None for v in column
+        ):
+            return np.array([np.nan if v is None else v for v in column], dtype=np.float64)
+
+    return None
+
+
+def _downcast(values: np.ndarray) -> np.ndarray:
+    """Returns the smallest representation of the values that is lossless at plotting
+    resolution, as a little-endian array.
+
+    """
+    if values.dtype.kind == "f" and values.dtype.itemsize > 4:
+        finite = values[np.isfinite(values)]
+        if finite.size == 0:
+            return values.astype("<f4")
+        if np.abs(finite).max() < np.finfo(np.float32).max:
+            error = np.abs(finite.astype(np.float32).astype(values.dtype) - finite).max()
+            if error <= FLOAT32_TOLERANCE * (finite.max() - finite.min()) or error == 0:
+                return values.astype("<f4")
+    elif values.dtype.kind in "iu" and values.size:
+        low, high = int(values.min()), int(values.max())
+        for dtype in ("<i1", "<i2", "<i4"):
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                return values.astype(dtype)
+        # JavaScript has no 64-bit typed arrays that can be used for plotting
+        return values.astype("<f8")
+
+    return values.astype(values.dtype.newbyteorder("<"), copy=False)
+
+
+def pack_plot_data(columns: List[Tuple[str, str, np.ndarray]]) -> bytes:
+    """Packs the given columns into the (uncompressed) binary layout described above.
+
+    Parameters:
+        columns: A list of `(source_id, column_name, values)` tuples.
+
+    Returns:
+        The packed bytes.
+
+    """
+    entries = []
+    buffers = []
+    offset = 0
+    for source_id, name, values in columns:
+        data = np.ascontiguousarray(values).tobytes()
+        entries.append(
+            {
+                "source": source_id,
+                "column": name,
+                "dtype": values.dtype.newbyteorder("=").name,
+                "shape": list(values.shape),
+                "offset": offset,
+                "length": len(data),
+            }
+        )
+        padding = -len(data) % _ALIGNMENT
+        buffers.append(data + b"\0" * padding)
+        offset += len(data) + padding
+
+    header = json.dumps({"version": PLOT_DATA_FORMAT, "columns": entries}).encode("utf-8")
+    # Align the start of the buffers, accounting for the 4-byte header length
+    header += b" " * (-(len(header) + 4) % _ALIGNMENT)
+    return len(header).to_bytes(4, "little") + header + b"".join(buffers)
+
+
+def unpack_plot_data(blob: bytes) -> Dict[str, Dict[str, np.ndarray]]:
+    """Unpacks the (uncompressed) binary layout into numpy arrays.
+
+    Returns:
+        A dictionary mapping each source ID to its dictionary of columns.
+
+    """
+    header_length = int.from_bytes(blob[:4], "little")
+    header = json.loads(blob[4 : 4 + header_length].decode("utf-8"))
+    start = 4 + header_length
+
+    sources: Dict[str, Dict[str, np.ndarray]] = {}
+    for entry in header["columns"]:
+        values = np.frombuffer(
+            blob,
+            dtype=np.dtype(entry["dtype"]).newbyteorder("<"),
+            count=entry["length"] // np.dtype(entry["dtype"]).itemsize,
+            offset=start + entry["offset"],
+        )
+        sources.setdefault(entry["source"], {})[entry["column"]] = values.reshape(entry["shape"])
+    return sources
+
+
+def _store_blob(blob: bytes) -> str:
+    key = hashlib.sha256(blob).hexdigest()
+    path = get_plot_data_path(key)
+    assert path is not None
+
+    if path.exists():
+        os.utime(path)
+        return key
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+    # A fixed mtime keeps the compressed output deterministic
+    compressed = gzip.compress(blob, compresslevel=6, mtime=0)
+    temporary.write_bytes(compressed)
+    os.replace(temporary, path)
+
+    if _SIZE_ESTIMATE.add(len(compressed), CONFIG.PLOT_DATA_CACHE_MAX_SIZE):
+        evict_plot_data()
+    return key
+
+
+def externalize_plot_data(plot_data: Dict[str, Any]) -> bool:
+    """Moves the numeric column data of the `ColumnDataSource` models in a Bokeh
+    `json_item` into a stored binary blob, replacing them in place with empty columns
+    and adding a reference to the blob under the `plot_data` key.
+
+    Parameters:
+        plot_data: The output of `bokeh.embed.json_item`, modified in place.
+
+    Returns:
+        Whether any data was externalized.
+
+    """
+    if not _plot_data_enabled() or not isinstance(plot_data, dict):
+        return False
+
+    columns: List[Tuple[str, str, np.ndarray]] = []
+    for source in _iter_column_data_sources(plot_data):
+        data = source.get("attributes", {}).get("data") or {}
+        for name, column in data.items():
+            values = _decode_column(column)
+            if values is not None:
+                columns.append((source["id"], name, _downcast(values)))
+
+    if sum(values.nbytes for _, _, values in columns) < MIN_EXTERNAL_SIZE:
+        return False
+
+    try:
+        key = _store_blob(pack_plot_data(columns))
+    except OSError as exc:
+        LOGGER.warning("Unable to store plot data: %s", exc)
+        return False
+
+    externalized: Dict[str, set] = {}
+    for source_id, name, _ in columns:
+        externalized.setdefault(source_id, set()).add(name)
+    for source in _iter_column_data_sources(plot_data):
+        data = source.get("attributes", {}).get("data") or {}
+        for name in externalized.get(source["id"], ()):
+            data[name] = []
+
+    plot_data["plot_data"] = {
+        "key": key,
+        "url": f"/plot-data/{key}",
+        "columns": len(columns),
+    }
+    return True
+
+
+def evict_plot_data(max_size: Optional[int] = None) -> int:
+    """Removes the least recently used blobs until their total size is below the
+    configured limit.
+
+    Parameters:
+        max_size: The maximum total size of the stored blobs in bytes, defaults to
+            `CONFIG.PLOT_DATA_CACHE_MAX_SIZE`.
+
+    Returns:
+        The number of blobs removed.
+
+    """
+    if max_size is None:
+        max_size = CONFIG.PLOT_DATA_CACHE_MAX_SIZE
+
+    root = _plot_data_directory()
+    if not root.exists():
+        _SIZE_ESTIMATE.scanned(0)
+        return 0
+
+    now = time.time()
+    entries: List[Tuple[float, int, str]] = []
+    total = 0
+    for item in os.scandir(root):
+        try:
+            stat = item.stat()
+            if item.name.startswith("."):
+                # Remove any blobs abandoned part-way through being written
+                if now - stat.st_mtime > _STALE_TEMPORARY_AGE:
+                    os.unlink(item.path)
+                continue
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, item.path))
+        total += stat.st_size
+
+    removed = 0
+    if total > max_size:
+        for _, size, path in sorted(entries):
+            if total <= max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        LOGGER.debug("Evicted %s entries from the plot data cache", removed)
+
+    _SIZE_ESTIMATE.scanned(total)
+    return removed
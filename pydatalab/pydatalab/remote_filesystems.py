@@ -1,24 +1,34 @@
+import collections
+import concurrent.futures
 import datetime
+import fnmatch
 import functools
-import json
 import multiprocessing
 import os
-import subprocess
+import posixpath
+import stat
 import time
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Callable, Deque, Dict, Iterator, List, NamedTuple, Optional, Tuple
 
 import pydatalab.mongo
 from pydatalab.config import CONFIG, RemoteFilesystem
 from pydatalab.logger import LOGGER
 
+SCAN_WORKERS = 8
+"""The number of threads used to list the directories of mounted filesystems in parallel."""
+
+SCAN_PROGRESS_INTERVAL = 10
+"""The interval, in seconds, at which the entries found so far by a scan are saved
+to the cache, which also renews the lock held by the scanning process."""
+
 
 def get_directory_structures(
     directories: List[RemoteFilesystem],
     invalidate_cache: Optional[bool] = None,
     parallel: bool = False,
 ) -> List[Dict[str, Any]]:
-    """For all registered top-level directories, call tree either
-    locally or remotely to get their directory structures, or access
+    """For all registered top-level directories, scan either the mounted
+    or remote filesystem to get their directory structures, or access
     the cached data for that directory, if it is available and fresh.
 
     Args:
@@ -80,6 +90,13 @@ def get_directory_structure(
 
     try:
         cached_dir_structure = _get_cached_directory_structure(directory)
+        partial_dir_structure = None
+        partial_last_updated = None
+        if cached_dir_structure and cached_dir_structure.get("contents") is None:
+            # Only the first scan of this directory has been started (by another process)
+            partial_dir_structure = cached_dir_structure.get("partial_contents")
+            partial_last_updated = cached_dir_structure.get("partial_updated")
+            cached_dir_structure = None
         cache_last_updated = None
         if cached_dir_structure:
             cache_last_updated = cached_dir_structure["last_updated"]
@@ -112,7 +129,10 @@ def get_directory_structure(
         ):
             owns_lock = _acquire_lock_dir_structure(directory)
             if owns_lock:
-                dir_structure = _get_latest_directory_structure(directory.path, directory.hostname)
+                dir_structure = _get_latest_directory_structure(
+                    directory,
+                    on_progress=functools.partial(_save_scan_progress, directory),
+                )
                 # Save the directory structure to the database, which also releases the lock
                 last_updated = _save_directory_structure(
                     directory,
@@ -124,6 +144,12 @@ def get_directory_structure(
                     cache_last_updated,
                 )
                 status = "updated"
+            elif max_retries <= 0 and partial_dir_structure is not None:
+                # Return the entries found so far by the scan in the other process
+                last_updated = partial_last_updated
+                dir_structure = partial_dir_structure
+                _sort_directory_structure(dir_structure)
+                status = "partial"
             else:
                 if max_retries <= 0:
                     raise RuntimeError(
@@ -164,169 +190,231 @@ def get_directory_structure(
     }
 
 
-def _get_latest_directory_structure(
-    directory_path: Union[str, "os.PathLike[str]"], hostname: str | None = None
-) -> List[Dict[str, str]]:
-    """Call `tree` on the remote or mounted filesystem.
-
-    If `directory_path` exists locally, then call tree directly,
-    otherwise interpret the path as a remote.
-
-    Args:
-        directory_path: The path to the directory.
-        hostname: The hostname of the remote server, if the path is remote.
-
-    Returns:
-        A dictionary of the `tree` output.
+class _ScanEntry(NamedTuple):
+    """An entry found by a scan, with the path of its parent directory relative to
+    the top-level directory (empty for the top-level directory itself).
 
     """
 
-    tree_command = ["tree", "-Jsf"]
-    tree_timefmt = "%s"
+    parent: str
+    name: str
+    type: str
+    size: int
+    mtime: float
 
-    def _call_local_tree(directory_path: Union[str, "os.PathLike[str]"]) -> List[Dict[str, Any]]:
-        """Call `tree` in a local directory.
 
-        Args:
-            directory_path: The path to the folder on the local filesystem.
+def _is_excluded(relative_path: str, name: str, exclude: List[str]) -> bool:
+    return any(
+        fnmatch.fnmatchcase(name, pattern) or fnmatch.fnmatchcase(relative_path, pattern)
+        for pattern in exclude
+    )
 
-        Returns:
-            A dictionary of the `tree` output.
 
-        """
-        command = tree_command + [str(directory_path), "--timefmt", tree_timefmt]
-        process = subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-        stdout, stderr = process.communicate()
-        if stderr:
-            raise RuntimeError(f"Local process {command!r} returned {stderr!r}.")
+def _list_local_directory(path: str) -> List[Tuple[str, str, int, float]]:
+    """Lists the name, type, size and modification time of each entry in a local directory.
 
-        return json.loads(stdout)
+    Symbolic links to directories are listed as links, and are not followed. Hidden
+    entries (i.e., those whose names start with `.`) are skipped, as they were by `tree`.
 
-    def _call_remote_tree(
-        directory_path: Union[str, "os.PathLike[str]"], hostname: str
-    ) -> List[Dict[str, Any]]:
-        """Call `tree` on a remote system.
+    """
+    listing = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            try:
+                if entry.is_symlink():
+                    entry_stat = entry.stat()
+                    entry_type = "link" if stat.S_ISDIR(entry_stat.st_mode) else "file"
+                else:
+                    entry_stat = entry.stat(follow_symlinks=False)
+                    entry_type = "directory" if stat.S_ISDIR(entry_stat.st_mode) else "file"
+            except OSError:
+                # e.g., broken links, or files removed during the scan
+                continue
+            listing.append((entry.name, entry_type, entry_stat.st_size, entry_stat.st_mtime))
+    return listing
+
+
+def _scan_local(
+    root: str, max_depth: Optional[int] = None, exclude: Optional[List[str]] = None
+) -> Iterator[_ScanEntry]:
+    """Scans a directory on a mounted filesystem, listing up to `SCAN_WORKERS`
+    directories at a time, and yields each entry as soon as it is found.
+
+    Parents are always yielded before their contents.
 
-        Args:
-            directory_path: The path to the folder on the remote filesystem.
-            hostname: The hostname of the remote server.
+    """
+    exclude = exclude or []
+    with concurrent.futures.ThreadPoolExecutor(SCAN_WORKERS) as pool:
+        pending = {pool.submit(_list_local_directory, root): ("", 1)}
+        while pending:
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                parent, depth = pending.pop(future)
+                try:
+                    listing = future.result()
+                except OSError as exc:
+                    if not parent:
+                        raise RuntimeError(f"Unable to scan directory {root!r}: {exc}")
+                    LOGGER.debug("Unable to scan directory %s in %s: %s", parent, root, exc)
+                    continue
+
+                for name, entry_type, size, mtime in listing:
+                    relative_path = f"{parent}/{name}" if parent else name
+                    if _is_excluded(relative_path, name, exclude):
+                        continue
+                    yield _ScanEntry(parent, name, entry_type, size, mtime)
+                    if entry_type == "directory" and (max_depth is None or depth < max_depth):
+                        future = pool.submit(
+                            _list_local_directory, os.path.join(root, relative_path)
+                        )
+                        pending[future] = (relative_path, depth + 1)
+
+
+def _scan_remote(
+    hostname: str, root: str, max_depth: Optional[int] = None, exclude: Optional[List[str]] = None
+) -> Iterator[_ScanEntry]:
+    """Scans a directory on an ssh remote over SFTP, on the shared connection to the
+    host (see `pydatalab.remote_sessions`), and yields each entry as soon as it is found.
+
+    The connection is only held while each directory is listed, so that other
+    requests for the same host (e.g., syncing files) are not held up by the scan.
+    Hidden entries (i.e., those whose names start with `.`) are skipped, as they
+    were by `tree`.
 
-        Returns:
-            A dictionary of the `tree` output.
+    """
+    from pydatalab.remote_sessions import remote_session
 
-        """
-        command = f"ssh {hostname} 'PATH=$PATH:~/ {' '.join(tree_command)} \"{directory_path}\" --timefmt {tree_timefmt}'"
-        process = subprocess.Popen(
-            command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
-        LOGGER.debug(f"Calling {command}")
+    exclude = exclude or []
+    queue: Deque[Tuple[str, int]] = collections.deque([("", 1)])
+    while queue:
+        parent, depth = queue.popleft()
         try:
-            stdout, stderr = process.communicate(timeout=20)
-        except Exception as exc:
-            raise RuntimeError(f"Remote tree process {command!r} returned: {exc!r}")
-        if stderr:
-            # Do not return the bare stderr, but instead specialise the error message to common errors
-            if "WARNING: REMOTE HOST IDENTIFICATION HAS CHANGED!" in stderr.decode("utf-8"):
-                msg = f"Remote host identification has changed for {hostname}: please contact the administrator of this datalab deployment."
+            with remote_session(hostname) as sftp:
+                listing = sftp.listdir_attr(posixpath.join(root, parent) if parent else root)
+        except OSError as exc:
+            if not parent:
                 LOGGER.error(
-                    "Remote host identification for %s has changed, failed to update remote directories",
-                    hostname,
+                    "Remote directory %s on %s no longer accessible: %s", root, hostname, exc
                 )
-            else:
-                msg = "Remote tree process returned an error: please contact the administrator of this datalab deployment."
-                LOGGER.error(
-                    "Remote tree process on %s returned an error: %s",
-                    hostname,
-                    stderr.decode("utf-8"),
+                raise RuntimeError(
+                    "Can no longer access the configured directory on the remote system; please contact the administrator of this datalab deployment."
                 )
-            raise RuntimeError(msg)
+            LOGGER.debug("Unable to scan directory %s in %s on %s: %s", parent, root, hostname, exc)
+            continue
 
-        try:
-            return json.loads(stdout)
-        except Exception:
-            if "error opening dir" in stdout.decode("utf-8"):
-                msg = "Can no longer access the configured directory on the remote system; please contact the administrator of this datalab deployment."
-                LOGGER.error(
-                    "Remote directory %s on %s no longer accessible. Response: %s",
-                    directory_path,
-                    hostname,
-                    stdout.decode("utf-8"),
-                )
+        for attrs in listing:
+            name = attrs.filename
+            if name.startswith("."):
+                continue
+            relative_path = f"{parent}/{name}" if parent else name
+            if _is_excluded(relative_path, name, exclude):
+                continue
+            mode = attrs.st_mode or 0
+            if stat.S_ISLNK(mode):
+                entry_type = "link"
+            elif stat.S_ISDIR(mode):
+                entry_type = "directory"
             else:
-                msg = "Remote tree process failed with an unhandled error; please contact the administrator of this datalab deployment."
-                LOGGER.error(
-                    "Remote directory syncing for  %s on %s failed. Response: %s",
-                    directory_path,
-                    hostname,
-                    stdout.decode("utf-8"),
-                )
+                entry_type = "file"
+            yield _ScanEntry(parent, name, entry_type, attrs.st_size or 0, attrs.st_mtime or 0)
+            if entry_type == "directory" and (max_depth is None or depth < max_depth):
+                queue.append((relative_path, depth + 1))
 
-            raise RuntimeError(msg)
 
-    if hostname:
-        LOGGER.debug(f"Calling remote {tree_command} on {directory_path}")
-        dir_structure = _call_remote_tree(directory_path, hostname)
+def _sort_directory_structure(contents: List[Dict[str, Any]]) -> None:
+    contents.sort(key=lambda entry: entry["name"])
+    for entry in contents:
+        if "contents" in entry:
+            _sort_directory_structure(entry["contents"])
 
-    elif os.path.isdir(directory_path):
-        dir_structure = _call_local_tree(directory_path)
 
-    else:
-        raise RuntimeError(f"Unable to find directory {directory_path!r} locally or remotely.")
-
-    # `tree` returned [{"type": "unknown", "contents": [{"error": "opening dir"}]}] for errors
-    # which needs to be handled here
-    if dir_structure[0]["type"] == "unknown" and len(dir_structure[0].get("contents", [])) == 1:
-        if "error" in dir_structure[0]["contents"][0]:
-            raise RuntimeError(
-                f"`tree` returned error for dir {dir_structure[0]['name']!r}: {dir_structure[0]['contents'][0]['error']!r}"
-            )
-
-    # because we used tree -f, the name: fields all contain full paths. We want to do a little re-arranging
-    # so we get both a name, and a relative path field
-    _fix_tree_paths(dir_structure[0]["contents"], directory_path)
-    dir_tree = dir_structure[0]["contents"]
+def _get_latest_directory_structure(
+    directory: RemoteFilesystem,
+    on_progress: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+) -> List[Dict[str, Any]]:
+    """Scans the remote or mounted filesystem, honouring the `max_depth` and
+    `exclude` settings of the filesystem.
 
-    return dir_tree
+    Entries are added to the directory structure as they are found, and the
+    structure found so far is periodically passed to `on_progress`.
 
+    Args:
+        directory: The filesystem to scan.
+        on_progress: A function to call with the partial directory structure every
+            `SCAN_PROGRESS_INTERVAL` seconds during the scan.
 
-def _fix_tree_paths(
-    subtree_list: List[Dict[str, Any]], root_path: Union[str, "os.PathLike[str]"]
-) -> None:
-    """Adjusts in-place the output from `tree` to provide relative
-    paths and names of each directory, rather than just the
-    full path.
+    Returns:
+        The directory structure, as a list of entries with keys `"type"`, `"name"`,
+        `"size"`, `"time"` (the modification time as a POSIX timestamp) and
+        `"relative_path"` (the path of the directory that contains the entry,
+        relative to the top-level directory), with the `"contents"` of each directory.
 
-    Will be called recursively to descend into the `'contents'`
-    key of each directory's info.
+    """
+    directory_path = str(directory.path)
+    if directory.hostname:
+        LOGGER.debug("Scanning %s on %s", directory_path, directory.hostname)
+        entries = _scan_remote(
+            directory.hostname, directory_path, directory.max_depth, directory.exclude
+        )
 
-    Args:
-        subtree_list: A list of `tree` outputs for directories.
-        root_path: The path to use as the root of the relative paths.
+    elif os.path.isdir(directory_path):
+        entries = _scan_local(directory_path, directory.max_depth, directory.exclude)
 
-    """
-    for subtree in subtree_list:
-        if "error" in subtree:
-            continue
+    else:
+        raise RuntimeError(f"Unable to find directory {directory_path!r} locally or remotely.")
 
-        full_path = subtree["name"]
+    dir_tree: List[Dict[str, Any]] = []
+    contents = {"": dir_tree}
+    num_entries = 0
+    last_progress = time.monotonic()
+    for entry in entries:
+        relative_path = "/" + entry.parent.replace(" ", r"\ ") + "/" if entry.parent else "/"
+        subtree: Dict[str, Any] = {
+            "type": entry.type,
+            "name": entry.name,
+            "size": entry.size,
+            "time": str(int(entry.mtime)),
+            "relative_path": relative_path,
+        }
+        if entry.type == "directory":
+            subtree["contents"] = contents[
+                f"{entry.parent}/{entry.name}" if entry.parent else entry.name
+            ] = []
+        contents[entry.parent].append(subtree)
+        num_entries += 1
+
+        if on_progress is not None and time.monotonic() - last_progress > SCAN_PROGRESS_INTERVAL:
+            on_progress(dir_tree)
+            last_progress = time.monotonic()
+
+    _sort_directory_structure(dir_tree)
+    LOGGER.debug("Found %s entries in %s", num_entries, directory.name)
+    return dir_tree
 
-        path, filename = os.path.split(full_path)
 
-        escaped_path = path.replace(" ", r"\ ")
-        relative_path = os.path.relpath(escaped_path, start=root_path)
-        if relative_path == ".":
-            relative_path = "/"
-        else:
-            relative_path = "/" + relative_path + "/"
+def _save_scan_progress(directory: RemoteFilesystem, dir_structure: List[Dict[str, Any]]) -> None:
+    """Saves the directory structure found so far by a scan to the `partial_contents`
+    of the cache (with the time it was saved as `partial_updated`), and renews the
+    lock held by this process, so that other processes do not start their own scan
+    while this one is still running.
 
-        subtree["relative_path"] = relative_path
-        subtree["name"] = filename
-        if "contents" in subtree:
-            _fix_tree_paths(subtree["contents"], root_path)
+    """
+    collection = pydatalab.mongo.get_database().remoteFilesystems
+    now = datetime.datetime.now()
+    collection.update_one(
+        {"name": directory.name, "_lock.pid": os.getpid()},
+        {
+            "$set": {
+                "partial_contents": dir_structure,
+                "partial_updated": now.replace(microsecond=0),
+                "_lock.ctime": now,
+            }
+        },
+    )
 
 
 def _save_directory_structure(
@@ -357,7 +445,8 @@ def _save_directory_structure(
                 "last_updated": last_updated,
                 "type": "toplevel",
                 "_lock": None,
-            }
+            },
+            "$unset": {"partial_contents": "", "partial_updated": ""},
         },
         upsert=True,
     )
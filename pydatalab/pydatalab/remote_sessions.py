@@ -0,0 +1,386 @@
+"""This module keeps persistent SSH connections to remote filesystems accessed
+over ssh (i.e., with a `hostname` of the form `ssh://[user@]host`), so that
+syncing and checking live files does not open a new connection (and perform a
+new SSH handshake) for every file on every access.
+
+Each server process holds at most one connection per host, opened on first use
+with the settings for the host in `~/.ssh/config` (user, hostname, port, identity
+file and proxy command or jump host), which is shared by all requests for that host.
+Files are accessed over SFTP with `remote_session`, which opens an SFTP channel of its
+own on the shared connection, so that concurrent requests (e.g., a large transfer and
+a directory scan) do not wait for each other:
+
+```python
+with remote_session("ssh://instrument-pc") as sftp:
+    sftp.listdir("/data")
+```
+
+On top of this, `stat_remote_files` fetches the modification time and size of many
+files in a single round trip, and `fetch_remote_file` copies a file to the local
+file store, resuming interrupted copies and only transferring the appended part
+of files that have grown since they were last copied (e.g., live cycler files). The
+part of the file that is not transferred is checked against the remote by comparing
+its SHA-256 hash with one computed on the remote, and the file is copied in full if
+they differ (or if commands cannot be run on the remote).
+
+"""
+
+import contextlib
+import hashlib
+import os
+import shlex
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from pydatalab.logger import LOGGER
+
+__all__ = (
+    "RemoteStat",
+    "split_remote_path",
+    "remote_session",
+    "close_remote_sessions",
+    "stat_remote_files",
+    "fetch_remote_file",
+)
+
+SSH_TIMEOUT = 20
+"""The timeout in seconds for connecting to a remote host and for each command run on it."""
+
+SSH_KEEPALIVE_INTERVAL = 30
+"""The interval in seconds at which keepalive packets are sent over idle connections."""
+
+_COPY_CHUNK_SIZE = 1024 * 1024
+_STAT_BATCH_SIZE = 200
+
+_SESSIONS: Dict[str, "_RemoteSession"] = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+class RemoteStat(NamedTuple):
+    """The modification time (as a POSIX timestamp) and size in bytes of a remote file."""
+
+    mtime: int
+    size: int
+
+
+def split_remote_path(remote_path: str) -> Tuple[str, str]:
+    """Splits a full remote path of the form `ssh://[user@]host:path` into the
+    hostname (`ssh://[user@]host`) and the path on the remote host.
+
+    """
+    if not remote_path.startswith("ssh://"):
+        raise ValueError(f"Not a path on an ssh remote: {remote_path!r}")
+    hostname, path = remote_path[len("ssh://") :].split(":", 1)
+    # Paths of files added from `tree` listings have their spaces escaped
+    return f"ssh://{hostname}", path.replace(r"\ ", " ")
+
+
+class _RemoteSession:
+    """A connection to a remote host, on which each request opens its own SFTP channel."""
+
+    def __init__(self, hostname: str):
+        self.hostname = hostname
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.client = None
+
+    def _connect(self):
+        from paramiko.client import SSHClient
+        from paramiko.config import SSHConfig
+        from paramiko.proxy import ProxyCommand
+
+        user, _, host = self.hostname[len("ssh://") :].rpartition("@")
+
+        ssh_cfg: dict = {}
+        ssh_config_path = Path.home() / ".ssh" / "config"
+        if ssh_config_path.exists():
+            ssh_cfg = dict(SSHConfig.from_path(str(ssh_config_path.resolve())).lookup(host))
+
+        hostname = ssh_cfg.get("hostname", host)
+        port = int(ssh_cfg.get("port", 22))
+        proxy_command = ssh_cfg.get("proxycommand")
+        if not proxy_command and ssh_cfg.get("proxyjump"):
+            proxy_command = f"ssh -W {hostname}:{port} {ssh_cfg['proxyjump']}"
+
+        client = SSHClient()
+        client.load_system_host_keys()
+        client.connect(
+            hostname,
+            port=port,
+            username=user or ssh_cfg.get("user"),
+            key_filename=ssh_cfg.get("identityfile"),
+            sock=ProxyCommand(proxy_command) if proxy_command else None,
+            timeout=SSH_TIMEOUT,
+            banner_timeout=SSH_TIMEOUT,
+            auth_timeout=SSH_TIMEOUT,
+        )
+        client.get_transport().set_keepalive(SSH_KEEPALIVE_INTERVAL)
+        self.client = client
+        LOGGER.debug("Opened SSH connection to %s", self.hostname)
+
+    def is_active(self) -> bool:
+        return (
+            self.client is not None
+            and self.client.get_transport() is not None
+            and self.client.get_transport().is_active()
+        )
+
+    def connect(self):
+        """Returns the client of the connection, (re-)opening it if required."""
+        with self.lock:
+            if not self.is_active():
+                self._close()
+                self._connect()
+            return self.client
+
+    def _close(self):
+        if self.client is not None:
+            with contextlib.suppress(Exception):
+                self.client.close()
+        self.client = None
+
+    def close(self, client=None):
+        """Closes the connection, or only closes it if it is still the connection
+        of the given client, so that a connection that failed while in use by one
+        request does not close another that was since opened by a different request.
+
+        """
+        with self.lock:
+            if client is None or client is self.client:
+                self._close()
+
+
+def _get_session(hostname: str) -> _RemoteSession:
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(hostname)
+        # Connections cannot be shared with processes forked after they were opened
+        if session is None or session.pid != os.getpid():
+            session = _SESSIONS[hostname] = _RemoteSession(hostname)
+        return session
+
+
+@contextlib.contextmanager
+def remote_session(hostname: str) -> Iterator:
+    """Yields an SFTP client on the shared connection to the given host, opening
+    (or re-opening) the connection if required. Each use opens a new SFTP channel,
+    which is closed on exit. The connection is closed if it fails while in use,
+    so that it is re-opened by the next request.
+
+    Parameters:
+        hostname: The hostname of the remote, of the form `ssh://[user@]host`.
+
+    Raises:
+        RuntimeError: If the connection to the remote fails.
+
+    """
+    from paramiko.ssh_exception import SSHException
+
+    session = _get_session(hostname)
+    client = None
+    try:
+        client = session.connect()
+        with contextlib.closing(client.open_sftp()) as sftp:
+            sftp.get_channel().settimeout(SSH_TIMEOUT)
+            yield sftp
+    except OSError as exc:
+        # Errors for individual files (e.g., missing files) do not affect the connection
+        if exc.errno is not None and not isinstance(exc, ConnectionError):
+            raise
+        session.close(client)
+        raise RuntimeError(f"Connection to {hostname} failed: {exc!r}") from exc
+    except (SSHException, EOFError) as exc:
+        session.close(client)
+        raise RuntimeError(f"Connection to {hostname} failed: {exc!r}") from exc
+
+
+def close_remote_sessions() -> None:
+    """Closes all of the connections held by this process."""
+    with _SESSIONS_LOCK:
+        for session in _SESSIONS.values():
+            if session.pid == os.getpid():
+                session.close()
+        _SESSIONS.clear()
+
+
+def _exec(sftp, command: str) -> Tuple[int, bytes, str]:
+    """Runs a command on the remote of an SFTP client, in a new channel on its connection.
+
+    Returns:
+        The exit status of the command, its standard output and its standard error.
+
+    """
+    channel = sftp.get_channel().get_transport().open_session(timeout=SSH_TIMEOUT)
+    try:
+        channel.settimeout(SSH_TIMEOUT)
+        channel.exec_command(command)
+        stdout = channel.makefile("rb").read()
+        stderr = channel.makefile_stderr("rb").read().decode("utf-8", errors="replace")
+        return channel.recv_exit_status(), stdout, stderr
+    finally:
+        channel.close()
+
+
+def _exec_stat(sftp, paths: List[str]) -> Dict[str, RemoteStat]:
+    """Runs `stat` for many paths in one command over an existing connection."""
+    command = "stat -c '%Y %s %n' -- " + " ".join(shlex.quote(path) for path in paths)
+    exit_status, stdout, stderr = _exec(sftp, command)
+
+    results = {}
+    for line in stdout.decode("utf-8", errors="surrogateescape").splitlines():
+        mtime, size, path = line.split(" ", 2)
+        results[path] = RemoteStat(int(mtime), int(size))
+    # `stat` also fails if any of the files are missing, so only treat failures
+    # without any results as failures to run the command
+    if exit_status != 0 and not results:
+        raise RuntimeError(f"Remote stat returned {exit_status}: {stderr!r}")
+    return results
+
+
+def stat_remote_files(hostname: str, paths: List[str]) -> Dict[str, Optional[RemoteStat]]:
+    """Returns the modification time and size of many files on a remote host, with
+    one command for each batch of files rather than one connection per file.
+
+    If commands cannot be run on the remote (e.g., for SFTP-only accounts), each
+    file is instead checked over SFTP on the shared connection.
+
+    Parameters:
+        hostname: The hostname of the remote, of the form `ssh://[user@]host`.
+        paths: The paths to check on the remote.
+
+    Returns:
+        A dictionary from each path to its `RemoteStat`, or `None` if the file
+        could not be found.
+
+    """
+    results: Dict[str, Optional[RemoteStat]] = {path: None for path in paths}
+    with remote_session(hostname) as sftp:
+        try:
+            for start in range(0, len(paths), _STAT_BATCH_SIZE):
+                results.update(_exec_stat(sftp, paths[start : start + _STAT_BATCH_SIZE]))
+            return results
+        except Exception as exc:
+            LOGGER.debug("Unable to run stat on %s (%r), falling back to SFTP", hostname, exc)
+
+        for path in paths:
+            try:
+                attrs = sftp.stat(path)
+                results[path] = RemoteStat(int(attrs.st_mtime), int(attrs.st_size))
+            except FileNotFoundError:
+                pass
+    return results
+
+
+def _verified_prefix_length(sftp, path: str, local_path: str, remote_size: int) -> int:
+    """Returns the length of a local file if it is identical to the start of the remote
+    file (e.g., an earlier version of an append-only file, or an interrupted copy),
+    by comparing its SHA-256 hash with that of the same number of bytes of the remote
+    file, computed on the remote.
+
+    Returns:
+        The length of the local file, or 0 if the file must be copied in full, i.e.,
+        if it differs from the start of the remote file, or if its hash could not be
+        computed on the remote (e.g., for SFTP-only accounts).
+
+    """
+    local_size = os.path.getsize(local_path)
+    if local_size == 0 or local_size > remote_size:
+        return 0
+
+    try:
+        exit_status, stdout, stderr = _exec(
+            sftp, f"head -c {local_size} -- {shlex.quote(path)} | sha256sum"
+        )
+    except Exception as exc:
+        LOGGER.debug("Unable to hash %s on the remote (%r), copying it in full", path, exc)
+        return 0
+    if exit_status != 0:
+        LOGGER.debug("Unable to hash %s on the remote (%r), copying it in full", path, stderr)
+        return 0
+
+    local_hash = hashlib.sha256()
+    with open(local_path, "rb") as f:
+        while data := f.read(_COPY_CHUNK_SIZE):
+            local_hash.update(data)
+
+    remote_hash = stdout.decode("ascii", errors="replace").split(" ", 1)[0].strip()
+    return local_size if remote_hash == local_hash.hexdigest() else 0
+
+
+def fetch_remote_file(
+    remote_path: str,
+    destination: Union[str, Path],
+    previous: Optional[Union[str, Path]] = None,
+) -> int:
+    """Copies a file from an ssh remote to a local path over the shared connection.
+
+    If the destination already holds the start of the remote file (e.g., from an
+    interrupted copy), or the previous version of the file is the start of the
+    remote file (e.g., a live file that has been appended to), only the rest of
+    the remote file is transferred (see `_verified_prefix_length`). The destination is locked while it is being
+    written, so that concurrent copies to the same destination fail rather than
+    interleave.
+
+    Parameters:
+        remote_path: The full remote path, of the form `ssh://[user@]host:path`.
+        destination: The local path to copy the file to; should not be a stored file
+            that may be linked to a shared blob (see `pydatalab.blobs`).
+        previous: A local copy of a previous version of the file, if any.
+
+    Raises:
+        RuntimeError: If the file could not be copied.
+
+    Returns:
+        The number of bytes transferred.
+
+    """
+    import fcntl
+
+    hostname, path = split_remote_path(remote_path)
+    destination = str(destination)
+    Path(destination).parent.mkdir(parents=False, exist_ok=True)
+
+    fd = os.open(destination, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise RuntimeError(f"{destination} is already being copied from {remote_path}")
+
+        start = time.monotonic()
+        with remote_session(hostname) as sftp, sftp.open(path, "rb") as remote_file:
+            remote_size = remote_file.stat().st_size
+
+            offset = _verified_prefix_length(sftp, path, destination, remote_size)
+            if offset == 0 and previous and os.path.isfile(previous):
+                offset = _verified_prefix_length(sftp, path, str(previous), remote_size)
+                if offset:
+                    with open(destination, "wb") as f, open(previous, "rb") as p:
+                        shutil.copyfileobj(p, f)
+
+            transferred = 0
+            with os.fdopen(fd, "r+b", closefd=False) as f:
+                f.seek(offset)
+                f.truncate()
+                remote_file.seek(offset)
+                remote_file.prefetch(remote_size)
+                while data := remote_file.read(_COPY_CHUNK_SIZE):
+                    f.write(data)
+                    transferred += len(data)
+
+        LOGGER.debug(
+            "Copied %s bytes of %s (from offset %s) in %.2f s",
+            transferred,
+            remote_path,
+            offset,
+            time.monotonic() - start,
+        )
+        return transferred
+
+    except OSError as exc:
+        raise RuntimeError(f"Unable to copy {remote_path} to {destination}: {exc!r}") from exc
+
+    finally:
+        os.close(fd)
@@ -0,0 +1,279 @@
+"""This module implements a persistent cache for the outputs of data block
+plotting functions (i.e., the results of `DataBlock.to_web()`).
+
+Entries are stored in a separate MongoDB collection (rather than inside the
+item document) and are keyed on a hash of everything that can change the
+rendered output:
+
+- the block type and version,
+- the user-controlled parameters stored in the block data,
+- the revision and modification times of every file referenced by the block,
+- any additional dependencies declared by the block itself.
+
+The total size of the cache is bounded by `CONFIG.RENDER_CACHE_MAX_SIZE`, with
+the least recently accessed entries evicted first. The total size is tracked
+incrementally in a counter document (in `renderCacheStats`) as entries are
+stored and evicted, so that storing a render does not need to sum the sizes of
+every entry in the cache.
+
+"""
+
+import datetime
+import hashlib
+import json
+import zlib
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from bson import Binary, ObjectId
+from pymongo import ReturnDocument
+
+import pydatalab.mongo
+from pydatalab.config import CONFIG
+from pydatalab.logger import LOGGER
+from pydatalab.utils import CustomJSONEncoder
+
+if TYPE_CHECKING:
+    from pydatalab.blocks.base import DataBlock
+
+__all__ = (
+    "RENDER_CACHE_COLLECTION",
+    "RENDER_CACHE_STATS_COLLECTION",
+    "get_render_cache_key",
+    "load_cached_render",
+    "store_cached_render",
+    "evict_render_cache",
+)
+
+RENDER_CACHE_COLLECTION = "renderCache"
+"""The name of the MongoDB collection used to store cached renders."""
+
+RENDER_CACHE_STATS_COLLECTION = "renderCacheStats"
+"""The name of the MongoDB collection holding the total size of the render cache."""
+
+MAX_ENTRY_SIZE = 15 * 1024 * 1024
+"""Compressed payloads larger than this (in bytes) will not be cached, to stay
+below the MongoDB document size limit."""
+
+VOLATILE_BLOCK_KEYS = (
+    "block_id",
+    "bokeh_plot_data",
+    "b64_encoded_image",
+    "media_urls",
+    "errors",
+    "warnings",
+    "title",
+    "freeform_comment",
+    "render_cache",
+)
+"""Block data keys that are either outputs of the plotting functions
+or do not affect the rendered output, and are thus excluded from the cache key."""
+
+_FILE_REVISION_FIELDS = {
+    "revision": 1,
+    "last_modified": 1,
+    "last_modified_remote": 1,
+    "is_live": 1,
+}
+
+
+def _render_cache_enabled() -> bool:
+    return bool(CONFIG.RENDER_CACHE_MAX_SIZE)
+
+
+def _get_file_revisions(file_ids: List[str]) -> Optional[List[Dict[str, Any]]]:
+    """Returns the revision information for each file, or `None` if any of the
+    files are live (and thus may change without their revision being bumped),
+    unless live files are kept up to date by the live file watcher, which bumps
+    their revision whenever they change (see `pydatalab.live_files`).
+
+    """
+    revisions = []
+    if not file_ids:
+        return revisions
+
+    files = pydatalab.mongo.get_database()["files"].find(
+        {"_id": {"$in": [ObjectId(f) for f in file_ids]}},
+        projection=_FILE_REVISION_FIELDS,
+    )
+    files_by_id = {str(f["_id"]): f for f in files}
+
+    for file_id in file_ids:
+        file_info = files_by_id.get(str(file_id))
+        if file_info is None:
+            revisions.append({"file_id": str(file_id), "missing": True})
+            continue
+        if file_info.get("is_live") and not CONFIG.LIVE_FILE_WATCHER:
+            return None
+        revisions.append(
+            {
+                "file_id": str(file_id),
+                "revision": file_info.get("revision"),
+                "last_modified": file_info.get("last_modified"),
+                "last_modified_remote": file_info.get("last_modified_remote"),
+            }
+        )
+
+    return revisions
+
+
+def get_render_cache_key(block: "DataBlock") -> Optional[str]:
+    """Computes the render cache key for the current state of the block.
+
+    Parameters:
+        block: The block to compute the key for.
+
+    Returns:
+        A hex digest to use as the cache key, or `None` if the render for this
+        block should not be cached (e.g., it depends on live files).
+
+    """
+    from pydatalab import __version__
+
+    if not _render_cache_enabled():
+        return None
+
+    file_revisions = _get_file_revisions(block._get_render_file_ids())
+    if file_revisions is None:
+        return None
+
+    parameters = {k: v for k, v in block.data.items() if k not in VOLATILE_BLOCK_KEYS}
+
+    key_data = {
+        "blocktype": block.blocktype,
+        "version": getattr(block, "version", __version__),
+        "parameters": parameters,
+        "files": file_revisions,
+        "dependencies": block._get_render_dependencies(),
+    }
+
+    serialized = json.dumps(key_data, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def load_cached_render(key: str) -> Optional[Dict[str, Any]]:
+    """Loads a cached render payload, if present, and marks it as recently used.
+
+    Parameters:
+        key: The render cache key.
+
+    Returns:
+        The cached payload, or `None` if no entry exists for this key.
+
+    """
+    entry = pydatalab.mongo.get_database()[RENDER_CACHE_COLLECTION].find_one_and_update(
+        {"_id": key},
+        {
+            "$set": {"last_accessed": datetime.datetime.now(tz=datetime.timezone.utc)},
+            "$inc": {"hits": 1},
+        },
+        projection={"payload": 1},
+    )
+    if entry is None:
+        return None
+
+    return json.loads(zlib.decompress(entry["payload"]).decode("utf-8"))
+
+
+def store_cached_render(key: str, payload: Dict[str, Any], blocktype: str) -> bool:
+    """Stores a render payload in the cache and evicts older entries if
+    the cache has exceeded its configured size.
+
+    Parameters:
+        key: The render cache key.
+        payload: A JSON-serializable dictionary to cache.
+        blocktype: The block type that produced the payload.
+
+    Returns:
+        Whether the payload was stored.
+
+    """
+    compressed = zlib.compress(json.dumps(payload, cls=CustomJSONEncoder).encode("utf-8"), level=6)
+    size = len(compressed)
+    if size > MAX_ENTRY_SIZE or size > CONFIG.RENDER_CACHE_MAX_SIZE:
+        LOGGER.debug("Not caching render for %s of size %s bytes", blocktype, size)
+        return False
+
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    previous = pydatalab.mongo.get_database()[RENDER_CACHE_COLLECTION].find_one_and_replace(
+        {"_id": key},
+        {
+            "_id": key,
+            "blocktype": blocktype,
+            "payload": Binary(compressed),
+            "size": size,
+            "created": now,
+            "last_accessed": now,
+            "hits": 0,
+        },
+        projection={"size": 1},
+        upsert=True,
+    )
+
+    total = _increment_total_size(size - (previous or {}).get("size", 0))
+    if total > CONFIG.RENDER_CACHE_MAX_SIZE:
+        evict_render_cache()
+    return True
+
+
+def _increment_total_size(delta: int) -> int:
+    """Adds `delta` bytes to the tracked total size of the cache, and returns
+    the new total. The total is computed from the entries themselves if it has
+    not been tracked yet (e.g., for caches created before it was tracked).
+
+    """
+    stats = pydatalab.mongo.get_database()[RENDER_CACHE_STATS_COLLECTION]
+    counter = stats.find_one_and_update(
+        {"_id": RENDER_CACHE_COLLECTION},
+        {"$inc": {"total_size": delta}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if counter is not None:
+        return counter["total_size"]
+
+    collection = pydatalab.mongo.get_database()[RENDER_CACHE_COLLECTION]
+    total = next(
+        iter(collection.aggregate([{"$group": {"_id": None, "total": {"$sum": "$size"}}}])),
+        {"total": 0},
+    )["total"]
+    counter = stats.find_one_and_update(
+        {"_id": RENDER_CACHE_COLLECTION},
+        {"$setOnInsert": {"total_size": total}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return counter["total_size"]
+
+
+def evict_render_cache(max_size: Optional[int] = None) -> int:
+    """Removes the least recently accessed entries from the render cache until
+    its total size is below the configured limit.
+
+    Parameters:
+        max_size: The maximum total size of the cache in bytes, defaults to
+            `CONFIG.RENDER_CACHE_MAX_SIZE`.
+
+    Returns:
+        The number of entries removed.
+
+    """
+    if max_size is None:
+        max_size = CONFIG.RENDER_CACHE_MAX_SIZE
+
+    total = _increment_total_size(0)
+    if total <= max_size:
+        return 0
+
+    collection = pydatalab.mongo.get_database()[RENDER_CACHE_COLLECTION]
+    removed = 0
+    for entry in collection.find({}, projection={"size": 1}, sort=[("last_accessed", 1)]):
+        if total <= max_size:
+            break
+        # Only count entries that were not already removed by a concurrent eviction
+        if collection.find_one_and_delete({"_id": entry["_id"]}, projection={"size": 1}):
+            total = _increment_total_size(-entry["size"])
+            removed += 1
+
+    if removed:
+        LOGGER.debug("Evicted %s entries from the render cache", removed)
+
+    return removed
@@ -0,0 +1,172 @@
+"""This module provides functions for rendering data blocks, either serially
+within the current process or in parallel on the shared pool of worker processes
+(see `pydatalab.worker_pool`).
+
+Worker processes are forked from the server process when the app is created,
+and inherit the Flask app so that blocks are rendered with the same configuration
+and permissions as the request that triggered them.
+
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, List, Optional
+
+from flask import current_app, has_request_context
+from flask_login import current_user, login_user
+
+from pydatalab.config import CONFIG
+from pydatalab.jobs import register_job_handler, submit_job, update_job_progress
+from pydatalab.logger import LOGGER
+from pydatalab.worker_pool import get_worker_app, get_worker_pool, handle_worker_failure
+
+__all__ = ("render_block", "render_blocks", "submit_render_job")
+
+
+def render_block(block_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Create the corresponding Python object for the JSON block data, then
+    serialize it again as JSON, rendering any plots in the process.
+
+    Parameters:
+        block_data: The JSON block data, as stored in the database, with any
+            fields stored in the block data store (see `pydatalab.block_data`)
+            loaded before rendering.
+
+    Returns:
+        The re-serialized block data.
+
+    """
+    from pydatalab.block_data import load_offloaded_fields
+    from pydatalab.blocks import BLOCK_TYPES
+
+    block_data = load_offloaded_fields(block_data)
+    blocktype = block_data["blocktype"]
+    return BLOCK_TYPES.get(blocktype, BLOCK_TYPES["notsupported"]).from_db(block_data).to_web()
+
+
+def _render_block_in_worker(block_data: Dict[str, Any], user) -> Dict[str, Any]:
+    """Renders a block inside a worker process, within a request context
+    authenticated as the user that made the original request.
+
+    """
+    with get_worker_app().test_request_context():
+        if user is not None:
+            login_user(user)
+        return render_block(block_data)
+
+
+def _requires_rendering(block_data: Dict[str, Any]) -> bool:
+    """Whether the block has any plot functions that would be worth
+    sending to a worker process.
+
+    """
+    from pydatalab.blocks import BLOCK_TYPES
+
+    block_type = BLOCK_TYPES.get(block_data["blocktype"], BLOCK_TYPES["notsupported"])
+    try:
+        return bool(block_type.from_db(block_data).plot_functions)
+    except Exception:
+        return False
+
+
+def render_blocks(blocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Renders a list of blocks, in parallel on the worker pool if
+    `CONFIG.BLOCK_RENDER_PROCESSES` is greater than 1 and there is more than one
+    block with plots to render.
+
+    Any errors and warnings raised by each block's plot functions are captured
+    on the block itself, as for serial rendering. Any block that fails to render
+    in the pool for other reasons (e.g., if its result cannot be sent back from
+    the worker, or the pool fails) is rendered serially instead.
+
+    Parameters:
+        blocks: A list of JSON block data.
+
+    Returns:
+        The re-serialized block data, in the same order as the input.
+
+    """
+    rendered: List[Optional[Dict[str, Any]]] = [None] * len(blocks)
+    to_render = [ind for ind, block in enumerate(blocks) if _requires_rendering(block)]
+
+    pool = get_worker_pool()
+    if (
+        pool is not None
+        and CONFIG.BLOCK_RENDER_PROCESSES > 1
+        and len(to_render) > 1
+        and has_request_context()
+    ):
+        user = current_user._get_current_object() if current_user.is_authenticated else None
+        futures = {
+            ind: pool.submit(_render_block_in_worker, blocks[ind], user) for ind in to_render
+        }
+        for ind, future in futures.items():
+            exc = handle_worker_failure(future)
+            if exc is not None:
+                LOGGER.warning(
+                    "Failed to render block %s in worker pool, rendering serially: %r",
+                    blocks[ind].get("block_id"),
+                    exc,
+                )
+                continue
+            rendered[ind] = future.result()
+
+    for ind, block in enumerate(blocks):
+        if rendered[ind] is None:
+            rendered[ind] = render_block(block)
+
+    return rendered  # type: ignore
+
+
+def submit_render_job(block_data: Dict[str, Any]) -> str:
+    """Submits a job to render the given block data in a background worker,
+    de-duplicated against any identical render already queued or running.
+
+    Parameters:
+        block_data: The JSON block data, as received from the web.
+
+    Returns:
+        The ID of the render job.
+
+    """
+    from pydatalab.render_cache import VOLATILE_BLOCK_KEYS
+
+    parameters = {k: v for k, v in block_data.items() if k not in VOLATILE_BLOCK_KEYS}
+    dedup_key = hashlib.sha256(
+        json.dumps(
+            {"block_id": block_data.get("block_id"), "parameters": parameters},
+            sort_keys=True,
+            default=str,
+        ).encode("utf-8")
+    ).hexdigest()
+
+    user_id = current_user.id if current_user.is_authenticated else None
+    block_data = {k: v for k, v in block_data.items() if k != "bokeh_plot_data"}
+    return submit_job(
+        "render_block",
+        {"block_data": block_data, "user_id": user_id},
+        dedup_key=f"render_block:{dedup_key}",
+        creator_id=user_id,
+    )
+
+
+@register_job_handler("render_block")
+def _render_block_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Renders a block from its web data, as the user that requested the job."""
+    from pydatalab.blocks import BLOCK_TYPES
+    from pydatalab.login import get_by_id
+
+    block_data = job["payload"]["block_data"]
+    user_id = job["payload"].get("user_id")
+
+    with current_app.test_request_context():
+        if user_id is not None:
+            user = get_by_id(user_id)
+            if user is None:
+                raise RuntimeError(f"User {user_id} who requested the render no longer exists.")
+            login_user(user)
+
+        update_job_progress(job["_id"], 0.1, "Loading block")
+        block = BLOCK_TYPES[block_data["blocktype"]].from_web(block_data)
+        update_job_progress(job["_id"], 0.2, "Rendering block")
+        return block.to_web()
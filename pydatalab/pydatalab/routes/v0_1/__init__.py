@@ -10,6 +10,7 @@ from .graphs import GRAPHS
 from .healthcheck import HEALTHCHECK
 from .info import INFO
 from .items import ITEMS
+from .jobs import JOBS
 from .remotes import REMOTES
 from .users import USERS
 
@@ -21,6 +22,7 @@ BLUEPRINTS: tuple[Blueprint, ...] = (
     ADMIN,
     ITEMS,
     BLOCKS,
+    JOBS,
     FILES,
     HEALTHCHECK,
     INFO,
@@ -93,3 +93,14 @@ def save_role(user_id):
         )
 
     return (jsonify({"status": "success"}), 200)
+
+
+@ADMIN.route("/mongo_pool")
+def get_mongo_pool():
+    """Returns the connection pool statistics of the MongoDB client(s) held
+    by the process that served this request.
+
+    """
+    from pydatalab.mongo import get_pool_statistics
+
+    return jsonify({"status": "success", "data": get_pool_statistics()})
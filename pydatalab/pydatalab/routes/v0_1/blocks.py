@@ -1,11 +1,19 @@
+import hashlib
+import json
+import os
+
 import pymongo.errors
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, make_response, request, send_file
 
+from pydatalab.block_data import load_offloaded_fields, offload_block_fields
 from pydatalab.blocks import BLOCK_TYPES
 from pydatalab.blocks.base import DataBlock
+from pydatalab.config import CONFIG
 from pydatalab.logger import LOGGER
 from pydatalab.mongo import flask_mongo
 from pydatalab.permissions import active_users_or_get_only, get_default_permissions
+from pydatalab.plot_data import get_plot_data_path
+from pydatalab.render_pool import submit_render_job
 
 BLOCKS = Blueprint("blocks", __name__)
 
@@ -136,13 +144,20 @@ def add_collection_data_block():
     )
 
 
+_FALLBACK_OFFLOAD_SIZE = 16 * 1024
+"""The size above which block fields are stored separately when saving a block
+would otherwise exceed the document size limit of its item."""
+
+
 def _save_block_to_db(block: DataBlock) -> bool:
     """Save data for a single block within an item to the database,
-    overwriting previous data saved there.
+    overwriting previous data saved there. Any large fields of the block
+    are stored separately (see `pydatalab.block_data`).
+
     returns true if successful, false if unsuccessful
     """
-    updated_block = block.to_db()
-    update = {"$set": {f"blocks_obj.{block.block_id}": updated_block}}
+    block_data = block.to_db()
+    update = {"$set": {f"blocks_obj.{block.block_id}": offload_block_fields(block_data)}}
 
     if block.data.get("collection_id"):
         match = {
@@ -160,11 +175,22 @@ def _save_block_to_db(block: DataBlock) -> bool:
     try:
         result = flask_mongo.db.items.update_one(match, update)
     except pymongo.errors.DocumentTooLarge:
-        LOGGER.warning(
-            "DocumentTooLarge error occurred while saving block to db, block.block_id='%s'",
-            block.block_id,
-        )
-        return False
+        # The item is too large with this block, so store more of the block separately
+        update = {
+            "$set": {
+                f"blocks_obj.{block.block_id}": offload_block_fields(
+                    block_data, min_size=_FALLBACK_OFFLOAD_SIZE
+                )
+            }
+        }
+        try:
+            result = flask_mongo.db.items.update_one(match, update)
+        except pymongo.errors.DocumentTooLarge:
+            LOGGER.warning(
+                "DocumentTooLarge error occurred while saving block to db, block.block_id='%s'",
+                block.block_id,
+            )
+            return False
 
     if result.matched_count != 1:
         LOGGER.warning(
@@ -181,12 +207,18 @@ def update_block():
     out updated data. May be used, for example, when the user
     changes plot parameters and the server needs to generate a new
     plot.
+
+    If `background` is set in the request and background job workers
+    are configured (`CONFIG.RENDER_JOB_WORKERS`), the render is instead
+    queued and the response (202) contains a `job_id` that can be polled
+    at `/jobs/<job_id>` for the rendered block data.
     """
 
     request_json = request.get_json()
     block_data = request_json["block_data"]
     blocktype = block_data["blocktype"]
     save_to_db = request_json.get("save_to_db", False)
+    background = request_json.get("background", False)
 
     block = BLOCK_TYPES[blocktype].from_web(block_data)
 
@@ -194,6 +226,13 @@ def update_block():
     if save_to_db:
         saved_successfully = _save_block_to_db(block)
 
+    if background and CONFIG.RENDER_JOB_WORKERS and block.plot_functions:
+        job_id = submit_render_job(block.data)
+        return (
+            jsonify(status="accepted", saved_successfully=saved_successfully, job_id=job_id),
+            202,
+        )
+
     return (
         jsonify(
             status="success", saved_successfully=saved_successfully, new_block_data=block.to_web()
@@ -202,6 +241,93 @@ def update_block():
     )
 
 
+@BLOCKS.route("/render-block/<item_id>/<block_id>", methods=["GET"])
+def render_block(item_id: str, block_id: str):
+    """Render a single block of an item from its saved data, returning
+    the rendered block data (including any plots).
+
+    This allows the item data to be fetched without rendering any blocks,
+    with each block then rendered by separate (parallel) requests.
+    Responses carry an `ETag` derived from the block data and the render cache
+    key of the block (see `pydatalab.render_cache`), so that unchanged blocks can be
+    revalidated by the browser without being re-rendered.
+
+    """
+    item = flask_mongo.db.items.find_one(
+        {
+            "item_id": item_id,
+            f"blocks_obj.{block_id}": {"$exists": True},
+            **get_default_permissions(user_only=False),
+        },
+        projection={f"blocks_obj.{block_id}": 1},
+    )
+
+    if not item:
+        return (
+            jsonify(
+                status="error",
+                message=f"No matching block {block_id=} for {item_id=} with current authorization.",
+            ),
+            404,
+        )
+
+    block_data = load_offloaded_fields(item["blocks_obj"][block_id])
+    block = BLOCK_TYPES.get(block_data["blocktype"], BLOCK_TYPES["notsupported"]).from_db(
+        block_data
+    )
+
+    etag = None
+    cache_key = block._get_render_cache_key()
+    if cache_key:
+        etag = hashlib.sha256(
+            (cache_key + json.dumps(block.data, sort_keys=True, default=str)).encode("utf-8")
+        ).hexdigest()
+        if etag in request.if_none_match:
+            response = make_response("", 304)
+            response.set_etag(etag)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+
+    response = make_response(jsonify(status="success", new_block_data=block.to_web()), 200)
+    if etag:
+        response.set_etag(etag)
+        # Allow the browser to store the response, but always revalidate it
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.no_store = True
+
+    return response
+
+
+@BLOCKS.route("/plot-data/<key>", methods=["GET"])
+def get_plot_data(key: str):
+    """Serve the binary column data of a rendered plot (see `pydatalab.plot_data`).
+
+    The key is the SHA-256 hash of the data, which is only made available
+    within an authorized block render, so the response never changes and
+    can be cached by the browser indefinitely.
+
+    """
+    path = get_plot_data_path(key)
+    if path is None or not path.exists():
+        return jsonify(status="error", message=f"No plot data found with {key=}."), 404
+
+    try:
+        # Mark as recently used, so that it is evicted last
+        os.utime(path)
+    except OSError:
+        pass
+
+    response = send_file(path, mimetype="application/octet-stream", etag=key, conditional=True)
+    response.headers["Content-Encoding"] = "gzip"
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    response.cache_control.max_age = 365 * 24 * 60 * 60
+    return response
+
+
 @BLOCKS.route("/delete-block/", methods=["POST"])
 def delete_block():
     """Completely delete a data block from the database. In the future,
@@ -1,16 +1,41 @@
+import datetime
+import mimetypes
 import os
+from urllib.parse import quote
 
 from bson import ObjectId
 from bson.errors import InvalidId
-from flask import Blueprint, jsonify, request, send_from_directory
+from flask import Blueprint, current_app, jsonify, request, send_file
 from flask_login import current_user
+from PIL import Image
 from pymongo import ReturnDocument
+from werkzeug.http import is_resource_modified
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 
 import pydatalab.mongo
 from pydatalab import file_utils
 from pydatalab.config import CONFIG
+from pydatalab.logger import LOGGER
+from pydatalab.media import (
+    IMAGE_PREVIEW_EXTENSIONS,
+    PREVIEW_VARIANTS,
+    check_image_tileable,
+    ensure_image_previews,
+    get_image_preview_key,
+    get_image_preview_path,
+    get_image_pyramid_info,
+    get_image_tile_path,
+    submit_image_pyramid_job,
+)
 from pydatalab.permissions import active_users_or_get_only, get_default_permissions
+from pydatalab.uploads import (
+    UploadOffsetMismatch,
+    abort_upload,
+    create_upload,
+    get_upload,
+    write_upload_chunk,
+)
 
 FILES = Blueprint("files", __name__)
 
@@ -20,29 +45,191 @@ FILES = Blueprint("files", __name__)
 def _(): ...
 
 
-@FILES.route("/files/<string:file_id>/<string:filename>", methods=["GET"])
-def get_file(file_id: str, filename: str):
+def _find_file(file_id: str):
+    """Returns the stored information of a file, if the current user can access it."""
     try:
         _file_id = ObjectId(file_id)
     except InvalidId:
-        # If the ID is invalid, then there will be no results in the database anyway,
-        # so just 401
         _file_id = file_id
-    if not pydatalab.mongo.flask_mongo.db.files.find_one(
+    return pydatalab.mongo.flask_mongo.db.files.find_one(
         {"_id": _file_id, **get_default_permissions(user_only=False)}
-    ):
-        return (
-            jsonify(
-                {
-                    "status": "error",
-                    "title": "Not Authorized",
-                    "detail": "Authorization required to access file",
-                }
-            ),
-            401,
+    )
+
+
+def _not_authorized():
+    return (
+        jsonify(
+            {
+                "status": "error",
+                "title": "Not Authorized",
+                "detail": "Authorization required to access file",
+            }
+        ),
+        401,
+    )
+
+
+def _send_preview_file(path, etag: str, key: str):
+    """Sends a generated file, which can be cached indefinitely if requested
+    with the `key` of the revision it was generated from.
+
+    """
+    response = send_file(path, etag=etag, conditional=True)
+    response.cache_control.private = True
+    if request.args.get("key") == key:
+        response.cache_control.no_cache = None
+        response.cache_control.immutable = True
+        response.cache_control.max_age = 365 * 24 * 60 * 60
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def _send_with_proxy(path: str, etag: str):
+    """Delegates sending a file to the reverse proxy (see `CONFIG.FILE_SENDFILE_HEADER`),
+    which also handles any range requests, after answering conditional requests.
+
+    """
+    stat = os.stat(path)
+    response = current_app.response_class(
+        mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream"
+    )
+    response.set_etag(etag)
+    response.last_modified = datetime.datetime.fromtimestamp(
+        int(stat.st_mtime), tz=datetime.timezone.utc
+    )
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=response.last_modified):
+        response.status_code = 304
+        return response
+
+    if CONFIG.FILE_SENDFILE_HEADER == "X-Accel-Redirect":
+        relative_path = os.path.relpath(path, CONFIG.FILE_DIRECTORY)
+        response.headers["X-Accel-Redirect"] = (
+            f"{CONFIG.FILE_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{quote(relative_path)}"
         )
-    path = os.path.join(CONFIG.FILE_DIRECTORY, secure_filename(file_id))
-    return send_from_directory(path, filename)
+    else:
+        response.headers["X-Sendfile"] = os.path.abspath(path)
+    return response
+
+
+@FILES.route("/files/<string:file_id>/<string:filename>", methods=["GET"])
+def get_file(file_id: str, filename: str):
+    """Serve a stored file, with support for byte range requests (e.g., to resume
+    downloads or seek within videos) and conditional requests.
+
+    The ETag of the file is derived from its revision and the SHA-256 hash of its
+    contents, so that unchanged files do not have to be downloaded again.
+
+    """
+    file_info = _find_file(file_id)
+    if not file_info:
+        return _not_authorized()
+
+    path = safe_join(os.path.join(CONFIG.FILE_DIRECTORY, secure_filename(file_id)), filename)
+    if path is None or not os.path.isfile(path):
+        return jsonify(status="error", message=f"No file {filename!r} found for {file_id=}."), 404
+
+    if filename == file_info.get("name"):
+        etag = f"{file_info.get('revision', 1)}-{file_utils.get_file_hash(file_info)}"
+    else:
+        stat = os.stat(path)
+        etag = f"{stat.st_mtime_ns}-{stat.st_size}"
+
+    if CONFIG.FILE_SENDFILE_HEADER:
+        return _send_with_proxy(path, etag)
+
+    response = send_file(path, etag=etag, conditional=True)
+    response.cache_control.private = True
+    return response
+
+
+@FILES.route("/files/<string:file_id>/preview/<string:variant>", methods=["GET"])
+def get_file_preview(file_id: str, variant: str):
+    """Serve a browser-friendly variant of an image file (see `pydatalab.media`),
+    generating it first if it does not exist for the current revision of the file.
+
+    Requests that include the current `key` of the previews (as in the URLs
+    stored by media blocks) are allowed to be cached by the browser indefinitely.
+
+    """
+    file_info = _find_file(file_id)
+    if not file_info:
+        return _not_authorized()
+
+    if variant not in PREVIEW_VARIANTS:
+        return jsonify(status="error", message=f"Unknown preview {variant=}."), 404
+
+    try:
+        key = ensure_image_previews(file_info)
+    except (OSError, Image.DecompressionBombError) as exc:
+        LOGGER.warning("Unable to generate preview of file %s: %s", file_id, exc)
+        key = None
+
+    path = get_image_preview_path(file_info["location"], key, variant) if key else None
+    if path is None or not path.exists():
+        return jsonify(status="error", message=f"No {variant} available for {file_id=}."), 404
+
+    return _send_preview_file(path, f"{key}.{variant}", key)
+
+
+@FILES.route("/files/<string:file_id>/tiles", methods=["GET"])
+def get_file_tiles(file_id: str):
+    """Describe the tile pyramid of an image file (see `pydatalab.media`).
+
+    If the pyramid has not yet been built for the current revision of the file,
+    a background job is submitted to build it, and its ID is returned instead.
+
+    """
+    file_info = _find_file(file_id)
+    if not file_info:
+        return _not_authorized()
+
+    if os.path.splitext(file_info["location"])[-1].lower() not in IMAGE_PREVIEW_EXTENSIONS:
+        return jsonify(status="error", message=f"No tiles available for {file_id=}."), 404
+
+    try:
+        info = get_image_pyramid_info(file_info)
+    except OSError as exc:
+        LOGGER.warning("Unable to find tiles of file %s: %s", file_id, exc)
+        return jsonify(status="error", message=f"No tiles available for {file_id=}."), 404
+
+    if info is None:
+        try:
+            check_image_tileable(file_info)
+        except (OSError, Image.DecompressionBombError) as exc:
+            LOGGER.warning("Unable to tile file %s: %s", file_id, exc)
+            return jsonify(status="error", message=f"Unable to tile {file_id=}: {exc}"), 400
+
+        creator_id = current_user.id if current_user.is_authenticated else None
+        job_id = submit_image_pyramid_job(file_info, creator_id=creator_id)
+        return jsonify(status="success", ready=False, job_id=job_id), 202
+
+    return jsonify(status="success", ready=True, **info), 200
+
+
+@FILES.route("/files/<string:file_id>/tiles/<int:level>/<int:x>/<int:y>", methods=["GET"])
+def get_file_tile(file_id: str, level: int, x: int, y: int):
+    """Serve a single tile from the pyramid of an image file, at the given
+    level (zoom) and column and row.
+
+    """
+    file_info = _find_file(file_id)
+    if not file_info:
+        return _not_authorized()
+
+    try:
+        key = get_image_preview_key(file_info)
+    except OSError:
+        key = None
+
+    path = get_image_tile_path(file_info["location"], key, level, x, y) if key else None
+    if path is None or not path.exists():
+        return jsonify(status="error", message=f"No tile {level}/{x}/{y} for {file_id=}."), 404
+
+    return _send_preview_file(path, f"{key}.{level}.{x}.{y}", key)
 
 
 @FILES.route("/upload-file/", methods=["POST"])
@@ -100,6 +287,157 @@ def upload():
     )
 
 
+def _upload_creator_id():
+    if not CONFIG.TESTING:
+        return current_user.person.immutable_id
+    return ObjectId(24 * "0")
+
+
+def _upload_requires_login():
+    return (
+        jsonify(
+            {
+                "status": "error",
+                "title": "Not Authorized",
+                "detail": "File upload requires login.",
+            }
+        ),
+        401,
+    )
+
+
+def _upload_status(upload):
+    return {
+        "status": "success",
+        "upload_id": str(upload["_id"]),
+        "offset": upload["offset"],
+        "size": upload["size"],
+        "chunk_size": CONFIG.UPLOAD_CHUNK_SIZE,
+    }
+
+
+@FILES.route("/uploads/", methods=["POST"])
+def create_upload_session():
+    """Creates a session for a resumable upload of a file, to which the contents
+    of the file are then sent in chunks (see `pydatalab.uploads`).
+
+    """
+    if not current_user.is_authenticated and not CONFIG.TESTING:
+        return _upload_requires_login()
+
+    request_json = request.get_json()
+    item_id = request_json.get("item_id")
+    filename = request_json.get("filename")
+    size = request_json.get("size")
+    replace_file_id = request_json.get("replace_file")
+    if replace_file_id == "null":
+        replace_file_id = None
+
+    if not item_id:
+        return jsonify(status="error", message="No item id provided"), 400
+    if not filename:
+        return jsonify(status="error", message="No filename provided"), 400
+    if not isinstance(size, int):
+        return jsonify(status="error", message="No file size provided"), 400
+
+    if not pydatalab.mongo.flask_mongo.db.items.find_one(
+        {"item_id": item_id, **get_default_permissions(user_only=True)}
+    ):
+        return jsonify(status="error", message=f"item_id is invalid: {item_id}"), 400
+    if replace_file_id:
+        try:
+            replace_file = pydatalab.mongo.flask_mongo.db.files.find_one(
+                {"_id": ObjectId(replace_file_id), **get_default_permissions(user_only=True)}
+            )
+        except InvalidId:
+            replace_file = None
+        if not replace_file:
+            return jsonify(status="error", message=f"Unable to find file {replace_file_id}"), 400
+
+    try:
+        upload = create_upload(
+            filename, size, item_id, _upload_creator_id(), replace_file_id=replace_file_id
+        )
+    except ValueError as exc:
+        return jsonify(status="error", message=str(exc)), 400
+    except RuntimeError as exc:
+        return jsonify(status="error", message=str(exc)), 507
+
+    return jsonify(_upload_status(upload)), 201
+
+
+@FILES.route("/uploads/<string:upload_id>", methods=["GET"])
+def get_upload_session(upload_id: str):
+    """Returns the offset from which to continue sending chunks to an upload session."""
+    if not current_user.is_authenticated and not CONFIG.TESTING:
+        return _upload_requires_login()
+
+    upload = get_upload(upload_id, _upload_creator_id())
+    if not upload:
+        return jsonify(status="error", message=f"Unable to find upload {upload_id}"), 404
+
+    return jsonify(_upload_status(upload)), 200
+
+
+@FILES.route("/uploads/<string:upload_id>", methods=["PUT"])
+def put_upload_chunk(upload_id: str):
+    """Writes a chunk of a file, starting at the offset given in the `Upload-Offset`
+    header, to an upload session. Once the last chunk has been written, the file is
+    stored and the response matches that of `/upload-file/`.
+
+    """
+    if not current_user.is_authenticated and not CONFIG.TESTING:
+        return _upload_requires_login()
+
+    upload = get_upload(upload_id, _upload_creator_id())
+    if not upload:
+        return jsonify(status="error", message=f"Unable to find upload {upload_id}"), 404
+
+    try:
+        offset = int(request.headers["Upload-Offset"])
+    except (KeyError, ValueError):
+        return jsonify(status="error", message="Missing or invalid Upload-Offset header"), 400
+    if request.content_length is None and offset != upload["size"]:
+        return jsonify(status="error", message="Missing Content-Length header"), 411
+
+    try:
+        upload = write_upload_chunk(upload, offset, request.stream, request.content_length or 0)
+    except UploadOffsetMismatch as exc:
+        return jsonify(status="error", message=str(exc), offset=exc.offset), 409
+    except ValueError as exc:
+        return jsonify(status="error", message=str(exc)), 400
+
+    if "file_information" not in upload:
+        return jsonify(_upload_status(upload)), 200
+
+    file_information = upload["file_information"]
+    return (
+        jsonify(
+            {
+                "status": "success",
+                "file_id": str(file_information["_id"]),
+                "file_information": file_information,
+                "is_update": bool(upload["replace_file_id"]),
+            }
+        ),
+        201,
+    )
+
+
+@FILES.route("/uploads/<string:upload_id>", methods=["DELETE"])
+def delete_upload_session(upload_id: str):
+    """Cancels an upload session, removing any chunks received so far."""
+    if not current_user.is_authenticated and not CONFIG.TESTING:
+        return _upload_requires_login()
+
+    upload = get_upload(upload_id, _upload_creator_id())
+    if not upload:
+        return jsonify(status="error", message=f"Unable to find upload {upload_id}"), 404
+
+    abort_upload(upload)
+    return jsonify(status="success"), 200
+
+
 @FILES.route("/add-remote-file-to-sample/", methods=["POST"])
 def add_remote_file_to_sample():
     if not current_user.is_authenticated and not CONFIG.TESTING:
@@ -131,6 +131,9 @@ def list_block_types():
                             "accepted_file_extensions": getattr(
                                 block, "accepted_file_extensions", []
                             ),
+                            "transforms": block.transforms.options
+                            if getattr(block, "transforms", None)
+                            else [],
                         },
                     )
                     for block_type, block in BLOCK_TYPES.items()
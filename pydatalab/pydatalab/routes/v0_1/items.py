@@ -3,11 +3,12 @@ import json
 from typing import Dict, List, Optional, Set, Union
 
 from bson import ObjectId
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, has_request_context, jsonify, request
 from flask_login import current_user
 from pydantic import ValidationError
 from pymongo.command_cursor import CommandCursor
 
+from pydatalab.block_data import offload_block_fields
 from pydatalab.blocks import BLOCK_TYPES
 from pydatalab.config import CONFIG
 from pydatalab.logger import LOGGER
@@ -17,6 +18,7 @@ from pydatalab.models.relationships import RelationshipType
 from pydatalab.models.utils import generate_unique_refcode
 from pydatalab.mongo import flask_mongo
 from pydatalab.permissions import active_users_or_get_only, get_default_permissions
+from pydatalab.render_pool import render_blocks
 
 ITEMS = Blueprint("items", __name__)
 
@@ -30,23 +32,26 @@ def reserialize_blocks(display_order: List[str], blocks_obj: Dict[str, Dict]) ->
     """Create the corresponding Python objects from JSON block data, then
     serialize it again as JSON to populate any missing properties.
 
+    Blocks are rendered in parallel if `CONFIG.BLOCK_RENDER_PROCESSES` is greater than 1.
+
     Parameters:
+        display_order: The order in which the blocks are displayed, by block ID.
         blocks_obj: A dictionary containing the JSON block data, keyed by block ID.
 
     Returns:
         A dictionary with the re-serialized block data.
 
     """
+    block_ids = []
     for block_id in display_order:
-        try:
-            block_data = blocks_obj[block_id]
-        except KeyError:
+        if block_id not in blocks_obj:
             LOGGER.warning(f"block_id {block_id} found in display order but not in blocks_obj")
             continue
-        blocktype = block_data["blocktype"]
-        blocks_obj[block_id] = (
-            BLOCK_TYPES.get(blocktype, BLOCK_TYPES["notsupported"]).from_db(block_data).to_web()
-        )
+        block_ids.append(block_id)
+
+    rendered_blocks = render_blocks([blocks_obj[block_id] for block_id in block_ids])
+    for block_id, block_data in zip(block_ids, rendered_blocks):
+        blocks_obj[block_id] = block_data
 
     return blocks_obj
 
@@ -637,12 +642,18 @@ def get_item_data(item_id, load_blocks: bool = False):
     """Generates a JSON response for the item with the given `item_id`,
     additionally resolving relationships to files and other items.
 
+    By default, only the stored metadata of each block is returned, and
+    the blocks can then be rendered individually via `/render-block/<item_id>/<block_id>`.
+
     Parameters:
        load_blocks: Whether to regenerate any data blocks associated with this
            sample (i.e., create the Python object corresponding to the block and
-           call its render function).
+           call its render function). Can also be requested with the `load_blocks`
+           query parameter.
 
     """
+    if not load_blocks and has_request_context():
+        load_blocks = request.args.get("load_blocks", "false").lower() in ("true", "1")
 
     # retrieve the entry from the database:
     cursor = flask_mongo.db.items.aggregate(
@@ -791,7 +802,7 @@ def save_item():
 
         block = BLOCK_TYPES.get(blocktype, BLOCK_TYPES["notsupported"]).from_web(block_data)
 
-        updated_data["blocks_obj"][block_id] = block.to_db()
+        updated_data["blocks_obj"][block_id] = offload_block_fields(block.to_db())
 
     user_only = updated_data["type"] not in ("starting_materials", "equipment")
 
@@ -0,0 +1,104 @@
+from typing import Any, Callable, Dict
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import Blueprint, jsonify
+from flask_login import current_user
+
+from pydatalab.jobs import JobStatus, get_job, get_job_result
+from pydatalab.models.utils import UserRole
+from pydatalab.mongo import flask_mongo
+from pydatalab.permissions import active_users_or_get_only, get_default_permissions
+
+JOBS = Blueprint("jobs", __name__)
+
+
+@JOBS.before_request
+@active_users_or_get_only
+def _(): ...
+
+
+def _can_view_render_job(job: Dict[str, Any]) -> bool:
+    """Render jobs can be viewed by users that can view the item (or collection)
+    that the block belongs to.
+
+    """
+    block_data = job["payload"].get("block_data", {})
+    if block_data.get("collection_id"):
+        collection, match = "collections", {"collection_id": block_data["collection_id"]}
+    elif block_data.get("item_id"):
+        collection, match = "items", {"item_id": block_data["item_id"]}
+    else:
+        return False
+    return (
+        flask_mongo.db[collection].find_one(
+            {**match, **get_default_permissions(user_only=False)}, projection={"_id": 1}
+        )
+        is not None
+    )
+
+
+def _can_view_file_job(job: Dict[str, Any]) -> bool:
+    """File jobs (e.g., building image pyramids) can be viewed by users that can
+    view the file.
+
+    """
+    try:
+        file_id = ObjectId(job["payload"].get("file_id"))
+    except (InvalidId, TypeError):
+        return False
+    return (
+        flask_mongo.db.files.find_one(
+            {"_id": file_id, **get_default_permissions(user_only=False)}, projection={"_id": 1}
+        )
+        is not None
+    )
+
+
+_JOB_PERMISSION_CHECKS: Dict[str, Callable[[Dict[str, Any]], bool]] = {
+    "render_block": _can_view_render_job,
+    "image_pyramid": _can_view_file_job,
+}
+"""The permission check for each kind of job, which should allow the same
+users to view the job as can view the resource it renders."""
+
+
+def _can_view_job(job: Dict[str, Any]) -> bool:
+    """Jobs can only be viewed by admins, or by users that can view the resource
+    that the job renders; jobs of any other kind can only be viewed by admins.
+
+    """
+    if current_user.is_authenticated and current_user.role == UserRole.ADMIN:
+        return True
+    check = _JOB_PERMISSION_CHECKS.get(job["kind"])
+    return check is not None and check(job)
+
+
+@JOBS.route("/jobs/<job_id>", methods=["GET"])
+def get_job_status(job_id):
+    """Returns the status and progress of a background job, and its
+    result once it has completed.
+
+    """
+    job = get_job(job_id, include_payload=True)
+    if not job or not _can_view_job(job):
+        return jsonify(status="error", message=f"No job found with {job_id=}."), 404
+
+    response = {
+        "status": "success",
+        "job_id": str(job["_id"]),
+        "kind": job["kind"],
+        "job_status": job["status"],
+        "progress": job.get("progress", 0.0),
+        "message": job.get("message"),
+        "created": job.get("created"),
+        "started": job.get("started"),
+        "finished": job.get("finished"),
+    }
+
+    if job["status"] == JobStatus.COMPLETE:
+        response["result"] = get_job_result(job_id)
+    elif job["status"] == JobStatus.FAILED:
+        response["error"] = job.get("error")
+
+    return jsonify(response), 200
@@ -0,0 +1,340 @@
+"""This module implements registries of derived columns (e.g., baselines or
+unit conversions) that blocks can compute on demand from parsed data.
+
+Each block type that supports derived columns holds a `TransformRegistry`,
+to which transforms are added with the `TransformRegistry.register` decorator:
+
+```python
+XRD_TRANSFORMS = TransformRegistry("xrd")
+
+@XRD_TRANSFORMS.register("sqrt(intensity)", depends_on=("intensity",))
+def _sqrt_intensity(df):
+    return np.sqrt(df["intensity"])
+```
+
+Only the requested columns (and the columns they depend on) are computed when
+the registry is evaluated, and expensive columns (e.g., baselines) are memoised in
+the parsed data cache (see `pydatalab.parsed_data`), keyed on the parsed data they
+were computed from and the version and parameters of the transform. Additional transforms (e.g.,
+alternative baselines or smoothing) can therefore be registered by plugins without
+slowing down the rendering of blocks that do not use them.
+
+Block types that plot 1D spectra against some x-axis (e.g., diffraction patterns
+and Raman spectra) share the intensity transforms and baselines registered by
+`register_spectrum_transforms`, and can add further baselines with
+`register_baseline`.
+
+"""
+
+import hashlib
+import json
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from scipy.signal import medfilt
+
+from pydatalab.config import CONFIG
+from pydatalab.logger import LOGGER
+
+__all__ = ("Transform", "TransformRegistry", "register_baseline", "register_spectrum_transforms")
+
+POLYFIT_DEGREE = 15
+"""The degree of the polynomial fitted by the polyfit baseline of spectra."""
+
+MEDFILT_KERNEL_SIZE = 101
+"""The kernel size of the median filter used by the median baseline of spectra."""
+
+
+class Transform:
+    """A single derived column, computed from other columns of a dataframe."""
+
+    def __init__(
+        self,
+        column: str,
+        func: Callable[..., Any],
+        depends_on: Sequence[str] = (),
+        parameters: Optional[Dict[str, Any]] = None,
+        version: str = "1",
+        public: bool = True,
+        memoise: bool = True,
+    ):
+        """
+        Parameters:
+            column: The name of the column produced by the transform.
+            func: A function that takes the dataframe (containing at least the
+                columns in `depends_on`) and any parameters as keyword arguments,
+                returning the values of the new column.
+            depends_on: The columns (raw or derived) required by the transform.
+            parameters: The names and default values of any parameters of the transform,
+                which can be overridden when the registry is evaluated.
+            version: A version string, which should be changed whenever the
+                output of the transform changes.
+            public: Whether the column can be requested and plotted, or is only
+                an intermediate result used by other transforms.
+            memoise: Whether to store the computed column in the parsed data cache,
+                which should be disabled for transforms cheaper than loading it back.
+
+        """
+        self.column = column
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.parameters = dict(parameters or {})
+        self.version = version
+        self.public = public
+        self.memoise = memoise
+
+    def resolve_parameters(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns the values of this transform's parameters, with any overrides applied."""
+        return {name: parameters.get(name, default) for name, default in self.parameters.items()}
+
+
+class TransformRegistry:
+    """An ordered collection of transforms that can be lazily evaluated on a dataframe."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._transforms: Dict[str, Transform] = {}
+
+    def register(
+        self,
+        column: str,
+        depends_on: Sequence[str] = (),
+        parameters: Optional[Dict[str, Any]] = None,
+        version: str = "1",
+        public: bool = True,
+        memoise: bool = True,
+        replace: bool = False,
+    ) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        """Decorator that registers the decorated function as the transform producing
+        `column`; see `Transform` for a description of the arguments.
+
+        Raises:
+            ValueError: If a transform is already registered for the column,
+                unless `replace` is `True`.
+
+        """
+
+        def decorator(func):
+            if column in self._transforms and not replace:
+                raise ValueError(f"A transform for {column!r} is already registered in {self.name}")
+            self._transforms[column] = Transform(
+                column,
+                func,
+                depends_on=depends_on,
+                parameters=parameters,
+                version=version,
+                public=public,
+                memoise=memoise,
+            )
+            return func
+
+        return decorator
+
+    def __contains__(self, column: str) -> bool:
+        return column in self._transforms
+
+    def __getitem__(self, column: str) -> Transform:
+        return self._transforms[column]
+
+    @property
+    def options(self) -> List[str]:
+        """The names of the columns that can be requested, in registration order."""
+        return [column for column, transform in self._transforms.items() if transform.public]
+
+    def _memo_key(self, cache_key: str, transform: Transform, parameters: Dict[str, Any]) -> str:
+        key_data = {
+            "data": cache_key,
+            "registry": self.name,
+            "column": transform.column,
+            "version": transform.version,
+            "parameters": transform.resolve_parameters(parameters),
+        }
+        return hashlib.sha256(
+            json.dumps(key_data, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+
+    def _resolve(self, columns: Iterable[str], available: Iterable[str]) -> List[str]:
+        """Returns the transforms required to compute the columns, in dependency order."""
+        available = set(available)
+        order: List[str] = []
+        visiting = set()
+
+        def visit(column: str):
+            if column in available or column in order:
+                return
+            if column not in self._transforms:
+                raise KeyError(f"No transform registered for {column!r} in {self.name}")
+            if column in visiting:
+                raise ValueError(f"Circular dependency on {column!r} in {self.name}")
+            visiting.add(column)
+            for dependency in self._transforms[column].depends_on:
+                visit(dependency)
+            visiting.discard(column)
+            order.append(column)
+
+        for column in columns:
+            visit(column)
+        return order
+
+    def evaluate(
+        self,
+        df: pd.DataFrame,
+        columns: Optional[Iterable[str]] = None,
+        parameters: Optional[Dict[str, Any]] = None,
+        cache_key: Optional[str] = None,
+    ) -> pd.DataFrame:
+        """Adds the requested derived columns to the dataframe, computing only those
+        that are needed.
+
+        Parameters:
+            df: The dataframe of raw (e.g., parsed) data, which is modified in place.
+            columns: The columns to add, defaults to all public columns. Any unknown
+                columns are ignored with a warning.
+            parameters: Overrides for the parameters of any transform.
+            cache_key: A key identifying the contents of `df` (e.g., its parsed data key);
+                if provided, computed columns will be memoised under this key.
+
+        Returns:
+            The dataframe, with the requested columns (and any public columns they
+            depend on) added.
+
+        """
+        from pydatalab.parsed_data import load_parsed_data, store_parsed_data
+
+        if columns is None:
+            columns = self.options
+        if parameters is None:
+            parameters = {}
+
+        requested = []
+        for column in columns:
+            if column in df.columns or column in self._transforms:
+                requested.append(column)
+            else:
+                LOGGER.warning("Ignoring unknown column %r requested from %s", column, self.name)
+
+        memoise = bool(cache_key and CONFIG.PARSED_DATA_CACHE_MAX_SIZE)
+        computed = []
+        for column in self._resolve(requested, df.columns):
+            transform = self._transforms[column]
+            memo_key = None
+            if memoise and transform.memoise:
+                memo_key = self._memo_key(cache_key, transform, parameters)
+
+            values = None
+            if memo_key:
+                cached = load_parsed_data(memo_key)
+                if cached is not None and len(cached) == len(df):
+                    values = cached[column].to_numpy()
+
+            if values is None:
+                values = transform.func(df, **transform.resolve_parameters(parameters))
+                values = np.asarray(values)
+                if memo_key:
+                    store_parsed_data(memo_key, pd.DataFrame({column: values}))
+
+            df[column] = values
+            computed.append(column)
+
+        hidden = [c for c in computed if not self._transforms[c].public]
+        if hidden:
+            df.drop(columns=hidden, inplace=True)
+
+        return df
+
+
+def register_baseline(
+    registry: TransformRegistry,
+    name: str,
+    label: str,
+    func: Callable[..., Any],
+    depends_on: Sequence[str] = ("normalized intensity",),
+    parameters: Optional[Dict[str, Any]] = None,
+    version: str = "1",
+) -> None:
+    """Registers a baseline of the normalized intensity of a spectrum, offering the
+    baseline-subtracted intensity (`"intensity - <name> baseline"`) and the baseline
+    itself (as `label`), both scaled such that the subtracted intensity peaks at 1.
+
+    Parameters:
+        registry: The registry to add the baseline to.
+        name: A short name for the baseline, e.g., `"median"`.
+        label: The name of the column containing the baseline, typically
+            describing the method and its parameters.
+        func: The transform computing the baseline, which is memoised (see `Transform`).
+        depends_on: The columns required by `func`, which must include `"normalized intensity"`.
+        parameters: Any parameters of `func` and their default values.
+        version: The version of `func`.
+
+    """
+    baseline = f"_{name} baseline"
+    subtracted = f"intensity - {name} baseline"
+
+    registry.register(
+        baseline,
+        depends_on=depends_on,
+        parameters=parameters,
+        version=version,
+        public=False,
+    )(func)
+
+    def _peak(df):
+        return np.max(df["normalized intensity"] - df[baseline])
+
+    @registry.register(subtracted, depends_on=("normalized intensity", baseline), memoise=False)
+    def _subtracted(df):
+        return (df["normalized intensity"] - df[baseline]) / _peak(df)
+
+    @registry.register(label, depends_on=("normalized intensity", baseline), memoise=False)
+    def _baseline_column(df):
+        return df[baseline] / _peak(df)
+
+
+def register_spectrum_transforms(registry: TransformRegistry, x_column: str) -> None:
+    """Registers the transforms shared by all 1D spectra on a block type's registry:
+    the normalized, square-root and logarithmic intensities, and median-filter and
+    polynomial baselines.
+
+    Parameters:
+        registry: The registry of the block type.
+        x_column: The column containing the x-axis of the spectra (e.g., `"2θ (°)"`).
+
+    """
+
+    @registry.register("normalized intensity", depends_on=("intensity",), memoise=False)
+    def _normalized_intensity(df):
+        return df["intensity"] / np.max(df["intensity"])
+
+    @registry.register("sqrt(intensity)", depends_on=("intensity",), memoise=False)
+    def _sqrt_intensity(df):
+        return np.sqrt(df["intensity"])
+
+    @registry.register("log(intensity)", depends_on=("intensity",), memoise=False)
+    def _log_intensity(df):
+        return np.log10(df["intensity"])
+
+    def _median_baseline(df, kernel_size):
+        return medfilt(df["normalized intensity"], kernel_size=kernel_size)
+
+    register_baseline(
+        registry,
+        "median",
+        f"baseline (`scipy.signal.medfilt`, kernel_size={MEDFILT_KERNEL_SIZE})",
+        _median_baseline,
+        parameters={"kernel_size": MEDFILT_KERNEL_SIZE},
+    )
+
+    def _polyfit_baseline(df, deg):
+        return np.poly1d(np.polyfit(df[x_column], df["normalized intensity"], deg=deg))(
+            df[x_column]
+        )
+
+    register_baseline(
+        registry,
+        "polyfit",
+        f"baseline (`numpy.polyfit`, deg={POLYFIT_DEGREE})",
+        _polyfit_baseline,
+        depends_on=(x_column, "normalized intensity"),
+        parameters={"deg": POLYFIT_DEGREE},
+    )
@@ -0,0 +1,363 @@
+"""This module implements resumable uploads of (large) files, which are sent to
+the server in chunks over many requests rather than in a single request that
+must succeed in one go.
+
+An upload session is first created with the name and size of the file
+(`create_upload`), after which the client sends chunks of the file in order,
+each with the offset in the file at which it starts (`write_upload_chunk`). Each
+chunk is streamed into a staging file under `FILE_DIRECTORY/.uploads` (on the
+same filesystem as the file store), and into a SHA-256 hash of the contents of
+the file. If a chunk is interrupted, the bytes received so far are kept, so the
+client can ask for the current offset of the session and resume from there.
+
+Once the last chunk has been received, the staged file is moved (rather than
+copied) into the file store, and recorded as a new `File` (or a new revision of
+an existing file) with the hash computed along the way, so that finishing an
+upload does not depend on the size of the file.
+
+The state of a hash cannot be stored in the database between requests, so each
+server process keeps the hashes of the sessions it has received chunks for. If a
+chunk is received by another process (e.g., after a restart), the hash is first
+brought up to date by reading the part of the staged file received so far.
+
+Sessions that have not received any chunks for `UPLOAD_SESSION_EXPIRY` are
+expired by the database (see `pydatalab.mongo.create_default_indices`), and their
+staged files are removed by `prune_uploads`, which is also run whenever a new
+session is created.
+
+"""
+
+import collections
+import datetime
+import hashlib
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import IO, Any, Dict, Optional, Tuple
+
+from bson import ObjectId
+
+import pydatalab.mongo
+from pydatalab.config import CONFIG
+from pydatalab.logger import LOGGER
+
+__all__ = (
+    "UPLOADS_COLLECTION",
+    "UploadOffsetMismatch",
+    "create_upload",
+    "get_upload",
+    "write_upload_chunk",
+    "abort_upload",
+    "prune_uploads",
+)
+
+UPLOADS_COLLECTION = "uploads"
+"""The name of the MongoDB collection used to store upload sessions."""
+
+UPLOAD_SESSION_EXPIRY = datetime.timedelta(days=1)
+"""The time after which an upload session that has not received any chunks is removed."""
+
+UPLOAD_LOCK_LEASE = datetime.timedelta(minutes=10)
+"""The time after which a chunk that is still being written is assumed to have
+been abandoned, so that another request can write to the session."""
+
+_STAGING_DIRECTORY = ".uploads"
+_READ_SIZE = 1024 * 1024
+_MAX_CACHED_HASHES = 64
+
+_HASHES: "collections.OrderedDict[str, Tuple[int, Any]]" = collections.OrderedDict()
+"""The hash of each upload session that this process has received chunks for,
+alongside the number of bytes it has consumed."""
+
+_HASHES_LOCK = threading.Lock()
+
+
+class UploadOffsetMismatch(RuntimeError):
+    """Raised when a chunk does not start at the current offset of an upload session."""
+
+    def __init__(self, offset: int):
+        self.offset = offset
+        super().__init__(f"Chunk must start at the current offset of the upload ({offset}).")
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(tz=datetime.timezone.utc)
+
+
+def _collection():
+    return pydatalab.mongo.get_database()[UPLOADS_COLLECTION]
+
+
+def _staging_directory() -> Path:
+    return Path(CONFIG.FILE_DIRECTORY) / _STAGING_DIRECTORY
+
+
+def _staged_path(upload_id: ObjectId) -> Path:
+    return _staging_directory() / f"{upload_id}.part"
+
+
+class _StagedFile:
+    """Stands in for an uploaded `FileStorage` when storing a completed upload, moving
+    the staged file into place rather than copying it.
+
+    """
+
+    def __init__(self, filename: str, path: Path):
+        self.filename = filename
+        self.name = filename
+        self.path = path
+
+    def save(self, destination: str) -> None:
+        os.replace(self.path, destination)
+
+
+def create_upload(
+    filename: str,
+    size: int,
+    item_id: str,
+    creator_id: Any,
+    replace_file_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Creates an upload session for a file.
+
+    Parameters:
+        filename: The name of the file being uploaded.
+        size: The size of the file in bytes.
+        item_id: The ID of the item to attach the file to.
+        creator_id: The ID of the person uploading the file, who will be registered as
+            its creator and is the only person allowed to send chunks to the session.
+        replace_file_id: The ID of an existing file that the upload is a new version of.
+
+    Raises:
+        ValueError: If the size of the file is invalid.
+        RuntimeError: If there is not enough space available to store the file.
+
+    Returns:
+        The upload session.
+
+    """
+    from pydatalab.file_utils import get_space_available_bytes
+
+    if size < 0:
+        raise ValueError(f"Invalid file size: {size}")
+    if get_space_available_bytes() < size:
+        raise RuntimeError(
+            f"Cannot store file: insufficient space available on disk (required: {size // 1024**3} GB). Please contact your datalab administrator."
+        )
+
+    prune_uploads()
+
+    now = _now()
+    upload = {
+        "filename": filename,
+        "size": size,
+        "offset": 0,
+        "item_id": item_id,
+        "replace_file_id": replace_file_id,
+        "creator_id": creator_id,
+        "created": now,
+        "updated": now,
+    }
+    upload["_id"] = _collection().insert_one(upload).inserted_id
+
+    _staging_directory().mkdir(parents=True, exist_ok=True)
+    _staged_path(upload["_id"]).touch()
+    return upload
+
+
+def get_upload(upload_id: str, creator_id: Optional[Any] = None) -> Optional[Dict[str, Any]]:
+    """Returns the upload session with the given ID, if it exists and was created by the given person."""
+    try:
+        _id = ObjectId(upload_id)
+    except Exception:
+        return None
+
+    query: Dict[str, Any] = {"_id": _id}
+    if creator_id is not None:
+        query["creator_id"] = creator_id
+    return _collection().find_one(query)
+
+
+def _take_hash(upload: Dict[str, Any], offset: int):
+    """Returns the hash of the first `offset` bytes of the staged file, using the
+    hash kept by this process if it is up to date.
+
+    """
+    key = str(upload["_id"])
+    with _HASHES_LOCK:
+        consumed, digest = _HASHES.pop(key, (None, None))
+    if consumed == offset:
+        return digest
+
+    LOGGER.debug("Hashing the first %s bytes of upload %s", offset, key)
+    digest = hashlib.sha256()
+    with open(_staged_path(upload["_id"]), "rb") as f:
+        remaining = offset
+        while remaining > 0 and (data := f.read(min(_READ_SIZE, remaining))):
+            digest.update(data)
+            remaining -= len(data)
+    return digest
+
+
+def _keep_hash(upload: Dict[str, Any], offset: int, digest) -> None:
+    with _HASHES_LOCK:
+        _HASHES[str(upload["_id"])] = (offset, digest)
+        while len(_HASHES) > _MAX_CACHED_HASHES:
+            _HASHES.popitem(last=False)
+
+
+def write_upload_chunk(
+    upload: Dict[str, Any], offset: int, stream: IO[bytes], length: int
+) -> Dict[str, Any]:
+    """Writes a chunk of the file to an upload session, and stores the file once
+    all of it has been received.
+
+    Parameters:
+        upload: The upload session.
+        offset: The offset in the file at which the chunk starts, which must be
+            the current offset of the session.
+        stream: The stream to read the chunk from.
+        length: The length of the chunk in bytes.
+
+    Raises:
+        UploadOffsetMismatch: If the chunk does not start at the current offset of
+            the session (e.g., a previous chunk was interrupted), or another chunk
+            is being written to the session.
+        ValueError: If the chunk extends beyond the size of the file.
+
+    Returns:
+        The updated upload session, which includes the `file_information` of the
+        stored file if the upload is complete.
+
+    """
+    if offset != upload["offset"]:
+        raise UploadOffsetMismatch(upload["offset"])
+    if length < 0 or offset + length > upload["size"]:
+        raise ValueError(f"Chunk of {length} bytes at {offset=} exceeds size of upload.")
+
+    token = uuid.uuid4().hex
+    now = _now()
+    claimed = _collection().find_one_and_update(
+        {
+            "_id": upload["_id"],
+            "offset": offset,
+            "$or": [{"lock": None}, {"locked": {"$lt": now - UPLOAD_LOCK_LEASE}}],
+        },
+        {"$set": {"lock": token, "locked": now}},
+    )
+    if claimed is None:
+        current = _collection().find_one({"_id": upload["_id"]}, projection={"offset": 1})
+        raise UploadOffsetMismatch(current["offset"] if current else offset)
+
+    written = 0
+    try:
+        digest = _take_hash(upload, offset)
+        with open(_staged_path(upload["_id"]), "r+b") as f:
+            # Discard anything left over from an interrupted chunk
+            f.seek(offset)
+            f.truncate()
+            while written < length:
+                data = stream.read(min(_READ_SIZE, length - written))
+                if not data:
+                    break
+                f.write(data)
+                digest.update(data)
+                written += len(data)
+        _keep_hash(upload, offset + written, digest)
+    finally:
+        upload = _collection().find_one_and_update(
+            {"_id": upload["_id"], "lock": token},
+            {"$set": {"offset": offset + written, "updated": _now()}, "$unset": {"lock": ""}},
+            return_document=True,
+        )
+
+    if upload is None:
+        raise RuntimeError("Upload session was removed while a chunk was being written.")
+    if upload["offset"] == upload["size"]:
+        return _store_upload(upload)
+    return upload
+
+
+def _store_upload(upload: Dict[str, Any]) -> Dict[str, Any]:
+    """Moves a completed upload into the file store, and records it as a file."""
+    from pydatalab import file_utils
+
+    now = _now()
+    claimed = _collection().find_one_and_update(
+        {
+            "_id": upload["_id"],
+            "offset": upload["size"],
+            "$or": [{"stored": None}, {"stored": {"$lt": now - UPLOAD_LOCK_LEASE}}],
+        },
+        {"$set": {"stored": now}},
+    )
+    if claimed is None:
+        raise UploadOffsetMismatch(upload["size"])
+
+    try:
+        digest = _take_hash(upload, upload["size"]).hexdigest()
+        staged = _StagedFile(upload["filename"], _staged_path(upload["_id"]))
+
+        if upload.get("replace_file_id"):
+            file_information = file_utils.update_uploaded_file(
+                staged,
+                ObjectId(upload["replace_file_id"]),
+                size_bytes=upload["size"],
+                sha256=digest,
+            )
+        else:
+            file_information = file_utils.save_uploaded_file(
+                staged,
+                item_ids=[upload["item_id"]],
+                creator_ids=[upload["creator_id"]],
+                sha256=digest,
+            )
+    except Exception:
+        # Allow the client to retry storing the file
+        _collection().update_one({"_id": upload["_id"]}, {"$unset": {"stored": ""}})
+        raise
+
+    _collection().delete_one({"_id": upload["_id"]})
+    return {**upload, "file_information": file_information}
+
+
+def abort_upload(upload: Dict[str, Any]) -> None:
+    """Removes an upload session and its staged file."""
+    _collection().delete_one({"_id": upload["_id"]})
+    _staged_path(upload["_id"]).unlink(missing_ok=True)
+    with _HASHES_LOCK:
+        _HASHES.pop(str(upload["_id"]), None)
+
+
+def prune_uploads(max_age: datetime.timedelta = UPLOAD_SESSION_EXPIRY) -> int:
+    """Removes upload sessions that have not received any chunks for `max_age`,
+    and any staged files that no longer belong to a session.
+
+    Returns:
+        The number of sessions removed.
+
+    """
+    cutoff = _now() - max_age
+    removed = 0
+    for upload in _collection().find({"updated": {"$lt": cutoff}}, projection={"_id": 1}):
+        abort_upload(upload)
+        removed += 1
+
+    directory = _staging_directory()
+    if directory.exists():
+        for item in os.scandir(directory):
+            try:
+                upload_id = ObjectId(item.name.split(".")[0])
+                if datetime.datetime.fromtimestamp(
+                    item.stat().st_mtime, tz=datetime.timezone.utc
+                ) < cutoff and not _collection().find_one(
+                    {"_id": upload_id}, projection={"_id": 1}
+                ):
+                    os.unlink(item.path)
+            except Exception:
+                continue
+
+    if removed:
+        LOGGER.debug("Removed %s expired upload sessions", removed)
+    return removed
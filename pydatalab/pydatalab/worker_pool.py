@@ -0,0 +1,175 @@
+"""This module manages the pool of worker processes that is shared by everything
+in a server process that spreads work across processes, i.e., rendering the
+blocks of an item (see `pydatalab.render_pool`), computing the differential
+curves of electrochemistry blocks and fitting the baselines of Raman maps.
+
+The pool is started with the app (see `pydatalab.main.create_app`), before the
+server process opens any database connections or starts any threads, as forking
+a multi-threaded process can leave locks held by other threads (e.g., by pymongo)
+locked forever in the child. The pool is therefore never created on demand:
+processes without a pool of their own (the workers themselves, background job
+workers, and any process forked after the pool was started, e.g., by servers
+that fork after creating the app) simply do the work serially instead.
+
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Iterable, List, Optional
+
+from flask import Flask
+
+from pydatalab.config import CONFIG
+from pydatalab.logger import LOGGER
+
+__all__ = (
+    "start_worker_pool",
+    "get_worker_pool",
+    "get_worker_app",
+    "shutdown_worker_pool",
+    "handle_worker_failure",
+    "map_in_worker_pool",
+)
+
+_WORKER_POOL: Optional[ProcessPoolExecutor] = None
+_WORKER_POOL_PID: Optional[int] = None
+
+_WORKER_APP: Optional[Flask] = None
+"""The Flask app inherited by a worker process."""
+
+
+def _reset_worker_pool() -> None:
+    global _WORKER_POOL, _WORKER_POOL_PID
+    _WORKER_POOL = None
+    _WORKER_POOL_PID = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_worker_pool)
+
+
+def _init_worker(app: Optional[Flask]) -> None:
+    global _WORKER_APP
+    _WORKER_APP = app
+
+
+def _get_worker_processes() -> int:
+    return max(
+        CONFIG.BLOCK_RENDER_PROCESSES,
+        CONFIG.ECHEM_DIFFERENTIAL_PROCESSES,
+        CONFIG.RAMAN_MAP_PROCESSES,
+    )
+
+
+def start_worker_pool(
+    app: Optional[Flask] = None, processes: Optional[int] = None
+) -> Optional[ProcessPoolExecutor]:
+    """Starts the worker pool for this process, replacing any existing pool.
+
+    All of the workers are forked before this function returns, so it should be
+    called before the process starts any other threads.
+
+    Parameters:
+        app: The Flask app to make available to the workers (see `get_worker_app`).
+        processes: The number of worker processes, defaults to the largest of the
+            configured `*_PROCESSES` settings.
+
+    Returns:
+        The pool, or `None` if no pool is needed (i.e., for a single process).
+
+    """
+    global _WORKER_POOL, _WORKER_POOL_PID
+
+    shutdown_worker_pool()
+
+    if processes is None:
+        processes = _get_worker_processes()
+    if processes <= 1:
+        return None
+
+    pool = ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_init_worker,
+        initargs=(app,),
+    )
+    # Workers are only forked once the first task is submitted
+    pool.submit(os.getpid).result()
+    _WORKER_POOL = pool
+    _WORKER_POOL_PID = os.getpid()
+    LOGGER.info("Started pool of %s worker processes.", processes)
+    return pool
+
+
+def get_worker_pool() -> Optional[ProcessPoolExecutor]:
+    """Returns the worker pool started by this process, if any."""
+    if _WORKER_POOL is None or _WORKER_POOL_PID != os.getpid():
+        return None
+    return _WORKER_POOL
+
+
+def get_worker_app() -> Flask:
+    """Returns the Flask app inherited by this worker process.
+
+    Raises:
+        RuntimeError: If the pool was started without an app.
+
+    """
+    if _WORKER_APP is None:
+        raise RuntimeError("Worker process was not initialised with an app.")
+    return _WORKER_APP
+
+
+def shutdown_worker_pool() -> None:
+    """Shuts down the worker pool of this process, if any, without waiting for
+    running tasks to finish.
+
+    """
+    pool = get_worker_pool()
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+    _reset_worker_pool()
+
+
+def handle_worker_failure(future: Future) -> Optional[Exception]:
+    """Returns the exception raised by a task submitted to the pool, if any,
+    shutting down the pool if it is broken (e.g., if a worker was killed), after
+    which all work is done serially until the server is restarted.
+
+    """
+    exc = future.exception()
+    if isinstance(exc, BrokenProcessPool):
+        LOGGER.error("Worker pool failed, no longer using worker processes: %s", exc)
+        shutdown_worker_pool()
+    return exc  # type: ignore[return-value]
+
+
+def map_in_worker_pool(func: Callable[..., Any], *iterables: Iterable[Any]) -> Optional[List[Any]]:
+    """Calls `func` on each set of arguments from `iterables` in the worker pool.
+
+    Parameters:
+        func: A function that can be pickled, i.e., defined at the top level of a module.
+        iterables: The arguments to `func`, as for `map`.
+
+    Returns:
+        The results, in order, or `None` if there is no pool or any call failed in the
+        pool, in which case the caller should do the work serially.
+
+    """
+    pool = get_worker_pool()
+    if pool is None:
+        return None
+
+    futures = [pool.submit(func, *args) for args in zip(*iterables)]
+    results = []
+    for future in futures:
+        exc = handle_worker_failure(future)
+        if exc is not None:
+            LOGGER.warning("Call to %s failed in worker pool: %r", func.__name__, exc)
+            for other in futures:
+                other.cancel()
+            return None
+        results.append(future.result())
+    return results
@@ -0,0 +1,82 @@
+"""Benchmarks the echem dataframe utilities against the number of cycles in the data.
+
+Times `compute_gpcl_differential` serially and across the shared worker pool.
+
+Usage:
+
+    python scripts/benchmark_echem_utils.py --cycles 10 100 1000 --processes 4
+
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from pydatalab.apps.echem.utils import compute_gpcl_differential
+from pydatalab.worker_pool import shutdown_worker_pool, start_worker_pool
+
+
+def make_cycling_data(num_cycles: int, points_per_half_cycle: int) -> pd.DataFrame:
+    """Generates synthetic galvanostatic cycling data with the given number of full cycles."""
+    num_half_cycles = 2 * num_cycles
+    progress = np.tile(np.linspace(0, 1, points_per_half_cycle), num_half_cycles)
+    half_cycle = np.repeat(np.arange(1, num_half_cycles + 1), points_per_half_cycle)
+    charging = half_cycle % 2 == 0
+
+    voltage = np.where(charging, 2.0 + 1.8 * progress**0.5, 3.8 - 1.8 * progress**0.5)
+    voltage += np.random.default_rng(0).normal(0, 1e-3, len(voltage))
+
+    return pd.DataFrame(
+        {
+            "time (s)": np.arange(len(progress), dtype=float),
+            "voltage (V)": voltage,
+            "capacity (mAh)": progress,
+            "current (mA)": np.where(charging, 1.0, -1.0),
+            "half cycle": half_cycle,
+            "full cycle": (half_cycle + 1) // 2,
+        }
+    )
+
+
+def _time(func, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--cycles", type=int, nargs="+", default=[10, 50, 200, 1000])
+    parser.add_argument("--points", type=int, default=1000, help="Points per half cycle")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--max-differential-cycles",
+        type=int,
+        default=200,
+        help="Skip the (slow) differential benchmark above this number of cycles",
+    )
+    args = parser.parse_args()
+
+    start_worker_pool(processes=args.processes)
+
+    print(
+        f"{'cycles':>8} {'rows':>10} {'dQ/dV (1 proc)':>16} {f'dQ/dV ({args.processes} procs)':>18}"
+    )
+    for num_cycles in args.cycles:
+        df = make_cycling_data(num_cycles, args.points)
+
+        serial = parallel = "-"
+        if num_cycles <= args.max_differential_cycles:
+            serial = f"{_time(compute_gpcl_differential, df, processes=1):.3f}s"
+            parallel = f"{_time(compute_gpcl_differential, df, processes=args.processes):.3f}s"
+
+        print(f"{num_cycles:>8} {len(df):>10} {serial:>16} {parallel:>18}")
+
+    shutdown_worker_pool()
+
+
+if __name__ == "__main__":
+    main()
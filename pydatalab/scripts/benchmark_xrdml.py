@@ -0,0 +1,101 @@
+"""Benchmarks the streaming XRDML parser against the previous regex-based parser on
+large, synthetic XRDML files.
+
+Reports the time taken and the peak Python memory allocated by each parser, for files
+with an increasing number of points per scan and (for the streaming parser, which
+reads every scan) an increasing number of scans.
+
+Usage:
+
+    python scripts/benchmark_xrdml.py --points 10000 100000 1000000 --scans 1 10
+
+"""
+
+import argparse
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+from pydatalab.apps.xrd.utils import getIntensities, getStartEnd, parse_xrdml
+
+_SCAN_TEMPLATE = """
+    <scan appendNumber="{index}" mode="Continuous" scanAxis="Gonio" status="Completed">
+      <dataPoints>
+        <positions axis="2Theta" unit="deg">
+          <startPosition>5.00000000</startPosition>
+          <endPosition>125.00000000</endPosition>
+        </positions>
+        <positions axis="Omega" unit="deg">
+          <startPosition>2.50000000</startPosition>
+          <endPosition>62.50000000</endPosition>
+        </positions>
+        <commonCountingTime unit="seconds">62.230</commonCountingTime>
+        <intensities unit="counts">{intensities}</intensities>
+      </dataPoints>
+    </scan>"""
+
+
+def write_xrdml(path: Path, num_points: int, num_scans: int) -> None:
+    """Writes a synthetic XRDML file with the given number of scans and points per scan."""
+    rng = np.random.default_rng(0)
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<xrdMeasurements xmlns="http://www.xrdml.com/XRDMeasurement/1.5">\n')
+        f.write('  <xrdMeasurement measurementType="Scan" status="Completed">')
+        for index in range(num_scans):
+            intensities = " ".join(map(str, rng.poisson(1000, num_points)))
+            f.write(_SCAN_TEMPLATE.format(index=index, intensities=intensities))
+        f.write("\n  </xrdMeasurement>\n</xrdMeasurements>\n")
+
+
+def _regex_parse(path: Path):
+    with open(path) as f:
+        s = f.read()
+    start, end = getStartEnd(s)
+    intensities = getIntensities(s)
+    return np.linspace(start, end, num=len(intensities)), intensities
+
+
+def _measure(func, *args, **kwargs):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024**2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--points", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--scans", type=int, nargs="+", default=[1, 10])
+    args = parser.parse_args()
+
+    print(
+        f"{'points':>10} {'scans':>6} {'size (MB)':>10} "
+        f"{'regex (first scan)':>22} {'streaming (all scans)':>24}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for num_points in args.points:
+            for num_scans in args.scans:
+                path = Path(directory) / f"{num_points}_{num_scans}.xrdml"
+                write_xrdml(path, num_points, num_scans)
+                size = path.stat().st_size / 1024**2
+
+                regex_time, regex_memory = _measure(_regex_parse, path)
+                stream_time, stream_memory = _measure(parse_xrdml, path, scan=None)
+
+                print(
+                    f"{num_points:>10} {num_scans:>6} {size:>10.1f} "
+                    f"{regex_time:>9.3f}s {regex_memory:>8.1f} MB "
+                    f"{stream_time:>11.3f}s {stream_memory:>8.1f} MB"
+                )
+                path.unlink()
+
+
+if __name__ == "__main__":
+    main()
@@ -222,6 +222,110 @@ def add_missing_refcodes(_):
 migration.add_task(add_missing_refcodes)
 
 
+@task
+def offload_block_data(_):
+    """Moves any large fields of the data blocks saved in items and collections
+    into the block data store, to shrink the documents they are stored in.
+
+    """
+    from pydatalab.block_data import offload_block_fields
+    from pydatalab.mongo import get_database
+
+    db = get_database()
+
+    for collection in (db.items, db.collections):
+        for doc in collection.find(
+            {"blocks_obj": {"$type": "object"}}, projection={"blocks_obj": 1}
+        ):
+            update = {}
+            for block_id, block_data in doc["blocks_obj"].items():
+                offloaded = offload_block_fields(block_data)
+                if offloaded != block_data:
+                    update[f"blocks_obj.{block_id}"] = offloaded
+            if update:
+                print(f"Offloading {len(update)} block(s) of {doc['_id']}")
+                collection.update_one({"_id": doc["_id"]}, {"$set": update})
+
+
+migration.add_task(offload_block_data)
+
+
+@task
+def store_file_blobs(_):
+    """Moves the contents of any stored files that are not yet linked to a blob
+    into the content-addressed blob store, so that identical files are only stored once.
+
+    """
+    from pydatalab.blobs import store_blob
+    from pydatalab.file_utils import compute_file_hash
+    from pydatalab.mongo import get_database
+
+    db = get_database()
+
+    for file in db.files.find(
+        {"blob": None, "location": {"$ne": None}}, projection={"location": 1, "revision": 1}
+    ):
+        location = pathlib.Path(file["location"])
+        if not location.is_file():
+            print(f"File {file['_id']} is missing from {location}")
+            continue
+        sha256 = compute_file_hash(location)
+        result = db.files.update_one(
+            {"_id": file["_id"], "revision": file.get("revision"), "blob": None},
+            {"$set": {"sha256": sha256, "blob": sha256}},
+        )
+        if result.modified_count and not store_blob(location, sha256):
+            db.files.update_one({"_id": file["_id"]}, {"$set": {"blob": None}})
+
+
+migration.add_task(store_file_blobs)
+
+
+@task
+def prune_block_data(_):
+    """Removes any stored block fields that are no longer referenced by a block."""
+    from pydatalab.block_data import prune_block_data as prune
+
+    print(f"Removed {prune()} unreferenced block field(s)")
+
+
+admin.add_task(prune_block_data)
+
+
+@task
+def prune_uploads(_):
+    """Removes any abandoned upload sessions and their partially uploaded files."""
+    from pydatalab.uploads import prune_uploads as prune
+
+    print(f"Removed {prune()} abandoned upload session(s)")
+
+
+admin.add_task(prune_uploads)
+
+
+@task
+def watch_live_files(_, poll_interval: float | None = None):
+    """Runs the live file watcher as a standalone service, rather than alongside
+    the server, keeping live files up to date in the background.
+
+    Parameters:
+        poll_interval: The interval (in seconds) at which all live files are checked,
+            defaults to `CONFIG.LIVE_FILE_POLL_INTERVAL`.
+
+    """
+    from pydatalab.live_files import run_live_file_watcher
+    from pydatalab.main import create_app
+
+    if poll_interval is not None:
+        poll_interval = float(poll_interval)
+
+    app = create_app({"RENDER_JOB_WORKERS": 0, "START_LIVE_FILE_WATCHER": False})
+    print(f"Made {run_live_file_watcher(app, poll_interval=poll_interval)} live file update(s)")
+
+
+admin.add_task(watch_live_files)
+
+
 def _check_id(id=None, base_url=None, api_key=None):
     """Checks the given item ID served at the base URL and logs the result."""
     import requests
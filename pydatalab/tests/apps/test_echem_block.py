@@ -1,12 +1,12 @@
 from pathlib import Path
 
+import pandas as pd
 import pytest
 from navani.echem import echem_file_loader
 
 from pydatalab.apps.echem.utils import (
     compute_gpcl_differential,
     filter_df_by_cycle_index,
-    reduce_echem_cycle_sampling,
 )
 
 
@@ -38,7 +38,9 @@ def echem_dataframe():
 
 @pytest.fixture
 def reduced_echem_dataframe(echem_dataframe):
-    return reduce_echem_cycle_sampling(echem_dataframe, 100)
+    """Keeps (at most) every 100th point of each half cycle, to speed up the tests."""
+    position = echem_dataframe.groupby("half cycle").cumcount()
+    return echem_dataframe[position % 100 == 0]
 
 
 @pytest.fixture
@@ -46,16 +48,6 @@ def reduced_and_filtered_echem_dataframe(reduced_echem_dataframe):
     return filter_df_by_cycle_index(reduced_echem_dataframe)
 
 
-def test_reduce_size(echem_dataframe):
-    original_size = echem_dataframe.shape[0]
-    for size in (1, 10, int(0.5 * len(echem_dataframe)), len(echem_dataframe)):
-        number_of_cycles = echem_dataframe["half cycle"].nunique()
-        reduced_df = reduce_echem_cycle_sampling(echem_dataframe, size)
-        assert size <= reduced_df.shape[0] <= (size + 1) * number_of_cycles
-        assert echem_dataframe.shape[0] == original_size
-        assert reduced_df.shape[1] == echem_dataframe.shape[1]
-
-
 def test_compute_gpcl_differential(reduced_and_filtered_echem_dataframe):
     df = reduced_and_filtered_echem_dataframe
 
@@ -81,3 +73,60 @@ def test_plot(reduced_echem_dataframe):
     differential_df = compute_gpcl_differential(reduced_echem_dataframe, mode="dV/dQ")
     layout = double_axes_echem_plot(differential_df, mode="dV/dQ")
     assert layout
+
+
+def test_compute_gpcl_differential_in_parallel(reduced_and_filtered_echem_dataframe):
+    df = reduced_and_filtered_echem_dataframe
+
+    from pydatalab.worker_pool import shutdown_worker_pool, start_worker_pool
+
+    serial = compute_gpcl_differential(df)
+    start_worker_pool(processes=2)
+    try:
+        parallel = compute_gpcl_differential(df, processes=2)
+    finally:
+        shutdown_worker_pool()
+    pd.testing.assert_frame_equal(serial, parallel)
+
+
+def test_parse_appended_echem_file(tmp_path, monkeypatch):
+    from pydatalab.apps.echem.blocks import NAVANI_VERSION, _parse_appended_echem_file
+    from pydatalab.config import CONFIG
+    from pydatalab.parsed_data import get_appended_parsed_data
+
+    monkeypatch.setattr(CONFIG, "CACHE_DIRECTORY", tmp_path / "cache")
+    monkeypatch.setattr(CONFIG, "PARSED_DATA_CACHE_MAX_SIZE", 1024 * 1024 * 1024)
+
+    def rows(start, stop, per_half_cycle=50):
+        lines = []
+        for ind in range(start, stop):
+            current = 1.0 if (ind // per_half_cycle) % 2 == 0 else -1.0
+            voltage = 3 + current * (ind % per_half_cycle) / per_half_cycle
+            lines.append(f"{ind * 10.0}\t{current}\t{voltage:.4f}\n")
+        return "".join(lines)
+
+    # An Ivium export that is appended to part-way through a half cycle
+    location = tmp_path / "live.txt"
+    location.write_text("time /s\tI /mA\tE /V\n" + rows(0, 130))
+    get_appended_parsed_data(
+        location, _parse_appended_echem_file, NAVANI_VERSION, partition_by="half cycle"
+    )
+
+    parsed = []
+    monkeypatch.setattr(
+        "pydatalab.apps.echem.blocks._parse_echem_file",
+        lambda path: parsed.append(path) or echem_file_loader(path),
+    )
+    with open(location, "a") as f:
+        f.write(rows(130, 260))
+    df = get_appended_parsed_data(
+        location, _parse_appended_echem_file, NAVANI_VERSION, partition_by="half cycle"
+    )
+
+    # Only the appended rows (and those of the last half cycle) are re-parsed
+    assert len(parsed) == 1 and parsed[0] != str(location)
+    expected = echem_file_loader(location)
+    columns = ["Time", "Voltage", "Current", "Capacity", "half cycle", "full cycle"]
+    pd.testing.assert_frame_equal(
+        df[columns].astype(float), expected[columns].astype(float), check_exact=False
+    )
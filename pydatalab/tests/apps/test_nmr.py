@@ -1,9 +1,14 @@
 import zipfile
 from pathlib import Path
 
+import pandas as pd
 import pytest
 
-from pydatalab.apps.nmr.utils import read_bruker_1d
+from pydatalab.apps.nmr.utils import (
+    list_bruker_zip_processes,
+    read_bruker_1d,
+    read_bruker_1d_zip,
+)
 
 
 def _extract_example(filename, dir):
@@ -52,3 +57,27 @@ def test_bruker_reader_2D(nmr_2d_matpass_example):
     assert a_dic
     assert topspin_title
     assert shape == (8, 4096)
+
+
+def test_bruker_zip_reader(nmr_1d_solid_example):
+    zip_path = Path(__file__).parent.parent.parent / "example_data" / "NMR" / "71.zip"
+    assert list_bruker_zip_processes(zip_path) == ["1"]
+
+    df = read_bruker_1d_zip(zip_path, process_number=1)
+    expected, a_dic, topspin_title, shape = read_bruker_1d(nmr_1d_solid_example)
+    pd.testing.assert_frame_equal(df, expected)
+    assert df.attrs["acquisition_parameters"]["NUC1"] == a_dic["acqus"]["NUC1"]
+    assert df.attrs["topspin_title"] == topspin_title
+    assert df.attrs["shape"] == list(shape)
+
+
+def test_bruker_zip_reader_2D():
+    zip_path = Path(__file__).parent.parent.parent / "example_data" / "NMR" / "72.zip"
+    assert list_bruker_zip_processes(zip_path) == ["1", "999"]
+
+    df = read_bruker_1d_zip(zip_path, process_number=1)
+    assert df.empty
+    assert df.attrs["shape"] == [8, 4096]
+
+    with pytest.raises(ValueError):
+        read_bruker_1d_zip(zip_path, process_number=2)
@@ -0,0 +1,58 @@
+import numpy as np
+from pybaselines import Baseline
+
+from pydatalab.apps.raman_map.utils import (
+    morphological_baselines,
+    representative_indices,
+    shade_density,
+    spectra_density,
+    subtract_baselines,
+)
+
+
+def test_batch_baselines_match_pybaselines():
+    rng = np.random.default_rng(0)
+    raman_shift = np.linspace(100, 3000, 500)
+    spectra = rng.random((20, 500)) + np.sin(raman_shift / 300)[None, :]
+
+    expected = np.array(
+        [Baseline(x_data=raman_shift).mor(spectrum, half_window=30)[0] for spectrum in spectra]
+    )
+    np.testing.assert_allclose(morphological_baselines(spectra, half_window=30), expected)
+
+    from pydatalab.worker_pool import shutdown_worker_pool, start_worker_pool
+
+    start_worker_pool(processes=2)
+    try:
+        subtracted = subtract_baselines(spectra, half_window=30, processes=2)
+    finally:
+        shutdown_worker_pool()
+    np.testing.assert_allclose(subtracted, spectra - expected)
+
+
+def test_spectra_density():
+    rng = np.random.default_rng(0)
+    raman_shift = np.linspace(100, 3000, 1000)
+    spectra = rng.random((2500, 1000))
+    spectra[0, 0] = np.nan
+
+    counts, x_range, y_range = spectra_density(raman_shift, spectra, (50, 200), chunk_size=1000)
+    assert counts.shape == (50, 200)
+    assert counts.sum() == spectra.size - 1
+    assert x_range == (100, 3000)
+    assert y_range == (np.nanmin(spectra), np.nanmax(spectra))
+
+    # fewer points than bins along the Raman shift axis
+    counts, _, _ = spectra_density(raman_shift[:100], spectra[:, :100], (50, 200))
+    assert counts.shape == (50, 100)
+
+    shaded = shade_density(np.array([[0, 1, 10, 1000]]))
+    assert shaded.dtype == np.uint8
+    assert shaded[0, 0] == 0 and shaded[0, -1] == 255
+    assert np.all(np.diff(shaded[0]) > 0)
+
+
+def test_representative_indices():
+    values = np.array([5.0, 1.0, 3.0, 2.0, 4.0])
+    assert list(representative_indices(values, 3)) == [1, 2, 0]
+    assert list(representative_indices(values, 10)) == [1, 3, 2, 4, 0]
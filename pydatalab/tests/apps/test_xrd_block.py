@@ -3,6 +3,7 @@ from pathlib import Path
 import pytest
 
 from pydatalab.apps.xrd.blocks import XRDBlock
+from pydatalab.apps.xrd.utils import XrdmlParseError, getIntensities, getStartEnd, parse_xrdml
 from pydatalab.bokeh_plots import selectable_axes_plot
 
 
@@ -29,3 +30,62 @@ def test_plot(data_files):
         point_size=3,
     )
     assert p
+
+
+def test_parse_xrdml_matches_regex_parser(data_files):
+    for f in data_files:
+        if f.suffix != ".xrdml":
+            continue
+        df = parse_xrdml(f)
+        contents = f.read_text()
+        start, end = getStartEnd(contents)
+        assert df["twotheta"].iloc[0] == pytest.approx(start)
+        assert df["twotheta"].iloc[-1] == pytest.approx(end)
+        assert df["intensity"].tolist() == getIntensities(contents)
+        assert "omega" in df
+
+
+def test_parse_multiple_xrdml_scans(tmp_path):
+    scan = """
+    <scan appendNumber="{index}" mode="Continuous" scanAxis="Gonio" status="Completed">
+      <dataPoints>
+        <positions axis="2Theta" unit="deg">
+          <listPositions>10.0 10.5 11.5</listPositions>
+        </positions>
+        <positions axis="Omega" unit="deg">
+          <commonPosition>{index}.0</commonPosition>
+        </positions>
+        <counts unit="counts">{index} 20 -3</counts>
+      </dataPoints>
+    </scan>"""
+    xrdml = tmp_path / "multi.xrdml"
+    xrdml.write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<xrdMeasurements xmlns="http://www.xrdml.com/XRDMeasurement/1.5">'
+        "<xrdMeasurement>"
+        f"{scan.format(index=1)}{scan.format(index=2)}"
+        "</xrdMeasurement></xrdMeasurements>"
+    )
+
+    df = parse_xrdml(xrdml, scan=1)
+    assert df["twotheta"].tolist() == [10.0, 10.5, 11.5]
+    assert df["omega"].tolist() == [2.0, 2.0, 2.0]
+    assert df["intensity"].tolist() == [2, 20, -3]
+
+    df = parse_xrdml(xrdml, scan=None)
+    assert df["scan"].tolist() == [0, 0, 0, 1, 1, 1]
+
+    with pytest.raises(XrdmlParseError):
+        parse_xrdml(xrdml, scan=2)
+
+    xrdml.write_text("<xrdMeasurements><scan>")
+    with pytest.raises(XrdmlParseError):
+        parse_xrdml(xrdml)
+
+
+def test_load_requested_columns(data_files):
+    f = next(data_files)
+    df, y_options = XRDBlock.load_pattern(f, wavelength=1.54, y_columns=["log(intensity)"])
+    assert y_options == ["intensity", "log(intensity)"]
+    assert "Q (Å⁻¹)" in df
+    assert not any("baseline" in column for column in df.columns)
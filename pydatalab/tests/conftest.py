@@ -1,5 +1,6 @@
 from pathlib import Path
 
+import mongomock
 import pytest
 
 
@@ -11,3 +12,30 @@ def example_data_dir():
 @pytest.fixture(scope="session", name="default_filepath")
 def fixture_default_filepath(example_data_dir):
     return example_data_dir / "echem" / "jdb11-1_c3_gcpl_5cycles_2V-3p8V_C-24_data_C09.mpr"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def cache_directory(tmp_path_factory):
+    """Keeps any derived data written during the tests out of the source tree."""
+    from pydatalab.config import CONFIG
+
+    cache_directory = tmp_path_factory.mktemp("cache")
+    previous, CONFIG.CACHE_DIRECTORY = CONFIG.CACHE_DIRECTORY, cache_directory
+    yield cache_directory
+    CONFIG.CACHE_DIRECTORY = previous
+
+
+@pytest.fixture
+def make_mock_database(monkeypatch):
+    """Returns a function that creates an in-memory (mongomock) database with the
+    given name, and makes it the database returned by `pydatalab.mongo.get_database`.
+
+    """
+    import pydatalab.mongo
+
+    def _make_mock_database(name: str):
+        database = mongomock.MongoClient().get_database(name)
+        monkeypatch.setattr(pydatalab.mongo, "get_database", lambda: database)
+        return database
+
+    return _make_mock_database
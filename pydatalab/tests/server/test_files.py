@@ -1,3 +1,5 @@
+import hashlib
+import os
 import shutil
 
 import pytest
@@ -26,6 +28,40 @@ def test_upload(client, default_filepath, insert_default_sample, default_sample)
     assert response.status_code == 201
 
 
+@pytest.mark.dependency(depends=["test_upload"])
+def test_get_file_ranges_and_conditional(client, default_filepath, default_sample):
+    response = client.get(f"/get-item-data/{default_sample.item_id}")
+    file_id = [_id for _id in response.json["files_data"]][0]
+    file_info = response.json["files_data"][file_id]
+    url = f"/files/{file_id}/{default_filepath.name}"
+
+    file_response = client.get(url)
+    assert file_response.status_code == 200
+    assert file_response.headers["Accept-Ranges"] == "bytes"
+    etag = file_response.headers["ETag"]
+    assert etag == f'"{file_info["revision"]}-{file_info["sha256"]}"'
+    with open(default_filepath, "rb") as f:
+        contents = f.read()
+
+    range_response = client.get(url, headers={"Range": "bytes=100-199"})
+    assert range_response.status_code == 206
+    assert range_response.headers["Content-Range"] == f"bytes 100-199/{len(contents)}"
+    assert range_response.data == contents[100:200]
+
+    suffix_response = client.get(url, headers={"Range": "bytes=-10"})
+    assert suffix_response.status_code == 206
+    assert suffix_response.data == contents[-10:]
+
+    assert client.get(url, headers={"Range": f"bytes={len(contents)}-"}).status_code == 416
+
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(url, headers={"If-None-Match": '"0-stale"'}).status_code == 200
+    last_modified = file_response.headers["Last-Modified"]
+    assert client.get(url, headers={"If-Modified-Since": last_modified}).status_code == 304
+
+    assert client.get(f"/files/{file_id}/missing.txt").status_code == 404
+
+
 @pytest.mark.dependency(depends=["test_upload"])
 def test_get_file_and_delete(client, default_filepath, default_sample):
     response = client.get(f"/get-item-data/{default_sample.item_id}")
@@ -118,3 +154,97 @@ def test_upload_new_version(
         == response.json["file_information"]["location"]
     )
     assert response_reup.json["file_id"] == response.json["file_id"]
+
+
+def test_chunked_upload(client, default_filepath, insert_default_sample, default_sample):  # pylint: disable=unused-argument
+    """Upload a file in chunks over a resumable upload session, resending a chunk
+    after a mismatched offset."""
+    with open(default_filepath, "rb") as f:
+        contents = f.read()
+
+    response = client.post(
+        "/uploads/",
+        json={
+            "item_id": default_sample.item_id,
+            "filename": "chunked_" + default_filepath.name,
+            "size": len(contents),
+            "replace_file": None,
+        },
+    )
+    assert response.status_code == 201
+    upload_id = response.json["upload_id"]
+    assert response.json["offset"] == 0
+
+    chunk_size = 1_000_000
+    response = client.put(
+        f"/uploads/{upload_id}", data=contents[:chunk_size], headers={"Upload-Offset": "0"}
+    )
+    assert response.status_code == 200
+    assert response.json["offset"] == chunk_size
+
+    response = client.put(
+        f"/uploads/{upload_id}", data=contents[:chunk_size], headers={"Upload-Offset": "0"}
+    )
+    assert response.status_code == 409
+    assert response.json["offset"] == chunk_size
+
+    offset = client.get(f"/uploads/{upload_id}").json["offset"]
+    while offset < len(contents):
+        response = client.put(
+            f"/uploads/{upload_id}",
+            data=contents[offset : offset + chunk_size],
+            headers={"Upload-Offset": str(offset)},
+        )
+        offset += chunk_size
+
+    assert response.status_code == 201
+    assert response.json["status"] == "success"
+    assert not response.json["is_update"]
+    file_information = response.json["file_information"]
+    assert file_information["size"] == len(contents)
+    assert file_information["sha256"] == hashlib.sha256(contents).hexdigest()
+    with open(file_information["location"], "rb") as f:
+        assert f.read() == contents
+
+    assert client.get(f"/uploads/{upload_id}").status_code == 404
+
+
+def test_upload_deduplicated(
+    client, default_filepath, insert_default_sample, default_sample, tmpdir
+):  # pylint: disable=unused-argument
+    """Upload the same file twice, check that it is only stored once, then
+    upload a new version of one of the copies."""
+
+    def _upload(path, name, replace_file="null"):
+        with open(path, "rb") as f:
+            response = client.post(
+                "/upload-file/",
+                buffered=True,
+                content_type="multipart/form-data",
+                data={
+                    "item_id": default_sample.item_id,
+                    "file": [(f, name)],
+                    "type": "application/octet-stream",
+                    "replace_file": replace_file,
+                    "relativePath": "null",
+                },
+            )
+        assert response.status_code == 201
+        return response.json["file_id"], response.json["file_information"]
+
+    _, first = _upload(default_filepath, "first_" + default_filepath.name)
+    second_id, second = _upload(default_filepath, "second_" + default_filepath.name)
+
+    with open(default_filepath, "rb") as f:
+        sha256 = hashlib.sha256(f.read()).hexdigest()
+    assert first["blob"] == second["blob"] == sha256
+    assert os.path.samefile(first["location"], second["location"])
+
+    new_version = tmpdir / "new_version.txt"
+    new_version.write_text("new contents", encoding="utf-8")
+    _, updated = _upload(new_version, second["name"], replace_file=second_id)
+
+    assert updated["blob"] == hashlib.sha256(b"new contents").hexdigest()
+    assert not os.path.samefile(first["location"], updated["location"])
+    with open(first["location"], "rb") as f:
+        assert hashlib.sha256(f.read()).hexdigest() == sha256
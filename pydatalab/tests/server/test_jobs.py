@@ -0,0 +1,44 @@
+import datetime
+
+from pydatalab.jobs import JobStatus
+
+
+def _insert_job(database, kind, payload):
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    return database.jobs.insert_one(
+        {
+            "kind": kind,
+            "payload": payload,
+            "status": JobStatus.QUEUED,
+            "active": True,
+            "progress": 0.0,
+            "created": now,
+            "updated": now,
+            "requester_ids": [],
+        }
+    ).inserted_id
+
+
+def test_job_permissions(
+    database, client, admin_client, unauthenticated_client, user_id, admin_user_id
+):
+    database.items.insert_many(
+        [
+            {"item_id": "job_user_item", "type": "samples", "creator_ids": [user_id]},
+            {"item_id": "job_admin_item", "type": "samples", "creator_ids": [admin_user_id]},
+        ]
+    )
+    user_job = _insert_job(database, "render_block", {"block_data": {"item_id": "job_user_item"}})
+    admin_job = _insert_job(database, "render_block", {"block_data": {"item_id": "job_admin_item"}})
+    other_job = _insert_job(database, "unknown", {})
+
+    response = client.get(f"/jobs/{user_job}")
+    assert response.status_code == 200
+    assert response.json["job_status"] == JobStatus.QUEUED
+    assert "payload" not in response.json
+
+    for job_id in (admin_job, other_job):
+        assert client.get(f"/jobs/{job_id}").status_code == 404
+        assert admin_client.get(f"/jobs/{job_id}").status_code == 200
+
+    assert unauthenticated_client.get(f"/jobs/{user_job}").status_code == 404
@@ -1,5 +1,4 @@
 import datetime
-import subprocess as sp
 import time
 from pathlib import Path
 
@@ -11,15 +10,7 @@ from pydatalab.remote_filesystems import (
     get_directory_structures,
 )
 
-"""The Unix `tree` utility is required for many of these tests,
-this variable checks whether it is installed locally."""
-TREE_AVAILABLE = False
-_ = sp.call("tree -v", shell=True)
-if _ == 0:
-    TREE_AVAILABLE = True
 
-
-@pytest.mark.skipif(not TREE_AVAILABLE, reason="`tree` utility not installed locally")
 def test_get_directory_structure_local(random_string):
     """Check that the file directory cache is used on the second
     attempt to query a directory.
@@ -74,7 +65,6 @@ def test_get_directory_structure_local(random_string):
     assert get_directory_structures([], invalidate_cache=True) == []
 
 
-@pytest.mark.skipif(not TREE_AVAILABLE, reason="`tree` utility not installed locally")
 def test_get_missing_directory_structure_local(random_string):
     """Check that missing directories do not crash everything, and that
     they still get cached.
@@ -91,7 +81,6 @@ def test_get_missing_directory_structure_local(random_string):
     assert last_updated_cached
 
 
-@pytest.mark.skipif(not TREE_AVAILABLE, reason="`tree` utility not installed locally")
 def test_get_directory_structure_remote(real_mongo_client, random_string):
     """Check that a fake ssh server initially fails, then successfully returns
     once the cache has been mocked.
@@ -114,26 +103,43 @@ def test_get_directory_structure_remote(real_mongo_client, random_string):
     assert dir_structure["last_updated"]
 
 
-def test_scp_escape_spaces():
-    """Test whether the escaping function for scp paths works correctly
-    in edge cases: already-escaped spaces, mixtures etc."""
-    from pydatalab.file_utils import _escape_spaces_scp_path
+def test_split_remote_path():
+    """Test that full remote paths are split into the host to connect to
+    and the (unescaped) path on that host."""
+    from pydatalab.remote_sessions import split_remote_path
 
-    assert (
-        _escape_spaces_scp_path(r"ssh://host:path with spaces")
-        == r'ssh://host:"path\ with\ spaces"'
-    )
-    assert (
-        _escape_spaces_scp_path(r"ssh://host:path with spaces/in two places/")
-        == r'ssh://host:"path\ with\ spaces/in\ two\ places/"'
+    assert split_remote_path("ssh://host:/data/file.csv") == ("ssh://host", "/data/file.csv")
+    assert split_remote_path(r"ssh://user@host:/data/with\ some already\ escaped") == (
+        "ssh://user@host",
+        "/data/with some already escaped",
     )
-    assert (
-        _escape_spaces_scp_path(
-            r"ssh://host:path with spaces/in two places/with\ some already\ escaped"
-        )
-        == r'ssh://host:"path\ with\ spaces/in\ two\ places/with\ some\ already\ escaped"'
-    )
-    assert (
-        _escape_spaces_scp_path(r"ssh://host:path_without_spaces")
-        == r"ssh://host:path_without_spaces"
+    with pytest.raises(ValueError):
+        split_remote_path("/mounted/data/file.csv")
+
+
+def test_get_partial_directory_structure(real_mongo_client, random_string):
+    """Check that the entries found so far by a scan in another process are
+    returned sorted, with the time at which they were found."""
+    test_dir = RemoteFilesystem(name=random_string, path=Path(__file__).parent)
+    partial_updated = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    real_mongo_client.get_database().remoteFilesystems.insert_one(
+        {
+            "name": random_string,
+            "partial_contents": [
+                {"type": "file", "name": "b.csv"},
+                {
+                    "type": "directory",
+                    "name": "a",
+                    "contents": [{"type": "file", "name": "z"}, {"type": "file", "name": "y"}],
+                },
+            ],
+            "partial_updated": partial_updated,
+            "_lock": {"pid": -1, "ctime": datetime.datetime.now()},
+        }
     )
+
+    dir_structure = get_directory_structure(test_dir, max_retries=0)
+    assert dir_structure["status"] == "partial"
+    assert dir_structure["last_updated"] == partial_updated
+    assert [entry["name"] for entry in dir_structure["contents"]] == ["a", "b.csv"]
+    assert [entry["name"] for entry in dir_structure["contents"][0]["contents"]] == ["y", "z"]
@@ -42,6 +42,86 @@ def test_get_item_data(client, default_sample_dict):
         assert response.json["item_data"][key] == v
 
 
+@pytest.mark.dependency(depends=["test_get_item_data"])
+def test_render_block(client):
+    response = client.post(
+        "/add-data-block/", json={"block_type": "xrd", "item_id": "12345", "index": None}
+    )
+    assert response.status_code == 200
+    block_id = response.json["new_block_obj"]["block_id"]
+
+    # item data is returned without rendering blocks unless requested
+    response = client.get("/get-item-data/12345")
+    assert "render_cache" not in response.json["item_data"]["blocks_obj"][block_id]
+    response = client.get("/get-item-data/12345?load_blocks=true")
+    assert "render_cache" in response.json["item_data"]["blocks_obj"][block_id]
+
+    response = client.get(f"/render-block/12345/{block_id}")
+    assert response.status_code == 200
+    assert response.json["new_block_data"]["block_id"] == block_id
+    etag = response.headers["ETag"]
+
+    response = client.get(f"/render-block/12345/{block_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    response = client.get("/render-block/12345/not-a-block")
+    assert response.status_code == 404
+
+    response = client.post("/delete-block/", json={"item_id": "12345", "block_id": block_id})
+    assert response.status_code == 200
+
+
+@pytest.mark.dependency(depends=["test_get_item_data"])
+def test_offloaded_block_fields(client, database):
+    response = client.post(
+        "/add-data-block/", json={"block_type": "comment", "item_id": "12345", "index": None}
+    )
+    assert response.status_code == 200
+    block_data = response.json["new_block_obj"]
+    block_id = block_data["block_id"]
+
+    block_data["freeform_comment"] = "<p>" + "a" * 1024 * 1024 + "</p>"
+    response = client.post("/update-block/", json={"block_data": block_data, "save_to_db": True})
+    assert response.status_code == 200
+    assert response.json["saved_successfully"]
+
+    # the comment is stored outside of the item document
+    stored_block = database.items.find_one({"item_id": "12345"})["blocks_obj"][block_id]
+    assert "freeform_comment" not in stored_block
+    assert "freeform_comment" in stored_block["offloaded_fields"]
+
+    response = client.get(f"/render-block/12345/{block_id}")
+    assert response.status_code == 200
+    assert response.json["new_block_data"]["freeform_comment"] == block_data["freeform_comment"]
+    assert "offloaded_fields" not in response.json["new_block_data"]
+
+    response = client.post("/delete-block/", json={"item_id": "12345", "block_id": block_id})
+    assert response.status_code == 200
+
+
+def test_get_plot_data(client):
+    import gzip
+
+    import numpy as np
+
+    from pydatalab.plot_data import _store_blob, pack_plot_data
+
+    blob = pack_plot_data([("1001", "y", np.arange(10_000, dtype=np.float32))])
+    key = _store_blob(blob)
+
+    response = client.get(f"/plot-data/{key}")
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "immutable" in response.headers["Cache-Control"]
+    assert gzip.decompress(response.data) == blob
+
+    response = client.get(f"/plot-data/{key}", headers={"If-None-Match": f'"{key}"'})
+    assert response.status_code == 304
+
+    response = client.get(f"/plot-data/{'0' * 64}")
+    assert response.status_code == 404
+
+
 @pytest.mark.dependency(depends=["test_new_sample"])
 def test_new_sample_collision(client, default_sample_dict):
     # Try to do the same thing again, expecting an ID collision
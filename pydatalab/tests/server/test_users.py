@@ -114,3 +114,12 @@ def test_user_update_admin(admin_client, real_mongo_client, user_id):
     assert resp.status_code == 200
     user = real_mongo_client.get_database().users.find_one({"_id": user_id})
     assert user["display_name"] == "Test Person"
+
+
+def test_mongo_pool_statistics_admin_only(client, unauthenticated_client, admin_client):
+    assert unauthenticated_client.get("/mongo_pool").status_code == 401
+    assert client.get("/mongo_pool").status_code == 403
+    response = admin_client.get("/mongo_pool")
+    assert response.status_code == 200
+    assert response.json["status"] == "success"
+    assert "data" in response.json
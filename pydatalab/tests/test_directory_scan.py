@@ -0,0 +1,37 @@
+from pydatalab.config import RemoteFilesystem
+from pydatalab.remote_filesystems import _get_latest_directory_structure
+
+
+def test_get_latest_directory_structure_depth_and_exclude(tmp_path):
+    """Check that local scans honour the configured maximum depth and exclude
+    patterns, and that hidden entries are skipped and relative paths are escaped
+    as they were by `tree`."""
+    (tmp_path / "run 1" / "raw").mkdir(parents=True)
+    (tmp_path / "run 1" / "cycle.csv").write_text("a,b\n1,2\n")
+    (tmp_path / "run 1" / "cycle.tmp").write_text("")
+    (tmp_path / "run 1" / "raw" / "data.bin").write_bytes(b"0" * 10)
+    (tmp_path / "notes.txt").write_text("notes")
+    (tmp_path / ".cache").mkdir()
+    (tmp_path / "run 1" / ".cycle.csv.swp").write_text("")
+
+    test_dir = RemoteFilesystem(name="local", path=tmp_path)
+    dir_structure = _get_latest_directory_structure(test_dir)
+    assert [entry["name"] for entry in dir_structure] == ["notes.txt", "run 1"]
+    notes, run = dir_structure
+    assert notes["type"] == "file"
+    assert notes["size"] == 5
+    assert notes["relative_path"] == "/"
+    assert int(notes["time"]) == int((tmp_path / "notes.txt").stat().st_mtime)
+    assert run["type"] == "directory"
+    assert [entry["name"] for entry in run["contents"]] == ["cycle.csv", "cycle.tmp", "raw"]
+    assert run["contents"][0]["relative_path"] == r"/run\ 1/"
+    assert run["contents"][2]["contents"][0]["relative_path"] == r"/run\ 1/raw/"
+
+    test_dir = RemoteFilesystem(name="local", path=tmp_path, max_depth=2, exclude=["*.tmp"])
+    run = _get_latest_directory_structure(test_dir)[1]
+    assert [entry["name"] for entry in run["contents"]] == ["cycle.csv", "raw"]
+    assert run["contents"][1]["contents"] == []
+
+    test_dir = RemoteFilesystem(name="local", path=tmp_path, exclude=["run 1/raw"])
+    run = _get_latest_directory_structure(test_dir)[1]
+    assert [entry["name"] for entry in run["contents"]] == ["cycle.csv", "cycle.tmp"]
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pydatalab.downsampling import (
+    downsample_df,
+    downsample_groups,
+    downsample_indices,
+    lttb_indices,
+    record_point_counts,
+)
+
+
+@pytest.fixture
+def noisy_peak():
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 100, 100_000)
+    y = np.sin(x) + rng.normal(0, 0.1, len(x))
+    y[12_345] = 50
+    return x, y
+
+
+@pytest.mark.parametrize("method", ("lttb", "minmax"))
+def test_downsampling_preserves_peaks_and_endpoints(noisy_peak, method):
+    x, y = noisy_peak
+    indices = downsample_indices(x, [y], 1000, method=method)
+    assert len(indices) <= 1002
+    assert indices[0] == 0
+    assert indices[-1] == len(x) - 1
+    assert 12_345 in indices
+    assert np.all(np.diff(indices) > 0)
+
+
+def test_lttb_small_and_missing_data():
+    assert lttb_indices(np.arange(5.0), np.arange(5.0), 10).tolist() == list(range(5))
+
+    y = np.sin(np.linspace(0, 10, 1000))
+    y[100:200] = np.nan
+    indices = lttb_indices(np.arange(1000.0), y, 100)
+    assert len(indices) == 100
+    # buckets with no finite values still keep a (missing) point, so gaps remain visible
+    assert np.isnan(y[indices]).any()
+    assert np.isfinite(y[indices]).sum() > 80
+
+
+def test_downsample_df_records_point_counts():
+    df = pd.DataFrame({"x": np.arange(10_000.0), "y": np.random.default_rng(0).random(10_000)})
+    df["half cycle"] = np.repeat(np.arange(1, 11), 1000)
+
+    with record_point_counts() as counts:
+        assert len(downsample_df(df, None)) == len(df)
+        reduced = downsample_df(df, 500, x="x", ys=["y"])
+        grouped = downsample_groups(df, "half cycle", 1000, ys=["y"])
+
+    assert len(reduced) <= 500
+    assert set(grouped["half cycle"]) == set(range(1, 11))
+    assert counts == {
+        "original": 3 * len(df),
+        "displayed": len(df) + len(reduced) + len(grouped),
+    }
+
+
+def test_selectable_axes_plot_downsampling():
+    from bokeh.models import Button, ColumnDataSource, GlyphRenderer
+
+    from pydatalab.bokeh_plots import selectable_axes_plot
+    from pydatalab.downsampling import MIN_POINT_BUDGET
+
+    df = pd.DataFrame({"x": np.arange(10_000.0), "y": np.random.default_rng(0).random(10_000)})
+    layout = selectable_axes_plot(df, x_options=["x"], y_options=["y"], point_budget=1000)
+
+    plotted = {len(r.data_source.data["x"]) for r in layout.select({"type": GlyphRenderer})}
+    assert max(plotted) <= 1000
+    # the full data is not embedded in the plot, so the csv export is labelled as downsampled
+    (button,) = layout.select({"type": Button})
+    (callback,) = button.js_event_callbacks["button_click"]
+    assert isinstance(callback.args["source"], ColumnDataSource)
+    assert len(callback.args["source"].data["x"]) == max(plotted)
+    assert button.label == "Download .csv (downsampled)"
+    assert max(len(s.data["x"]) for s in layout.select({"type": ColumnDataSource})) <= 1000
+
+    layout = selectable_axes_plot(df, x_options=["x"], y_options=["y"], point_budget=0)
+    (button,) = layout.select({"type": Button})
+    assert button.label == "Download .csv"
+
+    # each dataframe keeps a minimum budget when the budget is shared between many
+    dfs = [df.iloc[:1000].rename_axis(f"frame {i}") for i in range(20)]
+    layout = selectable_axes_plot(dfs, x_options=["x"], y_options=["y"], point_budget=1000)
+    plotted = {len(r.data_source.data["x"]) for r in layout.select({"type": GlyphRenderer})}
+    assert plotted == {MIN_POINT_BUDGET}
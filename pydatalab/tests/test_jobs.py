@@ -0,0 +1,97 @@
+import datetime
+import time
+
+import pytest
+from flask import Flask
+
+import pydatalab.jobs
+from pydatalab.jobs import (
+    JOB_HANDLERS,
+    JobStatus,
+    get_job,
+    get_job_result,
+    register_job_handler,
+    run_job_worker,
+    submit_job,
+    update_job_progress,
+)
+
+
+@pytest.fixture
+def mock_database(make_mock_database):
+    return make_mock_database("__datalab-jobs__")
+
+
+@pytest.fixture
+def handlers():
+    @register_job_handler("square")
+    def square(job):
+        update_job_progress(job["_id"], 0.5, "Halfway")
+        if job["payload"]["x"] < 0:
+            raise ValueError("Negative input")
+        return {"result": job["payload"]["x"] ** 2}
+
+    yield
+    JOB_HANDLERS.pop("square")
+
+
+def test_job_lifecycle(mock_database, handlers):
+    job_id = submit_job("square", {"x": 3}, creator_id="user")
+    job = get_job(job_id)
+    assert job["status"] == JobStatus.QUEUED
+    assert job["requester_ids"] == ["user"]
+
+    failing_job_id = submit_job("square", {"x": -1})
+
+    assert run_job_worker(Flask(__name__), exit_when_idle=True) == 2
+
+    job = get_job(job_id)
+    assert job["status"] == JobStatus.COMPLETE
+    assert job["progress"] == 1.0
+    assert get_job_result(job_id) == {"result": 9}
+
+    job = get_job(failing_job_id)
+    assert job["status"] == JobStatus.FAILED
+    assert "Negative input" in job["error"]
+
+
+def test_job_deduplication(mock_database, handlers):
+    job_id = submit_job("square", {"x": 2}, dedup_key="square-2", creator_id="user1")
+    assert submit_job("square", {"x": 2}, dedup_key="square-2", creator_id="user2") == job_id
+    assert set(get_job(job_id)["requester_ids"]) == {"user1", "user2"}
+    assert submit_job("square", {"x": 3}, dedup_key="square-3") != job_id
+
+    run_job_worker(Flask(__name__), exit_when_idle=True)
+
+    # once finished, an identical request creates a new job
+    assert submit_job("square", {"x": 2}, dedup_key="square-2") != job_id
+
+
+def test_unknown_job_kind(mock_database):
+    with pytest.raises(RuntimeError):
+        submit_job("not-a-job", {})
+    assert get_job("not-an-id") is None
+
+
+def test_running_jobs_keep_their_lease(mock_database, monkeypatch):
+    monkeypatch.setattr(pydatalab.jobs, "JOB_LEASE", datetime.timedelta(seconds=0.2))
+    monkeypatch.setattr(pydatalab.jobs, "JOB_HEARTBEAT_INTERVAL", datetime.timedelta(seconds=0.02))
+    claims = []
+
+    @register_job_handler("slow")
+    def slow(job):
+        time.sleep(0.5)
+        # the job has outlived its lease, but is not claimed by another worker
+        claims.append(pydatalab.jobs._claim_job("other worker"))
+        return {}
+
+    try:
+        job_id = submit_job("slow", {})
+        assert run_job_worker(Flask(__name__), exit_when_idle=True) == 1
+    finally:
+        JOB_HANDLERS.pop("slow")
+
+    assert claims == [None]
+    job = get_job(job_id)
+    assert job["status"] == JobStatus.COMPLETE
+    assert job["attempts"] == 1
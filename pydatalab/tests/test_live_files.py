@@ -0,0 +1,85 @@
+import datetime
+import os
+import types
+
+import pytest
+from bson import ObjectId
+
+import pydatalab.file_utils
+from pydatalab.config import CONFIG, RemoteFilesystem
+from pydatalab.live_files import _acquire_lease, _remote_timestamp, check_live_files
+
+
+@pytest.fixture
+def mock_database(make_mock_database, monkeypatch, tmp_path):
+    database = make_mock_database("__datalab-live-files__")
+    monkeypatch.setattr(pydatalab.file_utils, "flask_mongo", types.SimpleNamespace(db=database))
+    monkeypatch.setattr(CONFIG, "FILE_DIRECTORY", str(tmp_path / "files"))
+    return database
+
+
+def test_check_live_files(mock_database, monkeypatch, tmp_path):
+    remote = tmp_path / "remote"
+    remote.mkdir()
+    monkeypatch.setattr(CONFIG, "REMOTE_FILESYSTEMS", [RemoteFilesystem(name="mnt", path=remote)])
+
+    (remote / "cycle.csv").write_bytes(b"a,b\n1,2\n")
+    file_id = ObjectId()
+    location = tmp_path / "files" / str(file_id) / "cycle.csv"
+    location.parent.mkdir(parents=True)
+    location.write_bytes(b"a,b\n1,2\n")
+    mock_database.files.insert_one(
+        {
+            "_id": file_id,
+            "name": "cycle.csv",
+            "extension": ".csv",
+            "location": str(location),
+            "item_ids": [],
+            "blocks": [],
+            "revision": 1,
+            "time_added": datetime.datetime.now(),
+            "source_server_name": "mnt",
+            "source_path": "cycle.csv",
+            "last_modified_remote": _remote_timestamp(os.stat(remote / "cycle.csv").st_mtime),
+            "is_live": True,
+        }
+    )
+
+    assert check_live_files() == 0
+    assert mock_database.files.find_one({"_id": file_id})["revision"] == 1
+
+    with open(remote / "cycle.csv", "ab") as f:
+        f.write(b"3,4\n")
+    os.utime(remote / "cycle.csv", (1e9, datetime.datetime.now().timestamp() + 1))
+
+    # a watcher that has lost its lease to another stops before syncing any files
+    assert _acquire_lease("other watcher")
+    assert check_live_files(owner="watcher") == 0
+    assert mock_database.files.find_one({"_id": file_id})["revision"] == 1
+
+    # and the lease is renewed as files are synced
+    mock_database.liveFileWatcher.update_one(
+        {"_id": "watcher"}, {"$set": {"renewed": datetime.datetime(2000, 1, 1)}}
+    )
+    assert check_live_files(owner="watcher") == 1
+    lease = mock_database.liveFileWatcher.find_one({"_id": "watcher"})
+    assert lease["owner"] == "watcher"
+    assert lease["renewed"] > datetime.datetime(2000, 1, 1)
+    file_info = mock_database.files.find_one({"_id": file_id})
+    assert file_info["revision"] == 2
+    assert file_info["size"] == 12
+    assert location.read_bytes() == b"a,b\n1,2\n3,4\n"
+
+    assert check_live_files() == 0
+
+
+def test_live_file_watcher_lease(mock_database):
+    assert _acquire_lease("first")
+    assert _acquire_lease("first")
+    assert not _acquire_lease("second")
+
+    mock_database.liveFileWatcher.update_one(
+        {"_id": "watcher"}, {"$set": {"renewed": datetime.datetime(2000, 1, 1)}}
+    )
+    assert _acquire_lease("second")
+    assert not _acquire_lease("first")
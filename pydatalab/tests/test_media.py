@@ -0,0 +1,179 @@
+import struct
+import zlib
+
+import numpy as np
+import pytest
+from PIL import Image, TiffImagePlugin
+
+from pydatalab.config import CONFIG
+from pydatalab.media import (
+    _iter_row_bands,
+    build_image_pyramid,
+    check_image_tileable,
+    ensure_image_previews,
+    get_image_preview_path,
+    get_image_preview_urls,
+    get_image_pyramid_info,
+    get_image_tile_path,
+)
+
+
+def test_image_previews(tmp_path, monkeypatch):
+    monkeypatch.setattr(CONFIG, "IMAGE_PREVIEW_SIZE", 64)
+
+    tiff = tmp_path / "micrograph.tif"
+    Image.fromarray(np.arange(200 * 300, dtype=np.uint16).reshape(200, 300)).save(tiff)
+    file_info = {"_id": "abc", "name": tiff.name, "location": str(tiff), "revision": 1}
+
+    key = ensure_image_previews(file_info)
+    assert key is not None
+    with Image.open(get_image_preview_path(str(tiff), key, "preview")) as preview:
+        assert preview.format == "WEBP"
+        assert preview.size == (64, 43)
+    with Image.open(get_image_preview_path(str(tiff), key, "full")) as full:
+        assert full.format == "PNG"
+        assert full.size == (300, 200)
+
+    urls = get_image_preview_urls(file_info)
+    assert urls == {
+        "preview": f"/files/abc/preview/preview?key={key}",
+        "full": f"/files/abc/preview/full?key={key}",
+    }
+
+    # a new revision of the file replaces the previous previews
+    file_info["revision"] = 2
+    new_key = ensure_image_previews(file_info)
+    assert new_key != key
+    assert get_image_preview_path(str(tiff), new_key, "preview").exists()
+    assert not get_image_preview_path(str(tiff), key, "preview").exists()
+    assert not get_image_preview_path(str(tiff), key, "full").exists()
+
+    # browsers can display PNGs directly, so only the preview is generated
+    png = tmp_path / "photo.png"
+    Image.new("RGBA", (20, 10), (255, 0, 0, 128)).save(png)
+    file_info = {"immutable_id": "def", "name": png.name, "location": str(png), "revision": 1}
+    urls = get_image_preview_urls(file_info)
+    key = ensure_image_previews(file_info)
+    assert urls["full"] == "/files/def/photo.png"
+    assert not get_image_preview_path(str(png), key, "full").exists()
+    with Image.open(get_image_preview_path(str(png), key, "preview")) as preview:
+        assert preview.size == (20, 10)
+
+    assert ensure_image_previews({"location": str(tmp_path / "data.csv")}) is None
+
+
+@pytest.mark.parametrize("compression", ["raw", "tiff_lzw", "tiff_adobe_deflate"])
+def test_image_pyramid(tmp_path, monkeypatch, compression):
+    monkeypatch.setattr(CONFIG, "IMAGE_TILING_MIN_PIXELS", 100_000)
+    monkeypatch.setattr(CONFIG, "IMAGE_PREVIEW_SIZE", 300)
+    # written with libtiff, so that images are split into many strips
+    monkeypatch.setattr(TiffImagePlugin, "WRITE_LIBTIFF", True)
+    # images stored in strips are tiled even if too large to be decoded at once
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 200_000)
+
+    location = tmp_path / "mosaic.tif"
+    pixels = np.random.default_rng(0).integers(0, 255, (700, 1000, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(location, compression=compression)
+    file_info = {"_id": "abc", "name": location.name, "location": str(location), "revision": 1}
+
+    # the image is read in bands, which decode only the strips they need
+    bands = list(_iter_row_bands(str(location), 256))
+    assert [top for top, _ in bands] == [0, 256, 512]
+    np.testing.assert_array_equal(np.concatenate([np.asarray(b) for _, b in bands]), pixels)
+
+    # tiled images are not converted whole, even to generate their preview
+    key = ensure_image_previews(file_info)
+    assert not get_image_preview_path(str(location), key, "preview").exists()
+    assert get_image_preview_urls(file_info) == {
+        "preview": f"/files/abc/preview/preview?key={key}",
+        "tiles": f"/files/abc/tiles?key={key}",
+    }
+    assert get_image_pyramid_info(file_info) is None
+
+    steps = []
+    info = build_image_pyramid(file_info, progress=lambda fraction, _: steps.append(fraction))
+    assert info == get_image_pyramid_info(file_info)
+    assert info["max_level"] == 10
+    assert (info["width"], info["height"], info["tile_size"]) == (1000, 700, 256)
+    assert steps[-1] == 1.0
+
+    sizes = {
+        (10, 3, 2): (232, 188),
+        (10, 0, 0): (256, 256),
+        (9, 1, 1): (244, 94),
+        (8, 0, 0): (250, 175),
+        (0, 0, 0): (1, 1),
+    }
+    for (level, x, y), size in sizes.items():
+        with Image.open(get_image_tile_path(str(location), key, level, x, y)) as tile:
+            assert tile.size == size
+    assert not get_image_tile_path(str(location), key, 10, 4, 0).exists()
+
+    with Image.open(get_image_preview_path(str(location), key, "preview")) as preview:
+        assert preview.size == (250, 175)
+
+
+def _save_tiled_tiff(location, pixels, tile_size):
+    """Saves an RGB image as a Deflate-compressed TIFF in tiles, which Pillow cannot write."""
+    height, width = pixels.shape[:2]
+    tiles = []
+    for y in range(0, height, tile_size):
+        for x in range(0, width, tile_size):
+            tile = np.zeros((tile_size, tile_size, 3), dtype=np.uint8)
+            part = pixels[y : y + tile_size, x : x + tile_size]
+            tile[: part.shape[0], : part.shape[1]] = part
+            tiles.append(zlib.compress(tile.tobytes()))
+
+    ifd = TiffImagePlugin.ImageFileDirectory_v2(prefix=b"II")
+    ifd[256], ifd[257], ifd[258], ifd[259], ifd[262], ifd[277] = width, height, (8, 8, 8), 8, 2, 3
+    ifd[322] = ifd[323] = tile_size
+    ifd[324], ifd[325] = (0,) * len(tiles), tuple(len(tile) for tile in tiles)
+    ifd.tagtype[324] = ifd.tagtype[325] = 4
+    start = 8 + len(ifd.tobytes(8))
+    ifd[324] = tuple(start + sum(len(tile) for tile in tiles[:i]) for i in range(len(tiles)))
+    location.write_bytes(b"II*\x00" + struct.pack("<L", 8) + ifd.tobytes(8) + b"".join(tiles))
+
+
+def test_compressed_image_tiles(tmp_path, monkeypatch):
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 200_000)
+    location = tmp_path / "mosaic.tif"
+    pixels = np.random.default_rng(0).integers(0, 255, (700, 1000, 3), dtype=np.uint8)
+    _save_tiled_tiff(location, pixels, 256)
+    file_info = {"_id": "abc", "name": location.name, "location": str(location), "revision": 1}
+
+    # compressed tiles are decoded one at a time, so the image can be tiled
+    check_image_tileable(file_info)
+    bands = list(_iter_row_bands(str(location), 200))
+    assert [top for top, _ in bands] == [0, 200, 400, 600]
+    np.testing.assert_array_equal(np.concatenate([np.asarray(b) for _, b in bands]), pixels)
+
+    # other compressions can only be decoded whole, so large images are rejected up front
+    Image.fromarray(pixels).save(location, compression="jpeg")
+    with pytest.raises(Image.DecompressionBombError, match="Save the image as"):
+        check_image_tileable(file_info)
+    with pytest.raises(Image.DecompressionBombError):
+        build_image_pyramid(file_info)
+
+
+def test_preview_cache_control(tmp_path):
+    from flask import Flask
+
+    from pydatalab.routes.v0_1.files import _send_preview_file
+
+    path = tmp_path / "preview.webp"
+    path.write_bytes(b"preview")
+    app = Flask(__name__)
+
+    # only requests for the current key can be cached without revalidation
+    with app.test_request_context("/files/abc/preview/preview?key=123"):
+        response = _send_preview_file(path, "123.preview", "123")
+        assert not response.cache_control.no_cache
+        assert response.cache_control.immutable
+        assert response.cache_control.private
+        response.close()
+
+    with app.test_request_context("/files/abc/preview/preview?key=456"):
+        response = _send_preview_file(path, "123.preview", "123")
+        assert response.cache_control.no_cache
+        assert not response.cache_control.immutable
+        response.close()
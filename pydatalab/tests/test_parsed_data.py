@@ -0,0 +1,233 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import pydatalab.parsed_data
+from pydatalab.config import CONFIG
+from pydatalab.disk_cache import CacheSizeEstimate
+from pydatalab.parsed_data import (
+    evict_parsed_data,
+    file_content_hash,
+    get_parsed_data,
+    get_parsed_data_key,
+    load_parsed_data,
+    store_parsed_data,
+)
+
+CALLS = []
+
+
+def _parser(location):
+    CALLS.append(location)
+    df = pd.read_csv(location)
+    df["label"] = [f"row {i}" for i in range(len(df))]
+    df.attrs["source"] = "csv"
+    return df
+
+
+@pytest.fixture
+def csv_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(CONFIG, "CACHE_DIRECTORY", tmp_path / "cache")
+    monkeypatch.setattr(CONFIG, "PARSED_DATA_CACHE_MAX_SIZE", 1024 * 1024)
+    monkeypatch.setattr(pydatalab.parsed_data, "_SIZE_ESTIMATE", CacheSizeEstimate())
+    CALLS.clear()
+    location = tmp_path / "data.csv"
+    pd.DataFrame({"x": np.arange(100.0), "y": np.arange(100) ** 2}).to_csv(location, index=False)
+    return location
+
+
+def test_parsed_data_cache(csv_file):
+    df = get_parsed_data(csv_file, _parser)
+    assert len(CALLS) == 1
+
+    cached = get_parsed_data(csv_file, _parser)
+    assert len(CALLS) == 1
+    pd.testing.assert_frame_equal(df, cached)
+    assert cached.attrs == {"source": "csv"}
+
+    subset = get_parsed_data(csv_file, _parser, columns=["y", "label"], rows=slice(10, 20))
+    assert len(CALLS) == 1
+    assert list(subset.columns) == ["y", "label"]
+    assert subset["y"].tolist() == [i**2 for i in range(10, 20)]
+    assert subset.index.tolist() == list(range(10, 20))
+    assert subset["label"].iloc[0] == "row 10"
+
+    # a change to the file contents produces a new entry
+    pd.DataFrame({"x": [1.0], "y": [2]}).to_csv(csv_file, index=False)
+    assert len(get_parsed_data(csv_file, _parser)) == 1
+    assert len(CALLS) == 2
+
+    # as does a new version of the parser
+    get_parsed_data(csv_file, _parser, parser_version="2")
+    assert len(CALLS) == 3
+
+
+def test_parsed_data_index_roundtrip(csv_file):
+    def _indexed_parser(location):
+        return pd.read_csv(location).set_index("x")
+
+    df = get_parsed_data(csv_file, _indexed_parser)
+    pd.testing.assert_frame_equal(df, get_parsed_data(csv_file, _indexed_parser))
+
+
+def test_parsed_data_eviction(csv_file, tmp_path):
+    key = get_parsed_data_key(csv_file, _parser)
+    get_parsed_data(csv_file, _parser)
+
+    other_file = tmp_path / "other.csv"
+    other_file.write_text("x,y\n1,2\n")
+    other_key = get_parsed_data_key(other_file, _parser)
+    get_parsed_data(other_file, _parser)
+
+    # loading the first entry marks it as the most recently used
+    assert load_parsed_data(key) is not None
+    # both entries are removed, along with the memoised hashes of both files
+    assert evict_parsed_data(max_size=1) == 4
+    assert load_parsed_data(key) is None
+    assert load_parsed_data(other_key) is None
+    assert not any((CONFIG.CACHE_DIRECTORY / "parsed" / "hashes").iterdir())
+
+
+def test_parsed_data_eviction_is_deferred(csv_file, tmp_path, monkeypatch):
+    scans = []
+
+    def _evict_parsed_data(max_size=None):
+        scans.append(max_size)
+        return evict_parsed_data(max_size)
+
+    monkeypatch.setattr(pydatalab.parsed_data, "evict_parsed_data", _evict_parsed_data)
+
+    # the first store scans the cache, but later ones only add to the estimate of its size
+    get_parsed_data(csv_file, _parser)
+    assert len(scans) == 1
+    for i in range(3):
+        other_file = tmp_path / f"other {i}.csv"
+        other_file.write_text(f"x,y\n{i},2\n")
+        get_parsed_data(other_file, _parser)
+    assert len(scans) == 1
+
+    # until the estimate exceeds the limit
+    monkeypatch.setattr(CONFIG, "PARSED_DATA_CACHE_MAX_SIZE", 1)
+    store_parsed_data("new entry", pd.DataFrame({"x": [1.0]}))
+    assert len(scans) == 2
+    assert not any((CONFIG.CACHE_DIRECTORY / "parsed").glob("*/meta.json"))
+
+
+def test_content_hash_memo_is_bounded(csv_file, tmp_path, monkeypatch):
+    monkeypatch.setattr(pydatalab.parsed_data, "_CONTENT_HASHES", {})
+    monkeypatch.setattr(pydatalab.parsed_data, "_MAX_CONTENT_HASHES", 2)
+    for i in range(3):
+        other_file = tmp_path / f"other {i}.csv"
+        other_file.write_text(f"x,y\n{i},2\n")
+        file_content_hash(other_file)
+    assert [Path(path).name for path, _, _ in pydatalab.parsed_data._CONTENT_HASHES] == [
+        "other 1.csv",
+        "other 2.csv",
+    ]
+
+
+def test_parsed_data_disabled(csv_file, monkeypatch):
+    monkeypatch.setattr(CONFIG, "PARSED_DATA_CACHE_MAX_SIZE", 0)
+    get_parsed_data(csv_file, _parser)
+    get_parsed_data(csv_file, _parser)
+    assert len(CALLS) == 2
+    assert not (CONFIG.CACHE_DIRECTORY / "parsed").exists()
+
+
+def test_parsed_data_partitions(csv_file):
+    def _partitioned_parser(location):
+        df = pd.read_csv(location)
+        # interleave the partitions to check they are stored contiguously
+        df["half cycle"] = np.arange(len(df)) % 7 + 1
+        return df
+
+    options = {"partition_by": "half cycle"}
+    df = get_parsed_data(csv_file, _partitioned_parser, partitions=[2, 5], **options)
+    assert set(df["half cycle"]) == {2, 5}
+
+    cached = get_parsed_data(csv_file, _partitioned_parser, partitions=[2, 5], **options)
+    pd.testing.assert_frame_equal(df.sort_index(), cached.sort_index())
+
+    last = get_parsed_data(
+        csv_file, _partitioned_parser, partitions=lambda values: values[-1:], **options
+    )
+    assert set(last["half cycle"]) == {7}
+    assert last["x"].tolist() == [x for x in range(100) if x % 7 == 6]
+
+    assert len(get_parsed_data(csv_file, _partitioned_parser, partitions=[], **options)) == 0
+    assert len(get_parsed_data(csv_file, _partitioned_parser, **options)) == 100
+
+
+def test_parsed_data_partitions_without_layout(csv_file):
+    df = pd.read_csv(csv_file)
+    df["half cycle"] = np.arange(len(df)) % 7 + 1
+    key = get_parsed_data_key(csv_file, _parser, partition_by="half cycle")
+    # e.g., an entry stored before the rows were partitioned
+    store_parsed_data(key, df)
+
+    assert load_parsed_data(key, partitions=[2, 5]) is None
+    loaded = load_parsed_data(key, columns=["x"], partitions=[2, 5], partition_by="half cycle")
+    assert list(loaded.columns) == ["x"]
+    assert loaded["x"].tolist() == [x for x in range(100) if x % 7 in (1, 4)]
+
+    CALLS.clear()
+    cached = get_parsed_data(csv_file, _parser, partitions=[3], partition_by="half cycle")
+    assert not CALLS
+    assert set(cached["half cycle"]) == {3}
+
+
+def test_parsed_arrays(tmp_path):
+    from pydatalab.parsed_data import get_parsed_arrays
+
+    calls = []
+
+    def parser(location):
+        calls.append(location)
+        return {"cube": np.arange(24.0).reshape(2, 3, 4), "axis": np.arange(4)}, {"unit": "cm-1"}
+
+    location = tmp_path / "map.wdf"
+    location.write_bytes(b"map")
+
+    arrays, attrs = get_parsed_arrays(location, parser)
+    cached_arrays, cached_attrs = get_parsed_arrays(location, parser)
+    assert len(calls) == 1
+    assert cached_attrs == attrs == {"unit": "cm-1"}
+    assert isinstance(cached_arrays["cube"], np.memmap)
+    np.testing.assert_array_equal(cached_arrays["cube"], arrays["cube"])
+
+
+def _appended_parser(location, previous, state):
+    CALLS.append((previous is not None, state))
+    with open(location) as f:
+        f.seek(state.get("offset", 0))
+        rows = [int(line) for line in f.read().splitlines() if line]
+        offset = f.tell()
+    df = pd.DataFrame({"x": rows})
+    if previous is not None:
+        df = pd.concat([previous, df], ignore_index=True)
+    return df, {"offset": offset}
+
+
+def test_appended_parsed_data(csv_file, tmp_path):
+    location = tmp_path / "live.txt"
+    location.write_text("".join(f"{i}\n" for i in range(10)))
+
+    from pydatalab.parsed_data import get_appended_parsed_data
+
+    assert get_appended_parsed_data(location, _appended_parser)["x"].tolist() == list(range(10))
+    assert get_appended_parsed_data(location, _appended_parser)["x"].tolist() == list(range(10))
+    assert CALLS == [(False, {})]
+
+    with open(location, "a") as f:
+        f.write("".join(f"{i}\n" for i in range(10, 15)))
+    assert get_appended_parsed_data(location, _appended_parser)["x"].tolist() == list(range(15))
+    assert CALLS[-1] == (True, {"offset": 20})
+
+    # Files that are rewritten rather than appended to are parsed in full
+    location.write_text("".join(f"{i}\n" for i in range(100, 120)))
+    assert get_appended_parsed_data(location, _appended_parser)["x"].tolist() == list(
+        range(100, 120)
+    )
+    assert CALLS[-1] == (False, {})
@@ -0,0 +1,111 @@
+import gzip
+
+import bokeh.embed
+import numpy as np
+import pandas as pd
+
+import pydatalab.plot_data
+from pydatalab.bokeh_plots import selectable_axes_plot
+from pydatalab.config import CONFIG
+from pydatalab.disk_cache import CacheSizeEstimate
+from pydatalab.plot_data import (
+    _downcast,
+    _store_blob,
+    externalize_plot_data,
+    get_plot_data_path,
+    pack_plot_data,
+    plot_data_exists,
+    unpack_plot_data,
+)
+
+
+def test_pack_and_unpack_plot_data():
+    columns = [
+        ("1001", "x", np.linspace(0, 1, 11).astype("<f4")),
+        ("1001", "y", np.arange(7, dtype="<i2")),
+        ("1002", "z", np.array([1.5, np.nan, 2.5], dtype="<f8")),
+    ]
+    blob = pack_plot_data(columns)
+    # the buffers start 8-byte aligned so they can be viewed as typed arrays in the browser
+    assert (4 + int.from_bytes(blob[:4], "little")) % 8 == 0
+    sources = unpack_plot_data(blob)
+
+    assert set(sources) == {"1001", "1002"}
+    for source_id, name, values in columns:
+        unpacked = sources[source_id][name]
+        assert unpacked.dtype == values.dtype
+        np.testing.assert_array_equal(unpacked, values)
+
+
+def test_downcasting_is_lossless_at_plotting_resolution():
+    smooth = np.linspace(0, 1000, 10_000)
+    assert _downcast(smooth).dtype == np.float32
+
+    # a tiny range on a large offset cannot be represented in float32
+    offset = 1e6 + np.linspace(0, 1e-3, 100)
+    assert _downcast(offset).dtype == np.float64
+
+    assert _downcast(np.array([0, 200], dtype=np.int64)).dtype == np.int16
+    assert _downcast(np.array([0, 2**40], dtype=np.int64)).dtype == np.float64
+    assert np.isnan(_downcast(np.array([1.0, np.nan]))[1])
+
+
+def test_externalize_plot_data():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"x": np.linspace(0, 100, 5000), "y": rng.random(5000)})
+    df["label"] = "a"
+    plot_data = bokeh.embed.json_item(selectable_axes_plot([df], x_options=["x"], y_options=["y"]))
+
+    assert externalize_plot_data(plot_data)
+    key = plot_data["plot_data"]["key"]
+    assert plot_data_exists(key)
+
+    sources = [
+        ref for ref in plot_data["doc"]["roots"]["references"] if ref["type"] == "ColumnDataSource"
+    ]
+    data = sources[0]["attributes"]["data"]
+    assert data["x"] == [] and data["y"] == []
+    # non-numeric columns are left in the JSON
+    assert data["label"] == ["a"] * 5000
+
+    blob = gzip.decompress(get_plot_data_path(key).read_bytes())
+    columns = unpack_plot_data(blob)[sources[0]["id"]]
+    np.testing.assert_allclose(columns["y"], df["y"], rtol=1e-6)
+    np.testing.assert_allclose(columns["x"], df["x"], atol=1e-4)
+
+
+def test_small_plots_are_not_externalized():
+    df = pd.DataFrame({"x": np.arange(10.0), "y": np.arange(10.0)})
+    plot_data = bokeh.embed.json_item(selectable_axes_plot([df], x_options=["x"], y_options=["y"]))
+    assert not externalize_plot_data(plot_data)
+    assert "plot_data" not in plot_data
+
+
+def test_malformed_plot_data_keys():
+    assert get_plot_data_path("../../etc/passwd") is None
+    assert get_plot_data_path("A" * 64) is None
+    assert not plot_data_exists("0" * 64)
+
+
+def test_plot_data_eviction_is_deferred(tmp_path, monkeypatch):
+    monkeypatch.setattr(CONFIG, "CACHE_DIRECTORY", tmp_path)
+    monkeypatch.setattr(CONFIG, "PLOT_DATA_CACHE_MAX_SIZE", 1024 * 1024)
+    monkeypatch.setattr(pydatalab.plot_data, "_SIZE_ESTIMATE", CacheSizeEstimate())
+    scans = []
+    evict_plot_data = pydatalab.plot_data.evict_plot_data
+    monkeypatch.setattr(
+        pydatalab.plot_data,
+        "evict_plot_data",
+        lambda max_size=None: scans.append(max_size) or evict_plot_data(max_size),
+    )
+
+    # the first store scans the cache, but later ones only add to the estimate of its size
+    keys = [_store_blob(f"blob {i}".encode()) for i in range(5)]
+    assert len(scans) == 1
+    assert all(plot_data_exists(key) for key in keys)
+
+    # until the estimate exceeds the limit, when the least recently used are evicted
+    monkeypatch.setattr(CONFIG, "PLOT_DATA_CACHE_MAX_SIZE", 1)
+    _store_blob(b"new blob")
+    assert len(scans) == 2
+    assert not any(plot_data_exists(key) for key in keys)
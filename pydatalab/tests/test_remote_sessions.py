@@ -0,0 +1,107 @@
+import contextlib
+import io
+import os
+import subprocess
+
+import pytest
+
+from pydatalab import remote_sessions
+from pydatalab.remote_sessions import RemoteStat, fetch_remote_file, stat_remote_files
+
+
+class _RemoteFile(io.FileIO):
+    def stat(self):
+        return os.fstat(self.fileno())
+
+    def prefetch(self, file_size=None):
+        pass
+
+
+class _SFTPClient:
+    """An SFTP client for local files, standing in for paramiko's `SFTPClient`."""
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def open(self, path, mode="rb"):
+        return _RemoteFile(path, "r")
+
+
+def _exec_locally(sftp, command):
+    result = subprocess.run(command, shell=True, capture_output=True)
+    return result.returncode, result.stdout, result.stderr.decode()
+
+
+def _exec_unavailable(sftp, command):
+    raise RuntimeError("This account is restricted to SFTP")
+
+
+@pytest.fixture
+def remote(monkeypatch):
+    @contextlib.contextmanager
+    def _remote_session(hostname):
+        assert hostname == "ssh://host"
+        yield _SFTPClient()
+
+    monkeypatch.setattr(remote_sessions, "remote_session", _remote_session)
+    monkeypatch.setattr(remote_sessions, "_exec", _exec_locally)
+
+
+@pytest.mark.parametrize("exec_commands", [True, False])
+def test_stat_remote_files(tmp_path, monkeypatch, remote, exec_commands):
+    if not exec_commands:
+        monkeypatch.setattr(remote_sessions, "_exec", _exec_unavailable)
+    monkeypatch.setattr(remote_sessions, "_STAT_BATCH_SIZE", 2)
+
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"file {i}.csv"
+        path.write_bytes(b"x" * i)
+        os.utime(path, (1_700_000_000 + i, 1_700_000_000 + i))
+        paths.append(str(path))
+    paths.append(str(tmp_path / "missing.csv"))
+
+    assert stat_remote_files("ssh://host", paths) == {
+        paths[0]: RemoteStat(1_700_000_000, 0),
+        paths[1]: RemoteStat(1_700_000_001, 1),
+        paths[2]: RemoteStat(1_700_000_002, 2),
+        paths[3]: None,
+    }
+
+
+def test_fetch_remote_file(tmp_path, monkeypatch, remote):
+    source = tmp_path / "live.csv"
+    source.write_bytes(b"a,b\n" * 1000)
+
+    destination = tmp_path / "store" / "live.csv"
+    destination.parent.mkdir()
+    assert fetch_remote_file(f"ssh://host:{source}", destination) == 4000
+    assert destination.read_bytes() == source.read_bytes()
+
+    # only the appended part of a file is transferred, on top of the previous version
+    previous = tmp_path / "store" / "previous.csv"
+    os.replace(destination, previous)
+    with open(source, "ab") as f:
+        f.write(b"c,d\n" * 10)
+    assert fetch_remote_file(f"ssh://host:{source}", destination, previous=previous) == 40
+    assert destination.read_bytes() == source.read_bytes()
+
+    # as is the rest of an interrupted copy
+    with open(destination, "r+b") as f:
+        f.truncate(1000)
+    assert fetch_remote_file(f"ssh://host:{source}", destination) == 3040
+    assert destination.read_bytes() == source.read_bytes()
+
+    # files that changed anywhere before the appended part are copied in full
+    source.write_bytes(source.read_bytes().replace(b"a,b\n", b"a,B\n", 1) + b"e,f\n")
+    assert fetch_remote_file(f"ssh://host:{source}", destination) == 4044
+    assert destination.read_bytes() == source.read_bytes()
+    source.write_bytes(source.read_bytes() + b"g,h\n")
+    assert fetch_remote_file(f"ssh://host:{source}", destination, previous=previous) == 4
+    assert destination.read_bytes() == source.read_bytes()
+
+    # as are all files if their start cannot be verified on the remote
+    monkeypatch.setattr(remote_sessions, "_exec", _exec_unavailable)
+    source.write_bytes(source.read_bytes() + b"i,j\n")
+    assert fetch_remote_file(f"ssh://host:{source}", destination) == 4052
+    assert destination.read_bytes() == source.read_bytes()
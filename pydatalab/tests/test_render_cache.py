@@ -0,0 +1,95 @@
+import pytest
+from bson import ObjectId
+
+from pydatalab.blocks.base import DataBlock
+from pydatalab.config import CONFIG
+
+
+@pytest.fixture
+def mock_database(make_mock_database, monkeypatch):
+    database = make_mock_database("__datalab-render-cache__")
+    monkeypatch.setattr(CONFIG, "RENDER_CACHE_MAX_SIZE", 1024 * 1024)
+    return database
+
+
+class CountingBlock(DataBlock):
+    blocktype = "counting"
+    name = "Counting block"
+    calls = 0
+
+    @property
+    def plot_functions(self):
+        return (self.plot,)
+
+    def plot(self):
+        CountingBlock.calls += 1
+        self.data["bokeh_plot_data"] = {"scale": self.data.get("scale"), "n": CountingBlock.calls}
+
+
+def _render(file_id, **params):
+    return CountingBlock(item_id="test", init_data={"file_id": file_id, **params}).to_web()
+
+
+def test_render_cache_hit_and_miss(mock_database):
+    file_id = mock_database.files.insert_one({"revision": 1, "is_live": False}).inserted_id
+    CountingBlock.calls = 0
+
+    data = _render(file_id, scale=1)
+    assert data["render_cache"]["status"] == "miss"
+    assert CountingBlock.calls == 1
+
+    data = _render(file_id, scale=1)
+    assert data["render_cache"]["status"] == "hit"
+    assert data["bokeh_plot_data"] == {"scale": 1, "n": 1}
+    assert CountingBlock.calls == 1
+
+    # changing a parameter or the file revision invalidates the cached render
+    assert _render(file_id, scale=2)["render_cache"]["status"] == "miss"
+    mock_database.files.update_one({"_id": file_id}, {"$inc": {"revision": 1}})
+    assert _render(file_id, scale=1)["render_cache"]["status"] == "miss"
+    assert CountingBlock.calls == 3
+
+    # the cache status is not persisted with the block
+    block = CountingBlock(item_id="test", init_data={"file_id": file_id, "scale": 1})
+    block.to_web()
+    assert "render_cache" not in block.to_db()
+
+
+def test_render_cache_bypassed_for_live_files(mock_database):
+    file_id = mock_database.files.insert_one({"revision": 1, "is_live": True}).inserted_id
+    assert _render(file_id)["render_cache"]["status"] == "bypass"
+    assert _render(file_id)["render_cache"]["status"] == "bypass"
+
+
+def test_render_cache_eviction(mock_database):
+    from pydatalab.render_cache import (
+        RENDER_CACHE_COLLECTION,
+        RENDER_CACHE_STATS_COLLECTION,
+        evict_render_cache,
+    )
+
+    def tracked_size():
+        return mock_database[RENDER_CACHE_STATS_COLLECTION].find_one()["total_size"]
+
+    def actual_size():
+        return sum(entry["size"] for entry in collection.find())
+
+    file_id = mock_database.files.insert_one({"revision": 1}).inserted_id
+    for scale in range(5):
+        _render(file_id, scale=scale)
+
+    collection = mock_database[RENDER_CACHE_COLLECTION]
+    assert collection.count_documents({}) == 5
+    assert tracked_size() == actual_size()
+    entry_size = collection.find_one()["size"]
+
+    evict_render_cache(max_size=2 * entry_size)
+    assert collection.count_documents({}) <= 2
+    assert tracked_size() == actual_size()
+    # the most recently rendered entries are kept
+    assert _render(file_id, scale=4)["render_cache"]["status"] == "hit"
+    assert _render(file_id, scale=0)["render_cache"]["status"] == "miss"
+
+
+def test_render_cache_missing_file(mock_database):
+    assert _render(str(ObjectId()))["render_cache"]["status"] == "miss"
@@ -0,0 +1,92 @@
+import os
+
+import pytest
+from flask import Flask
+
+from pydatalab.blocks import BLOCK_TYPES
+from pydatalab.blocks.base import DataBlock
+from pydatalab.config import CONFIG
+from pydatalab.login import LOGIN_MANAGER
+from pydatalab.worker_pool import shutdown_worker_pool, start_worker_pool
+
+
+class PIDBlock(DataBlock):
+    blocktype = "pid"
+    name = "PID block"
+
+    @property
+    def plot_functions(self):
+        return (self.plot,)
+
+    def plot(self):
+        if self.data.get("fail"):
+            raise RuntimeError("Failed to plot")
+        if self.data.get("unpicklable"):
+            # Cannot be sent back from a worker process
+            self.data["callback"] = lambda: None
+        self.data["rendered_by"] = os.getpid()
+
+
+@pytest.fixture
+def render_app(monkeypatch):
+    monkeypatch.setitem(BLOCK_TYPES, "pid", PIDBlock)
+    monkeypatch.setattr(CONFIG, "RENDER_CACHE_MAX_SIZE", 0)
+    monkeypatch.setattr(CONFIG, "BLOCK_RENDER_PROCESSES", 2)
+    app = Flask(__name__)
+    app.secret_key = "test"
+    LOGIN_MANAGER.init_app(app)
+    start_worker_pool(app, processes=2)
+    yield app
+
+    shutdown_worker_pool()
+
+
+def test_parallel_render_blocks(render_app):
+    from pydatalab.routes.v0_1.items import reserialize_blocks
+
+    blocks = {
+        f"block{i}": {"blocktype": "pid", "block_id": f"block{i}", "item_id": "test"}
+        for i in range(4)
+    }
+    blocks["block2"]["fail"] = True
+    blocks["comment"] = {"blocktype": "comment", "block_id": "comment", "item_id": "test"}
+    display_order = ["block3", "comment", "block0", "missing", "block2", "block1"]
+
+    with render_app.test_request_context():
+        rendered = reserialize_blocks(display_order, blocks)
+
+    assert set(rendered) == set(blocks)
+    for block_id in ("block0", "block1", "block3"):
+        assert rendered[block_id]["block_id"] == block_id
+        assert rendered[block_id]["rendered_by"] != os.getpid()
+        assert "errors" not in rendered[block_id]
+
+    assert "rendered_by" not in rendered["block2"]
+    assert "Failed to plot" in rendered["block2"]["errors"][0]
+    assert rendered["comment"]["blocktype"] == "comment"
+
+
+def test_serial_render_blocks(render_app, monkeypatch):
+    from pydatalab.render_pool import render_blocks
+
+    monkeypatch.setattr(CONFIG, "BLOCK_RENDER_PROCESSES", 1)
+    blocks = [{"blocktype": "pid", "block_id": f"block{i}", "item_id": "test"} for i in range(3)]
+    with render_app.test_request_context():
+        rendered = render_blocks(blocks)
+
+    assert [b["block_id"] for b in rendered] == ["block0", "block1", "block2"]
+    assert all(b["rendered_by"] == os.getpid() for b in rendered)
+
+
+def test_render_blocks_falls_back_to_serial(render_app):
+    from pydatalab.render_pool import render_blocks
+
+    blocks = [{"blocktype": "pid", "block_id": f"block{i}", "item_id": "test"} for i in range(3)]
+    blocks[1]["unpicklable"] = True
+    with render_app.test_request_context():
+        rendered = render_blocks(blocks)
+
+    assert [b["block_id"] for b in rendered] == ["block0", "block1", "block2"]
+    assert rendered[0]["rendered_by"] != os.getpid()
+    assert rendered[1]["rendered_by"] == os.getpid()
+    assert rendered[2]["rendered_by"] != os.getpid()
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pydatalab.transforms import TransformRegistry
+
+
+@pytest.fixture
+def registry():
+    calls = []
+    registry = TransformRegistry("test")
+
+    @registry.register("_squared", depends_on=("y",), public=False)
+    def _squared(df):
+        calls.append("_squared")
+        return df["y"] ** 2
+
+    @registry.register("scaled squared", depends_on=("_squared",), parameters={"scale": 2})
+    def _scaled(df, scale):
+        calls.append("scaled squared")
+        return scale * df["_squared"]
+
+    @registry.register("negated", depends_on=("y",), memoise=False)
+    def _negated(df):
+        calls.append("negated")
+        return -df["y"]
+
+    registry.calls = calls
+    return registry
+
+
+def test_only_requested_transforms_are_computed(registry):
+    df = pd.DataFrame({"y": np.arange(5.0)})
+    registry.evaluate(df, ["negated"])
+    assert registry.calls == ["negated"]
+    assert list(df.columns) == ["y", "negated"]
+
+    df = pd.DataFrame({"y": np.arange(5.0)})
+    registry.evaluate(df, ["scaled squared"], parameters={"scale": 3})
+    assert registry.calls == ["negated", "_squared", "scaled squared"]
+    # intermediate columns are not returned
+    assert list(df.columns) == ["y", "scaled squared"]
+    np.testing.assert_array_equal(df["scaled squared"], 3 * np.arange(5.0) ** 2)
+
+    assert registry.options == ["scaled squared", "negated"]
+
+
+def test_transforms_are_memoised(registry):
+    df = pd.DataFrame({"y": np.arange(5.0)})
+    registry.evaluate(df, cache_key="abc")
+    assert registry.calls == ["_squared", "scaled squared", "negated"]
+
+    df = pd.DataFrame({"y": np.arange(5.0)})
+    registry.evaluate(df, cache_key="abc")
+    # only the transform that opted out of memoisation is recomputed
+    assert registry.calls[3:] == ["negated"]
+    np.testing.assert_array_equal(df["scaled squared"], 2 * np.arange(5.0) ** 2)
+
+    # a change of parameters or data is computed afresh
+    registry.evaluate(pd.DataFrame({"y": np.arange(5.0)}), parameters={"scale": 4}, cache_key="abc")
+    assert registry.calls[4:] == ["scaled squared", "negated"]
+    registry.evaluate(pd.DataFrame({"y": np.arange(5.0)}), cache_key="def")
+    assert registry.calls[6:] == ["_squared", "scaled squared", "negated"]
+
+
+def test_invalid_transforms(registry):
+    with pytest.raises(ValueError):
+        registry.register("negated")(lambda df: df)
+
+    registry.register("a", depends_on=("b",))(lambda df: df["b"])
+    registry.register("b", depends_on=("a",))(lambda df: df["a"])
+    with pytest.raises(ValueError, match="Circular"):
+        registry.evaluate(pd.DataFrame({"y": [1.0]}), ["a"])
+
+    df = registry.evaluate(pd.DataFrame({"y": [1.0]}), ["not a column"])
+    assert list(df.columns) == ["y"]
+
+
+def test_spectrum_transforms_are_registered_per_block_type():
+    from pydatalab.apps.raman.transforms import RAMAN_TRANSFORMS
+    from pydatalab.apps.xrd.transforms import XRD_TRANSFORMS
+
+    shared = [
+        "normalized intensity",
+        "sqrt(intensity)",
+        "log(intensity)",
+        "intensity - median baseline",
+        "baseline (`scipy.signal.medfilt`, kernel_size=101)",
+        "intensity - polyfit baseline",
+        "baseline (`numpy.polyfit`, deg=15)",
+    ]
+    assert XRD_TRANSFORMS.options == shared
+    assert RAMAN_TRANSFORMS.options[: len(shared)] == shared
+    assert "intensity - morphological baseline" in RAMAN_TRANSFORMS.options
+    assert "intensity - morphological baseline" not in XRD_TRANSFORMS.options
+
+    x = np.linspace(10, 80, 500)
+    intensity = 1 + 0.01 * x + np.exp(-((x - 40) ** 2))
+    xrd = XRD_TRANSFORMS.evaluate(pd.DataFrame({"2θ (°)": x, "intensity": intensity}), shared)
+    raman = RAMAN_TRANSFORMS.evaluate(
+        pd.DataFrame({"wavenumber": x, "intensity": intensity}), shared
+    )
+    for column in shared:
+        np.testing.assert_allclose(xrd[column], raman[column])
+    assert np.max(xrd["intensity - polyfit baseline"]) == pytest.approx(1)
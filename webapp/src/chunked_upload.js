@@ -0,0 +1,137 @@
+// An uppy uploader that sends files to the server in chunks over a resumable
+// upload session (see `pydatalab.uploads`), so that an interrupted upload of a
+// large file continues from the last chunk received rather than starting again.
+import { Plugin } from "@uppy/core";
+
+import { construct_headers } from "@/server_fetch_utils.js";
+import { API_URL } from "@/resources.js";
+
+const MAX_RETRIES = 5;
+const RETRY_DELAY_MS = 1000;
+
+function sleep(ms) {
+  return new Promise((resolve) => setTimeout(resolve, ms));
+}
+
+async function requestJson(method, url, body = null) {
+  const response = await fetch(url, {
+    method: method,
+    headers: construct_headers(body ? { "Content-Type": "application/json" } : null),
+    body: body ? JSON.stringify(body) : null,
+    credentials: "include",
+  });
+  const response_json = await response.json();
+  if (!response.ok) {
+    throw new Error(response_json.message || response_json.detail || response.statusText);
+  }
+  return response_json;
+}
+
+// Sends a single chunk with an XMLHttpRequest, so that its progress can be reported
+function putChunk(url, offset, chunk, onProgress) {
+  return new Promise((resolve, reject) => {
+    const xhr = new XMLHttpRequest();
+    xhr.open("PUT", url);
+    xhr.withCredentials = true;
+    const headers = construct_headers({ "Upload-Offset": String(offset) });
+    for (const header in headers) {
+      xhr.setRequestHeader(header, headers[header]);
+    }
+    xhr.upload.onprogress = (event) => onProgress(event.loaded);
+    xhr.onload = () => {
+      let body = {};
+      try {
+        body = JSON.parse(xhr.responseText);
+      } catch (error) {
+        // leave the body empty
+      }
+      resolve({ status: xhr.status, body: body });
+    };
+    xhr.onerror = () => reject(new Error(`Network error while uploading chunk at ${offset}`));
+    xhr.send(chunk);
+  });
+}
+
+export default class ChunkedUpload extends Plugin {
+  constructor(uppy, opts) {
+    super(uppy, opts);
+    this.id = this.opts.id || "ChunkedUpload";
+    this.type = "uploader";
+    this.title = "Chunked upload";
+    this.handleUpload = this.handleUpload.bind(this);
+  }
+
+  install() {
+    this.uppy.addUploader(this.handleUpload);
+  }
+
+  uninstall() {
+    this.uppy.removeUploader(this.handleUpload);
+  }
+
+  async uploadFile(file) {
+    this.uppy.emit("upload-started", file);
+    const session = await requestJson("POST", `${API_URL}/uploads/`, {
+      item_id: file.meta.item_id,
+      filename: file.name,
+      size: file.size,
+      replace_file: file.meta.replace_file,
+    });
+    const url = `${API_URL}/uploads/${session.upload_id}`;
+
+    let offset = session.offset;
+    let retries = 0;
+    for (;;) {
+      const end = Math.min(offset + session.chunk_size, file.size);
+      let response;
+      try {
+        response = await putChunk(url, offset, file.data.slice(offset, end), (loaded) => {
+          this.uppy.emit("upload-progress", file, {
+            uploader: this,
+            bytesUploaded: offset + loaded,
+            bytesTotal: file.size,
+          });
+        });
+      } catch (error) {
+        response = { status: 0, body: {} };
+      }
+
+      if (response.status == 201) {
+        return response;
+      }
+      if (response.status == 200 && response.body.offset > offset) {
+        offset = response.body.offset;
+        retries = 0;
+        continue;
+      }
+      if (
+        (response.status >= 400 && response.status < 500 && response.status != 409) ||
+        retries >= MAX_RETRIES
+      ) {
+        throw new Error(response.body.message || `Upload of ${file.name} failed`);
+      }
+
+      // The chunk was interrupted (or rejected as out of order), so find out
+      // how much of the file the server has received and continue from there
+      retries += 1;
+      await sleep(RETRY_DELAY_MS * retries);
+      try {
+        offset = (await requestJson("GET", url)).offset;
+      } catch (error) {
+        // try again from the same offset
+      }
+    }
+  }
+
+  async handleUpload(fileIDs) {
+    for (const fileID of fileIDs) {
+      const file = this.uppy.getFile(fileID);
+      try {
+        const response = await this.uploadFile(file);
+        this.uppy.emit("upload-success", file, response);
+      } catch (error) {
+        this.uppy.emit("upload-error", file, error);
+      }
+    }
+  }
+}
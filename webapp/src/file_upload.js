@@ -2,13 +2,12 @@ import "@uppy/core/dist/style.css";
 import "@uppy/dashboard/dist/style.css";
 import Uppy from "@uppy/core";
 import Dashboard from "@uppy/dashboard";
-import XHRUpload from "@uppy/xhr-upload";
 import Webcam from "@uppy/webcam";
 
 import store from "@/store/index.js";
-import { construct_headers } from "@/server_fetch_utils.js";
+import ChunkedUpload from "@/chunked_upload.js";
 
-import { API_URL, UPPY_MAX_NUMBER_OF_FILES, UPPY_MAX_TOTAL_FILE_SIZE } from "@/resources.js";
+import { UPPY_MAX_NUMBER_OF_FILES, UPPY_MAX_TOTAL_FILE_SIZE } from "@/resources.js";
 // file-upload loaded
 
 export default function setupUppy(item_id, trigger_selector, reactive_file_list) {
@@ -20,7 +19,6 @@ export default function setupUppy(item_id, trigger_selector, reactive_file_list)
       maxNumberOfFiles: UPPY_MAX_NUMBER_OF_FILES, // Similarly, a max of 10000 files in one upload as a single "File" entry feels reasonable, once we move to uploading folders etc.
     },
   });
-  let headers = construct_headers();
   uppy
     .use(Dashboard, {
       inline: false,
@@ -35,21 +33,8 @@ export default function setupUppy(item_id, trigger_selector, reactive_file_list)
       ],
     })
     .use(Webcam, { target: Dashboard })
-    .use(XHRUpload, {
-      //someday, try to upgrade this to Tus
-      headers: headers,
-      endpoint: `${API_URL}/upload-file/`,
-      FormData: true, // send as form
-      fieldName: "files[]", // default, think about whether or not to change this
-      showProgressDetails: true,
-      withCredentials: true,
-      // getResponseData(responseText, response) {
-      // 	console.log("Uppy response text:")
-      // 	console.log(responseText)
-      // 	console.log("Uppy response:")
-      // 	console.log(response)
-      // }
-    });
+    // files are sent in chunks over a resumable upload session
+    .use(ChunkedUpload);
 
   uppy.on("file-added", (file) => {
     console.log("searching for matching files for: " + file.name);
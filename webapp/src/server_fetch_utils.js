@@ -444,6 +444,20 @@ export async function getCollectionData(collection_id) {
     .catch((error) => alert("Error getting collection data: " + error));
 }
 
+export async function waitForJobResult(job_id, interval = 500) {
+  // poll the status of a background job until it has finished, returning its result
+  for (;;) {
+    const response_json = await fetch_get(`${API_URL}/jobs/${job_id}`);
+    if (response_json.job_status === "complete") {
+      return response_json.result;
+    }
+    if (response_json.job_status === "failed") {
+      throw new Error(response_json.error);
+    }
+    await new Promise((resolve) => setTimeout(resolve, interval));
+  }
+}
+
 export async function updateBlockFromServer(item_id, block_id, block_data, saveToDatabase = true) {
   console.log("updateBlockFromServer called with data:");
   console.log(block_data);
@@ -453,8 +467,13 @@ export async function updateBlockFromServer(item_id, block_id, block_data, saveT
     block_id: block_id,
     block_data: block_data,
     save_to_db: saveToDatabase,
+    background: true,
   })
-    .then(function (response_json) {
+    .then(async function (response_json) {
+      // the server may queue the render as a background job, in which case poll for the result
+      if (response_json.job_id) {
+        response_json.new_block_data = await waitForJobResult(response_json.job_id);
+      }
       store.commit("updateBlockData", {
         item_id: item_id,
         block_id: block_id,
@@ -473,6 +492,74 @@ export async function updateBlockFromServer(item_id, block_id, block_data, saveT
     });
 }
 
+export async function renderBlockFromServer(item_id, block_id) {
+  // Render a saved block without sending its data; the response may be cached by the browser
+  store.commit("setBlockUpdating", block_id);
+  return fetch_get(`${API_URL}/render-block/${item_id}/${block_id}`)
+    .then(function (response_json) {
+      store.commit("updateBlockData", {
+        item_id: item_id,
+        block_id: block_id,
+        block_data: response_json.new_block_data,
+      });
+      store.commit("setBlockNotUpdating", block_id);
+    })
+    .catch((error) => {
+      console.error("Error in renderBlockFromServer:", error);
+      store.commit("setBlockNotUpdating", block_id);
+    });
+}
+
+const PLOT_DATA_ARRAY_TYPES = {
+  float32: Float32Array,
+  float64: Float64Array,
+  int8: Int8Array,
+  int16: Int16Array,
+  int32: Int32Array,
+  uint8: Uint8Array,
+  uint16: Uint16Array,
+  uint32: Uint32Array,
+};
+
+export async function getPlotData(url) {
+  // Fetch the binary column data of a plot, returning the typed arrays for each data source
+  // (see pydatalab.plot_data for the layout); the response is gzipped and immutable
+  const response = await fetch(`${API_URL}${url}`, {
+    method: "GET",
+    headers: construct_headers(),
+    credentials: "include",
+  });
+  if (!response.ok) {
+    throw new Error(`Unable to fetch plot data (${response.status})`);
+  }
+  const buffer = await response.arrayBuffer();
+  const headerLength = new DataView(buffer).getUint32(0, true);
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength)));
+  const start = 4 + headerLength;
+
+  const sources = {};
+  header.columns.forEach((column) => {
+    const ArrayType = PLOT_DATA_ARRAY_TYPES[column.dtype];
+    sources[column.source] = sources[column.source] || {};
+    sources[column.source][column.column] = new ArrayType(
+      buffer,
+      start + column.offset,
+      column.length / ArrayType.BYTES_PER_ELEMENT,
+    );
+  });
+  return sources;
+}
+
+export async function getImageTiles(url) {
+  // Fetch the description of the tile pyramid of a large image (see pydatalab.media),
+  // waiting for the background job that builds it if it does not exist yet
+  const response_json = await fetch_get(`${API_URL}${url}`);
+  if (response_json.ready) {
+    return response_json;
+  }
+  return await waitForJobResult(response_json.job_id, 2000);
+}
+
 export function addABlock(item_id, block_type, index = null) {
   console.log("addABlock called with", item_id, block_type);
   var block_id_promise = fetch_post(`${API_URL}/add-data-block/`, {